@@ -5,17 +5,24 @@ import re
 from frappe import _ as translate
 from frappe.utils import get_bench_path
 from cloudprnt.pos_invoice_markup import get_pos_invoice_markup
+from cloudprnt.printer_pools import find_pool, is_pool_queue, pool_queue
 from datetime import datetime
 
 @frappe.whitelist()
-def print_pos_invoice(invoice_name, printer=None, use_mqtt=False):
+def print_pos_invoice(invoice_name, printer=None, use_mqtt=False, reprint=False, copy=0):
     """
     Print a POS Invoice using CloudPRNT
     Version 2.0 - Pure Python implementation (no PHP)
 
     :param invoice_name: Name of the POS Invoice
-    :param printer: MAC address of printer or CloudPRNT Printer label
+    :param printer: MAC address of printer, CloudPRNT Printer label or Printer Pool name.
+        A printer given by label that belongs to a pool prints through its pool;
+        a MAC address always targets that printer
     :param use_mqtt: Force MQTT mode (optional)
+    :param reprint: Reprint of an earlier receipt, queued behind live receipts (optional)
+    :param copy: Copy counter (optional): repeated requests for the same invoice
+        and printer are printed once within the dedupe window, unless they
+        carry a new copy number
     :return: Success message
     """
     try:
@@ -49,22 +56,33 @@ def print_pos_invoice(invoice_name, printer=None, use_mqtt=False):
         else:
             # Printer label or name provided - find in database (bypassing controller)
             printer_row = frappe.db.sql("""
-                SELECT name, label, mac_address, use_mqtt
+                SELECT name, label, mac_address, use_mqtt, printer_pool
                 FROM `tabCloudPRNT Printers`
                 WHERE parent = 'CloudPRNT Settings'
                 AND (label = %s OR name = %s)
                 LIMIT 1
             """, (printer, printer), as_dict=True)
 
-            if not printer_row:
-                return {"success": False, "message": f"Imprimante {printer} non trouvée"}
+            if printer_row and printer_row[0].get('printer_pool'):
+                # Pool member: the job goes to the least busy printer of its pool
+                mac_address = pool_queue(printer_row[0].printer_pool)
+            elif printer_row:
+                printer_row = printer_row[0]
+                mac_address = printer_row.mac_address
 
-            printer_row = printer_row[0]
-            mac_address = printer_row.mac_address
+                # Check if printer has MQTT enabled
+                if printer_row.get('use_mqtt'):
+                    use_mqtt = True
+            else:
+                # Printer pool given by name
+                pool = find_pool(printer)
+                if not pool:
+                    return {"success": False, "message": f"Imprimante {printer} non trouvée"}
+                mac_address = pool_queue(pool)
 
-            # Check if printer has MQTT enabled
-            if printer_row.get('use_mqtt'):
-                use_mqtt = True
+        # Pool jobs are handed out when a member polls, MQTT pushes to one printer
+        if is_pool_queue(mac_address):
+            use_mqtt = False
 
         # Determine print method
         if use_mqtt and frappe.conf.get("mqtt_broker_host"):
@@ -92,7 +110,14 @@ def print_pos_invoice(invoice_name, printer=None, use_mqtt=False):
                 use_mqtt = False
 
         # HTTP Mode (database queue)
-        from cloudprnt.print_queue_manager import add_job_to_queue
+        from cloudprnt.print_queue_manager import add_job_to_queue, find_recent_duplicate
+
+        copy = max(0, frappe.utils.cint(copy))
+
+        # Double-tap or client retry: skip the markup build
+        result = find_recent_duplicate(invoice_name, mac_address, copy)
+        if result:
+            return duplicate_print_response(invoice_name, printer, result)
 
         # Pre-generate Star Markup for the invoice
         try:
@@ -107,9 +132,14 @@ def print_pos_invoice(invoice_name, printer=None, use_mqtt=False):
             printer_mac=mac_address,
             invoice_name=invoice_name,
             job_data=job_data,  # Pre-generated binary data
-            media_types=["application/vnd.star.starprnt", "application/vnd.star.line", "text/vnd.star.markup"]
+            media_types=["application/vnd.star.starprnt", "application/vnd.star.line", "text/vnd.star.markup"],
+            priority="reprint" if frappe.utils.cint(reprint) else "pos",
+            copy=copy
         )
 
+        if result.get("success") and result.get("duplicate"):
+            return duplicate_print_response(invoice_name, printer, result)
+
         if result.get("success"):
             return {
                 "success": True,
@@ -126,6 +156,18 @@ def print_pos_invoice(invoice_name, printer=None, use_mqtt=False):
         return {"success": False, "message": str(e)}
 
 
+def duplicate_print_response(invoice_name, printer, result):
+    """Reply to a print request collapsed into a job already queued"""
+    return {
+        "success": True,
+        "message": f"Impression de la facture {invoice_name} déjà demandée",
+        "method": "http",
+        "printer": printer,
+        "queue_position": result.get("queue_position", 0),
+        "duplicate": True
+    }
+
+
 @frappe.whitelist()
 def print_image_to_cloudprnt(image_path, printer_mac, printer_width=3, dither=True, scale_to_fit=True, drawer_end=False, buzzer_end=0):
     """
@@ -194,7 +236,9 @@ def print_image_to_cloudprnt(image_path, printer_mac, printer_width=3, dither=Tr
             job_token=job_token,
             printer_mac=printer_mac,
             job_data=hex_data,
-            media_types=["application/vnd.star.starprnt"]
+            media_types=["application/vnd.star.starprnt"],
+            # Not a live receipt: large images wait behind POS receipts
+            priority="reprint"
         )
 
         if result.get("success"):
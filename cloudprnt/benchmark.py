@@ -0,0 +1,346 @@
+"""
+CloudPRNT Renderer Benchmarks
+=============================
+
+Microbenchmarks of the rendering hot path, compared with a committed
+baseline (benchmark_baseline.json).
+
+Cases:
+    job_ops/<n>                  StarCloudPRNTStarLineModeJob builder calls
+    str_to_hex/cp1252_<n>        str_to_hex on one long accented string
+    generate_star_line_job/<n>   markup parsing in cloudprnt_server
+    render_star_line/<n>         markup parsing in job_renderer
+    raster/<backend>             logo conversion by each CPUtil backend
+    png_receipt/<n>              generate_receipt_png, when available
+
+Receipt fixtures have 20, 100 and 500 lines. The "_logo" variants add a
+header and footer logo, served from a local HTTP server so image fetches
+never leave the machine. Logo and raster cases need CPUtil and are skipped
+without it.
+
+Each case is calibrated so one round lasts about min_time / rounds; the
+reported time is the median per-call time over the rounds.
+
+Usage:
+    bench --site prod.local cloudprnt-benchmark
+    bench --site prod.local cloudprnt-benchmark --filter markup --threshold 0.3
+    bench --site prod.local cloudprnt-benchmark --update-baseline
+"""
+
+import http.server
+import io
+import json
+import os
+import platform
+import statistics
+import tempfile
+import threading
+import time
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+DEFAULT_THRESHOLD = 0.25  # 25% slower than baseline is a regression
+DEFAULT_MIN_TIME = 1.0
+DEFAULT_ROUNDS = 5
+RECEIPT_SIZES = (20, 100, 500)
+BENCH_MAC = "00:11:62:00:00:01"
+
+# Accented cp1252 text as found on French receipts
+CP1252_LINE = "Crème brûlée œuf à la coque – déjà payé € 12,50 "
+
+
+class SkipCase(Exception):
+    """A case cannot run here (missing CPUtil or renderer)"""
+
+
+def make_receipt_markup(lines, logo_url=None):
+    """
+    Representative receipt in Star Document Markup
+
+    :param lines: Number of item lines
+    :param logo_url: Header/footer logo URL (optional)
+    :return: Markup string
+    """
+    parts = []
+    if logo_url:
+        parts.append(f"[image: url {logo_url}; width 100%]")
+    parts += [
+        "[align: centre][magnify: width 2; height 2]Boulangerie Démo[magnify]",
+        "[align: centre]Rue du Marché 12, 1003 Lausanne",
+        "[align: left]Ticket POS-INV-00042 — Caisse 1",
+        "[feed: length 3mm]"
+    ]
+    for i in range(lines):
+        parts.append(f"[column: left: {i + 1:3d} x Croissant beurre n°{i}; right: {(i % 7) * 1.35 + 1.2:7.2f} €]")
+    parts += [
+        "[bold: on]",
+        f"[column: left: TOTAL; right: {lines * 3.1:9.2f} €]",
+        "[bold: off]",
+        "[feed: length 5mm]",
+        "[align: centre]Merci de votre visite !"
+    ]
+    if logo_url:
+        parts.append(f"[image: url {logo_url}; width 60%]")
+    parts.append("[cut: feed; partial]")
+    return "\n".join(parts)
+
+
+def make_logo_png(width=576, height=160):
+    """Deterministic logo PNG (stripes and a frame) as bytes"""
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGBA", (width, height), (255, 255, 255, 0))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle([4, 4, width - 5, height - 5], outline=(0, 0, 0, 255), width=6)
+    for x in range(20, width - 20, 24):
+        draw.line([x, 20, x + 60, height - 20], fill=(40, 40, 40, 255), width=5)
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class LogoServer:
+    """Serves the logo PNG on 127.0.0.1 for the _logo fixtures"""
+
+    def __init__(self, png):
+        png_bytes = png
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(png_bytes)))
+                self.end_headers()
+                self.wfile.write(png_bytes)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/logo.png"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+        return False
+
+
+def _cputil_available():
+    from cloudprnt.cputil_wrapper import is_cputil_available
+    return is_cputil_available()
+
+
+def build_cases(logo_url, logo_path):
+    """
+    Benchmark cases as {name: zero-argument callable}
+
+    Callables raise SkipCase when their backend is missing.
+    """
+    from cloudprnt.print_job import StarCloudPRNTStarLineModeJob
+    from cloudprnt.cloudprnt_server import generate_star_line_job
+    from cloudprnt.job_renderer import render_star_line
+    from cloudprnt import cputil_wrapper, print_job
+
+    cputil = _cputil_available()
+
+    def needs_cputil(fn):
+        def run():
+            if not cputil:
+                raise SkipCase("CPUtil not available")
+            return fn()
+        return run
+
+    cases = {}
+
+    for lines in RECEIPT_SIZES:
+        def job_ops(lines=lines):
+            job = StarCloudPRNTStarLineModeJob({"printerMAC": BENCH_MAC.replace(":", ".")})
+            job.set_text_center_align()
+            job.set_font_magnification(2, 2)
+            job.add_text_line("Boulangerie Démo")
+            job.set_text_left_align()
+            for i in range(lines):
+                if i % 10 == 0:
+                    job.set_text_emphasized()
+                job.add_aligned_text(f"{i + 1:3d} x Croissant n°{i}", f"{i * 1.35:7.2f} €")
+                if i % 10 == 0:
+                    job.cancel_text_emphasized()
+            job.add_barcode(4, 2, True, 40, "POS-INV-00042")
+            job.add_qr_code(1, 4, "https://example.com/r/POS-INV-00042")
+            job.add_new_line(3)
+            job.cut()
+            return job.print_job_builder
+
+        cases[f"job_ops/{lines}"] = job_ops
+
+        text = CP1252_LINE * lines
+        job = StarCloudPRNTStarLineModeJob({"printerMAC": BENCH_MAC.replace(":", ".")})
+        cases[f"str_to_hex/cp1252_{lines}"] = lambda job=job, text=text: job.str_to_hex(text)
+
+        for suffix, url in (("", None), ("_logo", logo_url)):
+            markup = make_receipt_markup(lines, url)
+            job_data = {"test_markup": markup, "printer_mac": BENCH_MAC}
+
+            def parse_server(job_data=job_data):
+                return generate_star_line_job(job_data)
+
+            def parse_renderer(markup=markup):
+                return render_star_line(markup, BENCH_MAC)
+
+            if url:
+                parse_server = needs_cputil(parse_server)
+                parse_renderer = needs_cputil(parse_renderer)
+            cases[f"generate_star_line_job/{lines}{suffix}"] = parse_server
+            cases[f"render_star_line/{lines}{suffix}"] = parse_renderer
+
+            def png_receipt(markup=markup):
+                if not hasattr(print_job, "generate_receipt_png"):
+                    raise SkipCase("generate_receipt_png not available in this version")
+                return print_job.generate_receipt_png(markup, width_pixels=576)
+
+            cases[f"png_receipt/{lines}{suffix}"] = png_receipt
+
+    raster_options = {"printer_width": 3, "dither": True, "scale_to_fit": True}
+    cases["raster/cputil_image_starline"] = needs_cputil(
+        lambda: cputil_wrapper.convert_image_to_starline(logo_path, options=raster_options)
+    )
+    cases["raster/cputil_png_starprnt"] = needs_cputil(
+        lambda: cputil_wrapper.convert_png_to_starprnt(logo_path, options=raster_options)
+    )
+    cases["raster/cputil_markup_starline"] = needs_cputil(
+        lambda: cputil_wrapper.convert_markup_to_starline(make_receipt_markup(20), options=raster_options)
+    )
+
+    return cases
+
+
+def measure(fn, min_time=DEFAULT_MIN_TIME, rounds=DEFAULT_ROUNDS):
+    """
+    Time a callable
+
+    :param fn: Zero-argument callable
+    :param min_time: Total seconds to spend (approximately)
+    :param rounds: Number of timed rounds
+    :return: Dict with median_ms, min_ms, rounds and iterations per round
+    """
+    # Calibrate: the first call also warms caches and imports
+    start = time.perf_counter()
+    fn()
+    single = max(time.perf_counter() - start, 1e-7)
+    iterations = max(1, int(min_time / rounds / single))
+
+    per_call = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        per_call.append((time.perf_counter() - start) / iterations)
+
+    return {
+        "median_ms": round(statistics.median(per_call) * 1000, 4),
+        "min_ms": round(min(per_call) * 1000, 4),
+        "rounds": rounds,
+        "iterations": iterations
+    }
+
+
+def run_benchmarks(name_filter=None, min_time=DEFAULT_MIN_TIME, rounds=DEFAULT_ROUNDS):
+    """
+    Run every case whose name contains `name_filter`
+
+    :return: Dict with environment info, results and skipped cases
+    """
+    png = make_logo_png()
+    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as logo_file:
+        logo_file.write(png)
+
+    results = {}
+    skipped = {}
+    try:
+        with LogoServer(png) as logo_server:
+            for name, fn in build_cases(logo_server.url, logo_file.name).items():
+                if name_filter and name_filter not in name:
+                    continue
+                try:
+                    results[name] = measure(fn, min_time=min_time, rounds=rounds)
+                except SkipCase as e:
+                    skipped[name] = str(e)
+    finally:
+        os.unlink(logo_file.name)
+
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "processor": platform.processor() or None
+        },
+        "results": results,
+        "skipped": skipped
+    }
+
+
+def load_baseline(path=BASELINE_PATH):
+    """Committed baseline results ({} if the file does not exist)"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(run, path=BASELINE_PATH):
+    """Write a run as the new baseline"""
+    with open(path, "w") as f:
+        json.dump(run, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(run, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare a run with the baseline
+
+    :param run: run_benchmarks() result
+    :param baseline: Baseline dict (same shape)
+    :param threshold: Allowed slowdown as a fraction (0.25 = 25%)
+    :return: Dict with regressions, improvements, unchanged and new case names
+    """
+    report = {"regressions": [], "improvements": [], "unchanged": [], "new": []}
+    previous = baseline.get("results", {})
+
+    for name, result in sorted(run["results"].items()):
+        if name not in previous:
+            report["new"].append(name)
+            continue
+        before = previous[name]["median_ms"]
+        after = result["median_ms"]
+        ratio = after / before if before else 1
+        entry = {"case": name, "baseline_ms": before, "current_ms": after, "ratio": round(ratio, 3)}
+        if ratio > 1 + threshold:
+            report["regressions"].append(entry)
+        elif ratio < 1 - threshold:
+            report["improvements"].append(entry)
+        else:
+            report["unchanged"].append(name)
+
+    return report
+
+
+def format_report(run, report):
+    """Human-readable table of a run and its comparison"""
+    ratios = {e["case"]: e["ratio"] for e in report["regressions"] + report["improvements"]}
+    lines = [f"{'case':<40} {'median ms':>12} {'vs baseline':>12}"]
+    for name, result in sorted(run["results"].items()):
+        if name in ratios:
+            versus = f"x{ratios[name]:.2f}"
+        elif name in report["new"]:
+            versus = "new"
+        else:
+            versus = "ok"
+        lines.append(f"{name:<40} {result['median_ms']:>12.4f} {versus:>12}")
+    for name, reason in sorted(run["skipped"].items()):
+        lines.append(f"{name:<40} {'skipped':>12}  {reason}")
+    lines.append(f"{len(report['regressions'])} regression(s), {len(report['improvements'])} improvement(s)")
+    return "\n".join(lines)
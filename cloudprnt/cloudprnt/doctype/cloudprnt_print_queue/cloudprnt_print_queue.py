@@ -7,3 +7,11 @@ from frappe.model.document import Document
 
 class CloudPRNTPrintQueue(Document):
 	pass
+
+
+def on_doctype_update():
+	# Next job, queue position and depth all filter on printer and status, ordered by
+	# sequence (creation plus the priority aging, see cloudprnt.queue_backend)
+	frappe.db.add_index("CloudPRNT Print Queue", ["printer_mac", "status", "sequence"])
+	# Retention sweep (cloudprnt.queue_retention) finds old rows by status and last update
+	frappe.db.add_index("CloudPRNT Print Queue", ["status", "modified"])
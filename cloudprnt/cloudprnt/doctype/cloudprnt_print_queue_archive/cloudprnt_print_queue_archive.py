@@ -0,0 +1,14 @@
+# Copyright (c) 2026, bvisible and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class CloudPRNTPrintQueueArchive(Document):
+	pass
+
+
+def on_doctype_update():
+	# Pruning deletes the oldest rows first
+	frappe.db.add_index("CloudPRNT Print Queue Archive", ["archived_at"])
@@ -166,5 +166,124 @@ frappe.ui.form.on("CloudPRNT Settings", {
             });
             dialog.show();
         });
+
+        frm.add_custom_button(__('Capture Échanges'), function() {
+            const dialog = new frappe.ui.Dialog({
+                title: __('Capture des échanges CloudPRNT'),
+                fields: [
+                    {
+                        label: __('Imprimante'),
+                        fieldname: 'printer',
+                        fieldtype: 'Select',
+                        options: (frm.doc.printers || []).map(p => p.mac_address).join('\n'),
+                        description: __('Adresse MAC (ou saisissez-en une autre ci-dessous)')
+                    },
+                    {
+                        label: __('Autre adresse MAC'),
+                        fieldname: 'mac_address',
+                        fieldtype: 'Data'
+                    },
+                    {
+                        label: __('Durée (minutes)'),
+                        fieldname: 'minutes',
+                        fieldtype: 'Int',
+                        default: 30
+                    },
+                    {
+                        label: __('Nombre d\'échanges conservés'),
+                        fieldname: 'size',
+                        fieldtype: 'Int',
+                        default: 200
+                    },
+                    {
+                        fieldtype: 'HTML',
+                        fieldname: 'capture_status'
+                    }
+                ],
+                primary_action_label: __('Activer'),
+                primary_action: function(values) {
+                    call_capture('cloudprnt.exchange_capture.enable_capture', {
+                        mac_address: get_mac(values),
+                        minutes: values.minutes,
+                        size: values.size
+                    });
+                },
+                secondary_action_label: __('Désactiver'),
+                secondary_action: function() {
+                    call_capture('cloudprnt.exchange_capture.disable_capture', {
+                        mac_address: get_mac(dialog.get_values(true))
+                    });
+                }
+            });
+
+            const get_mac = (values) => values.mac_address || values.printer;
+
+            const call_capture = (method, args) => {
+                if (!args.mac_address) {
+                    frappe.msgprint(__('Sélectionnez une imprimante'));
+                    return;
+                }
+                frappe.call({
+                    method: method,
+                    args: args,
+                    callback: function(r) {
+                        if (r.message && r.message.success) {
+                            refresh_status();
+                        } else {
+                            frappe.msgprint({
+                                title: __('Erreur'),
+                                indicator: 'red',
+                                message: r.message ? r.message.message : __('Erreur inconnue')
+                            });
+                        }
+                    }
+                });
+            };
+
+            const refresh_status = () => {
+                frappe.call({
+                    method: 'cloudprnt.exchange_capture.get_capture_status',
+                    callback: function(r) {
+                        const captures = (r.message && r.message.captures) || [];
+                        let html = '<table class="table table-bordered">';
+                        html += '<thead><tr>';
+                        html += '<th>MAC Address</th>';
+                        html += '<th>' + __('Jusqu\'à') + '</th>';
+                        html += '<th>' + __('Échanges') + '</th>';
+                        html += '<th>Action</th>';
+                        html += '</tr></thead><tbody>';
+
+                        captures.forEach(capture => {
+                            const until = frappe.datetime.str_to_user(
+                                frappe.datetime.get_datetime_as_string(new Date(capture.until * 1000))
+                            );
+                            html += '<tr>';
+                            html += `<td><code>${capture.mac_address}</code></td>`;
+                            html += `<td>${until}</td>`;
+                            html += `<td>${capture.count} / ${capture.size}</td>`;
+                            html += `<td><button class="btn btn-sm btn-default download-capture" data-mac="${capture.mac_address}">${__('Télécharger')}</button></td>`;
+                            html += '</tr>';
+                        });
+
+                        if (captures.length === 0) {
+                            html += `<tr><td colspan="4">${__('Aucune capture active')}</td></tr>`;
+                        }
+                        html += '</tbody></table>';
+
+                        const $wrapper = dialog.fields_dict.capture_status.$wrapper;
+                        $wrapper.html(html);
+                        $wrapper.find('.download-capture').on('click', function() {
+                            window.open(
+                                '/api/method/cloudprnt.exchange_capture.download_capture?mac_address='
+                                + encodeURIComponent($(this).data('mac'))
+                            );
+                        });
+                    }
+                });
+            };
+
+            refresh_status();
+            dialog.show();
+        });
     },
 });
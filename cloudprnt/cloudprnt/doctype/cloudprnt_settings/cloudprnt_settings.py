@@ -19,6 +19,11 @@ class CloudPRNTSettings(Document):
 		if self.footer_logo_url and not self.footer_logo_url.startswith(('http://', 'https://')):
 			frappe.msgprint("L'URL du logo de pied de page doit commencer par http:// ou https://")
 
+	def on_update(self):
+		"""Printer pools may have changed"""
+		from cloudprnt.printer_pools import clear_pool_map
+		clear_pool_map()
+
 @frappe.whitelist()
 def get_settings():
 	"""Return CloudPRNT settings as a dict"""
@@ -125,24 +130,19 @@ def test_print(printer, test_text="Test d'impression CloudPRNT", image_link=None
 			# Image job - use Star Line Mode media type (same as text jobs)
 			test_job_token = f"TEST-IMG-{datetime.now().strftime('%Y%m%d%H%M%S')}"
 
-			from cloudprnt.print_queue_manager import add_job_to_queue
-
-			result = add_job_to_queue(
-				job_token=test_job_token,
-				printer_mac=mac_address,
-				invoice_name=None,
-				job_data=image_hex,
-				media_types=["application/vnd.star.line"]
-			)
+			from cloudprnt.print_queue_manager import add_jobs_to_queue
 
-			if not result.get("success"):
-				return result
-
-			frappe.logger().info(f"Test image print job added to queue: {test_job_token} for {mac_address}")
+			jobs = [{
+				"job_token": test_job_token,
+				"printer_mac": mac_address,
+				"job_data": image_hex,
+				"media_types": ["application/vnd.star.line"],
+				"priority": "test"
+			}]
 
 			# If there's also text, print it separately
 			if test_text and test_text.strip():
-				# Add a small delay by creating second job
+				# Second job, queued in the same transaction behind the image
 				test_job_token_text = f"TEST-TXT-{datetime.now().strftime('%Y%m%d%H%M%S')}"
 				current_time = datetime.now().strftime("%d-%m-%Y %H:%M:%S")
 
@@ -159,19 +159,26 @@ MAC: {mac_address}
 
 [cut: feed; partial]"""
 
-				add_job_to_queue(
-					job_token=test_job_token_text,
-					printer_mac=mac_address,
-					invoice_name=None,
-					job_data=test_markup,
-					media_types=["application/vnd.star.line", "text/vnd.star.markup"]
-				)
+				jobs.append({
+					"job_token": test_job_token_text,
+					"printer_mac": mac_address,
+					"job_data": test_markup,
+					"media_types": ["application/vnd.star.line", "text/vnd.star.markup"],
+					"priority": "test"
+				})
+
+			result = add_jobs_to_queue(jobs)
+
+			if not result.get("success"):
+				return result
+
+			frappe.logger().info(f"Test image print job added to queue: {test_job_token} for {mac_address}")
 
 			return {
 				"success": True,
 				"message": f"Test d'impression (image + texte) envoyé à la queue",
 				"job_token": test_job_token,
-				"queue_position": result.get("queue_position", 1)
+				"queue_position": result["jobs"][0]["queue_position"]
 			}
 
 		# Text only - original behavior
@@ -201,7 +208,8 @@ MAC: {mac_address}
 			printer_mac=mac_address,
 			invoice_name=None,  # No invoice for test
 			job_data=test_markup,  # Custom markup for test
-			media_types=["application/vnd.star.line", "text/vnd.star.markup"]
+			media_types=["application/vnd.star.line", "text/vnd.star.markup"],
+			priority="test"  # Served after POS receipts
 		)
 
 		if not result.get("success"):
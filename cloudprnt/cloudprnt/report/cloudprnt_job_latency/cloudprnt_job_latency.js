@@ -0,0 +1,39 @@
+// Copyright (c) 2026, bvisible and contributors
+// For license information, please see license.txt
+
+frappe.query_reports["CloudPRNT Job Latency"] = {
+	filters: [
+		{
+			fieldname: "from_date",
+			label: __("From Date"),
+			fieldtype: "Date",
+			default: frappe.datetime.add_days(frappe.datetime.get_today(), -7),
+			reqd: 1
+		},
+		{
+			fieldname: "to_date",
+			label: __("To Date"),
+			fieldtype: "Date",
+			default: frappe.datetime.get_today(),
+			reqd: 1
+		},
+		{
+			fieldname: "group_by",
+			label: __("Group By"),
+			fieldtype: "Select",
+			options: "Printer\nStore",
+			default: "Printer",
+			reqd: 1
+		},
+		{
+			fieldname: "printer_mac",
+			label: __("Printer MAC"),
+			fieldtype: "Data"
+		},
+		{
+			fieldname: "store",
+			label: __("Store"),
+			fieldtype: "Data"
+		}
+	]
+};
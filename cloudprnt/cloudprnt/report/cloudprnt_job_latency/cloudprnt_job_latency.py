@@ -0,0 +1,114 @@
+# Copyright (c) 2026, bvisible and contributors
+# For license information, please see license.txt
+
+"""
+CloudPRNT Job Latency
+=====================
+
+p50/p95/p99 of each print job stage per printer or per store, from the
+CloudPRNT Job History table:
+
+- Offer: enqueued -> first poll offering the job
+- Fetch: enqueued -> first GET /job
+- Render: render duration
+- Total: enqueued -> confirmed by DELETE /job (click to paper)
+"""
+
+import math
+
+import frappe
+from frappe import _
+
+PERCENTILES = (50, 95, 99)
+
+# (key, label) of each measured stage
+STAGES = (
+	("offer_ms", "Offer"),
+	("fetch_ms", "Fetch"),
+	("render_ms", "Render"),
+	("total_ms", "Total"),
+)
+
+
+def execute(filters=None):
+	filters = frappe._dict(filters or {})
+	return get_columns(filters), get_data(filters)
+
+
+def get_columns(filters):
+	group_label = _("Store") if filters.group_by == "Store" else _("Printer MAC")
+	columns = [
+		{"fieldname": "group", "label": group_label, "fieldtype": "Data", "width": 160},
+		{"fieldname": "jobs", "label": _("Jobs"), "fieldtype": "Int", "width": 80},
+		{"fieldname": "confirmed", "label": _("Confirmed"), "fieldtype": "Int", "width": 90},
+	]
+	for key, label in STAGES:
+		for p in PERCENTILES:
+			columns.append({
+				"fieldname": f"{key}_p{p}",
+				"label": f"{_(label)} p{p} (ms)",
+				"fieldtype": "Float",
+				"precision": 1,
+				"width": 120
+			})
+	return columns
+
+
+def get_data(filters):
+	conditions = ["enqueued_at >= %(from_date)s", "enqueued_at < DATE_ADD(%(to_date)s, INTERVAL 1 DAY)"]
+	if filters.printer_mac:
+		conditions.append("printer_mac = %(printer_mac)s")
+		filters.printer_mac = filters.printer_mac.upper()
+	if filters.store:
+		conditions.append("store = %(store)s")
+
+	rows = frappe.db.sql(f"""
+		SELECT
+			printer_mac,
+			store,
+			TIMESTAMPDIFF(MICROSECOND, enqueued_at, first_offered_at) / 1000 AS offer_ms,
+			TIMESTAMPDIFF(MICROSECOND, enqueued_at, fetched_at) / 1000 AS fetch_ms,
+			render_ms,
+			total_ms
+		FROM `tabCloudPRNT Job History`
+		WHERE {" AND ".join(conditions)}
+	""", filters, as_dict=True)
+
+	group_field = "store" if filters.group_by == "Store" else "printer_mac"
+	groups = {}
+	for row in rows:
+		groups.setdefault(row[group_field] or _("Unknown"), []).append(row)
+
+	data = []
+	for group, group_rows in sorted(groups.items()):
+		entry = {
+			"group": group,
+			"jobs": len(group_rows),
+			"confirmed": sum(1 for row in group_rows if row.total_ms is not None)
+		}
+		for key, _label in STAGES:
+			values = sorted(float(row[key]) for row in group_rows if row[key] is not None)
+			for p in PERCENTILES:
+				entry[f"{key}_p{p}"] = percentile(values, p)
+		data.append(entry)
+
+	return data
+
+
+def percentile(sorted_values, p):
+	"""
+	Percentile with linear interpolation between closest ranks
+
+	:param sorted_values: Ascending list of numbers
+	:param p: Percentile (0-100)
+	:return: Value, or None for an empty list
+	"""
+	if not sorted_values:
+		return None
+
+	rank = (len(sorted_values) - 1) * p / 100
+	low = math.floor(rank)
+	high = math.ceil(rank)
+	if low == high:
+		return sorted_values[low]
+	return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
@@ -17,23 +17,30 @@ import re
 from datetime import datetime
 from cloudprnt.print_job import StarCloudPRNTStarLineModeJob
 from cloudprnt.pos_invoice_markup import get_pos_invoice_markup
+from cloudprnt import exchange_capture, structured_log
+from cloudprnt.job_history import record_fetched
+from cloudprnt.job_renderer import is_hex_job
+from cloudprnt.payload_store import load_job_data
+from cloudprnt.printer_pools import dispatch_pool_job
+from cloudprnt.queue_backend import get_backend
+
+# Logs through Frappe's handlers; per-MAC verbosity is read from Redis
+log = structured_log.get_logger("cloudprnt.server")
+structured_log.enable_auto_refresh()
 
 # ============================================================================
-# PRINT QUEUE - In-memory storage
+# PRINT QUEUE
 # ============================================================================
-# Structure: {
-#     "00:11:62:12:34:56": [
-#         {
-#             "token": "POS-INV-001",
-#             "invoice": "POS-INV-001",
-#             "printer_mac": "00:11:62:12:34:56",
-#             "timestamp": "2025-01-01 12:00:00",
-#             "status": "pending",
-#             "media_types": ["image/png", "application/vnd.star.line", "text/vnd.star.markup"]
-#         }
-#     ]
-# }
-PRINT_QUEUE = {}
+# Jobs live in the shared queue backend (cloudprnt.queue_backend), chosen by
+# site_config cloudprnt_queue_backend. Job dicts:
+#     {
+#         "name": "a1b2c3d4e5",
+#         "token": "POS-INV-001",
+#         "invoice": "POS-INV-001",
+#         "job_data": None,  # markup or pre-converted hex, None for invoices
+#         "media_types": ["image/png", "application/vnd.star.line", "text/vnd.star.markup"],
+#         "printer_mac": "00:11:62:12:34:56"
+#     }
 
 # ============================================================================
 # UTILITY FUNCTIONS
@@ -270,60 +277,48 @@ def create_print_log(invoice_name):
 @frappe.whitelist(allow_guest=True, methods=['POST', 'GET'])
 def cloudprnt_debug():
     """
-    DEBUG Endpoint - Log everything the printer sends
+    DEBUG Endpoint - Capture everything the printer sends
+
+    The exchange goes to the printer's bounded Redis ring buffer, which is
+    downloaded from CloudPRNT Settings. Requests to this endpoint are
+    always captured; the regular endpoints only while capture is enabled
+    for the printer.
     """
-    import json
-    from datetime import datetime
+    data = frappe.request.get_json(force=True, silent=True) or {}
+    printer_mac = (
+        frappe.request.args.get("mac")
+        or (data.get("printerMAC") if isinstance(data, dict) else None)
+        or "unknown"
+    )
+
+    response = {
+        "jobReady": False,
+        "debug": "Logged successfully",
+        "mediaTypes": ["image/png", "application/vnd.star.line", "text/vnd.star.markup"]
+    }
 
-    # Log to file as well to bypass any Frappe filtering
     try:
-        log_file = "/tmp/cloudprnt_debug.log"
-        with open(log_file, "a") as f:
-            f.write("\n" + "=" * 80 + "\n")
-            f.write(f"Timestamp: {datetime.now()}\n")
-            f.write(f"Remote IP: {frappe.request.remote_addr}\n")
-            f.write(f"X-Forwarded-For: {frappe.request.headers.get('X-Forwarded-For', 'N/A')}\n")
-            f.write(f"Headers: {dict(frappe.request.headers)}\n")
-            f.write(f"Method: {frappe.request.method}\n")
-            f.write(f"URL: {frappe.request.url}\n")
-            f.write(f"Query String: {frappe.request.query_string}\n")
-            f.write(f"Form Dict: {frappe.form_dict}\n")
-            try:
-                data = frappe.request.get_json(force=True, silent=True)
-                f.write(f"JSON Data: {data}\n")
-            except Exception as e:
-                f.write(f"JSON Parse Error: {e}\n")
-            if frappe.request.data:
-                f.write(f"Raw Data: {frappe.request.data}\n")
-            f.write("=" * 80 + "\n")
+        exchange_capture.store_exchange(
+            exchange_capture.normalize_mac(printer_mac),
+            exchange_capture.build_entry(get_request_entry(), {"status": 200, "body": json.dumps(response)}),
+            size=exchange_capture.DEFAULT_SIZE
+        )
     except Exception as e:
-        frappe.logger().error(f"File logging error: {e}")
+        log.warning("capture_failed", mac=printer_mac, error=str(e))
 
-    frappe.logger().error("=" * 80)
-    frappe.logger().error("🔍 DEBUG CloudPRNT Request")
-    frappe.logger().error(f"Remote IP: {frappe.request.remote_addr}")
-    frappe.logger().error(f"Headers: {dict(frappe.request.headers)}")
-    frappe.logger().error(f"Method: {frappe.request.method}")
-    frappe.logger().error(f"URL: {frappe.request.url}")
-    frappe.logger().error(f"Query String: {frappe.request.query_string}")
-    frappe.logger().error(f"Form Dict: {frappe.form_dict}")
-
-    try:
-        data = frappe.request.get_json(force=True, silent=True)
-        frappe.logger().error(f"JSON Data: {data}")
-    except:
-        frappe.logger().error("No JSON data")
+    frappe.response.update(response)
 
-    if frappe.request.data:
-        frappe.logger().error(f"Raw Data: {frappe.request.data}")
 
-    frappe.logger().error("=" * 80)
-
-    frappe.response.update({
-        "jobReady": False,
-        "debug": "Logged successfully",
-        "mediaTypes": ["image/png", "application/vnd.star.line", "text/vnd.star.markup"]
-    })
+def get_request_entry():
+    """Current request as an exchange capture entry"""
+    return {
+        "method": frappe.request.method,
+        "path": frappe.request.path,
+        "query": frappe.request.query_string.decode("latin-1"),
+        "client": frappe.request.remote_addr,
+        "headers": dict(frappe.request.headers),
+        "body": frappe.request.get_data()
+    }
 
 @frappe.whitelist(allow_guest=True)
 def cloudprnt_poll():
@@ -348,9 +343,6 @@ def cloudprnt_poll():
         "jobToken": "unique-job-id"  // if jobReady=true
     }
     """
-    # Add logging to see ALL requests
-    frappe.logger().error(f"📥 cloudprnt_poll called from {frappe.request.remote_addr}")
-
     try:
         # Parse JSON body - handle both application/json and other content types
         data = None
@@ -386,10 +378,13 @@ def cloudprnt_poll():
         printer_mac = normalize_mac_address(printer_mac_dots)
 
         if not printer_mac:
-            frappe.log_error(f"Invalid MAC address: {printer_mac_dots}", "cloudprnt_poll")
+            # Rate limited: a misconfigured printer must not flood the Error Log
+            log.warning("invalid_mac", ip=frappe.request.remote_addr, printer_mac=printer_mac_dots)
             frappe.response.update({"jobReady": False})
             return
 
+        log.debug("poll", mac=printer_mac, ip=frappe.request.remote_addr, status=status_code)
+
         # Track for discovery (helps auto-detect new printers)
         try:
             from cloudprnt.printer_discovery import track_printer_poll
@@ -401,7 +396,7 @@ def cloudprnt_poll():
             )
         except Exception as e:
             # Don't fail if discovery tracking fails
-            frappe.logger().debug(f"Discovery tracking failed: {str(e)}")
+            log.debug("discovery_tracking_failed", mac=printer_mac, error=str(e))
 
         # Update printer status
         update_printer_status(
@@ -410,12 +405,17 @@ def cloudprnt_poll():
             printing_in_progress=printing_in_progress
         )
 
-        # Check for jobs in queue
-        if printer_mac in PRINT_QUEUE and len(PRINT_QUEUE[printer_mac]) > 0:
-            # Get first job
-            job = PRINT_QUEUE[printer_mac][0]
+        # Printer pools: take a pooled job if this printer is the least busy member
+        try:
+            dispatch_pool_job(printer_mac, printing_in_progress=printing_in_progress, status_code=status_code)
+        except Exception as e:
+            frappe.db.rollback()
+            log.warning("pool_dispatch_failed", mac=printer_mac, error=str(e))
 
-            frappe.logger().info(f"Job ready for printer {printer_mac}: {job['token']}")
+        # Check for jobs in queue
+        job = get_backend().peek(printer_mac)
+        if job:
+            log.info("job_ready", mac=printer_mac, token=job["token"])
 
             frappe.response.update({
                 "jobReady": True,
@@ -429,6 +429,13 @@ def cloudprnt_poll():
                 "mediaTypes": ["image/png", "application/vnd.star.line", "text/vnd.star.markup"]
             })
 
+        # No Redis access unless capture is enabled for this printer
+        exchange_capture.record_exchange(
+            printer_mac,
+            get_request_entry(),
+            {"status": 200, "body": json.dumps({k: frappe.response.get(k) for k in ("jobReady", "mediaTypes", "jobToken")})}
+        )
+
     except Exception as e:
         frappe.log_error(f"Error in cloudprnt_poll: {str(e)}", "cloudprnt_poll")
         frappe.response.update({"jobReady": False})
@@ -467,13 +474,11 @@ def cloudprnt_job():
             frappe.response['http_status_code'] = 400
             return "Missing parameters"
 
-        # Find job in queue
-        job = None
-        if printer_mac in PRINT_QUEUE:
-            for q_job in PRINT_QUEUE[printer_mac]:
-                if q_job["token"] == job_token:
-                    job = q_job
-                    break
+        # Hand the job to the printer (Pending -> Fetched)
+        job = get_backend().claim(printer_mac, job_token)
+        if job:
+            record_fetched(job["token"])
+        frappe.db.commit()
 
         if not job:
             frappe.log_error(
@@ -483,7 +488,14 @@ def cloudprnt_job():
             frappe.response['http_status_code'] = 404
             return "Job not found"
 
-        frappe.logger().info(f"Fetching job {job_token} for printer {printer_mac} (type: {media_type})")
+        log.info("job_requested", mac=printer_mac, token=job_token, media_type=media_type)
+
+        # Payloads queued through print_queue_manager are in the payload store
+        job["job_data"] = load_job_data(job)
+        hex_job = is_hex_job(job.get("job_data"))
+        if job.get("job_data") and not hex_job:
+            # Test and custom markup jobs carry their markup
+            job["test_markup"] = job["job_data"]
 
         # Generate content based on media type
         if media_type == "image/png":
@@ -502,8 +514,8 @@ def cloudprnt_job():
             frappe.response['content_type'] = 'image/png'
 
         elif media_type == "application/vnd.star.line":
-            # Generate Star Line Mode hex
-            hex_content = generate_star_line_job(job)
+            # Pre-converted hex is sent as-is, markup is converted to Star Line Mode
+            hex_content = job["job_data"] if hex_job else generate_star_line_job(job)
 
             # Convert hex to binary
             binary_content = bytes.fromhex(hex_content)
@@ -534,12 +546,7 @@ def cloudprnt_job():
         # Create print log
         create_print_log(job["invoice"])
 
-        # Remove job from queue
-        PRINT_QUEUE[printer_mac].remove(job)
-        if len(PRINT_QUEUE[printer_mac]) == 0:
-            del PRINT_QUEUE[printer_mac]
-
-        frappe.logger().info(f"Job {job_token} sent successfully")
+        log.info("job_sent", mac=printer_mac, token=job_token)
 
     except Exception as e:
         frappe.log_error(f"Error in cloudprnt_job: {str(e)}", "cloudprnt_job")
@@ -581,9 +588,12 @@ def cloudprnt_delete():
         # Normalize MAC
         printer_mac = normalize_mac_address(printer_mac_dots)
 
-        frappe.logger().info(
-            f"Print confirmation: printer={printer_mac}, token={job_token}, status={status_code}"
-        )
+        log.info("job_confirmed", mac=printer_mac, token=job_token, status=status_code)
+
+        # Printed: remove from queue and record the confirmation
+        if job_token:
+            from cloudprnt.print_queue_manager import mark_job_printed
+            mark_job_printed(job_token, status_code)
 
         # Update printer status
         if printer_mac:
@@ -695,25 +705,35 @@ def add_print_job(invoice_name, printer_mac=None):
 
 
 @frappe.whitelist()
-def get_queue_status(printer_mac=None):
+def get_queue_status(printer_mac=None, status=None, priority=None, after=None, limit=None, etag=None):
     """
-    Get queue status for debugging
+    Get queue status: job counts per printer and one page of jobs
 
-    :param printer_mac: Optional MAC address to filter
-    :return: Queue status dict
+    See print_queue_manager.get_queue_status for the filters, the cursor
+    and the etag.
+
+    :param printer_mac: Optional MAC address to filter (dots or colons)
+    :return: Queue status dict, plus total_printers and queues (pending
+        jobs per printer)
     """
     try:
+        from cloudprnt import print_queue_manager
+
         if printer_mac:
             printer_mac = normalize_mac_address(printer_mac)
-            return {
-                "printer_mac": printer_mac,
-                "jobs": PRINT_QUEUE.get(printer_mac, [])
-            }
-        else:
-            return {
-                "total_printers": len(PRINT_QUEUE),
-                "queues": PRINT_QUEUE
+            if not printer_mac:
+                return {"error": "Invalid MAC address"}
+        result = print_queue_manager.get_queue_status(
+            printer_mac, status=status, priority=priority, after=after, limit=limit, etag=etag
+        )
+        if "printers" in result:
+            result["queues"] = {
+                mac: summary["counts"]["Pending"]
+                for mac, summary in result["printers"].items()
+                if summary["counts"].get("Pending")
             }
+            result["total_printers"] = len(result["printers"])
+        return result
     except Exception as e:
         return {"error": str(e)}
 
@@ -727,15 +747,22 @@ def clear_queue(printer_mac=None):
     :return: Success message
     """
     try:
+        from cloudprnt.print_queue_manager import clear_idempotency_keys
+
         if printer_mac:
             printer_mac = normalize_mac_address(printer_mac)
-            if printer_mac in PRINT_QUEUE:
-                del PRINT_QUEUE[printer_mac]
+            # Any status: stuck Fetched jobs are what this endpoint is for
+            if printer_mac in get_backend().summary(printer_mac):
+                get_backend().clear(printer_mac)
+                frappe.db.commit()
+                clear_idempotency_keys(printer_mac)
                 return {"success": True, "message": f"Queue cleared for {printer_mac}"}
             else:
                 return {"success": False, "message": "Printer not in queue"}
         else:
-            PRINT_QUEUE.clear()
+            get_backend().clear()
+            frappe.db.commit()
+            clear_idempotency_keys()
             return {"success": True, "message": "All queues cleared"}
     except Exception as e:
         return {"success": False, "message": str(e)}
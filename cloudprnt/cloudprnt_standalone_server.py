@@ -18,13 +18,16 @@ Usage:
   cd frappe-bench && python3 apps/cloudprnt/cloudprnt/cloudprnt_standalone_server.py
 """
 
+import asyncio
 import os
 import sys
-import re
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime
 from typing import Optional
 from fastapi import FastAPI, Request, Response, Query
-from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+import redis
 import uvicorn
 
 # Add Frappe bench to path if needed
@@ -34,45 +37,223 @@ else:
     bench_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
 
 sys.path.insert(0, bench_path)
-# Add cloudprnt app directory so modules can be imported
+# Put the app root first so "cloudprnt" resolves to the app package. When this
+# file runs as a script, its own directory is on sys.path and would otherwise
+# shadow it with the cloudprnt/cloudprnt module folder.
 cloudprnt_path = os.path.join(bench_path, "apps", "cloudprnt", "cloudprnt")
-if cloudprnt_path not in sys.path:
-    sys.path.insert(0, cloudprnt_path)
+cloudprnt_app_path = os.path.dirname(cloudprnt_path)
+if cloudprnt_app_path in sys.path:
+    sys.path.remove(cloudprnt_app_path)
+sys.path.insert(0, cloudprnt_app_path)
 
 os.chdir(bench_path)
 
-# Frappe will be initialized per-request to avoid connection issues
 import frappe
+from cloudprnt import exchange_capture, metrics, queue_backend, structured_log, traffic_trace
+from cloudprnt.frappe_context import FrappeContextPool
+# Renderer modules are imported once here, never per request
+from cloudprnt.job_renderer import get_job_markup, get_render_profile, is_hex_job
+from cloudprnt.job_history import OFFERED_SQL, FETCHED_SQL, RENDERED_SQL, CONFIRMED_SQL
+from cloudprnt.render_pool import RenderPool, RenderTimeout
+from cloudprnt.render_coalescer import RenderCoalescer
+from cloudprnt.render_prefetcher import RenderPrefetcher
+from cloudprnt.job_spool import JobSpool, RangeNotSatisfiable, iter_file, parse_range
+from cloudprnt.payload_store import PayloadStore
+from cloudprnt.printer_pools import dispatch_pool_job
+from cloudprnt.printer_watchdog import POLL_STATUS_SQL
+
+SITE_NAME = "prod.local"
+
+log = structured_log.get_logger("cloudprnt.standalone")
+
+# Per-process metric files, merged on every /metrics scrape
+METRICS_DIR = os.path.join(bench_path, "sites", SITE_NAME, "private", "cloudprnt_metrics")
+METRICS_FLUSH_INTERVAL = 5  # seconds
+
+# Metric label sets, built once
+DB_NEXT_JOB = (("query", "next_job"),)
+DB_CLAIM_JOB = (("query", "claim_job"),)
+DB_DELETE_JOB = (("query", "delete_job"),)
+DB_QUEUE_DEPTH = (("query", "queue_depth"),)
+DB_HISTORY = (("query", "job_history"),)
+DB_PRINTER_STATUS = (("query", "printer_status"),)
+SPOOL_HIT = (("cache", "spool"), ("result", "hit"))
+SPOOL_MISS = (("cache", "spool"), ("result", "miss"))
+
+# Frappe is initialised once per pool thread, never on the request path
+frappe_pool = FrappeContextPool(
+    SITE_NAME,
+    os.path.join(bench_path, "sites"),
+    observer=lambda fn, seconds: metrics.observe(
+        "cloudprnt_frappe_call_duration_seconds", seconds, (("function", fn.__name__),)
+    )
+)
 
-app = FastAPI(title="CloudPRNT Standalone Server", version="1.0.0")
+# CPU-bound rendering runs in worker processes, off the event loop
+render_pool = RenderPool(SITE_NAME, os.path.join(bench_path, "sites"), metrics_dir=METRICS_DIR)
 
-# Global variables for queue (will be populated from Redis)
-PRINT_QUEUE = {}
+# Printer retries of the same GET share one render, across workers via Redis
+render_coalescer = RenderCoalescer(frappe_pool.run)
 
-# Cache site config to avoid opening file on every request
-SITE_CONFIG_CACHE = None
-SITE_CONFIG_LAST_LOADED = 0
+# Positive polls start rendering before the printer's GET arrives
+render_prefetcher = RenderPrefetcher(render_coalescer)
+
+# Payloads are streamed to printers from spool files, never held in memory
+SPOOL_PURGE_INTERVAL = 3600  # seconds between purges of unconfirmed spool files
+job_spool = JobSpool(os.path.join(bench_path, "sites", SITE_NAME, "private", "cloudprnt_spool"))
+
+# Content-addressed job payloads referenced by the queue (see cloudprnt.payload_store)
+payload_store = PayloadStore(os.path.join(bench_path, "sites", SITE_NAME, "private", "cloudprnt_payloads"))
+
+# Media type each printer last requested on GET /job, used to predict the next one
+LAST_MEDIA_TYPES = {}
+
+# Tokens whose first offer is already recorded in the job history
+OFFERED_TOKENS = set()
+MAX_OFFERED_TOKENS = 10000
+# Fire-and-forget writes (job history, printer status, exchange capture) still running
+BACKGROUND_TASKS = set()
+
+# Printer status is written on a change, else at most every POLL_STATUS_INTERVAL
+# seconds per printer: {printer_mac: (written at, (status_code, printing))}
+POLL_STATUS_INTERVAL = 10
+POLL_STATUS_WRITES = {}
+# now_datetime().timestamp() - time.time(): last_activity is on the site's clock
+LAST_ACTIVITY_OFFSET = 0.0
+
+
+def collect_pool_metrics():
+    """Copy render pool, coalescer and prefetch counters into the metrics registry"""
+    pool = render_pool.stats()
+    metrics.set_gauge("cloudprnt_render_pool_in_flight", pool["in_flight"])
+    metrics.set_gauge("cloudprnt_render_pool_queue_depth", pool["queue_depth"])
+    metrics.set_counter("cloudprnt_render_pool_recycled_total", pool["recycled"])
 
+    coalescer = render_coalescer.stats()
+    shared = coalescer["local_joins"] + coalescer["remote_joins"] + coalescer["handoff_hits"]
+    metrics.set_counter("cloudprnt_cache_requests_total", shared,
+                        (("cache", "render_handoff"), ("result", "hit")))
+    metrics.set_counter("cloudprnt_cache_requests_total", coalescer["renders"],
+                        (("cache", "render_handoff"), ("result", "miss")))
 
-def init_frappe():
-    """Initialize Frappe connection for this request"""
-    if not hasattr(frappe.local, 'site') or not frappe.local.site:
-        sites_path = os.path.join(bench_path, "sites")
+    metrics.set_counter("cloudprnt_cache_requests_total", render_prefetcher.hits,
+                        (("cache", "prefetch"), ("result", "hit")))
+    metrics.set_counter("cloudprnt_cache_requests_total", render_prefetcher.misses,
+                        (("cache", "prefetch"), ("result", "miss")))
 
-        # Disable logging during init to avoid issues
-        import logging
-        old_level = logging.root.level
-        logging.disable(logging.CRITICAL)
 
+metrics.register_collector(collect_pool_metrics)
+
+
+async def flush_metrics_periodically():
+    """Publish this worker's samples for /metrics scrapes served by other workers"""
+    while True:
+        await asyncio.sleep(METRICS_FLUSH_INTERVAL)
         try:
-            frappe.init(site="prod.local", sites_path=sites_path)
-            frappe.connect()
-            frappe.set_user("Administrator")
+            await asyncio.to_thread(metrics.flush)
         except Exception as e:
-            # Silently handle errors - connection still works for database queries
-            pass
-        finally:
-            logging.disable(old_level)
+            log.warning("metrics_flush_failed", error=str(e))
+
+
+async def purge_spool_periodically():
+    """Remove spool files of jobs never confirmed, at start-up and then hourly"""
+    while True:
+        try:
+            removed = await asyncio.to_thread(job_spool.purge_stale)
+            if removed:
+                log.info("spool_purged", files=removed)
+        except Exception as e:
+            log.warning("spool_purge_failed", error=str(e))
+        await asyncio.sleep(SPOOL_PURGE_INTERVAL)
+
+
+async def refresh_overrides_periodically():
+    """Pick up per-printer log levels and captures set from the Frappe side"""
+    while True:
+        try:
+            await frappe_pool.run(structured_log.refresh_overrides)
+            await frappe_pool.run(exchange_capture.refresh_enabled)
+        except Exception as e:
+            log.warning("overrides_refresh_failed", error=str(e))
+        await asyncio.sleep(structured_log.OVERRIDES_REFRESH_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Initialise Frappe and the render workers once for this worker"""
+    global LAST_ACTIVITY_OFFSET
+    frappe_pool.start()
+    # Fail fast if the site cannot be initialised
+    await frappe_pool.run(lambda: frappe.local.site)
+    LAST_ACTIVITY_OFFSET = await frappe_pool.run(lambda: frappe.utils.now_datetime().timestamp() - time.time())
+
+    site_config = get_site_config()
+    structured_log.configure_from_site_config(site_config)
+    overrides_task = asyncio.create_task(refresh_overrides_periodically())
+
+    render_pool.metrics_dir = site_config.get("cloudprnt_metrics_dir") or render_pool.metrics_dir
+    metrics.configure(render_pool.metrics_dir)
+    metrics.remove_dead_processes()
+    flush_task = asyncio.create_task(flush_metrics_periodically())
+
+    render_pool.workers = int(site_config.get("cloudprnt_render_workers", render_pool.workers))
+    render_pool.timeout = float(site_config.get("cloudprnt_render_timeout", render_pool.timeout))
+    await render_pool.warm_up()
+    # Keep the lock until the render deadline has passed
+    render_coalescer.lock_ttl = render_pool.timeout + 5
+    redis_cache = get_common_site_config().get("redis_cache")
+    if redis_cache:
+        # Retries waiting on another worker's render poll Redis from plain
+        # threads instead of holding Frappe context pool slots
+        render_coalescer.client = redis.Redis.from_url(redis_cache)
+        render_coalescer.prefix = site_config.get("db_name")
+        render_coalescer.run_in_context = asyncio.to_thread
+    render_prefetcher.budget = int(site_config.get("cloudprnt_prefetch_budget", render_prefetcher.budget))
+    job_spool.directory = site_config.get("cloudprnt_spool_dir") or job_spool.directory
+    payload_store.directory = site_config.get("cloudprnt_payload_dir") or payload_store.directory
+    purge_task = asyncio.create_task(purge_spool_periodically())
+    trace_path = traffic_trace.start_from_site_config(site_config)
+    if trace_path:
+        log.info("trace_recording", path=trace_path)
+
+    yield
+
+    traffic_trace.stop_recording()
+
+    flush_task.cancel()
+    overrides_task.cancel()
+    purge_task.cancel()
+    metrics.flush()
+    render_pool.shutdown()
+    frappe_pool.shutdown()
+    structured_log.shutdown()
+
+
+app = FastAPI(title="CloudPRNT Standalone Server", version="1.0.0", lifespan=lifespan)
+
+
+def classify_endpoint(method, path):
+    """Metric label of a CloudPRNT request, None for other routes"""
+    if path not in ("/", "/poll", "/job"):
+        return None
+    return {"POST": "poll", "GET": "job", "DELETE": "delete"}.get(method)
+
+
+# Latency histograms for poll/job/delete
+app.add_middleware(metrics.MetricsMiddleware, classify=classify_endpoint)
+
+# Raw exchanges of printers with capture enabled (CloudPRNT Settings)
+app.add_middleware(exchange_capture.CaptureMiddleware, store=lambda mac, entry: capture_exchange(mac, entry))
+
+# Anonymized traffic trace for replay on staging (site_config cloudprnt_trace_dir)
+app.add_middleware(traffic_trace.TraceMiddleware)
+
+# Print queue backend, built from the site config on first use
+QUEUE = None
+
+# Cache site config to avoid opening file on every request
+SITE_CONFIG_CACHE = None
+SITE_CONFIG_LAST_LOADED = 0
 
 
 def normalize_mac_address(mac_address):
@@ -100,7 +281,7 @@ def get_site_config():
     now = time.time()
     # Reload config every 60 seconds
     if SITE_CONFIG_CACHE is None or (now - SITE_CONFIG_LAST_LOADED) > 60:
-        site_config_path = os.path.join(bench_path, "sites", "prod.local", "site_config.json")
+        site_config_path = os.path.join(bench_path, "sites", SITE_NAME, "site_config.json")
         with open(site_config_path, 'r') as f:
             SITE_CONFIG_CACHE = json.load(f)
         SITE_CONFIG_LAST_LOADED = now
@@ -108,25 +289,69 @@ def get_site_config():
     return SITE_CONFIG_CACHE
 
 
-def get_next_job_for_printer(printer_mac):
+def get_common_site_config():
+    """Bench-wide config (redis_cache, redis_queue), read once"""
+    import json
+
+    path = os.path.join(bench_path, "sites", "common_site_config.json")
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def get_queue():
     """
-    Get next job for printer from database queue using raw MySQL
+    Queue backend chosen by site_config cloudprnt_queue_backend
+
+    Database queue calls use their own pymysql connection, Redis calls a
+    plain redis client: neither needs a Frappe context.
+    """
+    global QUEUE
+    if QUEUE is None:
+        site_config = get_site_config()
+        QUEUE = queue_backend.make_backend(
+            site_config,
+            redis_url=get_common_site_config().get("redis_queue"),
+            session=queue_backend.PyMySQLSession(site_config)
+        )
+        log.info("queue_backend", backend=QUEUE.name)
+    return QUEUE
+
 
-    :param printer_mac: Printer MAC address
-    :return: Job dict or None
+def queue_call(label, method, *args):
+    """
+    Run a queue backend call, timed under the given label
+
+    :param label: Metric label set
+    :param method: Name of the QueueBackend method
+    :return: The call's result, or None if it failed
     """
     try:
-        import json
-        import pymysql
+        with metrics.timer("cloudprnt_db_query_duration_seconds", label):
+            return getattr(get_queue(), method)(*args)
+    except Exception as e:
+        # Log the error instead of silently failing
+        log.exception("queue_call_failed", method=method, args=args, error=str(e))
+        return None
 
-        # Normalize MAC address to uppercase with colons
-        printer_mac_normalized = printer_mac.upper()
-        print(f"[CloudPRNT] Looking for jobs for printer MAC: {printer_mac_normalized}")
 
-        # Get database config from cache
-        site_config = get_site_config()
+def record_history(sql, params, label=DB_HISTORY, failure="job_history_failed"):
+    """
+    Run one write (job history timestamp, printer status) with direct MySQL
+
+    Never raises: history and status must not break printing.
 
-        # Connect directly to MySQL
+    :param sql: Statement from cloudprnt.job_history or cloudprnt.printer_watchdog
+    :param params: Statement parameters
+    :param label: Metric label set of the query
+    :param failure: Event logged when the write fails
+    """
+    try:
+        import pymysql
+
+        site_config = get_site_config()
         conn = pymysql.connect(
             host=site_config.get('db_host', 'localhost'),
             user=site_config.get('db_user', site_config.get('db_name', 'root')),
@@ -134,49 +359,227 @@ def get_next_job_for_printer(printer_mac):
             database=site_config.get('db_name'),
             charset='utf8mb4'
         )
-
         try:
-            with conn.cursor(pymysql.cursors.DictCursor) as cursor:
-                # Use UPPER() in SQL to ensure case-insensitive comparison
-                cursor.execute("""
-                    SELECT name, job_token, invoice_name, job_data, media_types, printer_mac
-                    FROM `tabCloudPRNT Print Queue`
-                    WHERE UPPER(printer_mac) = %s AND status = 'Pending'
-                    ORDER BY creation ASC
-                    LIMIT 1
-                """, (printer_mac_normalized,))
-
-                job = cursor.fetchone()
-
-                if not job:
-                    print(f"[CloudPRNT] No jobs found for {printer_mac_normalized}")
-                    return None
-
-                print(f"[CloudPRNT] Found job: {job['job_token']} for printer {job['printer_mac']}")
-
-                # Parse media types
-                try:
-                    media_types = json.loads(job.get("media_types") or "[]")
-                except:
-                    media_types = ["application/vnd.star.line", "text/vnd.star.markup"]
-
-                return {
-                    "name": job["name"],
-                    "token": job["job_token"],
-                    "invoice": job["invoice_name"],
-                    "job_data": job["job_data"],
-                    "media_types": media_types,
-                    "printer_mac": printer_mac_normalized
-                }
+            with conn.cursor() as cursor:
+                with metrics.timer("cloudprnt_db_query_duration_seconds", label):
+                    cursor.execute(sql, params)
+            conn.commit()
         finally:
             conn.close()
+    except Exception as e:
+        log.warning(failure, error=str(e))
 
+
+def record_history_later(sql, params, **kwargs):
+    """Run record_history without delaying the response"""
+    task = asyncio.get_running_loop().create_task(asyncio.to_thread(record_history, sql, params, **kwargs))
+    # Keep a reference until done, the loop only holds weak ones
+    BACKGROUND_TASKS.add(task)
+    task.add_done_callback(BACKGROUND_TASKS.discard)
+
+
+def capture_exchange(mac, entry):
+    """Push a captured exchange to the printer's Redis ring buffer in the background"""
+    async def store():
+        try:
+            await frappe_pool.run(exchange_capture.store_exchange, mac, entry)
+        except Exception as e:
+            log.warning("capture_failed", mac=mac, error=str(e))
+
+    task = asyncio.get_running_loop().create_task(store())
+    BACKGROUND_TASKS.add(task)
+    task.add_done_callback(BACKGROUND_TASKS.discard)
+
+
+def record_printer_poll(printer_mac, status_code, printing_in_progress):
+    """
+    Record a poll in CloudPRNT Printers (online, last_activity, status)
+
+    Read by printer pools and the printer watchdog, which would otherwise
+    see printers behind this server as silent.
+    """
+    now = time.time()
+    state = (status_code or None, 1 if printing_in_progress else 0)
+    last = POLL_STATUS_WRITES.get(printer_mac)
+    if last and last[1] == state and now - last[0] < POLL_STATUS_INTERVAL:
+        return
+    POLL_STATUS_WRITES[printer_mac] = (now, state)
+    record_history_later(
+        POLL_STATUS_SQL,
+        (now + LAST_ACTIVITY_OFFSET,) + state + (printer_mac,),
+        label=DB_PRINTER_STATUS,
+        failure="printer_status_failed"
+    )
+
+
+def record_offered(job_token):
+    """Record the first poll that offered a job to its printer"""
+    if job_token in OFFERED_TOKENS:
+        return
+    if len(OFFERED_TOKENS) >= MAX_OFFERED_TOKENS:
+        # Tokens of unconfirmed jobs; the SQL only sets the first offer anyway
+        OFFERED_TOKENS.clear()
+    OFFERED_TOKENS.add(job_token)
+    record_history_later(OFFERED_SQL, (job_token,))
+
+
+async def get_render_key(job, media_type):
+    """
+    Coalescing key of a markup job: (token, media type, render profile)
+
+    :param job: Job dict
+    :param media_type: Requested MIME type (may be None)
+    :return: Key tuple
+    """
+    try:
+        profile = await frappe_pool.run(get_render_profile)
     except Exception as e:
-        # Log the error instead of silently failing
-        print(f"[CloudPRNT ERROR] Failed to get job for {printer_mac}: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return None
+        log.warning("render_profile_failed", error=str(e))
+        profile = "default"
+    return (job["token"], media_type, profile)
+
+
+def make_job_render(job, printer_mac, media_type):
+    """
+    Build the coroutine function rendering a markup job
+
+    :param job: Job dict
+    :param printer_mac: Normalized printer MAC address
+    :param media_type: Requested MIME type (may be None)
+    :return: Coroutine function returning the binary job
+    :raises LookupError: If the job has neither markup nor invoice
+    """
+    async def render():
+        # Invoice markup needs the database, rendering only needs CPU
+        markup_text = await frappe_pool.run(get_job_markup, job)
+        if markup_text is None:
+            raise LookupError("No job data or invoice")
+        labels = (("media_type", media_type or "default"),)
+        start = time.perf_counter()
+        try:
+            binary_data = await render_pool.render(markup_text, printer_mac, media_type)
+        except Exception:
+            metrics.inc("cloudprnt_render_errors_total", labels)
+            raise
+        finally:
+            metrics.observe("cloudprnt_render_duration_seconds", time.perf_counter() - start, labels)
+
+        render_ms = (time.perf_counter() - start) * 1000
+        record_history_later(RENDERED_SQL, (round(render_ms, 3), job["token"]))
+        return binary_data
+    return render
+
+
+def is_hex_payload(job):
+    """
+    Whether a job's payload store entry is pre-converted hex
+
+    :param job: Job dict
+    :return: True if the job can be streamed from the payload store as-is
+    """
+    if not job.get("payload_hash"):
+        return False
+    try:
+        return payload_store.is_hex(job["payload_hash"])
+    except (OSError, ValueError) as e:
+        log.warning("payload_missing", token=job["token"], error=str(e))
+        return False
+
+
+def prefetch_job(job, printer_mac):
+    """
+    Start rendering a job reported by a poll, ahead of the printer's GET
+
+    The render is keyed by media type, so it is only useful for the type
+    the printer will ask for: until this process has seen one of its GETs,
+    nothing is prefetched.
+
+    :param job: Job dict
+    :param printer_mac: Normalized printer MAC address
+    """
+    if is_hex_job(job.get("job_data")) or is_hex_payload(job):
+        # Hex jobs only need decoding, nothing to warm up
+        return
+    media_type = LAST_MEDIA_TYPES.get(printer_mac)
+    if not media_type or render_pool.queue_depth > 0:
+        # Unknown media type, or real GETs are already waiting for a worker
+        render_prefetcher.skipped += 1
+        return
+
+    render_prefetcher.schedule(
+        job["token"],
+        lambda: get_render_key(job, media_type),
+        make_job_render(job, printer_mac, media_type)
+    )
+
+
+def payload_response(request: Request, job: dict, content_type: str):
+    """
+    Stream a hex payload from the payload store, decoding it on the way
+
+    :param request: Incoming GET request
+    :param job: Job dict with payload_hash and payload_size
+    :param content_type: Response MIME type
+    :return: StreamingResponse (200 or 206) or 416
+    """
+    size = int(job["payload_size"]) // 2
+
+    try:
+        byte_range = parse_range(request.headers.get("Range"), size)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+
+    headers = {"Accept-Ranges": "bytes"}
+    start, end, status_code = 0, size - 1, 200
+    if byte_range is not None:
+        # Resume of a dropped transfer
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        log.info("transfer_resumed", start=start, size=size)
+    headers["Content-Length"] = str(end - start + 1)
+
+    return StreamingResponse(
+        payload_store.iter_hex(job["payload_hash"], start, end),
+        status_code=status_code,
+        media_type=content_type,
+        headers=headers
+    )
+
+
+def spool_response(request: Request, path: str, content_type: str):
+    """
+    Stream a spooled payload, honouring a single-range Range header
+
+    :param request: Incoming GET request
+    :param path: Spool file path
+    :param content_type: Response MIME type
+    :return: FileResponse (full payload), StreamingResponse (206) or 416
+    """
+    size = os.path.getsize(path)
+
+    try:
+        byte_range = parse_range(request.headers.get("Range"), size)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+
+    if byte_range is None:
+        # Sent with sendfile where the server supports it
+        return FileResponse(path, media_type=content_type, headers={"Accept-Ranges": "bytes"})
+
+    # Resume of a dropped transfer
+    start, end = byte_range
+    log.info("transfer_resumed", start=start, size=size)
+    return StreamingResponse(
+        iter_file(path, start, end),
+        status_code=206,
+        media_type=content_type,
+        headers={
+            "Accept-Ranges": "bytes",
+            "Content-Range": f"bytes {start}-{end}/{size}",
+            "Content-Length": str(end - start + 1)
+        }
+    )
 
 
 def get_real_ip(request: Request) -> str:
@@ -196,8 +599,6 @@ async def poll(request: Request):
     Accepts both / and /poll paths
     """
     try:
-        init_frappe()
-
         # Get client IP
         client_ip = get_real_ip(request)
 
@@ -214,16 +615,11 @@ async def poll(request: Request):
         client_type = data.get("clientType", "")
         client_action = data.get("clientAction", [])
 
-        # DEBUG: Log full POST data
-        print(f"[CloudPRNT DEBUG] POST data: {data}")
-
         # Normalize MAC address
         printer_mac = normalize_mac_address(printer_mac_dots)
 
-        print(f"[CloudPRNT] Poll from {client_ip}, MAC: {printer_mac_dots} -> normalized: {printer_mac}, status: {status_code}")
-
         if not printer_mac:
-            print(f"[CloudPRNT WARNING] Invalid MAC address: {printer_mac_dots}")
+            log.warning("invalid_mac", ip=client_ip, printer_mac=printer_mac_dots)
             return JSONResponse({
                 "jobReady": False,
                 "mediaTypes": ["application/vnd.star.line", "text/vnd.star.markup"]
@@ -231,9 +627,9 @@ async def poll(request: Request):
 
         # Track for discovery
         try:
-            init_frappe()
-            from printer_discovery import track_printer_poll
-            track_printer_poll(
+            from cloudprnt.printer_discovery import track_printer_poll
+            await frappe_pool.run(
+                track_printer_poll,
                 printer_mac,
                 ip_address=client_ip,
                 client_type=client_type,
@@ -241,28 +637,49 @@ async def poll(request: Request):
             )
         except Exception as e:
             # Don't fail if discovery tracking fails
-            print(f"Discovery tracking error: {e}")
+            log.warning("discovery_tracking_failed", mac=printer_mac, error=str(e))
 
-        # Check for jobs in database queue
-        job = get_next_job_for_printer(printer_mac)
+        record_printer_poll(printer_mac, status_code, printing_in_progress)
 
-        print(f"[CloudPRNT] Job result: {job}")
+        # Printer pools: take a pooled job if this printer is the least busy member
+        try:
+            await frappe_pool.run(
+                dispatch_pool_job,
+                printer_mac,
+                printing_in_progress=printing_in_progress,
+                status_code=status_code
+            )
+        except Exception as e:
+            log.warning("pool_dispatch_failed", mac=printer_mac, error=str(e))
+
+        # Check for jobs in the queue
+        job = queue_call(DB_NEXT_JOB, "peek", printer_mac)
+
+        # One record per poll, sampled; full body only at DEBUG
+        log.debug(
+            "poll",
+            mac=printer_mac,
+            ip=client_ip,
+            status=status_code,
+            job=job["token"] if job else None,
+            body=data
+        )
 
         if job:
-            print(f"[CloudPRNT] Returning jobReady=True for token: {job['token']}")
             # Use job's media_types if specified, otherwise use default list with all formats
             media_types = job.get("media_types") or [
                 "application/vnd.star.starprnt",
                 "application/vnd.star.line",
                 "text/vnd.star.markup"
             ]
+            record_offered(job["token"])
+            prefetch_job(job, printer_mac)
             return JSONResponse({
                 "jobReady": True,
                 "mediaTypes": media_types,
                 "jobToken": job["token"]
             })
         else:
-            print(f"[CloudPRNT] Returning jobReady=False (no job found)")
             return JSONResponse({
                 "jobReady": False,
                 "mediaTypes": [
@@ -273,9 +690,7 @@ async def poll(request: Request):
             })
 
     except Exception as e:
-        print(f"Error in poll endpoint: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("poll_failed", error=str(e))
         return JSONResponse({
             "jobReady": False,
             "mediaTypes": ["application/vnd.star.line", "text/vnd.star.markup"]
@@ -290,13 +705,9 @@ async def get_job_handler(request: Request, mac: str = Query(..., description="P
     Returns the job data for printing
     """
     try:
-        init_frappe()
-
-        # Get media type from query params
+        # Get media type and job token (sent when the poll returned one) from query params
         media_type = request.query_params.get("type")
-
-        # Log requested media type
-        print(f"[CloudPRNT] GET /job request - MAC: {mac}, requested type: {media_type}")
+        token = request.query_params.get("token")
 
         # Normalize MAC
         printer_mac_dots = mac
@@ -305,216 +716,84 @@ async def get_job_handler(request: Request, mac: str = Query(..., description="P
         if not printer_mac:
             return Response(content="Invalid MAC address", status_code=400)
 
-        # Get job from database queue
-        job = get_next_job_for_printer(printer_mac)
+        LAST_MEDIA_TYPES[printer_mac] = media_type
+
+        # Hand the job to the printer (Pending -> Fetched)
+        job = queue_call(DB_CLAIM_JOB, "claim", printer_mac, token)
 
         if not job:
+            log.info("job_not_found", mac=printer_mac, token=token)
             return Response(content="No job available", status_code=404)
 
         job_token = job["token"]
-
-        # Mark job as fetched using direct MySQL
-        try:
-            import pymysql
-
-            site_config = get_site_config()
-
-            conn = pymysql.connect(
-                host=site_config.get('db_host', 'localhost'),
-                user=site_config.get('db_user', site_config.get('db_name', 'root')),
-                password=site_config.get('db_password', ''),
-                database=site_config.get('db_name'),
-                charset='utf8mb4'
-            )
-
-            try:
-                with conn.cursor() as cursor:
-                    cursor.execute("""
-                        UPDATE `tabCloudPRNT Print Queue`
-                        SET status = 'Fetched'
-                        WHERE job_token = %s
-                    """, (job_token,))
-                    conn.commit()
-            finally:
-                conn.close()
-        except Exception as e:
-            print(f"Error marking job as fetched: {e}")
+        log.debug("job_requested", mac=printer_mac, token=job_token, media_type=media_type)
+        record_history_later(FETCHED_SQL, (job_token,))
 
         # Check if job contains pre-converted hex data (from CPUtil image conversion or custom jobs)
         # These jobs have job_data as raw hex string that should be sent directly to printer
         media_types = job.get("media_types", [])
 
-        # If job has job_data and it looks like hex data (no markup tags), return it directly
-        if job.get("job_data"):
-            job_data = job["job_data"]
-
-            # Check if this is raw hex data (no Star Markup tags like [align:], [cut:], etc.)
-            # Hex data will only contain [0-9A-Fa-f] characters
-            is_hex_only = all(c in '0123456789ABCDEFabcdef\n\r ' for c in job_data[:100])
-
-            if is_hex_only and len(job_data) > 100:  # Raw hex data (image or pre-converted)
-                try:
-                    binary_data = bytes.fromhex(job_data)
-
-                    # Use requested media type or first from the list
-                    content_type = media_type or (media_types[0] if media_types else "application/vnd.star.line")
-                    print(f"[CloudPRNT] Returning hex job with Content-Type: {content_type}")
-
-                    return Response(
-                        content=binary_data,
-                        media_type=content_type,
-                        headers={
-                            "Content-Type": content_type,
-                            "Content-Length": str(len(binary_data))
-                        }
-                    )
-                except Exception as e:
-                    print(f"Error converting hex to binary: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    return Response(content=f"Error processing hex job: {str(e)}", status_code=500)
+        # Hex payloads in the payload store are streamed from there, decoded on the fly
+        if is_hex_payload(job):
+            content_type = media_type or (media_types[0] if media_types else "application/vnd.star.line")
+            return payload_response(request, job, content_type)
+
+        # If job_data looks like hex data (no markup tags), return it directly
+        if is_hex_job(job.get("job_data")):
+            try:
+                spool_path = job_spool.path_for(job_token)
+                if os.path.exists(spool_path):
+                    metrics.inc("cloudprnt_cache_requests_total", SPOOL_HIT)
+                else:
+                    metrics.inc("cloudprnt_cache_requests_total", SPOOL_MISS)
+                    # Decoded chunk by chunk, never as one bytes copy
+                    start = time.perf_counter()
+                    await asyncio.to_thread(job_spool.write_hex, spool_path, job["job_data"])
+                    render_ms = (time.perf_counter() - start) * 1000
+                    record_history_later(RENDERED_SQL, (round(render_ms, 3), job_token))
+
+                # Use requested media type or first from the list
+                content_type = media_type or (media_types[0] if media_types else "application/vnd.star.line")
+
+                return spool_response(request, spool_path, content_type)
+            except Exception as e:
+                log.exception("hex_job_failed", mac=printer_mac, token=job_token, error=str(e))
+                return Response(content=f"Error processing hex job: {str(e)}", status_code=500)
 
         # Generate Star Line Mode binary for markup jobs (test and invoice)
         try:
-            # Import cputil_wrapper dynamically first (needed by print_job)
-            import importlib.util
-            import sys
-
-            spec_cputil = importlib.util.spec_from_file_location("cputil_wrapper",
-                os.path.join(cloudprnt_path, "cputil_wrapper.py"))
-            cputil_module = importlib.util.module_from_spec(spec_cputil)
-
-            # Inject into sys.modules so print_job.py can find it
-            sys.modules['cloudprnt.cputil_wrapper'] = cputil_module
-            spec_cputil.loader.exec_module(cputil_module)
-
-            # Import print_job dynamically to avoid hooks errors
-            spec = importlib.util.spec_from_file_location("print_job",
-                os.path.join(cloudprnt_path, "print_job.py"))
-            print_job_module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(print_job_module)
-            StarCloudPRNTStarLineModeJob = print_job_module.StarCloudPRNTStarLineModeJob
-
-            # Get markup text
-            if job.get("job_data"):
-                # Test job - use job_data as markup
-                markup_text = job["job_data"]
-            elif job.get("invoice"):
-                # Regular invoice job - get markup from invoice
-                # Import pos_invoice_markup dynamically
-                import importlib.util
-                spec_markup = importlib.util.spec_from_file_location("pos_invoice_markup",
-                    os.path.join(cloudprnt_path, "pos_invoice_markup.py"))
-                pos_invoice_markup_module = importlib.util.module_from_spec(spec_markup)
-                spec_markup.loader.exec_module(pos_invoice_markup_module)
-                get_pos_invoice_markup = pos_invoice_markup_module.get_pos_invoice_markup
-                markup_text = get_pos_invoice_markup(job["invoice"])
+            render_key = await get_render_key(job, media_type)
+            spool_path = job_spool.path_for(job_token, render_key[1:])
+
+            if os.path.exists(spool_path):
+                metrics.inc("cloudprnt_cache_requests_total", SPOOL_HIT)
             else:
-                return Response(content="No job data or invoice", status_code=400)
-
-            # Create Star Line Mode job
-            printer_meta = {'printerMAC': mac_to_dots(printer_mac)}
-            star_job = StarCloudPRNTStarLineModeJob(printer_meta)
-
-            # Parse markup and build job
-            lines = markup_text.split('\n')
-
-            for line in lines:
-                # Alignment tags
-                if "[align: centre]" in line or "[align: center]" in line:
-                    star_job.set_text_center_align()
-                elif "[align: left]" in line:
-                    star_job.set_text_left_align()
-                elif "[align: right]" in line:
-                    star_job.set_text_right_align()
-
-                # Bold/emphasized tags
-                if "[magnify:" in line or "[bold: on]" in line:
-                    star_job.set_text_emphasized()
-                elif "[magnify]" in line or "[bold: off]" in line:
-                    star_job.cancel_text_emphasized()
-
-                # Image tags - [image: url URL; ...]
-                if "[image:" in line:
-                    import re as img_re
-                    img_match = img_re.search(r'\[image:\s*url\s+([^\s;]+)', line)
-                    if img_match:
-                        image_url = img_match.group(1)
-                        try:
-                            star_job.add_image_from_url(image_url)
-                            print(f"[CloudPRNT] Successfully added image from {image_url}")
-                        except Exception as e:
-                            print(f"[CloudPRNT] Skipping image from {image_url}: {e}")
-                            # Skip image but continue processing the rest of the job
-                    continue
-
-                # Feed tags - handle both [feed] and [feed: length Xmm]
-                if "[feed" in line:
-                    # Extract feed length if specified (e.g., "[feed: length 3mm]")
-                    import re as feed_re
-                    feed_match = feed_re.search(r'\[feed:\s*length\s+(\d+)mm\]', line)
-                    if feed_match:
-                        # Convert mm to lines (roughly 1mm = 0.3 lines, so 3mm = 1 line)
-                        mm = int(feed_match.group(1))
-                        lines_to_feed = max(1, mm // 3)
-                        star_job.add_new_line(lines_to_feed)
-                    else:
-                        # Simple [feed] tag
-                        star_job.add_new_line(1)
-
-                # Cut tags
-                if "[cut" in line:
-                    star_job.cut()
-                    continue
-
-                # Clean text - remove all tags and add line if not empty
-                clean_text = re.sub(r'\[([^\]]+)\]', '', line)
-                if clean_text.strip():
-                    star_job.add_text_line(clean_text)
-
-            # Get binary data from job builder
-            hex_data = star_job.print_job_builder
-
-            # Clean hex data: remove spaces, newlines, and ensure even length
-            hex_data = hex_data.replace(" ", "").replace("\n", "").replace("\r", "").upper()
-
-            # Ensure even length by padding with 0 if needed
-            if len(hex_data) % 2 != 0:
-                print(f"[CloudPRNT WARNING] Odd hex length {len(hex_data)}, padding with 0")
-                hex_data += "0"
-
-            # Debug: check if hex_data is valid hex
-            try:
-                binary_data = bytes.fromhex(hex_data)
-            except ValueError as hex_error:
-                print(f"[CloudPRNT ERROR] Invalid hex data: {str(hex_error)}")
-                print(f"[CloudPRNT ERROR] Hex data length: {len(hex_data)}")
-                error_pos = int(str(hex_error).split("position")[1].strip()) if "position" in str(hex_error) else 0
-                print(f"[CloudPRNT ERROR] Sample around error: {hex_data[max(0, error_pos-20):min(len(hex_data), error_pos+20)]}")
-                raise
+                metrics.inc("cloudprnt_cache_requests_total", SPOOL_MISS)
+                # Retries of the same GET (and a prefetch started by the poll)
+                # await this render instead of starting another
+                started = time.monotonic()
+                binary_data = await render_coalescer.run(
+                    render_key, make_job_render(job, printer_mac, media_type)
+                )
+                render_prefetcher.record_get(render_key, time.monotonic() - started)
+                await asyncio.to_thread(job_spool.write_bytes, spool_path, binary_data)
 
             # Use requested media type or default to Star Line Mode
             content_type = media_type or "application/vnd.star.line"
-            print(f"[CloudPRNT] Returning job with Content-Type: {content_type}")
-
-            return Response(
-                content=binary_data,
-                media_type=content_type,
-                headers={
-                    "Content-Type": content_type,
-                    "Content-Length": str(len(binary_data))
-                }
-            )
+
+            return spool_response(request, spool_path, content_type)
+        except LookupError as e:
+            return Response(content=str(e), status_code=400)
+        except RenderTimeout as e:
+            # The printer retries the GET; ask it to back off briefly
+            log.error("render_timeout", mac=printer_mac, token=job_token, error=str(e))
+            return Response(content=str(e), status_code=503, headers={"Retry-After": "2"})
         except Exception as e:
-            print(f"Error generating Star Line Mode job: {e}")
-            import traceback
-            traceback.print_exc()
+            log.exception("render_failed", mac=printer_mac, token=job_token, error=str(e))
             return Response(content=f"Error generating job: {str(e)}", status_code=500)
 
     except Exception as e:
-        print(f"Error in job endpoint: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("job_failed", error=str(e))
         return Response(content=f"Error: {str(e)}", status_code=500)
 
 
@@ -539,8 +818,6 @@ async def delete_job(
     Confirms job completion and removes it from queue
     """
     try:
-        init_frappe()
-
         # Normalize MAC
         printer_mac_dots = mac
         printer_mac = normalize_mac_address(printer_mac_dots)
@@ -551,48 +828,30 @@ async def delete_job(
         # Use token if provided, otherwise get next job
         job_token = token
         if not job_token:
-            job = get_next_job_for_printer(printer_mac)
+            job = queue_call(DB_NEXT_JOB, "peek", printer_mac)
             if job:
                 job_token = job["token"]
 
         if job_token:
-            # Mark job as printed (delete from queue) using direct MySQL
+            # Mark job as printed (remove from queue)
             try:
-                import pymysql
-
-                site_config = get_site_config()
-
-                conn = pymysql.connect(
-                    host=site_config.get('db_host', 'localhost'),
-                    user=site_config.get('db_user', site_config.get('db_name', 'root')),
-                    password=site_config.get('db_password', ''),
-                    database=site_config.get('db_name'),
-                    charset='utf8mb4'
-                )
-
-                try:
-                    with conn.cursor() as cursor:
-                        cursor.execute("""
-                            DELETE FROM `tabCloudPRNT Print Queue`
-                            WHERE job_token = %s
-                        """, (job_token,))
-                        conn.commit()
-                        return JSONResponse({"message": "ok"})
-                finally:
-                    conn.close()
-
+                with metrics.timer("cloudprnt_db_query_duration_seconds", DB_DELETE_JOB):
+                    get_queue().ack(job_token)
             except Exception as e:
-                print(f"Error marking job as printed: {e}")
-                import traceback
-                traceback.print_exc()
+                log.exception("mark_printed_failed", mac=printer_mac, token=job_token, error=str(e))
                 return JSONResponse({"message": f"Error: {str(e)}"}, status_code=500)
+
+            record_history_later(CONFIRMED_SQL, (code, job_token))
+            OFFERED_TOKENS.discard(job_token)
+            render_prefetcher.forget(job_token)
+            job_spool.remove(job_token)
+            log.debug("job_confirmed", mac=printer_mac, token=job_token, code=code)
+            return JSONResponse({"message": "ok"})
         else:
             return JSONResponse({"message": "No job to delete"}, status_code=404)
 
     except Exception as e:
-        print(f"Error in delete endpoint: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("delete_failed", error=str(e))
         return JSONResponse({"message": f"Error: {str(e)}"}, status_code=500)
 
 
@@ -612,7 +871,7 @@ async def root_endpoint(
     elif request.method == "GET":
         if not mac:
             return Response(content="MAC address required", status_code=400)
-        return await get_job(mac)
+        return await get_job(request, mac)
     elif request.method == "DELETE":
         if not mac:
             return Response(content="MAC address required", status_code=400)
@@ -624,13 +883,47 @@ async def root_endpoint(
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
+    try:
+        queued_jobs = sum((await asyncio.to_thread(get_queue_depths)).values())
+    except Exception as e:
+        log.warning("queue_depth_failed", error=str(e))
+        queued_jobs = None
+
     return JSONResponse({
         "status": "ok",
         "timestamp": datetime.now().isoformat(),
-        "queued_jobs": sum(len(jobs) for jobs in PRINT_QUEUE.values())
+        "queued_jobs": queued_jobs,
+        "queue_backend": QUEUE.name if QUEUE else None,
+        "render_pool": render_pool.stats(),
+        "render_coalescer": render_coalescer.stats(),
+        "prefetch": render_prefetcher.stats()
     })
 
 
+def get_queue_depths():
+    """
+    Pending jobs per printer, read at scrape time
+
+    :return: {labels: count} for the cloudprnt_queue_depth gauge
+    """
+    with metrics.timer("cloudprnt_db_query_duration_seconds", DB_QUEUE_DEPTH):
+        depths = get_queue().depth()
+    return {(("printer", mac),): count for mac, count in depths.items()}
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics, merged across all server and render worker processes"""
+    scrape_gauges = {}
+    try:
+        scrape_gauges["cloudprnt_queue_depth"] = await asyncio.to_thread(get_queue_depths)
+    except Exception as e:
+        log.warning("queue_depth_failed", error=str(e))
+
+    text = await asyncio.to_thread(metrics.render, scrape_gauges)
+    return PlainTextResponse(text, media_type=metrics.CONTENT_TYPE)
+
+
 if __name__ == "__main__":
     print("=" * 80)
     print("CloudPRNT Standalone Server")
@@ -642,6 +935,7 @@ if __name__ == "__main__":
     print(f"  - GET  http://0.0.0.0:8001/job?mac=XX.XX.XX.XX.XX.XX")
     print(f"  - DELETE http://0.0.0.0:8001/job?mac=XX.XX.XX.XX.XX.XX")
     print(f"  - GET  http://0.0.0.0:8001/health")
+    print(f"  - GET  http://0.0.0.0:8001/metrics")
     print("=" * 80)
 
     uvicorn.run(
@@ -649,5 +943,6 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=8001,
         log_level="info",
-        access_log=True
+        # One line per request; request counts are in /metrics instead
+        access_log=bool(get_site_config().get("cloudprnt_access_log", False))
     )
@@ -53,6 +53,184 @@ def run_cloudprnt_server(site):
 		sys.exit(0)
 
 
+@click.command('cloudprnt-swarm')
+@click.option('--site', default='prod.local', help='Site name (used to feed jobs)')
+@click.option('--server-url', default='http://localhost:8001', help='Server base URL')
+@click.option('--target', type=click.Choice(['standalone', 'frappe']), default='standalone', help='Server to load')
+@click.option('--printers', default=100, help='Number of virtual printers')
+@click.option('--duration', default=60.0, help='Seconds to run')
+@click.option('--poll-interval', default=5.0, help='Seconds between polls per printer')
+@click.option('--jobs-per-second', default=0.0, help='Jobs fed into the queue')
+@click.option('--timeout-rate', default=0.0, help='Fraction of requests with an injected timeout')
+@click.option('--failure-rate', default=0.0, help='Fraction of jobs confirmed with a 5xx status')
+@click.option('--drop-delete-rate', default=0.0, help='Fraction of jobs never confirmed')
+@click.option('--output', default=None, help='Write the JSON summary to this file')
+def cloudprnt_swarm(site, server_url, target, printers, duration, poll_interval, jobs_per_second,
+		timeout_rate, failure_rate, drop_delete_rate, output):
+	"""
+	Load test a CloudPRNT server with a swarm of virtual printers
+
+	Usage:
+		bench --site prod.local cloudprnt-swarm --printers 2000 --duration 120 --jobs-per-second 5
+	"""
+	import asyncio
+	import json
+	from cloudprnt.frappe_context import FrappeContextPool
+	from cloudprnt.printer_swarm import SwarmConfig, clear_swarm_jobs, enqueue_swarm_job, run_swarm
+
+	config = SwarmConfig(
+		poll_interval=poll_interval,
+		timeout_rate=timeout_rate,
+		failure_rate=failure_rate,
+		drop_delete_rate=drop_delete_rate
+	)
+
+	async def main():
+		if not jobs_per_second:
+			return await run_swarm(server_url, printers=printers, duration=duration, config=config, target=target)
+
+		bench_path = os.getcwd()
+		if bench_path.endswith('/sites'):
+			bench_path = os.path.dirname(bench_path)
+		pool = FrappeContextPool(site, os.path.join(bench_path, 'sites'), size=2)
+		pool.start()
+		try:
+			return await run_swarm(
+				server_url,
+				printers=printers,
+				duration=duration,
+				config=config,
+				target=target,
+				enqueue=lambda token, mac: pool.run(enqueue_swarm_job, token, mac),
+				jobs_per_second=jobs_per_second
+			)
+		finally:
+			await pool.run(clear_swarm_jobs)
+			pool.shutdown()
+
+	result = asyncio.run(main())
+
+	text = json.dumps(result, indent=2)
+	if output:
+		with open(output, 'w') as f:
+			f.write(text)
+	click.echo(text)
+
+
+@click.command('cloudprnt-benchmark')
+@click.option('--site', default='prod.local', help='Site name')
+@click.option('--filter', 'name_filter', default=None, help='Only run cases whose name contains this')
+@click.option('--min-time', default=1.0, help='Seconds spent per case')
+@click.option('--rounds', default=5, help='Timed rounds per case')
+@click.option('--threshold', default=0.25, help='Allowed slowdown over the baseline (0.25 = 25%)')
+@click.option('--baseline', default=None, help='Baseline JSON (default: cloudprnt/benchmark_baseline.json)')
+@click.option('--update-baseline', is_flag=True, help='Store this run as the new baseline')
+@click.option('--output', default=None, help='Write the run and comparison as JSON to this file')
+def cloudprnt_benchmark(site, name_filter, min_time, rounds, threshold, baseline, update_baseline, output):
+	"""
+	Benchmark the job renderers against the committed baseline
+
+	Exits with status 1 when a case is slower than the baseline by more
+	than the threshold.
+
+	Usage:
+		bench --site prod.local cloudprnt-benchmark --filter render_star_line
+	"""
+	import json
+	import frappe
+	from cloudprnt import benchmark
+
+	bench_path = os.getcwd()
+	if bench_path.endswith('/sites'):
+		bench_path = os.path.dirname(bench_path)
+
+	# CPUtil lookup and invoice markup read CloudPRNT Settings
+	frappe.init(site=site, sites_path=os.path.join(bench_path, 'sites'))
+	frappe.connect()
+	try:
+		run = benchmark.run_benchmarks(name_filter=name_filter, min_time=min_time, rounds=rounds)
+	finally:
+		frappe.destroy()
+
+	baseline_path = baseline or benchmark.BASELINE_PATH
+	report = benchmark.compare(run, benchmark.load_baseline(baseline_path), threshold=threshold)
+	click.echo(benchmark.format_report(run, report))
+
+	if output:
+		with open(output, 'w') as f:
+			json.dump({"run": run, "comparison": report}, f, indent=2)
+
+	if update_baseline:
+		benchmark.save_baseline(run, baseline_path)
+		click.echo(f"Baseline written to {baseline_path}")
+	elif report["regressions"]:
+		sys.exit(1)
+
+
+@click.command('cloudprnt-replay')
+@click.option('--site', default='prod.local', help='Site name (used to queue jobs)')
+@click.option('--trace', 'trace_file', required=True, help='Trace file (.jsonl.gz) or debug capture download (.jsonl)')
+@click.option('--server-url', default='http://localhost:8001', help='Staging server base URL')
+@click.option('--target', type=click.Choice(['standalone', 'frappe']), default='standalone', help='Server to replay against')
+@click.option('--speed', default=1.0, help='Time compression, 1 to 50')
+@click.option('--copies', default=1, help='Replay every printer this many times')
+@click.option('--enqueue/--no-enqueue', default=True, help='Queue a job before polls that got one in production')
+@click.option('--output', default=None, help='Write the JSON summary to this file')
+def cloudprnt_replay(site, trace_file, server_url, target, speed, copies, enqueue, output):
+	"""
+	Replay recorded printer traffic against a staging server
+
+	Usage:
+		bench --site staging.local cloudprnt-replay --trace saturday.jsonl.gz --speed 20
+	"""
+	import asyncio
+	import json
+	from cloudprnt.frappe_context import FrappeContextPool
+	from cloudprnt.printer_swarm import clear_swarm_jobs, enqueue_swarm_job
+	from cloudprnt.traffic_trace import load_trace, replay_trace, trace_from_capture, trace_summary
+
+	if trace_file.endswith('.gz'):
+		_, events = load_trace(trace_file)
+	else:
+		with open(trace_file) as f:
+			events = trace_from_capture([json.loads(line) for line in f if line.strip()])
+
+	click.echo(json.dumps(trace_summary(events)))
+
+	async def main():
+		if not enqueue:
+			return await replay_trace(events, server_url, speed=speed, target=target, copies=copies)
+
+		bench_path = os.getcwd()
+		if bench_path.endswith('/sites'):
+			bench_path = os.path.dirname(bench_path)
+		pool = FrappeContextPool(site, os.path.join(bench_path, 'sites'), size=2)
+		pool.start()
+		try:
+			return await replay_trace(
+				events,
+				server_url,
+				speed=speed,
+				target=target,
+				copies=copies,
+				enqueue=lambda token, mac: pool.run(enqueue_swarm_job, token, mac)
+			)
+		finally:
+			await pool.run(clear_swarm_jobs)
+			pool.shutdown()
+
+	result = asyncio.run(main())
+
+	text = json.dumps(result, indent=2)
+	if output:
+		with open(output, 'w') as f:
+			f.write(text)
+	click.echo(text)
+
+
 commands = [
-	run_cloudprnt_server
+	run_cloudprnt_server,
+	cloudprnt_swarm,
+	cloudprnt_benchmark,
+	cloudprnt_replay
 ]
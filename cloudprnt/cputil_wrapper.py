@@ -17,6 +17,9 @@ import shutil
 import frappe
 from frappe import _
 import binascii
+import time
+
+from cloudprnt import metrics
 
 
 # Mapping des largeurs d'imprimante vers les options CPUtil
@@ -216,6 +219,31 @@ def build_cputil_command(options=None):
     return cmd
 
 
+def _run_cputil(cmd, operation, **kwargs):
+    """
+    Run a CPUtil conversion and record it in the metrics registry
+
+    :param cmd: Command list
+    :param operation: Metric label (markup, image, png_starprnt)
+    :param kwargs: Passed to subprocess.run
+    :return: CompletedProcess
+    """
+    labels = (("operation", operation),)
+    metrics.inc("cloudprnt_cputil_invocations_total", labels)
+    start = time.perf_counter()
+    try:
+        result = subprocess.run(cmd, **kwargs)
+    except Exception:
+        metrics.inc("cloudprnt_cputil_failures_total", labels)
+        raise
+    finally:
+        metrics.observe("cloudprnt_cputil_duration_seconds", time.perf_counter() - start, labels)
+
+    if result.returncode != 0:
+        metrics.inc("cloudprnt_cputil_failures_total", labels)
+    return result
+
+
 def convert_markup_to_starline(markup_text, options=None):
     """
     Convertit Star Document Markup vers Star Line Mode (hex)
@@ -243,8 +271,9 @@ def convert_markup_to_starline(markup_text, options=None):
         frappe.logger().debug(f"CPUtil command: {' '.join(cmd)}")
 
         # Exécuter avec timeout de 30 secondes
-        result = subprocess.run(
+        result = _run_cputil(
             cmd,
+            'markup',
             input=markup_text.encode('utf-8'),  # Envoyer markup via stdin
             capture_output=True,
             timeout=30
@@ -301,8 +330,9 @@ def convert_image_to_starline(image_path, options=None):
         frappe.logger().debug(f"CPUtil image command: {' '.join(cmd)}")
 
         # Exécuter
-        result = subprocess.run(
+        result = _run_cputil(
             cmd,
+            'image',
             capture_output=True,
             timeout=30
         )
@@ -435,8 +465,9 @@ def convert_png_to_starprnt(png_path, options=None):
         frappe.logger().debug(f"Converting PNG to StarPRNT: {' '.join(cmd)}")
         
         # Exécuter CPUtil avec timeout de 30 secondes
-        result = subprocess.run(
+        result = _run_cputil(
             cmd,
+            'png_starprnt',
             capture_output=True,
             timeout=30,
             check=False  # Ne pas lever exception automatiquement
@@ -0,0 +1,361 @@
+"""
+CloudPRNT Exchange Capture
+==========================
+
+Bounded per-printer ring buffer of raw HTTP exchanges, kept in Redis.
+
+Capture is enabled for one MAC at a time, for a limited time, from the
+CloudPRNT Settings page (or enable_capture()). While enabled, every
+poll/job/delete request of that printer and the server's response are
+pushed onto a Redis list trimmed to the last `size` entries. The list
+expires with the capture, so nothing is written to disk and nothing grows
+without bound. download_capture() returns the buffer as JSON lines.
+
+Bodies are stored as text when they decode as UTF-8, otherwise as
+base64, truncated to MAX_BODY_BYTES (the original length is kept).
+Credential headers (Authorization, Cookie, ...) are redacted before an
+exchange is stored, since the buffer can be downloaded from the settings.
+
+Usage (standalone server):
+    app.add_middleware(exchange_capture.CaptureMiddleware, store=...)
+
+Usage (Frappe endpoints):
+    exchange_capture.record_exchange(mac, request_entry, response_entry)
+"""
+
+import base64
+import json
+import time
+from urllib.parse import parse_qs
+
+import frappe
+
+CAPTURE_KEY_PREFIX = "cloudprnt_capture"
+ENABLED_CACHE_KEY = "cloudprnt_capture_enabled"
+DEFAULT_SIZE = 200
+MAX_SIZE = 2000
+DEFAULT_MINUTES = 30
+MAX_BODY_BYTES = 16 * 1024
+REFRESH_INTERVAL = 5  # seconds
+REDACTED_HEADERS = {"authorization", "proxy-authorization", "cookie", "set-cookie"}
+REDACTED = "[redacted]"
+
+# MAC -> {"until": ts, "size": n} for printers being captured
+_enabled = {}
+_enabled_loaded_at = 0
+
+
+def normalize_mac(mac_address):
+    """MAC address with colons, upper case (None if empty)"""
+    if not mac_address:
+        return None
+    return mac_address.replace(".", ":").upper()
+
+
+def _buffer_key(mac):
+    return f"{CAPTURE_KEY_PREFIX}|{mac}"
+
+
+def encode_body(body):
+    """
+    JSON-safe representation of a request or response body
+
+    :param body: bytes or str
+    :return: Dict with length, encoding and (truncated) data
+    """
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    body = body or b""
+    data = body[:MAX_BODY_BYTES]
+    try:
+        return {"length": len(body), "encoding": "text", "data": data.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"length": len(body), "encoding": "base64", "data": base64.b64encode(data).decode("ascii")}
+
+
+def redact_headers(headers):
+    """
+    Copy of a header dict with credentials replaced by REDACTED
+
+    :param headers: Dict of header name -> value (any case)
+    :return: New dict
+    """
+    return {
+        name: REDACTED if name.lower() in REDACTED_HEADERS else value
+        for name, value in (headers or {}).items()
+    }
+
+
+def is_enabled(mac):
+    """
+    Whether exchanges of a printer are being captured
+
+    Reads the local copy of the enabled set, no Redis access.
+    """
+    entry = _enabled.get(mac)
+    return entry is not None and entry["until"] > time.time()
+
+
+def _load_enabled():
+    raw = frappe.cache().get_value(ENABLED_CACHE_KEY)
+    if not raw:
+        return {}
+    now = time.time()
+    return {mac: entry for mac, entry in json.loads(raw).items() if entry["until"] > now}
+
+
+def refresh_enabled():
+    """
+    Reload the set of captured printers from Redis
+
+    Must run inside a Frappe context.
+    """
+    global _enabled, _enabled_loaded_at
+    _enabled_loaded_at = time.monotonic()
+    _enabled = _load_enabled()
+
+
+def maybe_refresh_enabled():
+    """Reload the captured printers if the local copy is stale"""
+    if time.monotonic() - _enabled_loaded_at > REFRESH_INTERVAL:
+        try:
+            refresh_enabled()
+        except Exception:
+            # Redis down: keep the current set
+            pass
+
+
+def store_exchange(mac, entry, size=None):
+    """
+    Push one exchange onto a printer's ring buffer
+
+    Must run inside a Frappe context.
+
+    :param mac: Normalized printer MAC address
+    :param entry: Exchange dict
+    :param size: Buffer size (default: the size the capture was enabled with)
+    """
+    size = size or _enabled.get(mac, {}).get("size", DEFAULT_SIZE)
+    until = _enabled.get(mac, {}).get("until", time.time() + DEFAULT_MINUTES * 60)
+    cache = frappe.cache()
+    key = _buffer_key(mac)
+    cache.lpush(key, json.dumps(entry, default=str))
+    cache.ltrim(key, 0, size - 1)
+    # Keep the buffer downloadable for a while after the capture ends
+    cache.expire(cache.make_key(key), max(1, int(until - time.time())) + DEFAULT_MINUTES * 60)
+
+
+def record_exchange(mac, request, response):
+    """
+    Store an exchange if capture is enabled for the printer (Frappe side)
+
+    :param mac: Printer MAC address (dots or colons)
+    :param request: Dict with method, path, query, headers, body
+    :param response: Dict with status, headers, body
+    """
+    maybe_refresh_enabled()
+    mac = normalize_mac(mac)
+    if not mac or not is_enabled(mac):
+        return
+    try:
+        store_exchange(mac, build_entry(request, response))
+    except Exception as e:
+        frappe.log_error(f"Could not capture exchange for {mac}: {str(e)}", "CloudPRNT Capture")
+
+
+def build_entry(request, response):
+    """Exchange dict with encoded bodies and redacted credential headers"""
+    request = dict(request)
+    response = dict(response)
+    request["body"] = encode_body(request.get("body"))
+    response["body"] = encode_body(response.get("body"))
+    if "headers" in request:
+        request["headers"] = redact_headers(request["headers"])
+    if "headers" in response:
+        response["headers"] = redact_headers(response["headers"])
+    return {"ts": time.time(), "request": request, "response": response}
+
+
+def _mac_from_request(query_string, body):
+    """Printer MAC from the query string (GET/DELETE) or the JSON body (poll)"""
+    query = parse_qs(query_string.decode("latin-1"))
+    if query.get("mac"):
+        return normalize_mac(query["mac"][0])
+    if body:
+        try:
+            return normalize_mac(json.loads(body).get("printerMAC"))
+        except (ValueError, AttributeError):
+            return None
+    return None
+
+
+class CaptureMiddleware:
+    """
+    ASGI middleware copying exchanges of captured printers to Redis
+
+    When no printer is captured it only costs a dict check per request.
+
+    :param app: ASGI application
+    :param store: Callable(mac, entry) run in the background to store an
+        exchange (e.g. through the Frappe context pool)
+    :param paths: Paths to capture
+    """
+
+    def __init__(self, app, store, paths=("/", "/poll", "/job")):
+        self.app = app
+        self.store = store
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _enabled or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+
+        # Read the body once and replay it to the application
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+        body = b"".join(chunks)
+
+        mac = _mac_from_request(scope.get("query_string", b""), body)
+        if not mac or not is_enabled(mac):
+            return await self.app(scope, _replay(body, receive), send)
+
+        response = {"status": None, "headers": {}, "body": b"", "bytes_sent": 0}
+
+        async def send_and_copy(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = {k.decode("latin-1"): v.decode("latin-1") for k, v in message.get("headers", [])}
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                response["bytes_sent"] += len(chunk)
+                if len(response["body"]) < MAX_BODY_BYTES:
+                    response["body"] += chunk[:MAX_BODY_BYTES - len(response["body"])]
+            await send(message)
+
+        try:
+            await self.app(scope, _replay(body, receive), send_and_copy)
+        finally:
+            request = {
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "client": scope["client"][0] if scope.get("client") else None,
+                "headers": {k.decode("latin-1"): v.decode("latin-1") for k, v in scope.get("headers", [])},
+                "body": body
+            }
+            self.store(mac, build_entry(request, response))
+
+
+def _replay(body, receive):
+    sent = False
+
+    async def replay():
+        nonlocal sent
+        if sent:
+            # Later receive() calls wait for the client disconnect
+            return await receive()
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+    return replay
+
+
+def _save_enabled(enabled):
+    frappe.cache().set_value(
+        ENABLED_CACHE_KEY,
+        json.dumps(enabled),
+        expires_in_sec=max([int(e["until"] - time.time()) for e in enabled.values()] + [1])
+    )
+    refresh_enabled()
+
+
+@frappe.whitelist()
+def enable_capture(mac_address, minutes=DEFAULT_MINUTES, size=DEFAULT_SIZE):
+    """
+    Start capturing a printer's exchanges
+
+    :param mac_address: Printer MAC address (dots or colons)
+    :param minutes: Capture duration
+    :param size: Number of exchanges kept (oldest dropped first)
+    :return: Result dict with the captured printers
+    """
+    frappe.only_for("System Manager")
+
+    mac = normalize_mac(mac_address)
+    if not mac:
+        return {"success": False, "message": "MAC address required"}
+
+    enabled = _load_enabled()
+    enabled[mac] = {
+        "until": time.time() + int(minutes) * 60,
+        "size": max(1, min(int(size), MAX_SIZE))
+    }
+    _save_enabled(enabled)
+    return {"success": True, "captures": enabled}
+
+
+@frappe.whitelist()
+def disable_capture(mac_address):
+    """
+    Stop capturing a printer (its buffer stays downloadable until it expires)
+
+    :param mac_address: Printer MAC address (dots or colons)
+    :return: Result dict with the captured printers
+    """
+    frappe.only_for("System Manager")
+
+    enabled = _load_enabled()
+    enabled.pop(normalize_mac(mac_address), None)
+    _save_enabled(enabled)
+    return {"success": True, "captures": enabled}
+
+
+@frappe.whitelist()
+def get_capture_status():
+    """
+    Captured printers with their expiry and buffered exchange count
+
+    :return: Result dict
+    """
+    frappe.only_for("System Manager")
+
+    cache = frappe.cache()
+    captures = []
+    for mac, entry in _load_enabled().items():
+        captures.append({
+            "mac_address": mac,
+            "until": entry["until"],
+            "size": entry["size"],
+            "count": cache.llen(_buffer_key(mac))
+        })
+    return {"success": True, "captures": captures}
+
+
+def get_exchanges(mac_address):
+    """
+    Buffered exchanges of a printer, oldest first
+
+    :param mac_address: Printer MAC address (dots or colons)
+    :return: List of exchange dicts
+    """
+    raw = frappe.cache().lrange(_buffer_key(normalize_mac(mac_address)), 0, -1)
+    return [json.loads(item) for item in reversed(raw)]
+
+
+@frappe.whitelist()
+def download_capture(mac_address):
+    """
+    Download a printer's buffered exchanges as JSON lines
+
+    :param mac_address: Printer MAC address (dots or colons)
+    """
+    frappe.only_for("System Manager")
+
+    mac = normalize_mac(mac_address)
+    lines = [json.dumps(entry, ensure_ascii=False) for entry in get_exchanges(mac)]
+    frappe.response["type"] = "download"
+    frappe.response["filename"] = f"cloudprnt_capture_{mac.replace(':', '')}.jsonl"
+    frappe.response["filecontent"] = "\n".join(lines) + "\n"
@@ -0,0 +1,162 @@
+"""
+Frappe Context Pool for the Standalone Server
+==============================================
+
+Keeps a small pool of worker threads, each holding its own initialised
+Frappe context (site config, DB connection, session user).
+
+The standalone server used to call frappe.init() + frappe.connect() from
+inside request handlers whenever frappe.local was empty, which happens on
+almost every request under asyncio. With this pool, Frappe is initialised
+once per thread and handlers borrow a ready context through run().
+
+Usage:
+    pool = FrappeContextPool("prod.local", "/home/frappe/frappe-bench/sites")
+    pool.start()
+    result = await pool.run(track_printer_poll, mac, ip_address=ip)
+    pool.shutdown()
+"""
+
+import asyncio
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import frappe
+
+DEFAULT_POOL_SIZE = 4
+
+
+def init_site(site, sites_path):
+    """
+    Initialise Frappe for the current thread (or process)
+
+    :param site: Site name
+    :param sites_path: Absolute path to the bench sites directory
+    """
+    frappe.init(site=site, sites_path=sites_path)
+    frappe.connect()
+    frappe.set_user("Administrator")
+
+
+def _is_connection_error(error):
+    """Check whether an exception means the DB connection was lost"""
+    try:
+        import pymysql
+        return isinstance(error, (pymysql.err.OperationalError, pymysql.err.InterfaceError))
+    except ImportError:
+        return False
+
+
+class FrappeContextPool:
+    """
+    Thread pool whose workers each own a live Frappe context
+
+    Threads do not share contextvars, so the frappe.local set up by
+    init_site() in a worker stays bound to that worker and is reused by
+    every call it runs.
+    """
+
+    def __init__(self, site, sites_path, size=DEFAULT_POOL_SIZE, observer=None):
+        """
+        :param site: Site name
+        :param sites_path: Absolute path to the bench sites directory
+        :param size: Number of worker threads (one DB connection each)
+        :param observer: Optional callable(fn, seconds) told how long each run() took
+        """
+        self.site = site
+        self.sites_path = sites_path
+        self.size = size
+        self.observer = observer
+        self._executor = None
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger("cloudprnt.frappe_context")
+
+    def start(self):
+        """Create the worker threads (idempotent)"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.size,
+                    thread_name_prefix="cloudprnt-frappe"
+                )
+        return self
+
+    def shutdown(self):
+        """Stop the worker threads (their connections close with the process)"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) inside a pooled Frappe context
+
+        :return: Whatever fn returns
+        :raises: Whatever fn raises (after rolling back the transaction)
+        """
+        if self._executor is None:
+            self.start()
+
+        loop = asyncio.get_running_loop()
+        call = functools.partial(self._call, fn, args, kwargs)
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._executor, call)
+        finally:
+            if self.observer is not None:
+                self.observer(fn, time.perf_counter() - started)
+
+    def _ensure_context(self):
+        """Initialise Frappe in this thread on first use"""
+        if getattr(frappe.local, "site", None) and getattr(frappe.local, "db", None):
+            return
+
+        self._logger.info("Initialising Frappe context for %s in %s",
+                          self.site, threading.current_thread().name)
+        init_site(self.site, self.sites_path)
+
+    def _reconnect(self):
+        """Drop the current context and build a fresh one"""
+        self._destroy_context()
+        init_site(self.site, self.sites_path)
+
+    def _destroy_context(self):
+        """Tear down the Frappe context bound to this thread"""
+        try:
+            if getattr(frappe.local, "site", None):
+                frappe.destroy()
+        except Exception as e:
+            self._logger.warning("Error destroying Frappe context: %s", e)
+
+    def _call(self, fn, args, kwargs):
+        """Execute fn in this worker's context, retrying once on a lost connection"""
+        self._ensure_context()
+
+        try:
+            return self._call_in_transaction(fn, args, kwargs)
+        except Exception as e:
+            if not _is_connection_error(e):
+                raise
+
+            self._logger.warning("DB connection lost, reconnecting: %s", e)
+            self._reconnect()
+            return self._call_in_transaction(fn, args, kwargs)
+
+    def _call_in_transaction(self, fn, args, kwargs):
+        """Run fn and end its transaction the same way a Frappe request does"""
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            try:
+                frappe.db.rollback()
+            except Exception:
+                pass
+            raise
+
+        frappe.db.commit()
+        return result
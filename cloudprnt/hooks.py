@@ -251,10 +251,24 @@ fixtures = [
 # Initialize MQTT bridge on server startup (if configured)
 after_migrate = ["cloudprnt.mqtt_bridge.init_mqtt_bridge"]
 
+# CloudPRNT - Queue Retention
+# ---------------------------
+# Archive finished and expired queue rows, drop old payloads;
+# move pending jobs off printers that went offline
+scheduler_events = {
+	"all": [
+		"cloudprnt.queue_retention.sweep_queue",
+		"cloudprnt.printer_watchdog.check_printers"
+	]
+}
+
 # Bench Commands
 # --------------
 # Add custom bench commands
 commands = [
-	"cloudprnt.commands.run_cloudprnt_server"
+	"cloudprnt.commands.run_cloudprnt_server",
+	"cloudprnt.commands.cloudprnt_swarm",
+	"cloudprnt.commands.cloudprnt_benchmark",
+	"cloudprnt.commands.cloudprnt_replay"
 ]
 
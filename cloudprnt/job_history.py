@@ -0,0 +1,192 @@
+"""
+CloudPRNT Job History
+=====================
+
+Lifecycle timestamps of every print job, kept in the compact
+`CloudPRNT Job History` table after the queue row is deleted.
+
+Stages:
+    enqueued      add_job_to_queue()
+    first offered first poll answering jobReady with the token
+    fetched       first GET /job for the token
+    rendered      render finished (with render duration in ms)
+    confirmed     DELETE /job (with the printer's status code)
+
+The SQL statements use %s placeholders so the standalone server can run
+them on its raw pymysql connection, in the same transaction as the queue
+update. Inside Frappe, use the record_* helpers.
+
+The CloudPRNT Job Latency report computes p50/p95/p99 from this table.
+The queue sweep (cloudprnt.queue_retention) deletes rows older than
+cloudprnt_job_history_days.
+"""
+
+import frappe
+
+HISTORY_TABLE = "`tabCloudPRNT Job History`"
+
+# One VALUES row of ENQUEUED_SQL. Params: name, job_token, printer_mac, invoice_name, store
+ENQUEUED_ROW = """(%s, NOW(6), NOW(6), 'Administrator', 'Administrator', 0, 0,
+            %s, %s, %s, %s, NOW(6))"""
+
+# A token queued again (reprint of a printed job) starts a new lifecycle:
+# its row is reset instead of keeping the first print's stages
+ENQUEUED_SQL_HEAD = f"""
+    INSERT INTO {HISTORY_TABLE}
+    (name, creation, modified, modified_by, owner, docstatus, idx,
+     job_token, printer_mac, invoice_name, store, enqueued_at)
+    VALUES
+"""
+ENQUEUED_SQL_UPDATE = """
+    ON DUPLICATE KEY UPDATE
+        modified = NOW(6),
+        printer_mac = VALUES(printer_mac),
+        invoice_name = VALUES(invoice_name),
+        store = VALUES(store),
+        enqueued_at = NOW(6),
+        first_offered_at = NULL,
+        fetched_at = NULL,
+        rendered_at = NULL,
+        render_ms = NULL,
+        confirmed_at = NULL,
+        status_code = NULL,
+        total_ms = NULL
+"""
+ENQUEUED_SQL = ENQUEUED_SQL_HEAD + ENQUEUED_ROW + ENQUEUED_SQL_UPDATE
+
+# Params: job_token
+OFFERED_SQL = f"""
+    UPDATE {HISTORY_TABLE}
+    SET first_offered_at = NOW(6)
+    WHERE job_token = %s AND first_offered_at IS NULL
+"""
+
+# Params: job_token
+FETCHED_SQL = f"""
+    UPDATE {HISTORY_TABLE}
+    SET fetched_at = NOW(6)
+    WHERE job_token = %s AND fetched_at IS NULL
+"""
+
+# Params: render_ms, job_token
+RENDERED_SQL = f"""
+    UPDATE {HISTORY_TABLE}
+    SET rendered_at = NOW(6), render_ms = %s
+    WHERE job_token = %s AND rendered_at IS NULL
+"""
+
+# Params: status_code, job_token
+CONFIRMED_SQL = f"""
+    UPDATE {HISTORY_TABLE}
+    SET confirmed_at = NOW(6),
+        status_code = %s,
+        total_ms = TIMESTAMPDIFF(MICROSECOND, enqueued_at, NOW(6)) / 1000
+    WHERE job_token = %s AND confirmed_at IS NULL
+"""
+
+
+def get_store(invoice_name):
+    """
+    Store (POS Profile) of the invoice a job prints
+
+    :param invoice_name: POS Invoice name (may be None)
+    :return: POS Profile name or None
+    """
+    if not invoice_name:
+        return None
+    try:
+        return frappe.db.get_value("POS Invoice", invoice_name, "pos_profile")
+    except Exception:
+        # ERPNext not installed or not a POS Invoice
+        return None
+
+
+def record_enqueued(job_token, printer_mac, invoice_name=None):
+    """Create the history row of a newly queued job (caller commits)"""
+    frappe.db.sql(ENQUEUED_SQL, (
+        frappe.generate_hash(length=10),
+        job_token,
+        printer_mac.upper(),
+        invoice_name,
+        get_store(invoice_name)
+    ))
+
+
+def get_stores(invoice_names):
+    """
+    Stores of several invoices with one query
+
+    :param invoice_names: POS Invoice names (None entries are skipped)
+    :return: {invoice_name: POS Profile name}
+    """
+    invoice_names = sorted({name for name in invoice_names if name})
+    if not invoice_names:
+        return {}
+    try:
+        rows = frappe.get_all(
+            "POS Invoice",
+            filters={"name": ["in", invoice_names]},
+            fields=["name", "pos_profile"]
+        )
+    except Exception:
+        # ERPNext not installed
+        return {}
+    return {row.name: row.pos_profile for row in rows}
+
+
+def record_enqueued_many(jobs):
+    """
+    Create the history rows of several queued jobs in one INSERT (caller commits)
+
+    :param jobs: List of dicts with job_token, printer_mac and invoice_name
+    """
+    if not jobs:
+        return
+    stores = get_stores(job.get("invoice_name") for job in jobs)
+    params = []
+    for job in jobs:
+        params += [
+            frappe.generate_hash(length=10),
+            job["job_token"],
+            job["printer_mac"].upper(),
+            job.get("invoice_name"),
+            stores.get(job.get("invoice_name"))
+        ]
+    # ENQUEUED_SQL with one VALUES row per job
+    frappe.db.sql(
+        ENQUEUED_SQL_HEAD + ",".join([ENQUEUED_ROW] * len(jobs)) + ENQUEUED_SQL_UPDATE,
+        tuple(params)
+    )
+
+
+def record_fetched(job_token):
+    """Record the first fetch of a job (caller commits)"""
+    frappe.db.sql(FETCHED_SQL, (job_token,))
+
+
+def record_confirmed(job_token, status_code=None):
+    """Record the printer's confirmation of a job (caller commits)"""
+    frappe.db.sql(CONFIRMED_SQL, (status_code, job_token))
+
+
+def for_tokens(sql, job_tokens):
+    """
+    A single-token statement rewritten for a list of tokens
+
+    :param sql: Statement ending on WHERE job_token = %s ...
+    :param job_tokens: List of job tokens
+    :return: Statement with job_token IN (%s, ...)
+    """
+    return sql.replace("job_token = %s", "job_token IN ({})".format(", ".join(["%s"] * len(job_tokens))))
+
+
+def record_fetched_many(job_tokens):
+    """Record the first fetch of several jobs in one statement (caller commits)"""
+    if job_tokens:
+        frappe.db.sql(for_tokens(FETCHED_SQL, job_tokens), tuple(job_tokens))
+
+
+def record_confirmed_many(job_tokens, status_code=None):
+    """Record the confirmation of several jobs in one statement (caller commits)"""
+    if job_tokens:
+        frappe.db.sql(for_tokens(CONFIRMED_SQL, job_tokens), (status_code,) + tuple(job_tokens))
@@ -0,0 +1,233 @@
+"""
+CloudPRNT Job Renderers
+=======================
+
+Registry of renderers that turn a queued markup job into printer bytes.
+
+The renderer modules (print_job, cputil_wrapper, pos_invoice_markup) are
+imported once, together with this module, so the job endpoint never has
+to load or re-execute them per request.
+
+Usage:
+    from cloudprnt.job_renderer import render_job
+    binary_data = render_job(job, "00:11:62:12:34:56", "application/vnd.star.line")
+
+Register an additional output format:
+    @register_renderer("application/vnd.star.starprnt")
+    def render_starprnt(markup_text, printer_mac):
+        return b"..."
+"""
+
+import re
+
+import frappe
+
+from cloudprnt import cputil_wrapper  # noqa: F401 - used lazily by print_job
+from cloudprnt.structured_log import get_logger
+from cloudprnt.print_job import StarCloudPRNTStarLineModeJob
+from cloudprnt.pos_invoice_markup import get_pos_invoice_markup
+
+log = get_logger("cloudprnt.renderer")
+
+STAR_LINE_MEDIA_TYPE = "application/vnd.star.line"
+DEFAULT_MEDIA_TYPE = STAR_LINE_MEDIA_TYPE
+
+HEX_CHARS = frozenset("0123456789ABCDEFabcdef\n\r ")
+
+IMAGE_TAG_RE = re.compile(r'\[image:\s*url\s+([^\s;]+)')
+FEED_TAG_RE = re.compile(r'\[feed:\s*length\s+(\d+)mm\]')
+ANY_TAG_RE = re.compile(r'\[([^\]]+)\]')
+
+# media type -> callable(markup_text, printer_mac) -> bytes
+_RENDERERS = {}
+
+
+def register_renderer(media_type):
+    """
+    Decorator registering a markup renderer for a media type
+
+    :param media_type: MIME type the renderer produces
+    """
+    def decorator(fn):
+        _RENDERERS[media_type] = fn
+        return fn
+    return decorator
+
+
+def get_renderer(media_type=None):
+    """
+    Get the renderer for a media type
+
+    Unknown or missing media types fall back to Star Line Mode, which every
+    supported printer accepts.
+
+    :param media_type: Requested MIME type (optional)
+    :return: Renderer callable
+    """
+    return _RENDERERS.get(media_type) or _RENDERERS[DEFAULT_MEDIA_TYPE]
+
+
+def get_registered_media_types():
+    """List media types that have a registered renderer"""
+    return list(_RENDERERS)
+
+
+def is_hex_job(job_data):
+    """
+    Check whether job data is pre-converted hex (CPUtil image or custom job)
+
+    Hex data only contains [0-9A-Fa-f] characters, markup contains tags.
+
+    :param job_data: job_data column value
+    :return: True if the job should be sent as-is after hex decoding
+    """
+    if not job_data or len(job_data) <= 100:
+        return False
+    return all(c in HEX_CHARS for c in job_data[:100])
+
+
+def get_job_markup(job):
+    """
+    Get the Star Markup for a queued markup job
+
+    Must run inside a Frappe context for invoice jobs.
+
+    :param job: Job dict (job_data or payload_hash, and/or invoice)
+    :return: Markup string, or None if the job has neither
+    """
+    from cloudprnt.payload_store import load_job_data
+
+    job_data = load_job_data(job)
+    if job_data:
+        # Test job - use job_data (inline or from the payload store) as markup
+        return job_data
+    if job.get("invoice"):
+        # Regular invoice job - get markup from invoice
+        return get_pos_invoice_markup(job["invoice"])
+    return None
+
+
+def get_render_profile():
+    """
+    Get the render profile: the CPUtil settings that change rendered bytes
+
+    Must run inside a Frappe context. Jobs rendered under different
+    profiles are never shared by the render coalescer.
+
+    :return: Profile string, e.g. "thermal3-dither-fit"
+    """
+    settings = frappe.get_cached_doc("CloudPRNT Settings")
+    profile = f"thermal{settings.get('default_printer_width') or 3}"
+    if settings.get("enable_image_dithering"):
+        profile += "-dither"
+    if settings.get("enable_scale_to_fit"):
+        profile += "-fit"
+    return profile
+
+
+def render_job(job, printer_mac, media_type=None):
+    """
+    Render a markup job to printer bytes
+
+    :param job: Job dict (job_data and/or invoice)
+    :param printer_mac: Normalized printer MAC address
+    :param media_type: Requested MIME type (optional)
+    :return: Binary job data, or None if the job has no data and no invoice
+    """
+    markup_text = get_job_markup(job)
+    if markup_text is None:
+        return None
+    return get_renderer(media_type)(markup_text, printer_mac)
+
+
+@register_renderer(STAR_LINE_MEDIA_TYPE)
+def render_star_line(markup_text, printer_mac):
+    """
+    Convert Star Markup to Star Line Mode binary
+
+    :param markup_text: Star Document Markup
+    :param printer_mac: Printer MAC address (colons)
+    :return: Binary Star Line Mode data
+    """
+    printer_meta = {'printerMAC': printer_mac.replace(":", ".")}
+    star_job = StarCloudPRNTStarLineModeJob(printer_meta)
+
+    for line in markup_text.split('\n'):
+        # Alignment tags
+        if "[align: centre]" in line or "[align: center]" in line:
+            star_job.set_text_center_align()
+        elif "[align: left]" in line:
+            star_job.set_text_left_align()
+        elif "[align: right]" in line:
+            star_job.set_text_right_align()
+
+        # Bold/emphasized tags
+        if "[magnify:" in line or "[bold: on]" in line:
+            star_job.set_text_emphasized()
+        elif "[magnify]" in line or "[bold: off]" in line:
+            star_job.cancel_text_emphasized()
+
+        # Image tags - [image: url URL; ...]
+        if "[image:" in line:
+            img_match = IMAGE_TAG_RE.search(line)
+            if img_match:
+                image_url = img_match.group(1)
+                try:
+                    star_job.add_image_from_url(image_url)
+                    log.debug("image_added", url=image_url)
+                except Exception as e:
+                    # Skip image but continue processing the rest of the job
+                    log.warning("image_skipped", url=image_url, error=str(e))
+            continue
+
+        # Feed tags - handle both [feed] and [feed: length Xmm]
+        if "[feed" in line:
+            feed_match = FEED_TAG_RE.search(line)
+            if feed_match:
+                # Convert mm to lines (roughly 1mm = 0.3 lines, so 3mm = 1 line)
+                mm = int(feed_match.group(1))
+                star_job.add_new_line(max(1, mm // 3))
+            else:
+                # Simple [feed] tag
+                star_job.add_new_line(1)
+
+        # Cut tags
+        if "[cut" in line:
+            star_job.cut()
+            continue
+
+        # Clean text - remove all tags and add line if not empty
+        clean_text = ANY_TAG_RE.sub('', line)
+        if clean_text.strip():
+            star_job.add_text_line(clean_text)
+
+    return hex_to_bytes(star_job.print_job_builder)
+
+
+def hex_to_bytes(hex_data):
+    """
+    Convert job builder hex to bytes
+
+    Strips whitespace and pads odd-length data with a trailing 0.
+
+    :param hex_data: Hex string
+    :return: Bytes
+    :raises ValueError: If the data contains non-hex characters
+    """
+    hex_data = hex_data.replace(" ", "").replace("\n", "").replace("\r", "").upper()
+
+    if len(hex_data) % 2 != 0:
+        log.warning("odd_hex_length", length=len(hex_data))
+        hex_data += "0"
+
+    try:
+        return bytes.fromhex(hex_data)
+    except ValueError as hex_error:
+        error_pos = int(str(hex_error).split("position")[1].strip()) if "position" in str(hex_error) else 0
+        log.error(
+            "invalid_hex",
+            error=str(hex_error),
+            length=len(hex_data),
+            sample=hex_data[max(0, error_pos-20):min(len(hex_data), error_pos+20)]
+        )
+        raise
@@ -0,0 +1,215 @@
+"""
+CloudPRNT Job Spool
+===================
+
+On-disk spool of rendered job payloads for the standalone server.
+
+Image-heavy jobs used to be materialized three times (hex string,
+bytes.fromhex copy, Response body) and held in memory for the whole
+transfer to a slow Wi-Fi printer. With the spool:
+
+- Hex jobs are decoded in fixed-size chunks straight into a spool file.
+- Rendered markup jobs are written to the spool once.
+- The job endpoint streams the file in chunks and honours HTTP Range, so a
+  printer that drops the connection can resume instead of pulling the
+  whole job again.
+
+Spool files live in sites/<site>/private/cloudprnt_spool and are removed
+when the printer confirms the job with DELETE /job. Files of jobs never
+confirmed are purged after STALE_AGE by the standalone server, at start-up
+and then every hour.
+
+Configuration (site_config.json):
+{
+    "cloudprnt_spool_dir": "/path/to/spool"
+}
+"""
+
+import glob
+import hashlib
+import os
+import re
+import time
+import uuid
+
+CHUNK_SIZE = 64 * 1024  # bytes per read / per streamed chunk
+STALE_AGE = 24 * 3600  # seconds before an unconfirmed spool file is purged
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised when a Range header does not overlap the payload"""
+
+
+class JobSpool:
+    """
+    Directory of spooled job payloads, one file per job and render key
+
+    Files are named after a hash of the full token, so tokens that share a
+    prefix (INV-001 and its copy INV-001-copy-1) or differ only in
+    characters unsafe in file names never share or remove each other's files.
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: Spool directory (created on first write)
+        """
+        self.directory = directory
+
+    def path_for(self, token, variant=None):
+        """
+        Spool file path of a job
+
+        :param token: Job token
+        :param variant: Extra key for jobs rendered per media type / profile
+        :return: Absolute file path
+        """
+        name = self._token_hash(token)
+        if variant:
+            name += "-" + hashlib.sha1(repr(variant).encode()).hexdigest()[:12]
+        return os.path.join(self.directory, f"{name}.bin")
+
+    def write_hex(self, path, hex_data):
+        """
+        Decode a hex job into a spool file, one chunk at a time
+
+        :param path: Spool file path
+        :param hex_data: Hex string (whitespace allowed)
+        :return: Payload size in bytes
+        """
+        hex_data = "".join(hex_data.split())
+        if len(hex_data) % 2 != 0:
+            hex_data += "0"
+
+        step = CHUNK_SIZE * 2
+        with self._atomic_open(path) as f:
+            for i in range(0, len(hex_data), step):
+                f.write(bytes.fromhex(hex_data[i:i + step]))
+        return len(hex_data) // 2
+
+    def write_bytes(self, path, data):
+        """
+        Write a rendered payload to a spool file
+
+        :param path: Spool file path
+        :param data: Binary job data
+        :return: Payload size in bytes
+        """
+        with self._atomic_open(path) as f:
+            f.write(data)
+        return len(data)
+
+    def remove(self, token):
+        """Remove every spool file of a job, and only that job's"""
+        pattern = os.path.join(self.directory, self._token_hash(token))
+        for path in glob.glob(f"{pattern}.bin") + glob.glob(f"{pattern}-*.bin"):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def purge_stale(self, max_age=STALE_AGE):
+        """
+        Remove spool files of jobs that were never confirmed
+
+        :return: Number of files removed
+        """
+        cutoff = time.time() - max_age
+        removed = 0
+        for path in glob.glob(os.path.join(self.directory, "*.bin")):
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.unlink(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    @staticmethod
+    def _token_hash(token):
+        """Fixed-length file name stem of a token, without "-" so variant globs stay exact"""
+        return hashlib.sha1(token.encode()).hexdigest()[:16]
+
+    def _atomic_open(self, path):
+        """Open a temp file that replaces path when closed without error"""
+        os.makedirs(self.directory, exist_ok=True)
+        return _AtomicFile(path)
+
+
+class _AtomicFile:
+    """Write to path.tmp and rename on success, so readers never see partial files"""
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+
+    def __enter__(self):
+        self.file = open(self.tmp_path, "wb")
+        return self.file
+
+    def __exit__(self, exc_type, exc, tb):
+        self.file.close()
+        if exc_type is None:
+            os.replace(self.tmp_path, self.path)
+        else:
+            os.unlink(self.tmp_path)
+        return False
+
+
+def parse_range(range_header, size):
+    """
+    Parse a single-range HTTP Range header
+
+    Multi-range requests are not supported and return None (the full
+    payload is sent instead, which RFC 9110 allows).
+
+    :param range_header: Value of the Range header (may be None)
+    :param size: Payload size in bytes
+    :return: (start, end) inclusive byte offsets, or None for the full payload
+    :raises RangeNotSatisfiable: If the range lies outside the payload
+    """
+    if not range_header:
+        return None
+
+    match = _RANGE_RE.match(range_header.strip())
+    if not match:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+
+    if not start:
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            raise RangeNotSatisfiable(range_header)
+        return max(0, size - length), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable(range_header)
+    return start, end
+
+
+def iter_file(path, start=0, end=None, chunk_size=CHUNK_SIZE):
+    """
+    Yield a byte range of a file in chunks
+
+    :param path: File path
+    :param start: First byte offset
+    :param end: Last byte offset (inclusive), None for end of file
+    :param chunk_size: Maximum chunk size
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = None if end is None else end - start + 1
+        while remaining is None or remaining > 0:
+            chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
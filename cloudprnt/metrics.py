@@ -0,0 +1,377 @@
+"""
+CloudPRNT Metrics
+=================
+
+Minimal Prometheus metrics registry for the CloudPRNT servers.
+
+Recording a sample is a dict update (counters) or a bisect plus three
+list updates (histograms): well under a microsecond, so instrumentation
+can sit on the /poll hot path. Label sets are plain tuples of
+(name, value) pairs; keep them as module constants on hot paths.
+
+Multi-process aggregation is file backed: every process that calls
+configure() periodically writes its samples to <directory>/<pid>.json
+(flush()). render() merges the files of every process with the live
+samples of the calling process: counters and histograms are summed,
+gauges are summed over processes that are still alive.
+
+Usage:
+    from cloudprnt import metrics
+
+    metrics.configure("/path/to/metrics_dir")
+    metrics.inc("cloudprnt_cputil_invocations_total", (("operation", "image"),))
+    metrics.observe("cloudprnt_request_duration_seconds", 0.012, (("endpoint", "poll"),))
+    text = metrics.render()
+"""
+
+import bisect
+import glob
+import json
+import os
+import time
+import uuid
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+HELP = {
+    "cloudprnt_request_duration_seconds": "CloudPRNT HTTP request latency by endpoint",
+    "cloudprnt_requests_total": "CloudPRNT HTTP requests by endpoint and status code",
+    "cloudprnt_db_query_duration_seconds": "Queue database query latency by query",
+    "cloudprnt_frappe_call_duration_seconds": "Calls into the Frappe context pool by function",
+    "cloudprnt_render_duration_seconds": "Job render time by media type",
+    "cloudprnt_render_errors_total": "Failed or timed out renders by media type",
+    "cloudprnt_cputil_invocations_total": "CPUtil conversions by operation",
+    "cloudprnt_cputil_failures_total": "Failed CPUtil conversions by operation",
+    "cloudprnt_cputil_duration_seconds": "CPUtil conversion time by operation",
+    "cloudprnt_cache_requests_total": "Cache lookups by cache and result",
+    "cloudprnt_cache_hit_ratio": "Cache hits over lookups by cache",
+    "cloudprnt_render_pool_in_flight": "Renders submitted to the worker pool and not finished",
+    "cloudprnt_render_pool_queue_depth": "Renders waiting for a free worker",
+    "cloudprnt_render_pool_recycled_total": "Render workers replaced after a render overran its deadline or the worker died",
+    "cloudprnt_queue_depth": "Pending jobs by printer",
+}
+
+# name -> {labels: value}
+_counters = {}
+_gauges = {}
+# name -> {labels: [bucket counts..., +Inf count, sum]}
+_histograms = {}
+
+_directory = None
+_collectors = []
+
+
+def configure(directory):
+    """
+    Enable file-backed aggregation for this process
+
+    :param directory: Directory shared by all processes of the server
+    """
+    global _directory
+    os.makedirs(directory, exist_ok=True)
+    _directory = directory
+
+
+def register_collector(fn):
+    """
+    Register a callable run before every flush and render
+
+    Collectors copy state kept elsewhere (pool and cache counters) into
+    the registry with set_gauge() / set_counter().
+    """
+    _collectors.append(fn)
+
+
+def inc(name, labels=(), value=1):
+    """Increment a counter"""
+    series = _counters.get(name)
+    if series is None:
+        series = _counters[name] = {}
+    series[labels] = series.get(labels, 0) + value
+
+
+def set_counter(name, value, labels=()):
+    """Set a counter from a running total kept elsewhere"""
+    _counters.setdefault(name, {})[labels] = value
+
+
+def set_gauge(name, value, labels=()):
+    """Set a gauge"""
+    _gauges.setdefault(name, {})[labels] = value
+
+
+def clear_gauge(name):
+    """Drop every series of a gauge (before re-populating it)"""
+    _gauges.pop(name, None)
+
+
+def observe(name, value, labels=()):
+    """Record a histogram observation (seconds)"""
+    series = _histograms.get(name)
+    if series is None:
+        series = _histograms[name] = {}
+    counts = series.get(labels)
+    if counts is None:
+        counts = series[labels] = [0] * (len(DEFAULT_BUCKETS) + 2)
+    counts[bisect.bisect_left(DEFAULT_BUCKETS, value)] += 1
+    counts[-1] += value
+
+
+class timer:
+    """
+    Context manager observing the duration of a block
+
+    with metrics.timer("cloudprnt_db_query_duration_seconds", (("query", "next_job"),)):
+        cursor.execute(...)
+    """
+
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, labels=()):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.name, time.perf_counter() - self.start, self.labels)
+        return False
+
+
+def reset():
+    """Clear all samples of this process (tests)"""
+    _counters.clear()
+    _gauges.clear()
+    _histograms.clear()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request latency and status per endpoint
+
+    :param app: ASGI application
+    :param classify: Callable(method, path) -> endpoint label, or None to skip
+    """
+
+    def __init__(self, app, classify):
+        self.app = app
+        self.classify = classify
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        endpoint = self.classify(scope["method"], scope["path"])
+        if endpoint is None:
+            return await self.app(scope, receive, send)
+
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            labels = (("endpoint", endpoint),)
+            observe("cloudprnt_request_duration_seconds", time.perf_counter() - start, labels)
+            inc("cloudprnt_requests_total", labels + (("code", status[0]),))
+
+
+def _run_collectors():
+    for collector in _collectors:
+        try:
+            collector()
+        except Exception:
+            # A broken collector must never break a scrape or a request
+            pass
+
+
+def _snapshot():
+    """Samples of this process as JSON-serialisable lists"""
+    def dump(store):
+        return [[name, [list(pair) for pair in labels], value]
+                for name, series in store.items() for labels, value in series.items()]
+
+    return {
+        "pid": os.getpid(),
+        "counters": dump(_counters),
+        "gauges": dump(_gauges),
+        "histograms": dump(_histograms)
+    }
+
+
+def flush():
+    """Write this process's samples to the shared directory"""
+    if _directory is None:
+        return
+
+    _run_collectors()
+    path = os.path.join(_directory, f"{os.getpid()}.json")
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(_snapshot(), f)
+    os.replace(tmp_path, path)
+
+
+def remove_dead_processes():
+    """
+    Delete files of processes that are gone
+
+    Call once at server start-up, before the new workers flush.
+    """
+    if _directory is None:
+        return
+    for path in glob.glob(os.path.join(_directory, "*.json")):
+        pid = _pid_from_path(path)
+        if pid is not None and not _is_alive(pid):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
+def _pid_from_path(path):
+    try:
+        return int(os.path.basename(path)[:-len(".json")])
+    except ValueError:
+        return None
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def _merge(snapshot, counters, gauges, histograms, alive):
+    """Add one process snapshot to the merged stores"""
+    for name, labels, value in snapshot["counters"]:
+        series = counters.setdefault(name, {})
+        key = tuple(tuple(pair) for pair in labels)
+        series[key] = series.get(key, 0) + value
+
+    if alive:
+        for name, labels, value in snapshot["gauges"]:
+            series = gauges.setdefault(name, {})
+            key = tuple(tuple(pair) for pair in labels)
+            series[key] = series.get(key, 0) + value
+
+    for name, labels, value in snapshot["histograms"]:
+        series = histograms.setdefault(name, {})
+        key = tuple(tuple(pair) for pair in labels)
+        if key in series:
+            series[key] = [a + b for a, b in zip(series[key], value)]
+        else:
+            series[key] = list(value)
+
+
+def collect():
+    """
+    Merge the samples of every process
+
+    :return: (counters, gauges, histograms) dicts of name -> {labels: value}
+    """
+    _run_collectors()
+    snapshot = json.loads(json.dumps(_snapshot()))
+    counters, gauges, histograms = {}, {}, {}
+    _merge(snapshot, counters, gauges, histograms, alive=True)
+
+    if _directory is not None:
+        own = os.getpid()
+        for path in glob.glob(os.path.join(_directory, "*.json")):
+            pid = _pid_from_path(path)
+            if pid is None or pid == own:
+                continue
+            try:
+                with open(path) as f:
+                    other = json.load(f)
+            except (OSError, ValueError):
+                # File replaced or removed while listing
+                continue
+            _merge(other, counters, gauges, histograms, alive=_is_alive(pid))
+
+    return counters, gauges, histograms
+
+
+def _format_labels(labels, extra=None):
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in pairs
+    )
+    return "{" + escaped + "}"
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return repr(value)
+    return str(value)
+
+
+def _add_hit_ratios(counters, gauges):
+    """Derive cloudprnt_cache_hit_ratio from the merged cache counters"""
+    totals = {}
+    for labels, value in counters.get("cloudprnt_cache_requests_total", {}).items():
+        label_dict = dict(labels)
+        hits, total = totals.get(label_dict["cache"], (0, 0))
+        if label_dict["result"] == "hit":
+            hits += value
+        totals[label_dict["cache"]] = (hits, total + value)
+
+    ratios = gauges.setdefault("cloudprnt_cache_hit_ratio", {})
+    for cache, (hits, total) in totals.items():
+        if total:
+            ratios[(("cache", cache),)] = round(hits / total, 4)
+
+
+def render(scrape_gauges=None):
+    """
+    Merged samples in the Prometheus text exposition format
+
+    :param scrape_gauges: Gauges computed for this scrape only, e.g. queue
+        depth read from the database, as {name: {labels: value}}. They are
+        not stored, so they are never summed across processes.
+    :return: Exposition text
+    """
+    counters, gauges, histograms = collect()
+    _add_hit_ratios(counters, gauges)
+    gauges.update(scrape_gauges or {})
+    lines = []
+
+    for kind, store in (("counter", counters), ("gauge", gauges)):
+        for name in sorted(store):
+            if name in HELP:
+                lines.append(f"# HELP {name} {HELP[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(store[name].items()):
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    for name in sorted(histograms):
+        if name in HELP:
+            lines.append(f"# HELP {name} {HELP[name]}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, counts in sorted(histograms[name].items()):
+            cumulative = 0
+            for bound, count in zip(DEFAULT_BUCKETS, counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, ('le', bound))} {cumulative}")
+            cumulative += counts[len(DEFAULT_BUCKETS)]
+            lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(counts[-1])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+
+    return "\n".join(lines) + "\n"
@@ -195,6 +195,12 @@ class CloudPRNTMQTTBridge:
                 printing_in_progress=False
             )
 
+            # Take the job off the queue like DELETE /job, or the retention
+            # sweep would only archive it as expired
+            if job_token:
+                from cloudprnt.print_queue_manager import mark_job_printed
+                mark_job_printed(job_token, status_code)
+
             # Log result
             if print_succeeded:
                 frappe.logger().info(f"✅ Print succeeded: {job_token}")
@@ -0,0 +1,10 @@
+import frappe
+
+
+def execute():
+	"""Give jobs queued before priorities their serving order: POS receipts in creation order"""
+	frappe.db.sql("""
+		UPDATE `tabCloudPRNT Print Queue`
+		SET priority = 0, sequence = creation
+		WHERE sequence IS NULL
+	""")
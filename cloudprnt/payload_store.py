@@ -0,0 +1,214 @@
+"""
+CloudPRNT Payload Store
+=======================
+
+Content-addressed store for job payloads (markup text or hex raster).
+
+Payloads used to live inline in the queue's job_data column: reprints,
+multi-copy and test prints stored the same large blob once per job, and
+every queue scan read those pages. Now each distinct payload is written
+once, as a file named by its SHA-256, and queue entries only keep
+payload_hash and payload_size.
+
+    sites/<site>/private/cloudprnt_payloads/ab/ab12...ef
+
+Hex payloads are stored normalized (no whitespace, uppercase, even
+length), so the standalone server can decode them while streaming,
+straight from the store, with byte ranges mapped to hex offsets.
+
+Files are immutable. Storing a payload that already exists refreshes its
+modification time, and the retention sweep (cloudprnt.queue_retention)
+removes files no queued job references once they are older than the
+longest time a job can stay queued.
+
+Configuration (site_config.json):
+{
+    "cloudprnt_payload_dir": "/path/to/payloads"
+}
+"""
+
+import hashlib
+import os
+import time
+import uuid
+from functools import lru_cache
+
+import frappe
+from cloudprnt.job_renderer import HEX_CHARS, is_hex_job
+
+CHUNK_SIZE = 64 * 1024  # decoded bytes per streamed chunk
+HEX_HEAD = 101  # characters is_hex_job() needs to classify a payload
+
+
+class PayloadStore:
+    """
+    Directory of payload files keyed by SHA-256
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: Store directory (created on first write)
+        """
+        self.directory = directory
+
+    def path(self, payload_hash):
+        """
+        File path of a payload
+
+        :param payload_hash: SHA-256 hex digest
+        :return: Absolute file path
+        :raises ValueError: If the hash is not a SHA-256 hex digest
+        """
+        if len(payload_hash) != 64 or not all(c in "0123456789abcdef" for c in payload_hash):
+            raise ValueError(f"Invalid payload hash {payload_hash!r}")
+        return os.path.join(self.directory, payload_hash[:2], payload_hash)
+
+    def put(self, data):
+        """
+        Store a payload once
+
+        :param data: Markup text or hex string
+        :return: (payload_hash, payload_size in bytes)
+        """
+        if is_hex_job(data):
+            data = "".join(data.split()).upper()
+            if len(data) % 2:
+                data += "0"
+        content = data.encode("utf-8")
+        payload_hash = hashlib.sha256(content).hexdigest()
+        path = self.path(payload_hash)
+
+        try:
+            # Shared with an earlier job: keep it out of the purge
+            os.utime(path)
+        except FileNotFoundError:
+            # New, or purged since it was last stored
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        return payload_hash, len(content)
+
+    def read(self, payload_hash):
+        """
+        Load a payload
+
+        :return: Payload text
+        :raises FileNotFoundError: If the payload was purged
+        """
+        with open(self.path(payload_hash), "rb") as f:
+            return f.read().decode("utf-8")
+
+    def is_hex(self, payload_hash):
+        """Whether a payload is pre-converted hex, from its first characters"""
+        return _is_hex_file(self.path(payload_hash))
+
+    def iter_hex(self, payload_hash, start=0, end=None, chunk_size=CHUNK_SIZE):
+        """
+        Yield a decoded byte range of a hex payload in chunks
+
+        :param payload_hash: Hash of a hex payload
+        :param start: First decoded byte offset
+        :param end: Last decoded byte offset (inclusive), None for the end
+        :param chunk_size: Maximum decoded chunk size
+        """
+        with open(self.path(payload_hash), "rb") as f:
+            f.seek(start * 2)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                size = chunk_size if remaining is None else min(chunk_size, remaining)
+                chunk = f.read(size * 2)
+                if not chunk:
+                    break
+                data = bytes.fromhex(chunk.decode("ascii"))
+                if remaining is not None:
+                    remaining -= len(data)
+                yield data
+
+    def purge(self, referenced=(), max_age=None):
+        """
+        Remove payload files no job references any more
+
+        :param referenced: Hashes still used by queued jobs, or a callable
+            returning them, called once the old files are listed so jobs
+            queued during the walk are seen
+        :param max_age: Seconds since the last store of a payload before it may go
+        :return: Number of files removed
+        """
+        cutoff = time.time() - (max_age or 0)
+        removed = 0
+        if not os.path.isdir(self.directory):
+            return 0
+
+        candidates = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        candidates.append((name, path))
+                except FileNotFoundError:
+                    pass
+
+        referenced = set(referenced() if callable(referenced) else referenced)
+        for name, path in candidates:
+            if name in referenced:
+                continue
+            try:
+                # put() refreshes the time of a payload stored again since the walk
+                if os.path.getmtime(path) < cutoff:
+                    os.unlink(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+
+@lru_cache(maxsize=4096)
+def _is_hex_file(path):
+    """Payload files never change, so the answer is cached per path"""
+    with open(path, "rb") as f:
+        head = f.read(HEX_HEAD).decode("utf-8", "replace")
+    return len(head) > 100 and all(c in HEX_CHARS for c in head[:100])
+
+
+def get_payload_store():
+    """
+    Payload store of the current site, for code running inside Frappe
+
+    :return: PayloadStore
+    """
+    return PayloadStore(
+        frappe.conf.get("cloudprnt_payload_dir") or frappe.get_site_path("private", "cloudprnt_payloads")
+    )
+
+
+def store_payloads(jobs, store=None):
+    """
+    Move the job_data of job specs into the store
+
+    :param jobs: Job spec dicts, updated in place: job_data becomes None,
+        payload_hash and payload_size are set
+    :param store: PayloadStore (default get_payload_store())
+    :return: jobs
+    """
+    store = store or get_payload_store()
+    for job in jobs:
+        if job.get("job_data"):
+            job["payload_hash"], job["payload_size"] = store.put(job["job_data"])
+            job["job_data"] = None
+    return jobs
+
+
+def load_job_data(job, store=None):
+    """
+    job_data of a queued job, inline or from the store
+
+    :param job: Job dict from the queue backend
+    :param store: PayloadStore (default get_payload_store())
+    :return: Markup or hex string, or None for invoice jobs
+    """
+    if job.get("job_data") or not job.get("payload_hash"):
+        return job.get("job_data")
+    return (store or get_payload_store()).read(job["payload_hash"])
@@ -2,68 +2,423 @@
 CloudPRNT Print Queue Manager
 ==============================
 
-Database-backed print queue for sharing jobs between processes.
+Shared print queue for sharing jobs between processes.
 Replaces in-memory PRINT_QUEUE for multi-process compatibility.
+
+Jobs are stored by the backend chosen in site_config
+(cloudprnt_queue_backend, see cloudprnt.queue_backend); the job history
+is always written to the database.
+
+Enqueueing is idempotent: a job whose idempotency key (default: job
+token and printer) was already queued within the dedupe window is not
+queued again, the caller gets the first job back instead. This absorbs
+double-taps on the POS button and client retries. A reprint that must
+come out again passes a copy counter, which gives it its own token.
+
+Queue status is aggregated: job counts per printer and status, the age
+of each printer's oldest pending job, and one page of jobs at a time
+(keyset cursor). Each reply carries an etag; a caller passing it back
+gets {"not_modified": True} until the queue changes.
+
+Configuration (site_config.json):
+{
+	"cloudprnt_dedupe_window": 30
+}
 """
 
 import frappe
+import hashlib
 import json
-from datetime import datetime
-
-
-def add_job_to_queue(job_token, printer_mac, invoice_name=None, job_data=None, media_types=None):
+import re
+from cloudprnt.job_history import (
+	record_enqueued_many,
+	record_fetched,
+	record_confirmed,
+	record_fetched_many,
+	record_confirmed_many
+)
+from cloudprnt.payload_store import store_payloads
+from cloudprnt.printer_pools import is_pool_queue
+from cloudprnt.queue_backend import DEFAULT_MEDIA_TYPES, DEFAULT_PAGE_SIZE, get_backend, priority_level
+
+JOB_SPEC_FIELDS = {
+	"job_token", "printer_mac", "invoice_name", "job_data", "media_types", "priority",
+	"idempotency_key", "copy"
+}
+MAC_RE = re.compile(r"^([0-9A-F]{2}:){5}[0-9A-F]{2}$")
+
+DEFAULT_DEDUPE_WINDOW = 30  # seconds, 0 disables deduplication
+IDEMPOTENCY_PREFIX = "cloudprnt_enqueue"
+
+MAX_STATUS_PAGE_SIZE = 500  # jobs per get_queue_status page
+
+
+def add_job_to_queue(job_token, printer_mac, invoice_name=None, job_data=None, media_types=None, priority=None,
+		idempotency_key=None, copy=0):
 	"""
 	Add a print job to the database queue
 
 	:param job_token: Unique job identifier
-	:param printer_mac: Printer MAC address
+	:param printer_mac: Printer MAC address, or a printer pool's queue (printer_pools.pool_queue())
 	:param invoice_name: POS Invoice name (optional)
 	:param job_data: Job data for custom jobs (optional)
 	:param media_types: Supported media types
-	:return: Success dict
+	:param priority: "pos" (live receipt, default), "reprint" or "test"
+	:param idempotency_key: Key collapsing repeated requests (default: token and printer)
+	:param copy: Copy counter, > 0 for another copy of an already printed job
+	:return: Success dict; duplicate is True if the job was already queued
+		within the dedupe window (job_token is then the first job's)
+	"""
+	result = add_jobs_to_queue([{
+		"job_token": job_token,
+		"printer_mac": printer_mac,
+		"invoice_name": invoice_name,
+		"job_data": job_data,
+		"media_types": media_types,
+		"priority": priority,
+		"idempotency_key": idempotency_key,
+		"copy": copy
+	}])
+
+	if not result.get("success"):
+		return result
+
+	job = result["jobs"][0]
+	return {
+		"success": True,
+		"job_token": job["job_token"],
+		"queue_position": job["queue_position"],
+		"duplicate": job["duplicate"]
+	}
+
+
+def add_jobs_to_queue(jobs):
+	"""
+	Add several print jobs in one transaction
+
+	All jobs are written with one multi-row INSERT (queue and job history)
+	and one commit; each affected printer gets one cloudprnt_queue_update
+	realtime event. Nothing is queued if any job spec is invalid.
+	Payloads go to the payload store, identical ones stored once.
+	Jobs whose idempotency key was queued within the dedupe window, or
+	whose token is still in the queue (job_token is unique), are skipped
+	and reported with the queued job's token and position.
+
+	:param jobs: List of dicts with job_token, printer_mac and optionally
+		invoice_name, job_data, media_types, priority, idempotency_key and
+		copy (add_job_to_queue arguments)
+	:return: Success dict with jobs: [{job_token, printer_mac, queue_position, duplicate}],
+		in list order
 	"""
+	try:
+		jobs = validate_job_specs(jobs)
+	except (TypeError, ValueError) as e:
+		return {
+			"success": False,
+			"message": str(e)
+		}
+
+	window = get_dedupe_window()
+	originals = reserve_idempotency_keys(jobs, window)
+	new_jobs = [job for job, original in zip(jobs, originals) if not original]
+
 	try:
 		# Ensure we have a user set
 		if not frappe.session.user:
 			frappe.set_user("Administrator")
 
-		# Default media types
-		if not media_types:
-			media_types = ["image/png", "application/vnd.star.line", "text/vnd.star.markup"]
-
-		# Create queue entry using direct SQL to avoid module loading issues
-		frappe.db.sql("""
-			INSERT INTO `tabCloudPRNT Print Queue`
-			(name, creation, modified, modified_by, owner, docstatus, idx,
-			 job_token, printer_mac, invoice_name, status, job_data, media_types)
-			VALUES
-			(%(name)s, NOW(), NOW(), %(user)s, %(user)s, 0, 0,
-			 %(job_token)s, %(printer_mac)s, %(invoice_name)s, 'Pending', %(job_data)s, %(media_types)s)
-		""", {
-			'name': frappe.generate_hash(length=10),
-			'user': frappe.session.user or 'Administrator',
-			'job_token': job_token,
-			'printer_mac': printer_mac.upper(),
-			'invoice_name': invoice_name,
-			'job_data': job_data,
-			'media_types': json.dumps(media_types)
-		})
-		frappe.db.commit()
-
-
-		return {
-			"success": True,
-			"job_token": job_token,
-			"queue_position": get_queue_position(printer_mac, job_token)
-		}
+		positions = {}
+		if new_jobs:
+			try:
+				positions = enqueue_jobs(new_jobs)
+			except Exception as e:
+				if not frappe.db.is_duplicate_entry(e):
+					raise
+				# A token still queued (after the window, or with it disabled)
+				frappe.db.rollback()
+				queued = get_backend().find([job["job_token"] for job in new_jobs])
+				for idx, job in enumerate(jobs):
+					if not originals[idx] and job["job_token"] in queued:
+						originals[idx] = {"job_token": job["job_token"], "printer_mac": queued[job["job_token"]]}
+				new_jobs = [job for job, original in zip(jobs, originals) if not original]
+				if new_jobs:
+					positions = enqueue_jobs(new_jobs)
+
+		for original in originals:
+			if original and original["job_token"] not in positions:
+				positions[original["job_token"]] = get_queue_position(original["printer_mac"], original["job_token"])
 
 	except Exception as e:
-		frappe.log_error(f"Error adding job to queue: {str(e)}", "add_job_to_queue")
+		frappe.db.rollback()
+		# Let the retry through
+		release_idempotency_keys(new_jobs, window)
+		frappe.log_error(f"Error adding jobs to queue: {str(e)}", "add_jobs_to_queue")
 		return {
 			"success": False,
 			"message": str(e)
 		}
 
+	notify_printers(new_jobs)
+
+	results = []
+	for job, original in zip(jobs, originals):
+		if original:
+			frappe.logger().info(f"Duplicate print request {job['job_token']} collapsed into {original['job_token']}")
+		queued = original or job
+		results.append({
+			"job_token": queued["job_token"],
+			"printer_mac": queued["printer_mac"],
+			"queue_position": positions[queued["job_token"]],
+			"duplicate": bool(original)
+		})
+
+	return {
+		"success": True,
+		"jobs": results
+	}
+
+
+def enqueue_jobs(jobs):
+	"""
+	Queue normalized jobs and their history rows, then commit
+
+	:return: {job_token: queue_position}
+	"""
+	# Queue rows only reference the payloads
+	positions = get_backend().enqueue_many(store_payloads(jobs))
+	record_enqueued_many(jobs)
+	frappe.db.commit()
+	return positions
+
+
+def get_dedupe_window():
+	"""
+	Seconds during which a repeated idempotency key is not queued again
+
+	:return: Window from site config cloudprnt_dedupe_window, 0 when disabled
+	"""
+	window = frappe.conf.get("cloudprnt_dedupe_window")
+	return DEFAULT_DEDUPE_WINDOW if window is None else max(0, frappe.utils.cint(window))
+
+
+def copy_token(job_token, copy=0):
+	"""
+	Job token of a numbered copy
+
+	:param job_token: Token of the original job (usually the invoice name)
+	:param copy: Copy counter, 0 for the original
+	:return: job_token, or job_token-copy-N for copy N
+	"""
+	return f"{job_token}-copy-{copy}" if copy else job_token
+
+
+def _idempotency_cache_key(key):
+	"""Site-prefixed Redis key of an idempotency key"""
+	return frappe.cache().make_key(f"{IDEMPOTENCY_PREFIX}|{key}")
+
+
+def reserve_idempotency_keys(jobs, window):
+	"""
+	Claim the idempotency keys of jobs about to be queued
+
+	Each key is set once (SET NX) with the window as expiry, so of two
+	requests racing with the same key only one queues its job. A key
+	repeated inside the list is a duplicate of its first job.
+
+	:param jobs: Normalized job specs
+	:param window: Dedupe window in seconds (0: nothing is deduplicated)
+	:return: One entry per job: None to queue it, or {job_token, printer_mac}
+		of the job already queued with its key
+	"""
+	originals = [None] * len(jobs)
+	if not window:
+		return originals
+
+	claimed = {}
+	try:
+		cache = frappe.cache()
+		for idx, job in enumerate(jobs):
+			key = job["idempotency_key"]
+			if key in claimed:
+				originals[idx] = claimed[key]
+				continue
+			queued = {"job_token": job["job_token"], "printer_mac": job["printer_mac"]}
+			if cache.set(_idempotency_cache_key(key), json.dumps(queued), ex=window, nx=True):
+				claimed[key] = queued
+				continue
+			existing = cache.get(_idempotency_cache_key(key))
+			# Expired between SET and GET: nothing to collapse into
+			originals[idx] = json.loads(existing) if existing else None
+			claimed[key] = originals[idx] or queued
+	except Exception as e:
+		# Printing twice beats not printing
+		frappe.logger().warning(f"Idempotency check failed, queueing without it: {str(e)}")
+		return [None] * len(jobs)
+
+	return originals
+
+
+def find_recent_duplicate(job_token, printer_mac, copy=0):
+	"""
+	Job already queued for the same request within the dedupe window
+
+	A read-only check for callers to run before expensive work (building
+	the markup); add_job_to_queue still reserves the key atomically.
+
+	:param job_token: Token of the original job
+	:param printer_mac: Printer MAC address or pool queue
+	:param copy: Copy counter
+	:return: {job_token, queue_position} of the queued job, or None
+	"""
+	if not get_dedupe_window() or not printer_mac:
+		return None
+	try:
+		key = f"{copy_token(job_token, copy)}|{printer_mac.replace('.', ':').upper()}"
+		existing = frappe.cache().get(_idempotency_cache_key(key))
+	except Exception as e:
+		frappe.logger().warning(f"Idempotency check failed: {str(e)}")
+		return None
+	if not existing:
+		return None
+
+	original = json.loads(existing)
+	return {
+		"job_token": original["job_token"],
+		"queue_position": get_queue_position(original["printer_mac"], original["job_token"])
+	}
+
+
+def release_idempotency_keys(jobs, window):
+	"""
+	Drop the keys reserved for jobs that could not be queued
+
+	:param jobs: Normalized job specs passed to reserve_idempotency_keys()
+	:param window: Dedupe window in seconds
+	"""
+	if not window or not jobs:
+		return
+	try:
+		frappe.cache().delete(*[_idempotency_cache_key(job["idempotency_key"]) for job in jobs])
+	except Exception as e:
+		frappe.logger().warning(f"Could not release idempotency keys: {str(e)}")
+
+
+def clear_idempotency_keys(printer_mac=None):
+	"""
+	Forget the idempotency keys of cleared jobs, so they can be printed again
+
+	:param printer_mac: Only keys of this printer's jobs (default all)
+	"""
+	try:
+		cache = frappe.cache()
+		if not printer_mac:
+			cache.delete_keys(f"{IDEMPOTENCY_PREFIX}|")
+			return
+
+		printer_mac = printer_mac.replace(".", ":").upper()
+		keys = cache.get_keys(f"{IDEMPOTENCY_PREFIX}|")
+		if not keys:
+			return
+		stale = [
+			key for key, value in zip(keys, cache.mget(keys))
+			if value and json.loads(value).get("printer_mac") == printer_mac
+		]
+		if stale:
+			cache.delete(*stale)
+	except Exception as e:
+		frappe.logger().warning(f"Could not clear idempotency keys: {str(e)}")
+
+
+def validate_job_specs(jobs):
+	"""
+	Check and normalize job specs before anything is written
+
+	:param jobs: List of job spec dicts
+	:return: List of normalized specs (token of the copy, MAC uppercase with colons,
+		default media types, priority level, idempotency key)
+	:raises ValueError: On a missing field, invalid MAC or priority, or duplicate token
+	"""
+	if not isinstance(jobs, (list, tuple)) or not jobs:
+		raise ValueError("jobs must be a non-empty list")
+
+	normalized = []
+	tokens = set()
+	for idx, spec in enumerate(jobs, 1):
+		if not isinstance(spec, dict):
+			raise ValueError(f"Job {idx}: expected a dict")
+
+		unknown = set(spec) - JOB_SPEC_FIELDS
+		if unknown:
+			raise ValueError(f"Job {idx}: unknown fields {', '.join(sorted(unknown))}")
+
+		copy = spec.get("copy") or 0
+		if not isinstance(copy, int) or copy < 0:
+			raise ValueError(f"Job {idx}: copy must be a non-negative integer")
+
+		job_token = spec.get("job_token")
+		if job_token and isinstance(job_token, str):
+			job_token = copy_token(job_token, copy)
+		if not job_token or not isinstance(job_token, str) or len(job_token) > 140:
+			raise ValueError(f"Job {idx}: job_token is required (text, at most 140 characters)")
+		if job_token in tokens:
+			raise ValueError(f"Job {idx}: duplicate job_token {job_token}")
+		tokens.add(job_token)
+
+		printer_mac = spec.get("printer_mac") or ""
+		if is_pool_queue(printer_mac):
+			# Assigned to a member when one polls
+			printer_mac = printer_mac.upper()
+		else:
+			printer_mac = printer_mac.replace(".", ":").upper()
+			if not MAC_RE.match(printer_mac):
+				raise ValueError(f"Job {idx}: invalid printer_mac {spec.get('printer_mac')!r}")
+
+		media_types = spec.get("media_types") or DEFAULT_MEDIA_TYPES
+		if not isinstance(media_types, (list, tuple)) or not all(isinstance(m, str) for m in media_types):
+			raise ValueError(f"Job {idx}: media_types must be a list of MIME types")
+
+		try:
+			priority = priority_level(spec.get("priority"))
+		except (TypeError, ValueError) as e:
+			raise ValueError(f"Job {idx}: {e}")
+
+		idempotency_key = spec.get("idempotency_key") or f"{job_token}|{printer_mac}"
+		if not isinstance(idempotency_key, str) or len(idempotency_key) > 200:
+			raise ValueError(f"Job {idx}: idempotency_key must be text, at most 200 characters")
+
+		normalized.append({
+			"job_token": job_token,
+			"printer_mac": printer_mac,
+			"invoice_name": spec.get("invoice_name"),
+			"job_data": spec.get("job_data"),
+			"media_types": list(media_types),
+			"priority": priority,
+			"idempotency_key": idempotency_key
+		})
+
+	return normalized
+
+
+def notify_printers(jobs):
+	"""
+	Publish one cloudprnt_queue_update realtime event per affected printer
+
+	:param jobs: Normalized job specs that were just queued
+	"""
+	tokens_by_printer = {}
+	for job in jobs:
+		tokens_by_printer.setdefault(job["printer_mac"], []).append(job["job_token"])
+
+	for printer_mac, tokens in tokens_by_printer.items():
+		try:
+			frappe.publish_realtime(
+				"cloudprnt_queue_update",
+				{"printer_mac": printer_mac, "job_tokens": tokens}
+			)
+		except Exception as e:
+			# Queued jobs are printed on the next poll anyway
+			frappe.logger().warning(f"Queue notification failed for {printer_mac}: {str(e)}")
+
 
 def get_next_job(printer_mac):
 	"""
@@ -73,37 +428,7 @@ def get_next_job(printer_mac):
 	:return: Job dict or None
 	"""
 	try:
-		# Get oldest pending job for this printer
-		jobs = frappe.get_all(
-			"CloudPRNT Print Queue",
-			filters={
-				"printer_mac": printer_mac.upper(),
-				"status": "Pending"
-			},
-			fields=["name", "job_token", "invoice_name", "job_data", "media_types", "printer_mac", "creation"],
-			order_by="creation asc",
-			limit=1
-		)
-
-		if not jobs:
-			return None
-
-		job = jobs[0]
-
-		# Parse media types
-		try:
-			media_types = json.loads(job.get("media_types") or "[]")
-		except:
-			media_types = ["image/png", "application/vnd.star.line", "text/vnd.star.markup"]
-
-		return {
-			"name": job.name,
-			"token": job.job_token,
-			"invoice": job.invoice_name,
-			"job_data": job.job_data,
-			"media_types": media_types,
-			"printer_mac": job.printer_mac
-		}
+		return get_backend().peek(printer_mac)
 
 	except Exception as e:
 		frappe.log_error(f"Error getting next job: {str(e)}", "get_next_job")
@@ -117,28 +442,39 @@ def mark_job_fetched(job_token):
 	:param job_token: Job token
 	"""
 	try:
-		frappe.db.set_value("CloudPRNT Print Queue", {"job_token": job_token}, "status", "Fetched")
+		get_backend().mark_fetched([job_token])
+		record_fetched(job_token)
 		frappe.db.commit()
 	except Exception as e:
 		frappe.log_error(f"Error marking job as fetched: {str(e)}", "mark_job_fetched")
 
 
-def mark_job_printed(job_token):
+def mark_jobs_fetched(job_tokens):
+	"""
+	Mark several jobs as fetched with one queue statement
+
+	:param job_tokens: List of job tokens
+	"""
+	try:
+		job_tokens = list(job_tokens)
+		get_backend().mark_fetched(job_tokens)
+		record_fetched_many(job_tokens)
+		frappe.db.commit()
+	except Exception as e:
+		frappe.log_error(f"Error marking jobs as fetched: {str(e)}", "mark_jobs_fetched")
+
+
+def mark_job_printed(job_token, status_code=None):
 	"""
 	Mark job as printed (delete from queue)
 
 	:param job_token: Job token
+	:param status_code: Status code sent by the printer with DELETE (optional)
 	"""
 	try:
-		# Find and delete the job by token (regardless of status)
-		jobs = frappe.get_all(
-			"CloudPRNT Print Queue",
-			filters={"job_token": job_token},
-			fields=["name"]
-		)
-
-		if jobs:
-			frappe.delete_doc("CloudPRNT Print Queue", jobs[0].name, ignore_permissions=True)
+		# Remove the job by token (regardless of status)
+		if get_backend().ack(job_token):
+			record_confirmed(job_token, status_code)
 			frappe.db.commit()
 			return {"success": True}
 		else:
@@ -150,6 +486,33 @@ def mark_job_printed(job_token):
 		return {"success": False, "message": str(e)}
 
 
+def mark_jobs_printed(job_tokens, status_code=None):
+	"""
+	Mark several jobs as printed (delete from queue) with one statement
+
+	:param job_tokens: List of job tokens
+	:param status_code: Status code sent by the printer with DELETE (optional)
+	:return: {job_token: result} with the mark_job_printed result of each token
+	"""
+	job_tokens = list(job_tokens)
+	try:
+		removed = get_backend().ack_many(job_tokens)
+		record_confirmed_many([token for token in job_tokens if token in removed], status_code)
+		frappe.db.commit()
+	except Exception as e:
+		frappe.log_error(f"Error marking jobs as printed: {str(e)}", "mark_jobs_printed")
+		return {token: {"success": False, "message": str(e)} for token in job_tokens}
+
+	results = {}
+	for token in job_tokens:
+		if token in removed:
+			results[token] = {"success": True}
+		else:
+			frappe.logger().warning(f"Job not found for deletion: {token}")
+			results[token] = {"success": False, "message": "Job not found"}
+	return results
+
+
 def get_queue_position(printer_mac, job_token):
 	"""
 	Get position of job in queue
@@ -159,57 +522,83 @@ def get_queue_position(printer_mac, job_token):
 	:return: Queue position (1-based)
 	"""
 	try:
-		jobs = frappe.get_all(
-			"CloudPRNT Print Queue",
-			filters={
-				"printer_mac": printer_mac.upper(),
-				"status": "Pending"
-			},
-			fields=["job_token", "creation"],
-			order_by="creation asc"
-		)
-
-		for idx, job in enumerate(jobs, 1):
-			if job.job_token == job_token:
-				return idx
-
-		return 0
+		return get_backend().position(printer_mac, job_token)
 
 	except Exception as e:
 		frappe.log_error(f"Error getting queue position: {str(e)}", "get_queue_position")
 		return 0
 
 
-@frappe.whitelist()
-def get_queue_status(printer_mac=None):
+def get_queue_positions(printer_mac, job_tokens):
 	"""
-	Get queue status for debugging
+	Get positions of several jobs of one printer with one query
 
-	:param printer_mac: Optional MAC address to filter
-	:return: Queue status dict
+	:param printer_mac: Printer MAC address
+	:param job_tokens: List of job tokens
+	:return: {job_token: position}, 0 for jobs not pending
 	"""
+	job_tokens = list(job_tokens)
 	try:
-		filters = {}
-		if printer_mac:
-			filters["printer_mac"] = printer_mac.upper()
+		return get_backend().positions(printer_mac, job_tokens)
 
-		jobs = frappe.get_all(
-			"CloudPRNT Print Queue",
-			filters=filters,
-			fields=["job_token", "printer_mac", "invoice_name", "status", "creation"],
-			order_by="creation asc"
-		)
+	except Exception as e:
+		frappe.log_error(f"Error getting queue positions: {str(e)}", "get_queue_positions")
+		return {token: 0 for token in job_tokens}
+
+
+def queue_status_etag(version, *filters):
+	"""
+	ETag of a queue status reply
+
+	:param version: QueueBackend.version() of the queried printers
+	:param filters: Query arguments, so each page and filter has its own
+	"""
+	return hashlib.sha1(repr((version,) + filters).encode()).hexdigest()[:16]
+
+
+@frappe.whitelist()
+def get_queue_status(printer_mac=None, status=None, priority=None, after=None, limit=None, etag=None):
+	"""
+	Get queue status: job counts per printer and one page of jobs
+
+	Counts come from one GROUP BY; jobs are paged in serving order with a
+	keyset cursor, so the reply stays small however long the queue is.
 
+	:param printer_mac: Optional MAC address to filter
+	:param status: Only list jobs with this status (Pending, Fetched)
+	:param priority: Only list jobs of this priority class
+	:param after: Cursor of the page to list ("next" of the previous reply)
+	:param limit: Jobs per page (default 50, at most MAX_STATUS_PAGE_SIZE)
+	:param etag: etag of a previous reply; unchanged queues return
+		{"etag": etag, "not_modified": True}
+	:return: Queue status dict with etag, printers ({printer_mac: {counts,
+		total, oldest_pending, oldest_pending_age}}), total_jobs, jobs
+		(serving order, with their priority) and next (cursor or None)
+	"""
+	try:
+		backend = get_backend()
+		printer_mac = printer_mac.upper() if printer_mac else None
+		limit = min(max(frappe.utils.cint(limit) or DEFAULT_PAGE_SIZE, 1), MAX_STATUS_PAGE_SIZE)
+
+		current = queue_status_etag(backend.version(printer_mac), printer_mac, status, priority, after, limit)
+		if etag and etag == current:
+			return {"etag": current, "not_modified": True}
+
+		printers = backend.summary(printer_mac)
+		for summary in printers.values():
+			summary["total"] = sum(summary["counts"].values())
+		jobs, next_cursor = backend.page(printer_mac, status=status, priority=priority, after=after, limit=limit)
+
+		result = {
+			"etag": current,
+			"total_jobs": sum(summary["total"] for summary in printers.values()),
+			"printers": printers,
+			"jobs": jobs,
+			"next": next_cursor
+		}
 		if printer_mac:
-			return {
-				"printer_mac": printer_mac.upper(),
-				"jobs": jobs
-			}
-		else:
-			return {
-				"total_jobs": len(jobs),
-				"jobs": jobs
-			}
+			result["printer_mac"] = printer_mac
+		return result
 
 	except Exception as e:
 		frappe.log_error(f"Error getting queue status: {str(e)}", "get_queue_status")
@@ -225,12 +614,9 @@ def clear_queue(printer_mac=None):
 	:return: Success dict
 	"""
 	try:
-		filters = {}
-		if printer_mac:
-			filters["printer_mac"] = printer_mac.upper()
-
-		frappe.db.delete("CloudPRNT Print Queue", filters)
+		get_backend().clear(printer_mac)
 		frappe.db.commit()
+		clear_idempotency_keys(printer_mac)
 
 		return {
 			"success": True,
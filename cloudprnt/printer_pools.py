@@ -0,0 +1,220 @@
+"""
+CloudPRNT Printer Pools
+=======================
+
+Identical printers at one counter can share their print jobs: printers
+with the same Printer Pool name in CloudPRNT Settings > Printers form a
+pool. Jobs printed to a pool are queued under the pool itself
+(printer_mac "POOL:<NAME>") and handed to a member when one polls:
+
+    a polling member takes the pool's next job unless it is printing, or
+    another available member has a shorter queue
+
+so each job is assigned at claim time to the least busy printer, not
+when the receipt is requested. The job then belongs to that printer's
+queue, keeping its place in the serving order, and is fetched and
+confirmed like any other job.
+
+A member is available when it is online, not printing_in_progress, not
+reporting an error status (4xx: paper, cover), and has polled within
+`cloudprnt_pool_member_timeout` seconds. A member that stops polling is
+therefore skipped without waiting for its online flag to be cleared.
+Printer status is recorded on poll by both servers (the standalone
+server writes it in the background, at most every few seconds per
+printer).
+
+Pool membership is cached in Redis (POOL_MAP_CACHE_KEY, dropped when
+CloudPRNT Settings is saved), so the poll of a printer outside any pool
+costs no query. A member's poll reads the pending jobs of its pools and
+their members only, and the members' status only when a pool has jobs.
+
+Configuration (site_config.json):
+{
+    "cloudprnt_pool_member_timeout": 30
+}
+"""
+
+import json
+
+import frappe
+from cloudprnt.queue_backend import get_backend
+
+POOL_PREFIX = "POOL:"
+DEFAULT_MEMBER_TIMEOUT = 30  # seconds since a member's last poll
+
+POOL_MAP_CACHE_KEY = "cloudprnt_pool_map"
+POOL_MAP_TTL = 300  # seconds, the settings controller drops it on save
+
+# Status of some pool members. Params: member MACs (colons)
+_MEMBERS_SQL = """
+    SELECT UPPER(REPLACE(mac_address, '.', ':')) AS mac_address,
+        online, printing_in_progress, status_code, last_activity
+    FROM `tabCloudPRNT Printers`
+    WHERE parent = 'CloudPRNT Settings'
+    AND UPPER(REPLACE(mac_address, '.', ':')) IN ({macs})
+"""
+
+
+def pool_queue(pool_name):
+    """
+    Queue key of a printer pool, used as printer_mac of its jobs
+
+    :param pool_name: Printer Pool name (any case)
+    :return: "POOL:<NAME>"
+    """
+    return f"{POOL_PREFIX}{pool_name.strip().upper()}"
+
+
+def is_pool_queue(printer_mac):
+    """Whether a queue key is a printer pool's"""
+    return bool(printer_mac) and printer_mac.upper().startswith(POOL_PREFIX)
+
+
+def find_pool(pool_name):
+    """
+    Printer Pool name as configured, looked up in any case
+
+    :param pool_name: Pool name given by a caller
+    :return: Configured pool name, or None if no printer has it
+    """
+    rows = frappe.db.sql("""
+        SELECT printer_pool
+        FROM `tabCloudPRNT Printers`
+        WHERE parent = 'CloudPRNT Settings'
+        AND UPPER(printer_pool) = UPPER(%s)
+        LIMIT 1
+    """, (pool_name,), as_dict=True)
+    return rows[0].printer_pool if rows else None
+
+
+def get_pool_map():
+    """
+    Members of every printer pool, cached
+
+    :return: {pool name (uppercase): [member MACs (colons)]}
+    """
+    raw = frappe.cache().get_value(POOL_MAP_CACHE_KEY)
+    if raw is not None:
+        return json.loads(raw)
+
+    pools = {}
+    for row in frappe.db.sql("""
+        SELECT UPPER(printer_pool) AS printer_pool, UPPER(REPLACE(mac_address, '.', ':')) AS mac_address
+        FROM `tabCloudPRNT Printers`
+        WHERE parent = 'CloudPRNT Settings'
+        AND IFNULL(printer_pool, '') != ''
+    """, as_dict=True):
+        pools.setdefault(row.printer_pool.strip(), []).append(row.mac_address)
+    frappe.cache().set_value(POOL_MAP_CACHE_KEY, json.dumps(pools), expires_in_sec=POOL_MAP_TTL)
+    return pools
+
+
+def clear_pool_map():
+    """Drop the cached pool membership (CloudPRNT Settings saved)"""
+    frappe.cache().delete_value(POOL_MAP_CACHE_KEY)
+
+
+def get_pool_members(member_macs):
+    """
+    Status of pool members
+
+    :param member_macs: Member MAC addresses (colons)
+    :return: {mac_address: dict with online, printing_in_progress,
+        status_code and last_activity}
+    """
+    member_macs = list(member_macs)
+    if not member_macs:
+        return {}
+    rows = frappe.db.sql(
+        _MEMBERS_SQL.format(macs=", ".join(["%s"] * len(member_macs))),
+        tuple(mac.upper() for mac in member_macs),
+        as_dict=True
+    )
+    return {row.mac_address: row for row in rows}
+
+
+def is_available(member, now=None, timeout=None):
+    """
+    Whether a pool member can take a job
+
+    :param member: Value from get_pool_members()
+    :param now: Current timestamp, on the clock of last_activity (default now)
+    :param timeout: Seconds since the last poll (default from site config)
+    """
+    now = frappe.utils.now_datetime().timestamp() if now is None else now
+    timeout = get_member_timeout() if timeout is None else timeout
+    return bool(
+        member.get("online")
+        and not member.get("printing_in_progress")
+        and not is_error_status(member.get("status_code"))
+        and (member.get("last_activity") or 0) >= now - timeout
+    )
+
+
+def is_error_status(status_code):
+    """Whether a CloudPRNT status code reports a printer error (4xx)"""
+    return str(status_code or "").strip().startswith("4")
+
+
+def get_member_timeout():
+    """Seconds after its last poll a pool member stops counting as available"""
+    return frappe.utils.cint(frappe.conf.get("cloudprnt_pool_member_timeout")) or DEFAULT_MEMBER_TIMEOUT
+
+
+def dispatch_pool_job(printer_mac, printing_in_progress=False, status_code=None, backend=None):
+    """
+    Give the polling printer the next job of one of its pools, if it is
+    the least busy available member
+
+    Called on every poll before the printer's queue is read. Commits when
+    a job is assigned.
+
+    :param printer_mac: MAC address of the polling printer (colons)
+    :param printing_in_progress: printingInProgress of the poll
+    :param status_code: statusCode of the poll
+    :param backend: QueueBackend (default get_backend())
+    :return: Token of the assigned job, or None
+    """
+    if printing_in_progress or is_error_status(status_code):
+        return None
+
+    printer_mac = printer_mac.upper()
+    pool_map = get_pool_map()
+    pools = sorted(pool for pool, macs in pool_map.items() if printer_mac in macs)
+    if not pools:
+        return None
+
+    # Depths of this printer's pools and their members only
+    backend = backend or get_backend()
+    member_macs = sorted({mac for pool in pools for mac in pool_map[pool]})
+    depths = backend.depth([pool_queue(pool) for pool in pools] + member_macs)
+    pools = [pool for pool in pools if depths.get(pool_queue(pool))]
+    if not pools:
+        return None
+
+    members = get_pool_members(member_macs)
+    mine = depths.get(printer_mac, 0)
+    # last_activity is written from now_datetime() on poll
+    now = frappe.utils.now_datetime().timestamp()
+    timeout = get_member_timeout()
+
+    for pool in pools:
+        queue = pool_queue(pool)
+        others = [
+            depths.get(mac, 0)
+            for mac in pool_map[pool]
+            if mac != printer_mac
+            and mac in members
+            and is_available(members[mac], now, timeout)
+        ]
+        # Ties go to the printer polling now
+        if others and mine > min(others):
+            continue
+
+        job_token = backend.assign(queue, printer_mac)
+        if job_token:
+            frappe.db.commit()
+            frappe.logger().info(f"Pool {pool}: job {job_token} assigned to {printer_mac}")
+            return job_token
+
+    return None
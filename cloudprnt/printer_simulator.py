@@ -17,13 +17,100 @@ import json
 import os
 from datetime import datetime
 
+# CloudPRNT endpoints of each server, shared with cloudprnt.printer_swarm
+ENDPOINTS = {
+    "standalone": {
+        "poll": "/poll",
+        "job": "/job",
+        "delete": "/job"
+    },
+    "frappe": {
+        "poll": "/api/method/cloudprnt.cloudprnt_server.cloudprnt_poll",
+        "job": "/api/method/cloudprnt.cloudprnt_server.cloudprnt_job",
+        "delete": "/api/method/cloudprnt.cloudprnt_server.cloudprnt_delete"
+    }
+}
+
+PREFERRED_MEDIA_TYPE = "application/vnd.star.line"
+
+
+# ============================================================================
+# REQUESTS (what an mC-Print3 sends, for the simulator and the swarm)
+# ============================================================================
+
+def poll_body(mac_display, status_code="200 OK", printing_in_progress=False):
+    """
+    JSON body of a poll (POST)
+
+    :param mac_display: MAC address with dots
+    :return: Dict
+    """
+    return {
+        "printerMAC": mac_display,
+        "statusCode": status_code,
+        "clientType": "Star mC-Print3",
+        "clientVersion": "3.0",
+        "printingInProgress": printing_in_progress
+    }
+
+
+def poll_reply(data):
+    """
+    Poll response without the Frappe "message" wrapper
+
+    :param data: Decoded JSON response
+    :return: Dict with jobReady, jobToken, mediaTypes
+    """
+    # Frappe wraps whitelisted responses in "message" only for return values
+    if isinstance(data, dict) and isinstance(data.get("message"), dict):
+        return data["message"]
+    return data if isinstance(data, dict) else {}
+
+
+def choose_media_type(media_types):
+    """Star Line Mode when offered, else the server's first media type"""
+    if not media_types or PREFERRED_MEDIA_TYPE in media_types:
+        return PREFERRED_MEDIA_TYPE
+    return media_types[0]
+
+
+def job_params(mac_display, job_token, media_type):
+    """Query parameters of a job fetch (GET)"""
+    return {
+        "mac": mac_display,
+        "type": media_type,
+        "token": job_token
+    }
+
+
+def delete_request(target, mac_display, job_token, status_code="200 OK"):
+    """
+    Request arguments of a print confirmation (DELETE)
+
+    The standalone server takes query parameters, the Frappe endpoint a JSON body.
+
+    :param target: "standalone" or "frappe"
+    :return: Dict with params or json, for requests / httpx
+    """
+    if target == "frappe":
+        return {"json": {
+            "printerMAC": mac_display,
+            "statusCode": status_code,
+            "jobToken": job_token
+        }}
+    return {"params": {
+        "mac": mac_display,
+        "token": job_token,
+        "code": status_code
+    }}
+
 
 class CloudPRNTPrinterSimulator:
     """
     Simulates a Star mC-Print3 printer polling a CloudPRNT server
     """
 
-    def __init__(self, mac_address, server_url, poll_interval=5, output_dir="./output"):
+    def __init__(self, mac_address, server_url, poll_interval=5, output_dir="./output", keep_raw=False):
         """
         Initialize printer simulator
 
@@ -31,14 +118,17 @@ class CloudPRNTPrinterSimulator:
         :param server_url: Base URL of CloudPRNT server
         :param poll_interval: Seconds between polls (default: 5)
         :param output_dir: Directory to save received jobs
+        :param keep_raw: Also save the raw job bytes (.slt)
         """
         self.mac_address = mac_address
         self.mac_display = mac_address.replace(":", ".")  # CloudPRNT uses dots
         self.server_url = server_url.rstrip("/")
         self.poll_interval = poll_interval
         self.output_dir = output_dir
+        self.keep_raw = keep_raw
         self.running = False
         self.job_count = 0
+        self.paths = ENDPOINTS["frappe"]
 
         # Create output directory
         os.makedirs(self.output_dir, exist_ok=True)
@@ -75,25 +165,15 @@ class CloudPRNTPrinterSimulator:
         Poll the CloudPRNT server (POST request)
         """
         try:
-            # Prepare poll request
-            poll_url = f"{self.server_url}/api/method/cloudprnt.cloudprnt_server.cloudprnt_poll"
-            poll_data = {
-                "printerMAC": self.mac_display,
-                "statusCode": "200 OK",
-                "clientType": "Star mC-Print3",
-                "clientVersion": "3.0",
-                "printingInProgress": False
-            }
-
             # Send poll request
-            response = requests.post(poll_url, json=poll_data, timeout=10)
+            response = requests.post(self.server_url + self.paths["poll"], json=poll_body(self.mac_display), timeout=10)
 
             if response.status_code != 200:
                 print(f"❌ Poll failed: HTTP {response.status_code}")
                 return
 
             # Parse response
-            data = response.json()
+            data = poll_reply(response.json())
 
             if data.get("jobReady"):
                 job_token = data.get("jobToken")
@@ -125,21 +205,16 @@ class CloudPRNTPrinterSimulator:
         """
         try:
             # Choose preferred media type (Star Line Mode)
-            media_type = "application/vnd.star.line"
-            if media_type not in media_types and len(media_types) > 0:
-                media_type = media_types[0]
-
-            # Fetch job
-            job_url = f"{self.server_url}/api/method/cloudprnt.cloudprnt_server.cloudprnt_job"
-            params = {
-                "mac": self.mac_display,
-                "type": media_type,
-                "token": job_token
-            }
+            media_type = choose_media_type(media_types)
 
             print(f"   📡 Fetching job: {media_type}")
 
-            response = requests.get(job_url, params=params, timeout=10)
+            # Fetch job
+            response = requests.get(
+                self.server_url + self.paths["job"],
+                params=job_params(self.mac_display, job_token, media_type),
+                timeout=10
+            )
 
             if response.status_code != 200:
                 print(f"   ❌ Fetch failed: HTTP {response.status_code}")
@@ -149,23 +224,14 @@ class CloudPRNTPrinterSimulator:
             self.job_count += 1
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 
-            if media_type == "application/vnd.star.line":
-                # Binary data (hex)
-                filename = f"{timestamp}_{self.job_count}_{job_token}.slt"
-                filepath = os.path.join(self.output_dir, filename)
-
-                with open(filepath, 'wb') as f:
-                    f.write(response.content)
+            if media_type in ("application/vnd.star.line", "application/vnd.star.starprnt"):
+                # Binary data: save a readable preview of what would print
+                base = f"{timestamp}_{self.job_count}_{job_token}"
+                self.save_preview(base, response.content)
 
-                # Also save as hex for inspection
-                hex_filename = f"{timestamp}_{self.job_count}_{job_token}.hex"
-                hex_filepath = os.path.join(self.output_dir, hex_filename)
-
-                with open(hex_filepath, 'w') as f:
-                    f.write(response.content.hex().upper())
-
-                print(f"   ✅ Job saved: {filename} ({len(response.content)} bytes)")
-                print(f"   📄 Hex saved: {hex_filename}")
+                if self.keep_raw:
+                    with open(os.path.join(self.output_dir, f"{base}.slt"), 'wb') as f:
+                        f.write(response.content)
 
             else:
                 # Text data (markup)
@@ -187,6 +253,29 @@ class CloudPRNTPrinterSimulator:
         except Exception as e:
             print(f"   ❌ Fetch error: {str(e)}")
 
+    def save_preview(self, base, content):
+        """
+        Decode a binary job and save its text and PNG previews
+
+        :param base: File name without extension
+        :param content: Job bytes
+        """
+        from cloudprnt.star_decoder import decode, layout, preview_png, preview_text
+
+        commands = decode(content)
+        blocks = layout(commands)
+
+        with open(os.path.join(self.output_dir, f"{base}.txt"), 'w', encoding='utf-8') as f:
+            f.write(preview_text(blocks))
+
+        with open(os.path.join(self.output_dir, f"{base}.png"), 'wb') as f:
+            f.write(preview_png(blocks))
+
+        unknown = [c["bytes"] for c in commands if c["op"] == "unknown"]
+        print(f"   ✅ Preview saved: {base}.txt, {base}.png ({len(content)} bytes, {len(blocks)} blocks)")
+        if unknown:
+            print(f"   ⚠️  Unknown commands: {', '.join(unknown[:5])}")
+
     def confirm_print(self, job_token):
         """
         Send print confirmation to server (DELETE request)
@@ -194,14 +283,11 @@ class CloudPRNTPrinterSimulator:
         :param job_token: Job token
         """
         try:
-            delete_url = f"{self.server_url}/api/method/cloudprnt.cloudprnt_server.cloudprnt_delete"
-            delete_data = {
-                "printerMAC": self.mac_display,
-                "statusCode": "200 OK",
-                "jobToken": job_token
-            }
-
-            response = requests.delete(delete_url, json=delete_data, timeout=10)
+            response = requests.delete(
+                self.server_url + self.paths["delete"],
+                timeout=10,
+                **delete_request("frappe", self.mac_display, job_token)
+            )
 
             if response.status_code == 200:
                 print(f"   ✅ Print confirmed\n")
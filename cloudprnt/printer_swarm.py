@@ -0,0 +1,413 @@
+"""
+CloudPRNT Printer Swarm
+=======================
+
+Load generator running thousands of virtual printers on one asyncio loop.
+
+Each virtual printer follows the same poll / GET / DELETE cycle as
+CloudPRNTPrinterSimulator, with the same requests (built by the helpers
+of cloudprnt.printer_simulator), against either server:
+
+    standalone  POST /poll, GET /job, DELETE /job (port 8001)
+    frappe      /api/method/cloudprnt.cloudprnt_server.cloudprnt_*
+
+Behaviour is configured with SwarmConfig: poll interval and jitter, think
+time before the GET, print speed, and failure injection (client timeouts,
+printers reporting 5xx print failures, dropped DELETE confirmations).
+
+The result is a JSON summary: p50/p95/p99 latency, request counts, status
+codes and error rate per endpoint, overall throughput and job counts.
+Timed-out requests count towards the latency percentiles at the time they
+gave up, so a server that stalls shows up in p99 rather than vanishing.
+
+Jobs can be fed into the shared print queue (print_queue_manager) while
+the swarm runs. Both servers serve the same queue backend, so feeding
+works with either target.
+
+Usage:
+    bench --site prod.local cloudprnt-swarm --printers 2000 --duration 120
+    python printer_swarm.py --server-url http://localhost:8001 --printers 500
+"""
+
+import asyncio
+import json
+import random
+import time
+
+from cloudprnt.printer_simulator import (
+    ENDPOINTS,
+    choose_media_type,
+    delete_request,
+    job_params,
+    poll_body,
+    poll_reply
+)
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+FAILURE_STATUS = "500 Print Failed"
+SWARM_TOKEN_PREFIX = "SWARM-"
+# Locally administered MAC range, never a real printer
+SWARM_MAC_PREFIX = "02:CF"
+
+
+class SwarmConfig:
+    """
+    Virtual printer behaviour
+
+    :param poll_interval: Seconds between polls
+    :param poll_jitter: Random fraction added to or removed from each interval
+    :param think_time: (min, max) seconds between a positive poll and the GET
+    :param print_speed: Bytes printed per second (print time = bytes / speed)
+    :param min_print_time: Seconds every job takes to print at least
+    :param timeout: Request timeout in seconds
+    :param timeout_rate: Fraction of requests sent with an injected tiny
+        timeout, as printers dropping off the network do
+    :param failure_rate: Fraction of jobs confirmed with a 5xx print failure
+    :param drop_delete_rate: Fraction of jobs never confirmed
+    """
+
+    def __init__(self, poll_interval=5, poll_jitter=0.2, think_time=(0.05, 0.3), print_speed=50000,
+                 min_print_time=1.0, timeout=10, timeout_rate=0.0, failure_rate=0.0, drop_delete_rate=0.0):
+        self.poll_interval = poll_interval
+        self.poll_jitter = poll_jitter
+        self.think_time = think_time
+        self.print_speed = print_speed
+        self.min_print_time = min_print_time
+        self.timeout = timeout
+        self.timeout_rate = timeout_rate
+        self.failure_rate = failure_rate
+        self.drop_delete_rate = drop_delete_rate
+
+
+def percentile(values, p):
+    """
+    Percentile with linear interpolation between ranks
+
+    :param values: Sorted list of numbers
+    :param p: Percentile (0-100)
+    :return: Value or None if empty
+    """
+    if not values:
+        return None
+    rank = (len(values) - 1) * p / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+class SwarmStats:
+    """Latencies and outcomes per endpoint, shared by all virtual printers"""
+
+    def __init__(self):
+        # endpoint -> [ms, ...]
+        self.latencies = {}
+        # endpoint -> {outcome: count}, outcome is a status code or "timeout"/"error"
+        self.outcomes = {}
+        self.jobs_enqueued = 0
+        self.jobs_printed = 0
+        self.jobs_failed = 0
+        self.deletes_dropped = 0
+        self.started = time.monotonic()
+
+    def record(self, endpoint, outcome, ms=None):
+        if ms is not None:
+            self.latencies.setdefault(endpoint, []).append(ms)
+        outcomes = self.outcomes.setdefault(endpoint, {})
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    def summary(self):
+        """
+        Results as a JSON-serialisable dict
+
+        :return: Dict with throughput, jobs and per-endpoint stats
+        """
+        elapsed = time.monotonic() - self.started
+        endpoints = {}
+        total = 0
+        for endpoint, outcomes in sorted(self.outcomes.items()):
+            requests = sum(outcomes.values())
+            errors = sum(n for outcome, n in outcomes.items() if not str(outcome).startswith(("2", "404")))
+            latencies = sorted(self.latencies.get(endpoint, []))
+            total += requests
+            endpoints[endpoint] = {
+                "requests": requests,
+                "errors": errors,
+                "error_rate": round(errors / requests, 4) if requests else 0,
+                "throughput_rps": round(requests / elapsed, 2) if elapsed else 0,
+                "outcomes": {str(k): v for k, v in sorted(outcomes.items(), key=lambda item: str(item[0]))},
+                "p50_ms": _round(percentile(latencies, 50)),
+                "p95_ms": _round(percentile(latencies, 95)),
+                "p99_ms": _round(percentile(latencies, 99)),
+                "max_ms": _round(latencies[-1] if latencies else None)
+            }
+
+        return {
+            "duration_s": round(elapsed, 2),
+            "requests": total,
+            "throughput_rps": round(total / elapsed, 2) if elapsed else 0,
+            "jobs": {
+                "enqueued": self.jobs_enqueued,
+                "printed": self.jobs_printed,
+                "failed": self.jobs_failed,
+                "deletes_dropped": self.deletes_dropped
+            },
+            "endpoints": endpoints
+        }
+
+
+def _round(value):
+    return None if value is None else round(value, 2)
+
+
+def swarm_mac(index):
+    """MAC address of virtual printer number `index`"""
+    return f"{SWARM_MAC_PREFIX}:" + ":".join(f"{(index >> shift) & 0xFF:02X}" for shift in (24, 16, 8, 0))
+
+
+class VirtualPrinter:
+    """
+    One printer of the swarm
+
+    :param mac_address: MAC address (colons)
+    :param client: Shared httpx.AsyncClient
+    :param stats: Shared SwarmStats
+    :param config: SwarmConfig
+    :param target: "standalone" or "frappe"
+    """
+
+    def __init__(self, mac_address, client, stats, config, target="standalone"):
+        self.mac_display = mac_address.replace(":", ".")
+        self.client = client
+        self.stats = stats
+        self.config = config
+        self.target = target
+        self.paths = ENDPOINTS[target]
+
+    def _timeout(self):
+        if self.config.timeout_rate and random.random() < self.config.timeout_rate:
+            # Injected failure: the printer gives up almost immediately
+            return 0.001
+        return self.config.timeout
+
+    async def request(self, endpoint, method, path, **kwargs):
+        """
+        Send one request and record its latency and outcome
+
+        :return: httpx.Response or None on timeout / connection error
+        """
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, timeout=self._timeout(), **kwargs)
+        except httpx.TimeoutException:
+            # What the printer waited before giving up
+            self.stats.record(endpoint, "timeout", (time.perf_counter() - start) * 1000)
+            return None
+        except httpx.HTTPError:
+            self.stats.record(endpoint, "error")
+            return None
+        self.stats.record(endpoint, response.status_code, (time.perf_counter() - start) * 1000)
+        return response
+
+    async def run(self, stop_at):
+        """
+        Poll until `stop_at` (event loop time)
+
+        :param stop_at: loop.time() at which to stop
+        """
+        loop = asyncio.get_running_loop()
+        # Spread the first polls over one interval instead of a thundering herd
+        await asyncio.sleep(random.uniform(0, self.config.poll_interval))
+
+        while loop.time() < stop_at:
+            await self.poll()
+            jitter = 1 + random.uniform(-self.config.poll_jitter, self.config.poll_jitter)
+            await asyncio.sleep(max(0.0, self.config.poll_interval * jitter))
+
+    async def poll(self):
+        response = await self.request("poll", "POST", self.paths["poll"], json=poll_body(self.mac_display))
+        if response is None or response.status_code != 200:
+            return
+
+        try:
+            data = poll_reply(response.json())
+        except ValueError:
+            return
+
+        if data.get("jobReady") and data.get("jobToken"):
+            await asyncio.sleep(random.uniform(*self.config.think_time))
+            await self.print_job(data["jobToken"], data.get("mediaTypes"))
+
+    async def print_job(self, job_token, media_types=None):
+        response = await self.request(
+            "job", "GET", self.paths["job"],
+            params=job_params(self.mac_display, job_token, choose_media_type(media_types))
+        )
+        if response is None or response.status_code != 200:
+            return
+
+        # Paper moves at print_speed bytes per second
+        await asyncio.sleep(max(self.config.min_print_time, len(response.content) / self.config.print_speed))
+
+        if self.config.drop_delete_rate and random.random() < self.config.drop_delete_rate:
+            self.stats.deletes_dropped += 1
+            return
+
+        failed = self.config.failure_rate and random.random() < self.config.failure_rate
+        await self.confirm(job_token, FAILURE_STATUS if failed else "200 OK")
+        if failed:
+            self.stats.jobs_failed += 1
+        else:
+            self.stats.jobs_printed += 1
+
+    async def confirm(self, job_token, status_code):
+        await self.request(
+            "delete", "DELETE", self.paths["delete"],
+            **delete_request(self.target, self.mac_display, job_token, status_code)
+        )
+
+
+async def feed_jobs(enqueue, printers, jobs_per_second, stats, stop_at):
+    """
+    Enqueue jobs for random virtual printers at a steady rate
+
+    :param enqueue: Async callable(job_token, printer_mac)
+    :param printers: List of MAC addresses
+    :param jobs_per_second: Enqueue rate
+    :param stats: SwarmStats
+    :param stop_at: loop.time() at which to stop
+    """
+    loop = asyncio.get_running_loop()
+    interval = 1 / jobs_per_second
+    next_at = loop.time()
+    while loop.time() < stop_at:
+        token = f"{SWARM_TOKEN_PREFIX}{random.getrandbits(48):012x}"
+        try:
+            await enqueue(token, random.choice(printers))
+            stats.jobs_enqueued += 1
+        except Exception:
+            stats.record("enqueue", "error")
+        next_at += interval
+        await asyncio.sleep(max(0.0, next_at - loop.time()))
+
+
+async def run_swarm(server_url, printers=100, duration=60, config=None, target="standalone",
+                    enqueue=None, jobs_per_second=0, transport=None):
+    """
+    Run a swarm and return its summary
+
+    :param server_url: Base URL of the server
+    :param printers: Number of virtual printers
+    :param duration: Seconds to run
+    :param config: SwarmConfig (defaults if None)
+    :param target: "standalone" or "frappe"
+    :param enqueue: Async callable(job_token, printer_mac) feeding jobs (optional)
+    :param jobs_per_second: Rate for `enqueue`
+    :param transport: httpx transport (tests use httpx.ASGITransport)
+    :return: Summary dict
+    """
+    if not HTTPX_AVAILABLE:
+        raise RuntimeError("httpx is required for the printer swarm: pip install httpx")
+    if target not in ENDPOINTS:
+        raise ValueError(f"Unknown target {target}, expected one of {', '.join(ENDPOINTS)}")
+
+    config = config or SwarmConfig()
+    stats = SwarmStats()
+    macs = [swarm_mac(i) for i in range(printers)]
+    stop_at = asyncio.get_running_loop().time() + duration
+
+    # Real printers each hold their own keep-alive connection
+    limits = httpx.Limits(max_connections=printers, max_keepalive_connections=printers)
+    async with httpx.AsyncClient(base_url=server_url.rstrip("/"), limits=limits, transport=transport) as client:
+        tasks = [
+            VirtualPrinter(mac, client, stats, config, target).run(stop_at)
+            for mac in macs
+        ]
+        if enqueue and jobs_per_second:
+            tasks.append(feed_jobs(enqueue, macs, jobs_per_second, stats, stop_at))
+        await asyncio.gather(*tasks)
+
+    summary = stats.summary()
+    summary.update({
+        "target": target,
+        "server_url": server_url,
+        "printers": printers,
+        "config": dict(vars(config))
+    })
+    return summary
+
+
+def enqueue_swarm_job(job_token, printer_mac, lines=20):
+    """
+    Add a markup job for a virtual printer to the database queue
+
+    Must run inside a Frappe context.
+    """
+    from cloudprnt.print_queue_manager import add_job_to_queue
+
+    markup = "[align: centre]SWARM TEST\n" + "\n".join(
+        f"[align: left]Line {i:03d} ........................ {i * 1.5:8.2f}" for i in range(lines)
+    ) + "\n[cut: feed; partial]"
+    add_job_to_queue(job_token=job_token, printer_mac=printer_mac, job_data=markup)
+
+
+def clear_swarm_jobs():
+    """
+    Remove queued jobs left by a swarm run, from whichever queue backend
+
+    Must run inside a Frappe context.
+    """
+    import frappe
+    from cloudprnt.queue_backend import get_backend
+
+    backend = get_backend()
+    backend.ack_many([
+        job["job_token"] for job in backend.list()
+        if job["job_token"].startswith(SWARM_TOKEN_PREFIX)
+    ])
+    frappe.db.commit()
+
+
+if __name__ == "__main__":
+    """
+    Run a swarm without bench (no job feeding)
+
+    Example:
+        python printer_swarm.py --server-url http://localhost:8001 --printers 1000 --duration 60
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="CloudPRNT printer swarm")
+    parser.add_argument("--server-url", default="http://localhost:8001")
+    parser.add_argument("--target", choices=list(ENDPOINTS), default="standalone")
+    parser.add_argument("--printers", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--poll-interval", type=float, default=5)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--drop-delete-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="Write the JSON summary to this file")
+    args = parser.parse_args()
+
+    result = asyncio.run(run_swarm(
+        args.server_url,
+        printers=args.printers,
+        duration=args.duration,
+        target=args.target,
+        config=SwarmConfig(
+            poll_interval=args.poll_interval,
+            timeout_rate=args.timeout_rate,
+            failure_rate=args.failure_rate,
+            drop_delete_rate=args.drop_delete_rate
+        )
+    ))
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
@@ -0,0 +1,227 @@
+"""
+CloudPRNT Printer Watchdog
+==========================
+
+Scheduled check moving the jobs of printers that stopped printing to a
+backup, so receipts are not left pending on a printer that is off,
+disconnected or out of paper.
+
+A printer is down when it has not polled for `cloudprnt_offline_after`
+seconds (last_activity), when it reports an error status code (4xx:
+paper, cover), or when one of its error flags is set. last_activity is
+written on poll by both servers (update_printer_status, and
+POLL_STATUS_SQL from the standalone server); a printer that never
+recorded a poll has unknown liveness and is left alone. Each run:
+
+    1. marks down printers offline (one UPDATE)
+    2. moves the pending jobs of every down printer to its backup in one
+       bulk move (QueueBackend.move_pending, one UPDATE on the database
+       queue)
+    3. tells the cashier of each moved receipt's invoice, with a
+       cloudprnt_job_failover realtime event
+
+The backup is the printer's Backup Printer (a printer label or a printer
+pool name) or, for pool members, their pool. A backup that is down
+itself is skipped, so jobs never bounce between two dead printers.
+Fetched jobs stay with their printer until the retention sweep expires
+them.
+
+Moved markup jobs are rendered when the backup fetches them, for the
+media type it asks for: renders are keyed by job token, media type and
+render profile, so one made for the original printer is only reused if
+all three match. Pre-converted hex jobs are sent as they are.
+
+A printer is marked online again by its next poll (update_printer_status).
+
+Configuration (site_config.json):
+{
+    "cloudprnt_offline_after": 120
+}
+"""
+
+import frappe
+from cloudprnt.printer_pools import POOL_PREFIX, is_pool_queue, pool_queue
+from cloudprnt.queue_backend import get_backend
+
+DEFAULT_OFFLINE_AFTER = 120  # seconds without a poll
+
+# Status flags meaning the printer cannot print
+ERROR_FLAGS = (
+    "paper_empty",
+    "cover_open",
+    "cutter_error",
+    "mechanical_error",
+    "over_temperature",
+    "presenter_paper_jam",
+    "receive_buffer_overflow",
+    "voltage_error"
+)
+
+# Poll liveness written by the standalone server, with direct MySQL.
+# Params: last_activity, status_code (None keeps it), printing_in_progress,
+# MAC (colons)
+POLL_STATUS_SQL = """
+    UPDATE `tabCloudPRNT Printers`
+    SET online = 1, last_activity = %s, status_code = COALESCE(%s, status_code),
+        printing_in_progress = %s
+    WHERE parent = 'CloudPRNT Settings'
+    AND UPPER(REPLACE(mac_address, '.', ':')) = %s
+"""
+
+# Params: last_activity cutoff. Printers without a recorded poll are skipped.
+_DOWN_SQL = f"""
+    SELECT name, label, UPPER(REPLACE(mac_address, '.', ':')) AS mac_address,
+        printer_pool, backup_printer, online
+    FROM `tabCloudPRNT Printers`
+    WHERE parent = 'CloudPRNT Settings'
+    AND IFNULL(last_activity, 0) > 0
+    AND (
+        last_activity < %s
+        OR IFNULL(status_code, '') LIKE '4%%'
+        OR {" OR ".join(f"{flag} = 1" for flag in ERROR_FLAGS)}
+    )
+"""
+
+
+def get_offline_after():
+    """Seconds without a poll after which a printer is down"""
+    return frappe.utils.cint(frappe.conf.get("cloudprnt_offline_after")) or DEFAULT_OFFLINE_AFTER
+
+
+def get_down_printers(offline_after=None):
+    """
+    Printers that stopped polling or report an error
+
+    :param offline_after: Seconds without a poll (default get_offline_after())
+    :return: List of dicts with name, label, mac_address, printer_pool,
+        backup_printer and online
+    """
+    offline_after = offline_after or get_offline_after()
+    # last_activity is written from now_datetime() by update_printer_status
+    cutoff = frappe.utils.now_datetime().timestamp() - offline_after
+    return frappe.db.sql(_DOWN_SQL, (cutoff,), as_dict=True)
+
+
+def get_printers():
+    """Every configured printer: name, label, mac_address and printer_pool"""
+    return frappe.db.sql("""
+        SELECT name, label, UPPER(REPLACE(mac_address, '.', ':')) AS mac_address, printer_pool
+        FROM `tabCloudPRNT Printers`
+        WHERE parent = 'CloudPRNT Settings'
+    """, as_dict=True)
+
+
+def get_backup_targets(down, printers):
+    """
+    Queue receiving the pending jobs of each down printer
+
+    :param down: Rows from get_down_printers()
+    :param printers: Rows from get_printers()
+    :return: {printer MAC: target MAC or pool queue}, printers without a
+        usable backup left out
+    """
+    down_macs = {row.mac_address for row in down}
+    by_label = {}
+    pools = {}
+    for printer in printers:
+        by_label[printer.label] = printer.mac_address
+        by_label[printer.name] = printer.mac_address
+        if printer.printer_pool:
+            pools[printer.printer_pool.upper()] = pool_queue(printer.printer_pool)
+
+    targets = {}
+    for row in down:
+        backup = (row.backup_printer or "").strip()
+        if backup:
+            target = by_label.get(backup) or pools.get(backup.upper())
+        else:
+            target = pool_queue(row.printer_pool) if row.printer_pool else None
+
+        if not target or target == row.mac_address or target in down_macs:
+            continue
+        targets[row.mac_address] = target
+    return targets
+
+
+def notify_failover(moved, labels):
+    """
+    Tell the cashier of each moved receipt where it will print
+
+    :param moved: Result of QueueBackend.move_pending()
+    :param labels: {printer MAC: label}
+    """
+    invoices = sorted({job["invoice_name"] for job in moved if job["invoice_name"]})
+    if not invoices:
+        return
+    try:
+        owners = {
+            row.name: row.owner
+            for row in frappe.get_all("POS Invoice", filters={"name": ["in", invoices]}, fields=["name", "owner"])
+        }
+    except Exception:
+        # ERPNext not installed
+        return
+
+    for job in moved:
+        owner = owners.get(job["invoice_name"])
+        if not owner:
+            continue
+        target = job["to_mac"]
+        if is_pool_queue(target):
+            target_label = target[len(POOL_PREFIX):]
+        else:
+            target_label = labels.get(target) or target
+        frappe.publish_realtime(
+            "cloudprnt_job_failover",
+            {
+                "invoice_name": job["invoice_name"],
+                "job_token": job["job_token"],
+                "from_printer": labels.get(job["from_mac"]) or job["from_mac"],
+                "to_printer": target_label
+            },
+            user=owner
+        )
+
+
+def check_printers(offline_after=None):
+    """
+    Mark down printers offline and move their pending jobs to their backup
+
+    Runs from scheduler_events.
+
+    :param offline_after: Seconds without a poll (default get_offline_after())
+    :return: Dict with offline (printers marked offline) and moved (jobs moved)
+    """
+    result = {"offline": 0, "moved": 0}
+    try:
+        down = get_down_printers(offline_after)
+        if not down:
+            return result
+
+        newly_offline = [row.name for row in down if row.online]
+        if newly_offline:
+            frappe.db.sql(f"""
+                UPDATE `tabCloudPRNT Printers`
+                SET online = 0, printing_in_progress = 0
+                WHERE name IN ({", ".join(["%s"] * len(newly_offline))})
+            """, tuple(newly_offline))
+            result["offline"] = len(newly_offline)
+
+        printers = get_printers()
+        moved = get_backend().move_pending(get_backup_targets(down, printers))
+        frappe.db.commit()
+        result["moved"] = len(moved)
+
+    except Exception as e:
+        frappe.db.rollback()
+        frappe.log_error(f"Error checking printers: {str(e)}", "check_printers")
+        return result
+
+    if moved:
+        labels = {printer.mac_address: printer.label for printer in printers}
+        sources = sorted({labels.get(job["from_mac"]) or job["from_mac"] for job in moved})
+        frappe.logger().info(f"CloudPRNT failover: {result['moved']} jobs moved from {', '.join(sources)}")
+        notify_failover(moved, labels)
+    elif result["offline"]:
+        frappe.logger().info(f"CloudPRNT watchdog: {result['offline']} printers marked offline")
+    return result
@@ -0,0 +1,9 @@
+// Receipts moved off a printer that went offline (cloudprnt.printer_watchdog)
+frappe.realtime.on('cloudprnt_job_failover', function(data) {
+    frappe.show_alert({
+        message: __('Imprimante {0} hors ligne : ticket {1} envoyé à {2}', [
+            data.from_printer, data.invoice_name, data.to_printer
+        ]),
+        indicator: 'orange'
+    }, 10);
+});
@@ -0,0 +1,1342 @@
+"""
+CloudPRNT Queue Backends
+========================
+
+One interface for the print queue, used by print_queue_manager (Frappe),
+the Frappe CloudPRNT endpoints and the standalone server:
+
+    enqueue   add a job at the back of a printer's queue
+    peek      next pending job of a printer, without taking it
+    claim     hand a job to the printer (GET /job), Pending -> Fetched
+    ack       job printed (DELETE /job), removed from the queue
+    requeue   put a fetched job back at the back of the queue
+    assign    move the next pending job of one queue to another (printer
+              pools, see cloudprnt.printer_pools)
+    move_pending  move every pending job of some queues to others (offline
+              printer failover, see cloudprnt.printer_watchdog)
+    find      printer of queued tokens
+    depth     pending jobs per printer
+    summary   jobs per printer and status, with the oldest pending job
+    version   changes whenever the queue does (status ETags)
+    list      all queued jobs, in serving order
+    page      one page of queued jobs, filtered, after a keyset cursor
+
+Priorities: jobs are live POS receipts ("pos"), reprints ("reprint") or
+test prints ("test"). A job is served as if it had been queued
+`aging` seconds later per class below "pos", so POS receipts go first
+without starving the others: a test print waiting longer than two aging
+periods is served before a receipt queued now. Within a class jobs keep
+their creation order.
+
+Backends:
+
+- DatabaseBackend: the `tabCloudPRNT Print Queue` table. Every call is
+  one keyed or indexed statement (two for claim), bulk calls included.
+- RedisStreamsBackend: one Redis stream per printer with a consumer group.
+  Claimed jobs sit in the group's pending entries list until acknowledged.
+  The database only keeps the audit trail (CloudPRNT Job History, written
+  by the callers).
+
+Statements use %s placeholders so the same backend runs on frappe.db and
+on the standalone server's raw pymysql connections.
+
+The streams must survive memory pressure, so they default to bench's
+redis_queue (no eviction), never to the allkeys-lru redis_cache.
+
+Configuration (site_config.json):
+{
+    "cloudprnt_queue_backend": "redis",              # default "db"
+    "cloudprnt_queue_redis_url": "redis://localhost:11000",  # default redis_queue
+    "cloudprnt_priority_aging": 30                   # seconds per priority class
+}
+"""
+
+import bisect
+import json
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import frappe
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+QUEUE_TABLE = "`tabCloudPRNT Print Queue`"
+DEFAULT_MEDIA_TYPES = ["image/png", "application/vnd.star.line", "text/vnd.star.markup"]
+BACKENDS = ("db", "redis")
+
+# Priority classes, served lowest level first
+PRIORITIES = {"pos": 0, "reprint": 1, "test": 2}
+DEFAULT_PRIORITY = "pos"
+DEFAULT_PRIORITY_AGING = 30
+DEFAULT_PAGE_SIZE = 50
+
+STREAM_PREFIX = "cloudprnt_queue"
+GROUP = "cloudprnt"
+CONSUMER = "printer"
+
+_JOB_COLUMNS = "name, job_token, invoice_name, job_data, payload_hash, payload_size, media_types, printer_mac"
+
+# Pending jobs of the printer served before each job, on the
+# (printer_mac, status, sequence) index; ties broken by name like peek()
+_POSITION_SQL = f"""
+    SELECT j.job_token, 1 + (
+        SELECT COUNT(*)
+        FROM {QUEUE_TABLE} p
+        WHERE p.printer_mac = j.printer_mac AND p.status = 'Pending'
+        AND (p.sequence < j.sequence OR (p.sequence = j.sequence AND p.name < j.name))
+    ) AS position
+    FROM {QUEUE_TABLE} j
+    WHERE j.job_token IN ({{tokens}}) AND j.printer_mac = %s AND j.status = 'Pending'
+"""
+
+
+def priority_level(priority):
+    """
+    Level of a priority class
+
+    :param priority: Class name (see PRIORITIES), level, or None for the default
+    :return: Level, 0 served first
+    :raises ValueError: On an unknown priority
+    """
+    if priority is None or priority == "":
+        return PRIORITIES[DEFAULT_PRIORITY]
+    if isinstance(priority, str) and not priority.isdigit():
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority {priority!r}, expected one of {', '.join(PRIORITIES)}")
+        return PRIORITIES[priority]
+    level = int(priority)
+    if level not in PRIORITIES.values():
+        raise ValueError(f"Unknown priority level {level}")
+    return level
+
+
+def priority_name(level):
+    """Class name of a priority level"""
+    for name, value in PRIORITIES.items():
+        if value == level:
+            return name
+    return DEFAULT_PRIORITY
+
+
+def _placeholders(values):
+    """%s list for an IN clause"""
+    return ", ".join(["%s"] * len(values))
+
+
+def _parse_media_types(value):
+    """Media types stored as JSON, with the defaults for unreadable values"""
+    try:
+        return json.loads(value or "[]")
+    except (TypeError, ValueError):
+        return list(DEFAULT_MEDIA_TYPES)
+
+
+def _job_from_row(row):
+    """Queue row to the job dict handed to the endpoints"""
+    return {
+        "name": row["name"],
+        "token": row["job_token"],
+        "invoice": row["invoice_name"],
+        "job_data": row["job_data"],
+        "payload_hash": row.get("payload_hash"),
+        "payload_size": row.get("payload_size"),
+        "media_types": _parse_media_types(row["media_types"]),
+        "printer_mac": row["printer_mac"]
+    }
+
+
+class QueueBackend:
+    """
+    Print queue operations shared by every backend
+
+    MAC addresses are passed normalized (colons, any case); backends store
+    them uppercase. Jobs are dicts with name, token, invoice, job_data,
+    payload_hash, payload_size, media_types and printer_mac. Payloads
+    enqueued through print_queue_manager are in the payload store
+    (cloudprnt.payload_store) and only referenced by payload_hash.
+    """
+
+    name = None
+    aging = DEFAULT_PRIORITY_AGING
+
+    def enqueue(self, job_token, printer_mac, invoice_name=None, job_data=None, media_types=None, priority=None):
+        """
+        Add a job behind the printer's queued jobs of its priority class
+
+        :param priority: "pos" (default), "reprint" or "test"
+        :return: Queue position of the job (1-based)
+        """
+        raise NotImplementedError
+
+    def enqueue_many(self, jobs):
+        """
+        Add several jobs, in list order
+
+        :param jobs: List of dicts with the enqueue() arguments
+        :return: {job_token: queue position}
+        """
+        return {job["job_token"]: self.enqueue(**job) for job in jobs}
+
+    def peek(self, printer_mac):
+        """
+        Next pending job of a printer, left pending
+
+        :return: Job dict or None
+        """
+        raise NotImplementedError
+
+    def claim(self, printer_mac, job_token=None):
+        """
+        Hand a job to its printer and mark it fetched
+
+        Claiming the token of a job that is already fetched returns it
+        again, so a printer retrying a slow GET gets the same job back.
+
+        :param printer_mac: Printer MAC address (None: any printer, token required)
+        :param job_token: Token the printer asks for (None: next pending job)
+        :return: Job dict or None
+        """
+        raise NotImplementedError
+
+    def ack(self, job_token):
+        """
+        Remove a printed job from the queue
+
+        :return: True if the job was queued
+        """
+        raise NotImplementedError
+
+    def ack_many(self, job_tokens):
+        """
+        Remove several printed jobs from the queue
+
+        :return: Set of the tokens that were queued
+        """
+        return {token for token in job_tokens if self.ack(token)}
+
+    def mark_fetched(self, job_tokens):
+        """
+        Mark pending jobs fetched without handing them out
+
+        :return: Number of jobs that were pending
+        """
+        return sum(1 for token in job_tokens if self.claim(None, token))
+
+    def requeue(self, job_token):
+        """
+        Put a fetched job back as pending, behind the queued jobs of its class
+
+        :return: True if the job was queued
+        """
+        raise NotImplementedError
+
+    def assign(self, from_mac, to_mac):
+        """
+        Move the next pending job of one queue to another
+
+        Safe against concurrent calls: a job is moved once.
+
+        :param from_mac: Queue the job is taken from (a printer pool's queue)
+        :param to_mac: Printer MAC address the job is given to
+        :return: Token of the moved job, or None if there was none
+        """
+        raise NotImplementedError
+
+    def move_pending(self, moves):
+        """
+        Move all pending jobs of some queues to other queues
+
+        :param moves: {from_mac: to_mac}
+        :return: List of dicts with job_token, invoice_name, from_mac and to_mac
+            of the moved jobs
+        """
+        raise NotImplementedError
+
+    def position(self, printer_mac, job_token):
+        """
+        Position of a pending job in its printer's queue
+
+        :return: 1-based position, 0 if the job is not pending
+        """
+        raise NotImplementedError
+
+    def positions(self, printer_mac, job_tokens):
+        """
+        Positions of several jobs of one printer
+
+        :return: {job_token: position}, 0 for jobs that are not pending
+        """
+        return {token: self.position(printer_mac, token) for token in job_tokens}
+
+    def find(self, job_tokens):
+        """
+        Queue of jobs still in the queue (pending or fetched)
+
+        :return: {job_token: printer_mac}, tokens not queued left out
+        """
+        raise NotImplementedError
+
+    def depth(self, printer_mac=None):
+        """
+        Pending jobs per printer
+
+        :param printer_mac: One printer, a list of printers (or pool queues),
+            or None for every printer
+        :return: {printer_mac: count}, printers without pending jobs left out
+        """
+        raise NotImplementedError
+
+    def summary(self, printer_mac=None):
+        """
+        Jobs per printer and status
+
+        :return: {printer_mac: {"counts": {status: count}, "oldest_pending":
+            creation of the oldest pending job or None, "oldest_pending_age":
+            its age in seconds or None}}, printers without jobs left out
+        """
+        raise NotImplementedError
+
+    def version(self, printer_mac=None):
+        """
+        Token that changes whenever a job is queued, claimed, moved or removed
+
+        :return: Short string, compared for equality only
+        """
+        raise NotImplementedError
+
+    def list(self, printer_mac=None):
+        """
+        Queued jobs, in serving order
+
+        :return: List of dicts with job_token, printer_mac, invoice_name, status,
+            priority (class name) and creation
+        """
+        raise NotImplementedError
+
+    def page(self, printer_mac=None, status=None, priority=None, after=None, limit=DEFAULT_PAGE_SIZE):
+        """
+        Queued jobs in serving order, one page at a time
+
+        :param printer_mac: Only this printer's jobs
+        :param status: Only jobs with this status ("Pending", "Fetched")
+        :param priority: Only jobs of this priority class
+        :param after: Cursor returned with the previous page
+        :param limit: Jobs per page
+        :return: (jobs as in list(), cursor of the next page or None)
+        :raises ValueError: On a malformed cursor
+        """
+        raise NotImplementedError
+
+    def clear(self, printer_mac=None):
+        """Remove every queued job, or the jobs of one printer"""
+        raise NotImplementedError
+
+
+# ============================================================================
+# Database
+# ============================================================================
+
+class FrappeSession:
+    """
+    frappe.db as a backend session
+
+    Writes are not committed: inside Frappe the caller commits, in the same
+    transaction as the job history (see cloudprnt.job_history).
+    """
+
+    rowcount = 0
+
+    def execute(self, sql, params=()):
+        rows = frappe.db.sql(sql, params, as_dict=True)
+        self.rowcount = frappe.db._cursor.rowcount
+        return rows
+
+    @contextmanager
+    def __call__(self):
+        yield self
+
+
+class PyMySQLSession:
+    """
+    One raw pymysql connection per backend call, committed on success
+
+    Used by the standalone server, which runs queue calls on the event
+    loop without a Frappe context.
+    """
+
+    def __init__(self, site_config):
+        """
+        :param site_config: Site config dict with the db_* keys
+        """
+        self.site_config = site_config
+
+    @contextmanager
+    def __call__(self):
+        import pymysql
+
+        conn = pymysql.connect(
+            host=self.site_config.get('db_host', 'localhost'),
+            user=self.site_config.get('db_user', self.site_config.get('db_name', 'root')),
+            password=self.site_config.get('db_password', ''),
+            database=self.site_config.get('db_name'),
+            charset='utf8mb4',
+            cursorclass=pymysql.cursors.DictCursor
+        )
+        try:
+            yield _PyMySQLCursor(conn)
+            conn.commit()
+        finally:
+            conn.close()
+
+
+class _PyMySQLCursor:
+    """execute() / rowcount over a pymysql connection"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = 0
+
+    def execute(self, sql, params=()):
+        with self.conn.cursor() as cursor:
+            cursor.execute(sql, params)
+            self.rowcount = cursor.rowcount
+            return cursor.fetchall()
+
+
+class DatabaseBackend(QueueBackend):
+    """
+    Queue rows in `tabCloudPRNT Print Queue`
+    """
+
+    name = "db"
+
+    def __init__(self, session=None, aging=None):
+        """
+        :param session: FrappeSession (default) or PyMySQLSession
+        :param aging: Seconds of delay per priority class (default DEFAULT_PRIORITY_AGING)
+        """
+        self.session = session or FrappeSession()
+        if aging is not None:
+            self.aging = aging
+
+    @property
+    def _aging_us(self):
+        return int(float(self.aging) * 1000000)
+
+    def enqueue(self, job_token, printer_mac, invoice_name=None, job_data=None, media_types=None, priority=None):
+        return self.enqueue_many([{
+            "job_token": job_token,
+            "printer_mac": printer_mac,
+            "invoice_name": invoice_name,
+            "job_data": job_data,
+            "media_types": media_types,
+            "priority": priority
+        }])[job_token]
+
+    def enqueue_many(self, jobs):
+        if not jobs:
+            return {}
+        user = getattr(getattr(frappe.local, "session", None), "user", None) or "Administrator"
+        params = []
+        for job in jobs:
+            params += [
+                frappe.generate_hash(length=10),
+                user,
+                user,
+                job["job_token"],
+                job["printer_mac"].upper(),
+                job.get("invoice_name"),
+                job.get("job_data"),
+                job.get("payload_hash"),
+                job.get("payload_size"),
+                json.dumps(job.get("media_types") or DEFAULT_MEDIA_TYPES)
+            ]
+        levels = [priority_level(job.get("priority")) for job in jobs]
+        # NOW(6) is the statement's start time: rows of one INSERT tie on
+        # creation and keep their list order through the row offset.
+        # sequence is the serving order: creation delayed by the class's aging
+        values = ", ".join(
+            f"(%s, NOW(6) + INTERVAL {i} MICROSECOND, NOW(6), %s, %s, 0, 0, %s, %s, %s, 'Pending', %s, %s, %s, %s, "
+            f"{level}, NOW(6) + INTERVAL {i + level * self._aging_us} MICROSECOND)"
+            for i, level in enumerate(levels)
+        )
+
+        tokens_by_printer = {}
+        for job in jobs:
+            tokens_by_printer.setdefault(job["printer_mac"].upper(), []).append(job["job_token"])
+
+        positions = {}
+        with self.session() as db:
+            db.execute(f"""
+                INSERT INTO {QUEUE_TABLE}
+                (name, creation, modified, modified_by, owner, docstatus, idx,
+                 job_token, printer_mac, invoice_name, status, job_data, payload_hash, payload_size,
+                 media_types, priority, sequence)
+                VALUES {values}
+            """, tuple(params))
+            for printer_mac, tokens in tokens_by_printer.items():
+                positions.update(self._positions(db, printer_mac, tokens))
+        return {job["job_token"]: positions.get(job["job_token"], 0) for job in jobs}
+
+    def peek(self, printer_mac):
+        with self.session() as db:
+            rows = db.execute(f"""
+                SELECT {_JOB_COLUMNS}
+                FROM {QUEUE_TABLE}
+                WHERE printer_mac = %s AND status = 'Pending'
+                ORDER BY sequence ASC, name ASC
+                LIMIT 1
+            """, (printer_mac.upper(),))
+        return _job_from_row(rows[0]) if rows else None
+
+    def claim(self, printer_mac, job_token=None):
+        with self.session() as db:
+            if job_token:
+                sql = f"""
+                    SELECT {_JOB_COLUMNS}, status
+                    FROM {QUEUE_TABLE}
+                    WHERE job_token = %s AND status IN ('Pending', 'Fetched')
+                """
+                params = (job_token,)
+                if printer_mac:
+                    sql += " AND printer_mac = %s"
+                    params += (printer_mac.upper(),)
+                rows = db.execute(sql + " LIMIT 1", params)
+            else:
+                rows = db.execute(f"""
+                    SELECT {_JOB_COLUMNS}, status
+                    FROM {QUEUE_TABLE}
+                    WHERE printer_mac = %s AND status = 'Pending'
+                    ORDER BY sequence ASC, name ASC
+                    LIMIT 1
+                """, (printer_mac.upper(),))
+
+            if not rows:
+                return None
+            if rows[0]["status"] == "Pending":
+                db.execute(
+                    f"UPDATE {QUEUE_TABLE} SET status = 'Fetched', modified = NOW(6) WHERE name = %s",
+                    (rows[0]["name"],)
+                )
+        return _job_from_row(rows[0])
+
+    def ack(self, job_token):
+        with self.session() as db:
+            db.execute(f"DELETE FROM {QUEUE_TABLE} WHERE job_token = %s", (job_token,))
+            return db.rowcount > 0
+
+    def ack_many(self, job_tokens):
+        if not job_tokens:
+            return set()
+        with self.session() as db:
+            rows = db.execute(f"""
+                DELETE FROM {QUEUE_TABLE}
+                WHERE job_token IN ({_placeholders(job_tokens)})
+                RETURNING job_token
+            """, tuple(job_tokens))
+        return {row["job_token"] for row in rows}
+
+    def mark_fetched(self, job_tokens):
+        if not job_tokens:
+            return 0
+        with self.session() as db:
+            db.execute(f"""
+                UPDATE {QUEUE_TABLE} SET status = 'Fetched', modified = NOW(6)
+                WHERE job_token IN ({_placeholders(job_tokens)}) AND status = 'Pending'
+            """, tuple(job_tokens))
+            return db.rowcount
+
+    def requeue(self, job_token):
+        with self.session() as db:
+            db.execute(f"""
+                UPDATE {QUEUE_TABLE}
+                SET status = 'Pending', creation = NOW(6), modified = NOW(6),
+                    sequence = NOW(6) + INTERVAL priority * {self._aging_us} MICROSECOND
+                WHERE job_token = %s
+            """, (job_token,))
+            return db.rowcount > 0
+
+    def assign(self, from_mac, to_mac):
+        with self.session() as db:
+            rows = db.execute(f"""
+                SELECT name, job_token
+                FROM {QUEUE_TABLE}
+                WHERE printer_mac = %s AND status = 'Pending'
+                ORDER BY sequence ASC, name ASC
+                LIMIT 1
+            """, (from_mac.upper(),))
+            if not rows:
+                return None
+            # sequence is kept: the job keeps its place in the serving order.
+            # The conditions make a concurrent assign of the same job a no-op
+            db.execute(f"""
+                UPDATE {QUEUE_TABLE} SET printer_mac = %s, modified = NOW(6)
+                WHERE name = %s AND printer_mac = %s AND status = 'Pending'
+            """, (to_mac.upper(), rows[0]["name"], from_mac.upper()))
+            return rows[0]["job_token"] if db.rowcount else None
+
+    def move_pending(self, moves):
+        if not moves:
+            return []
+        moves = {from_mac.upper(): to_mac.upper() for from_mac, to_mac in moves.items()}
+        sources = list(moves)
+        with self.session() as db:
+            rows = db.execute(f"""
+                SELECT name, job_token, invoice_name, printer_mac
+                FROM {QUEUE_TABLE}
+                WHERE printer_mac IN ({_placeholders(sources)}) AND status = 'Pending'
+                ORDER BY sequence ASC, name ASC
+            """, tuple(sources))
+            if not rows:
+                return []
+
+            # One UPDATE for every job; sequence is kept, so moved jobs are
+            # served among the target's jobs by their original time
+            cases = " ".join(["WHEN %s THEN %s"] * len(moves))
+            names = [row["name"] for row in rows]
+            db.execute(f"""
+                UPDATE {QUEUE_TABLE}
+                SET printer_mac = CASE printer_mac {cases} ELSE printer_mac END, modified = NOW(6)
+                WHERE name IN ({_placeholders(names)}) AND status = 'Pending'
+            """, tuple(value for pair in moves.items() for value in pair) + tuple(names))
+
+        return [
+            {
+                "job_token": row["job_token"],
+                "invoice_name": row["invoice_name"],
+                "from_mac": row["printer_mac"].upper(),
+                "to_mac": moves[row["printer_mac"].upper()]
+            }
+            for row in rows
+        ]
+
+    def position(self, printer_mac, job_token):
+        with self.session() as db:
+            return self._positions(db, printer_mac, [job_token]).get(job_token, 0)
+
+    def positions(self, printer_mac, job_tokens):
+        if not job_tokens:
+            return {}
+        with self.session() as db:
+            found = self._positions(db, printer_mac, job_tokens)
+        return {token: found.get(token, 0) for token in job_tokens}
+
+    def _positions(self, db, printer_mac, job_tokens):
+        rows = db.execute(
+            _POSITION_SQL.format(tokens=_placeholders(job_tokens)),
+            tuple(job_tokens) + (printer_mac.upper(),)
+        )
+        return {row["job_token"]: int(row["position"]) for row in rows}
+
+    def find(self, job_tokens):
+        if not job_tokens:
+            return {}
+        with self.session() as db:
+            rows = db.execute(
+                f"SELECT job_token, printer_mac FROM {QUEUE_TABLE} WHERE job_token IN ({_placeholders(job_tokens)})",
+                tuple(job_tokens)
+            )
+        return {row["job_token"]: row["printer_mac"].upper() for row in rows}
+
+    def depth(self, printer_mac=None):
+        sql = f"SELECT printer_mac, COUNT(*) AS pending FROM {QUEUE_TABLE} WHERE status = 'Pending'"
+        params = ()
+        if isinstance(printer_mac, (list, tuple)):
+            if not printer_mac:
+                return {}
+            sql += f" AND printer_mac IN ({_placeholders(printer_mac)})"
+            params = tuple(mac.upper() for mac in printer_mac)
+        elif printer_mac:
+            sql += " AND printer_mac = %s"
+            params = (printer_mac.upper(),)
+        with self.session() as db:
+            rows = db.execute(sql + " GROUP BY printer_mac", params)
+        return {row["printer_mac"].upper(): row["pending"] for row in rows}
+
+    def summary(self, printer_mac=None):
+        # One GROUP BY on the (printer_mac, status, sequence) index
+        sql = f"""
+            SELECT printer_mac, status, COUNT(*) AS jobs, MIN(creation) AS oldest,
+                TIMESTAMPDIFF(SECOND, MIN(creation), NOW(6)) AS age
+            FROM {QUEUE_TABLE}
+        """
+        params = ()
+        if printer_mac:
+            sql += " WHERE printer_mac = %s"
+            params = (printer_mac.upper(),)
+        with self.session() as db:
+            rows = db.execute(sql + " GROUP BY printer_mac, status", params)
+
+        summary = {}
+        for row in rows:
+            printer = summary.setdefault(
+                row["printer_mac"].upper(),
+                {"counts": {}, "oldest_pending": None, "oldest_pending_age": None}
+            )
+            printer["counts"][row["status"]] = row["jobs"]
+            if row["status"] == "Pending":
+                printer["oldest_pending"] = row["oldest"]
+                printer["oldest_pending_age"] = max(int(row["age"]), 0)
+        return summary
+
+    def version(self, printer_mac=None):
+        # Claims, requeues and moves set modified; acks and clears change the count
+        sql = f"SELECT COUNT(*) AS jobs, MAX(modified) AS modified FROM {QUEUE_TABLE}"
+        params = ()
+        if printer_mac:
+            sql += " WHERE printer_mac = %s"
+            params = (printer_mac.upper(),)
+        with self.session() as db:
+            row = db.execute(sql, params)[0]
+        return f"{row['jobs']}-{row['modified']}"
+
+    def list(self, printer_mac=None):
+        sql = f"SELECT job_token, printer_mac, invoice_name, status, priority, creation FROM {QUEUE_TABLE}"
+        params = ()
+        if printer_mac:
+            sql += " WHERE printer_mac = %s"
+            params = (printer_mac.upper(),)
+        with self.session() as db:
+            rows = db.execute(sql + " ORDER BY sequence ASC, name ASC", params)
+        for row in rows:
+            row["priority"] = priority_name(row["priority"])
+        return list(rows)
+
+    def page(self, printer_mac=None, status=None, priority=None, after=None, limit=DEFAULT_PAGE_SIZE):
+        conditions = []
+        params = []
+        if printer_mac:
+            conditions.append("printer_mac = %s")
+            params.append(printer_mac.upper())
+        if status:
+            conditions.append("status = %s")
+            params.append(status)
+        if priority is not None:
+            conditions.append("priority = %s")
+            params.append(priority_level(priority))
+        if after:
+            # Cursor: sequence and name of the last job of the previous page
+            sequence, separator, name = after.partition("|")
+            if not separator:
+                raise ValueError(f"Invalid cursor: {after}")
+            conditions.append("(sequence > %s OR (sequence = %s AND name > %s))")
+            params += [sequence, sequence, name]
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self.session() as db:
+            rows = db.execute(f"""
+                SELECT name, sequence, job_token, printer_mac, invoice_name, status, priority, creation
+                FROM {QUEUE_TABLE}
+                {where}
+                ORDER BY sequence ASC, name ASC
+                LIMIT %s
+            """, tuple(params) + (limit + 1,))
+
+        next_cursor = f"{rows[limit - 1]['sequence']}|{rows[limit - 1]['name']}" if len(rows) > limit else None
+        jobs = []
+        for row in rows[:limit]:
+            jobs.append({
+                "job_token": row["job_token"],
+                "printer_mac": row["printer_mac"],
+                "invoice_name": row["invoice_name"],
+                "status": row["status"],
+                "priority": priority_name(row["priority"]),
+                "creation": row["creation"]
+            })
+        return jobs, next_cursor
+
+    def clear(self, printer_mac=None):
+        sql = f"DELETE FROM {QUEUE_TABLE}"
+        params = ()
+        if printer_mac:
+            sql += " WHERE printer_mac = %s"
+            params = (printer_mac.upper(),)
+        with self.session() as db:
+            db.execute(sql, params)
+
+
+# ============================================================================
+# Redis Streams
+# ============================================================================
+
+def _entry_key(entry_id):
+    """Stream entry id as a comparable (ms, seq) tuple"""
+    ms, seq = _text(entry_id).split("-")
+    return int(ms), int(seq)
+
+
+def _text(value):
+    """Decode a Redis reply value"""
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class RedisStreamsBackend(QueueBackend):
+    """
+    One stream per printer and priority class, one consumer group per stream
+
+    - enqueue XADDs the job to the stream of its printer and class.
+    - claim delivers it with XREADGROUP: the entry moves to the group's
+      pending entries list (PEL), which is the Fetched state.
+    - ack XACKs and XDELs it, so a stream only holds queued jobs: first the
+      fetched ones (in the PEL), then the pending ones in order.
+    - requeue re-adds the entry at the back of its stream.
+
+    The next job of a printer is the first pending entry of one of its
+    streams, chosen by entry time plus the class's aging like the
+    database backend's sequence. A hash maps job tokens to their printer,
+    class and entry id, so ack and requeue only need the token.
+    """
+
+    name = "redis"
+
+    def __init__(self, client, prefix, aging=None):
+        """
+        :param client: redis.Redis client (frappe.cache() inside Frappe)
+        :param prefix: Key prefix shared by every process of the site (its db_name)
+        :param aging: Seconds of delay per priority class (default DEFAULT_PRIORITY_AGING)
+        """
+        self.client = client
+        self.prefix = prefix
+        if aging is not None:
+            self.aging = aging
+        self._groups = set()
+
+    def _stream(self, printer_mac, level=0):
+        # POS receipts keep the plain per-printer key
+        stream = f"{self.prefix}|{STREAM_PREFIX}|{printer_mac.upper()}"
+        return f"{stream}|{level}" if level else stream
+
+    def _streams(self, printer_mac):
+        """(level, stream) of every class of a printer, first served first"""
+        return [(level, self._stream(printer_mac, level)) for level in sorted(PRIORITIES.values())]
+
+    @property
+    def _tokens(self):
+        return f"{self.prefix}|{STREAM_PREFIX}_tokens"
+
+    @property
+    def _printers(self):
+        return f"{self.prefix}|{STREAM_PREFIX}_printers"
+
+    def _ensure_group(self, stream):
+        """Create the stream and its consumer group once per process"""
+        if stream in self._groups:
+            return
+        try:
+            self.client.xgroup_create(stream, GROUP, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._groups.add(stream)
+
+    def _locate(self, job_token):
+        """(printer_mac, level, entry_id) of a queued token, or (None, None, None)"""
+        value = self.client.hget(self._tokens, job_token)
+        if not value:
+            return None, None, None
+        printer_mac, level, entry_id = _text(value).split(" ", 2)
+        return printer_mac, int(level), entry_id
+
+    def _sort_key(self, level, entry_id):
+        """Serving order of an entry: its time in ms delayed by the class's aging"""
+        ms, seq = _text(entry_id).split("-")
+        return (int(ms) + level * int(float(self.aging) * 1000), level, int(seq))
+
+    def _fetched_count(self, stream):
+        """Entries delivered and not yet acknowledged"""
+        try:
+            return self.client.xpending(stream, GROUP)["pending"]
+        except redis.ResponseError:
+            # No stream or group yet
+            return 0
+
+    def _is_fetched(self, stream, entry_id):
+        try:
+            return bool(self.client.xpending_range(stream, GROUP, min=entry_id, max=entry_id, count=1))
+        except redis.ResponseError:
+            return False
+
+    def _job(self, printer_mac, entry_id, fields):
+        fields = {_text(k): _text(v) for k, v in fields.items()}
+        return {
+            "name": _text(entry_id),
+            "token": fields["token"],
+            "invoice": fields.get("invoice") or None,
+            "job_data": fields.get("job_data") or None,
+            "payload_hash": fields.get("payload_hash") or None,
+            "payload_size": int(fields["payload_size"]) if fields.get("payload_size") else None,
+            "media_types": _parse_media_types(fields.get("media_types")),
+            "printer_mac": printer_mac.upper()
+        }
+
+    def _entries(self, stream, start="-", end="+", count=None):
+        return self.client.xrange(stream, min=start, max=end, count=count)
+
+    def _head(self, stream):
+        """First pending (entry_id, fields) of a stream, or None"""
+        fetched = self._fetched_count(stream)
+        # Fetched entries come first in the stream, the next pending one follows
+        entries = self._entries(stream, count=fetched + 1)
+        if len(entries) <= fetched:
+            return None
+        return entries[fetched]
+
+    def _pending(self, printer_mac):
+        """[(sort key, level, entry_id, fields)] of a printer's pending jobs, in serving order"""
+        pending = []
+        for level, stream in self._streams(printer_mac):
+            entries = self._entries(stream)
+            for entry_id, fields in entries[self._fetched_count(stream) if entries else 0:]:
+                pending.append((self._sort_key(level, entry_id), level, _text(entry_id), fields))
+        pending.sort(key=lambda entry: entry[0])
+        return pending
+
+    def enqueue(self, job_token, printer_mac, invoice_name=None, job_data=None, media_types=None, priority=None):
+        return self.enqueue_many([{
+            "job_token": job_token,
+            "printer_mac": printer_mac,
+            "invoice_name": invoice_name,
+            "job_data": job_data,
+            "media_types": media_types,
+            "priority": priority
+        }])[job_token]
+
+    def enqueue_many(self, jobs):
+        if not jobs:
+            return {}
+        levels = [priority_level(job.get("priority")) for job in jobs]
+        printers = []
+        for job, level in zip(jobs, levels):
+            if job["printer_mac"].upper() not in printers:
+                printers.append(job["printer_mac"].upper())
+            self._ensure_group(self._stream(job["printer_mac"], level))
+
+        # One MULTI/EXEC: the jobs are added together or not at all
+        pipe = self.client.pipeline()
+        for job, level in zip(jobs, levels):
+            pipe.xadd(self._stream(job["printer_mac"], level), {
+                "token": job["job_token"],
+                "invoice": job.get("invoice_name") or "",
+                "job_data": job.get("job_data") or "",
+                "payload_hash": job.get("payload_hash") or "",
+                "payload_size": job.get("payload_size") or "",
+                "media_types": json.dumps(job.get("media_types") or DEFAULT_MEDIA_TYPES)
+            })
+        entry_ids = [_text(entry_id) for entry_id in pipe.execute()]
+
+        pipe = self.client.pipeline()
+        pipe.hset(self._tokens, mapping={
+            job["job_token"]: f"{job['printer_mac'].upper()} {level} {entry_id}"
+            for job, level, entry_id in zip(jobs, levels, entry_ids)
+        })
+        pipe.sadd(self._printers, *printers)
+        pipe.execute()
+
+        positions = {}
+        for printer_mac in printers:
+            positions.update(self.positions(
+                printer_mac,
+                [job["job_token"] for job in jobs if job["printer_mac"].upper() == printer_mac]
+            ))
+        return {job["job_token"]: positions[job["job_token"]] for job in jobs}
+
+    def _next(self, printer_mac):
+        """(level, entry_id, fields) of the next pending job of a printer, or None"""
+        heads = []
+        for level, stream in self._streams(printer_mac):
+            head = self._head(stream)
+            if head:
+                heads.append((self._sort_key(level, head[0]), level, head))
+        if not heads:
+            return None
+        _, level, (entry_id, fields) = min(heads, key=lambda head: head[0])
+        return level, entry_id, fields
+
+    def peek(self, printer_mac):
+        found = self._next(printer_mac)
+        if not found:
+            return None
+        _, entry_id, fields = found
+        return self._job(printer_mac, entry_id, fields)
+
+    def claim(self, printer_mac, job_token=None):
+        if job_token:
+            queued_mac, level, entry_id = self._locate(job_token)
+            if not entry_id or (printer_mac and queued_mac != printer_mac.upper()):
+                return None
+            printer_mac = queued_mac
+            stream = self._stream(printer_mac, level)
+
+            if self._is_fetched(stream, entry_id):
+                # Retried GET: hand out the same job again
+                entries = self._entries(stream, entry_id, entry_id)
+                return self._job(printer_mac, *entries[0]) if entries else None
+
+            # Streams deliver in order: only the next pending job of its class can be claimed
+            head = self._head(stream)
+            if not head or _text(head[0]) != entry_id:
+                return None
+        else:
+            found = self._next(printer_mac)
+            if not found:
+                return None
+            stream = self._stream(printer_mac, found[0])
+
+        self._ensure_group(stream)
+        try:
+            reply = self.client.xreadgroup(GROUP, CONSUMER, {stream: ">"}, count=1)
+        except redis.ResponseError as e:
+            if "NOGROUP" not in str(e):
+                raise
+            # Another process cleared the stream since this one created its group
+            self._groups.discard(stream)
+            self._ensure_group(stream)
+            reply = self.client.xreadgroup(GROUP, CONSUMER, {stream: ">"}, count=1)
+        if not reply or not reply[0][1]:
+            return None
+        entry_id, fields = reply[0][1][0]
+        return self._job(printer_mac, entry_id, fields)
+
+    def ack(self, job_token):
+        printer_mac, level, entry_id = self._locate(job_token)
+        if not entry_id:
+            return False
+        stream = self._stream(printer_mac, level)
+        pipe = self.client.pipeline()
+        pipe.xack(stream, GROUP, entry_id)
+        pipe.xdel(stream, entry_id)
+        pipe.hdel(self._tokens, job_token)
+        pipe.execute()
+        return True
+
+    def requeue(self, job_token):
+        printer_mac, level, entry_id = self._locate(job_token)
+        if not entry_id:
+            return False
+        stream = self._stream(printer_mac, level)
+        entries = self._entries(stream, entry_id, entry_id)
+        if not entries:
+            return False
+
+        pipe = self.client.pipeline()
+        pipe.xack(stream, GROUP, entry_id)
+        pipe.xdel(stream, entry_id)
+        pipe.xadd(stream, entries[0][1])
+        new_id = _text(pipe.execute()[2])
+        self.client.hset(self._tokens, job_token, f"{printer_mac} {level} {new_id}")
+        return True
+
+    def assign(self, from_mac, to_mac):
+        found = self._next(from_mac)
+        if not found:
+            return None
+        level, entry_id, fields = found
+        # XDEL removes the entry once: a concurrent assign gets 0 and stops
+        if not self.client.xdel(self._stream(from_mac, level), entry_id):
+            return None
+
+        # The entry gets a new id, behind the printer's jobs of its class
+        stream = self._stream(to_mac, level)
+        self._ensure_group(stream)
+        job_token = self._job(from_mac, entry_id, fields)["token"]
+        new_id = _text(self.client.xadd(stream, fields))
+        pipe = self.client.pipeline()
+        pipe.hset(self._tokens, job_token, f"{to_mac.upper()} {level} {new_id}")
+        pipe.sadd(self._printers, to_mac.upper())
+        pipe.execute()
+        return job_token
+
+    def move_pending(self, moves):
+        entries = []
+        for from_mac, to_mac in moves.items():
+            for _, level, entry_id, fields in self._pending(from_mac):
+                entries.append((from_mac.upper(), to_mac.upper(), level, entry_id, fields))
+        if not entries:
+            return []
+
+        for _, to_mac, level, _, _ in entries:
+            self._ensure_group(self._stream(to_mac, level))
+        # One MULTI/EXEC; entries get new ids, behind the target's jobs of their class
+        pipe = self.client.pipeline()
+        for from_mac, to_mac, level, entry_id, fields in entries:
+            pipe.xdel(self._stream(from_mac, level), entry_id)
+            pipe.xadd(self._stream(to_mac, level), fields)
+        new_ids = [_text(entry_id) for entry_id in pipe.execute()[1::2]]
+
+        moved = []
+        tokens = {}
+        for (from_mac, to_mac, level, entry_id, fields), new_id in zip(entries, new_ids):
+            job = self._job(from_mac, entry_id, fields)
+            tokens[job["token"]] = f"{to_mac} {level} {new_id}"
+            moved.append({
+                "job_token": job["token"],
+                "invoice_name": job["invoice"],
+                "from_mac": from_mac,
+                "to_mac": to_mac
+            })
+        pipe = self.client.pipeline()
+        pipe.hset(self._tokens, mapping=tokens)
+        pipe.sadd(self._printers, *{move["to_mac"] for move in moved})
+        pipe.execute()
+        return moved
+
+    def position(self, printer_mac, job_token):
+        return self.positions(printer_mac, [job_token])[job_token]
+
+    def positions(self, printer_mac, job_tokens):
+        """
+        Positions counted from stream lengths
+
+        A job's position is the number of pending entries served up to and
+        including it: per stream, XLEN minus the fetched entries minus the
+        entries served after the job. Only those later entries are read (the
+        newer entries of the job's class, and of lower classes those within
+        their aging), never the whole queue.
+        """
+        printer_mac = printer_mac.upper()
+        positions = {token: 0 for token in job_tokens}
+        located = {}
+        for token in job_tokens:
+            queued_mac, level, entry_id = self._locate(token)
+            if queued_mac == printer_mac:
+                located[token] = (level, _entry_key(entry_id))
+        if not located:
+            return positions
+
+        # First entry id served after each job, per stream
+        bounds = {
+            token: {level: self._first_after(job_level, ms, seq, level) for level, _ in self._streams(printer_mac)}
+            for token, (job_level, (ms, seq)) in located.items()
+        }
+        counts = {token: {} for token in located}
+        for level, stream in self._streams(printer_mac):
+            length = self.client.xlen(stream)
+            if not length:
+                continue
+            fetched = self._fetched_count(stream)
+            start = min(bounds[token][level] for token in located)
+            later = sorted(_entry_key(entry_id) for entry_id, _ in self.client.xrevrange(
+                stream, max="+", min=f"{start[0]}-{start[1]}"
+            ))
+            for token in located:
+                served_after = len(later) - bisect.bisect_left(later, bounds[token][level])
+                counts[token][level] = length - fetched - served_after
+
+        for token, (job_level, _) in located.items():
+            # Not above zero in its own stream: the job itself is fetched
+            if counts[token].get(job_level, 0) > 0:
+                positions[token] = sum(max(0, count) for count in counts[token].values())
+        return positions
+
+    def _first_after(self, job_level, ms, seq, level):
+        """(ms, seq) of the first entry id of class level served after a job"""
+        if level == job_level:
+            return ms, seq + 1
+        # Entries are ordered by ms + level * aging, ties go to the higher class
+        aging_ms = int(float(self.aging) * 1000)
+        served_at = ms + (job_level - level) * aging_ms
+        return max(0, served_at + 1 if level < job_level else served_at), 0
+
+    def _printer_macs(self, printer_mac=None):
+        if isinstance(printer_mac, (list, tuple)):
+            return [mac.upper() for mac in printer_mac]
+        if printer_mac:
+            return [printer_mac.upper()]
+        return sorted(_text(m) for m in self.client.smembers(self._printers))
+
+    def find(self, job_tokens):
+        if not job_tokens:
+            return {}
+        values = self.client.hmget(self._tokens, list(job_tokens))
+        return {
+            token: _text(value).split(" ", 1)[0]
+            for token, value in zip(job_tokens, values)
+            if value
+        }
+
+    def depth(self, printer_mac=None):
+        printers = self._printer_macs(printer_mac)
+        streams = [(mac, stream) for mac in printers for _, stream in self._streams(mac)]
+        pipe = self.client.pipeline(transaction=False)
+        for _, stream in streams:
+            pipe.xlen(stream)
+        lengths = pipe.execute()
+
+        depths = {}
+        for (mac, stream), length in zip(streams, lengths):
+            pending = length - self._fetched_count(stream) if length else 0
+            if pending:
+                depths[mac] = depths.get(mac, 0) + pending
+        return depths
+
+    def summary(self, printer_mac=None):
+        now = time.time()
+        summary = {}
+        for mac in self._printer_macs(printer_mac):
+            counts = {}
+            oldest = None
+            for _, stream in self._streams(mac):
+                fetched = self._fetched_count(stream)
+                pending = self.client.xlen(stream) - fetched
+                if fetched:
+                    counts["Fetched"] = counts.get("Fetched", 0) + fetched
+                if pending > 0:
+                    counts["Pending"] = counts.get("Pending", 0) + pending
+                    head = self._head(stream)
+                    if head:
+                        # Entry ids start with their creation time in ms
+                        ms = int(_text(head[0]).split("-")[0])
+                        oldest = ms if oldest is None else min(oldest, ms)
+            if counts:
+                summary[mac] = {
+                    "counts": counts,
+                    "oldest_pending": datetime.fromtimestamp(oldest / 1000) if oldest else None,
+                    "oldest_pending_age": max(int(now - oldest / 1000), 0) if oldest else None
+                }
+        return summary
+
+    def version(self, printer_mac=None):
+        # Every write adds, deletes or delivers an entry: length, last id
+        # and delivered count of each stream change with it
+        streams = [stream for mac in self._printer_macs(printer_mac) for _, stream in self._streams(mac)]
+        pipe = self.client.pipeline(transaction=False)
+        for stream in streams:
+            pipe.xlen(stream)
+            pipe.xrevrange(stream, count=1)
+        replies = pipe.execute()
+
+        parts = []
+        for stream, length, last in zip(streams, replies[0::2], replies[1::2]):
+            if length:
+                parts.append(f"{length}:{_text(last[0][0]) if last else ''}:{self._fetched_count(stream)}")
+        return ",".join(parts)
+
+    def list(self, printer_mac=None):
+        return [job for _, job in self._keyed(printer_mac)]
+
+    def page(self, printer_mac=None, status=None, priority=None, after=None, limit=DEFAULT_PAGE_SIZE):
+        """
+        Streams cannot be read in serving order across printers and classes:
+        every stream of the printers is read (XRANGE) and paged here, so a
+        page costs as much as list() on the same printers.
+        """
+        level = priority_level(priority) if priority is not None else None
+        if after:
+            # Cursor: serving key, printer and entry id of the last job of the previous page
+            key, _, entry = after.partition("|")
+            mac, separator, entry_id = entry.rpartition("|")
+            try:
+                key = tuple(int(part) for part in key.split("-"))
+            except ValueError:
+                raise ValueError(f"Invalid cursor: {after}")
+            if len(key) != 3 or not separator:
+                raise ValueError(f"Invalid cursor: {after}")
+            after = key + (mac, entry_id)
+
+        keyed = [
+            (key, job)
+            for key, job in self._keyed(printer_mac)
+            if (not status or job["status"] == status)
+            and (level is None or key[1] == level)
+            and (not after or key > after)
+        ]
+        next_cursor = None
+        if len(keyed) > limit:
+            ms, key_level, seq, mac, entry_id = keyed[limit - 1][0]
+            next_cursor = f"{ms}-{key_level}-{seq}|{mac}|{entry_id}"
+        return [job for _, job in keyed[:limit]], next_cursor
+
+    def _keyed(self, printer_mac=None):
+        """[(sort key, job)] of every queued job, in serving order, as in list()
+
+        Keys end with the printer and entry id: entry ids only order one
+        stream, two printers' jobs can share time, class and sequence.
+        """
+        keyed = []
+        for mac in self._printer_macs(printer_mac):
+            for level, stream in self._streams(mac):
+                entries = self._entries(stream)
+                if not entries:
+                    continue
+                fetched = self._fetched_count(stream)
+                for idx, (entry_id, fields) in enumerate(entries):
+                    job = self._job(mac, entry_id, fields)
+                    keyed.append((self._sort_key(level, entry_id) + (mac, _text(entry_id)), {
+                        "job_token": job["token"],
+                        "printer_mac": mac,
+                        "invoice_name": job["invoice"],
+                        "status": "Fetched" if idx < fetched else "Pending",
+                        "priority": priority_name(level),
+                        # Entry ids start with their creation time in ms
+                        "creation": datetime.fromtimestamp(int(job["name"].split("-")[0]) / 1000)
+                    }))
+        keyed.sort(key=lambda item: item[0])
+        return keyed
+
+    def clear(self, printer_mac=None):
+        printers = self._printer_macs(printer_mac)
+        tokens = [job["job_token"] for job in self.list(printer_mac)]
+        streams = [stream for mac in printers for _, stream in self._streams(mac)]
+        # Deleting a stream drops its group too; claim() recreates it in every process
+        pipe = self.client.pipeline()
+        for stream in streams:
+            pipe.delete(stream)
+        for mac in printers:
+            pipe.srem(self._printers, mac)
+        if tokens:
+            pipe.hdel(self._tokens, *tokens)
+        pipe.execute()
+        self._groups.difference_update(streams)
+
+
+# ============================================================================
+# Backend selection
+# ============================================================================
+
+_backends = {}
+
+
+def make_backend(site_config, redis_url=None, session=None):
+    """
+    Backend chosen by site_config cloudprnt_queue_backend
+
+    :param site_config: Site config dict
+    :param redis_url: Redis URL for the streams backend when cloudprnt_queue_redis_url is not set (bench's redis_queue)
+    :param session: Database session (default FrappeSession)
+    :return: QueueBackend
+    :raises ValueError: On an unknown backend name, or a redis backend without URL
+    """
+    name = site_config.get("cloudprnt_queue_backend") or "db"
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown CloudPRNT queue backend: {name}")
+    aging = site_config.get("cloudprnt_priority_aging")
+
+    if name == "redis":
+        if not REDIS_AVAILABLE:
+            raise ValueError("The redis queue backend needs the redis package")
+        url = site_config.get("cloudprnt_queue_redis_url") or redis_url
+        if not url:
+            raise ValueError("The redis queue backend needs cloudprnt_queue_redis_url or redis_queue")
+        return RedisStreamsBackend(redis.Redis.from_url(url), site_config.get("db_name"), aging=aging)
+
+    return DatabaseBackend(session, aging=aging)
+
+
+def get_backend():
+    """
+    Queue backend of the current site, for code running inside Frappe
+
+    :return: QueueBackend (one per site and process)
+    """
+    site = getattr(frappe.local, "site", None)
+    name = frappe.conf.get("cloudprnt_queue_backend") or "db"
+    backend = _backends.get(site)
+    if backend is None or backend.name != name:
+        backend = make_backend(frappe.conf, redis_url=frappe.conf.get("redis_queue"))
+        _backends[site] = backend
+    return backend
@@ -0,0 +1,228 @@
+"""
+CloudPRNT Queue Retention
+=========================
+
+Scheduled sweep keeping `tabCloudPRNT Print Queue` down to the jobs still
+waiting for a printer:
+
+    payloads   inline job_data of fetched jobs older than the payload TTL
+               is dropped (a retried GET that late is not expected)
+    finished   Printed / Error rows are moved to the archive
+    expired    jobs fetched but never confirmed, and jobs never fetched,
+               are moved to the archive after their TTL
+    archive    archive rows older than the archive retention are deleted
+    files      payload store files no queued job references are deleted
+               once older than the pending and fetched TTLs together
+    history    CloudPRNT Job History rows older than the history retention
+               are deleted
+
+The archive (`CloudPRNT Print Queue Archive`) keeps the job's token,
+printer, invoice, last status and timestamps, without the payload.
+
+Every step works in batches of at most `cloudprnt_queue_sweep_batch`
+rows, one commit per batch, and stops after
+`cloudprnt_queue_sweep_max_batches` batches so a backlog is worked off
+over several runs instead of in one long transaction.
+
+Only the database queue is swept: with the Redis Streams backend the
+table holds no jobs. Job history is pruned with either backend.
+
+Configuration (site_config.json, seconds unless stated):
+{
+    "cloudprnt_queue_payload_ttl": 600,
+    "cloudprnt_queue_fetched_ttl": 3600,
+    "cloudprnt_queue_pending_ttl": 86400,
+    "cloudprnt_queue_archive_days": 90,
+    "cloudprnt_job_history_days": 90,
+    "cloudprnt_queue_sweep_batch": 500,
+    "cloudprnt_queue_sweep_max_batches": 20
+}
+"""
+
+import frappe
+from cloudprnt.job_history import HISTORY_TABLE
+from cloudprnt.payload_store import get_payload_store
+from cloudprnt.queue_backend import QUEUE_TABLE
+
+ARCHIVE_TABLE = "`tabCloudPRNT Print Queue Archive`"
+
+RETENTION_DEFAULTS = {
+    "cloudprnt_queue_payload_ttl": 600,
+    "cloudprnt_queue_fetched_ttl": 3600,
+    "cloudprnt_queue_pending_ttl": 86400,
+    "cloudprnt_queue_archive_days": 90,
+    "cloudprnt_job_history_days": 90,
+    "cloudprnt_queue_sweep_batch": 500,
+    "cloudprnt_queue_sweep_max_batches": 20
+}
+
+# (outcome, condition, setting holding the age in seconds), on the
+# (status, modified) index. modified is set by enqueue, claim and requeue.
+ARCHIVE_RULES = [
+    ("Finished", "status IN ('Printed', 'Error')", None),
+    ("Expired", "status = 'Fetched' AND modified < NOW(6) - INTERVAL %s SECOND", "cloudprnt_queue_fetched_ttl"),
+    ("Expired", "status = 'Pending' AND modified < NOW(6) - INTERVAL %s SECOND", "cloudprnt_queue_pending_ttl")
+]
+
+# Params: payload TTL, batch size
+DROP_PAYLOADS_SQL = f"""
+    UPDATE {QUEUE_TABLE}
+    SET job_data = NULL
+    WHERE status = 'Fetched' AND modified < NOW(6) - INTERVAL %s SECOND
+    AND job_data IS NOT NULL
+    LIMIT %s
+"""
+
+# Params: archive days, batch size
+PRUNE_ARCHIVE_SQL = f"""
+    DELETE FROM {ARCHIVE_TABLE}
+    WHERE archived_at < NOW(6) - INTERVAL %s DAY
+    LIMIT %s
+"""
+
+# Params: history days, batch size (enqueued_at is indexed)
+PRUNE_HISTORY_SQL = f"""
+    DELETE FROM {HISTORY_TABLE}
+    WHERE enqueued_at < NOW(6) - INTERVAL %s DAY
+    LIMIT %s
+"""
+
+
+def get_retention_settings(conf=None):
+    """
+    Retention settings from the site config, with the defaults
+
+    :param conf: Site config dict (default frappe.conf)
+    :return: Dict with every RETENTION_DEFAULTS key as an int
+    """
+    conf = frappe.conf if conf is None else conf
+    return {key: int(conf.get(key) or default) for key, default in RETENTION_DEFAULTS.items()}
+
+
+def _in_batches(step, settings):
+    """
+    Run a batch step until it handles less than a full batch
+
+    :param step: Callable(batch_size) returning the number of rows handled
+    :return: Total rows handled
+    """
+    batch = settings["cloudprnt_queue_sweep_batch"]
+    total = 0
+    for _ in range(settings["cloudprnt_queue_sweep_max_batches"]):
+        count = step(batch)
+        frappe.db.commit()
+        total += count
+        if count < batch:
+            break
+    return total
+
+
+def drop_payloads(settings, batch):
+    """Clear job_data of one batch of old fetched jobs"""
+    frappe.db.sql(DROP_PAYLOADS_SQL, (settings["cloudprnt_queue_payload_ttl"], batch))
+    return frappe.db._cursor.rowcount
+
+
+def archive_batch(outcome, condition, params, batch):
+    """
+    Move one batch of queue rows matching a rule to the archive
+
+    The condition is checked again by the INSERT and the DELETE, so a job
+    that changed status since the SELECT (requeued, confirmed) is left alone.
+
+    :return: Number of rows archived
+    """
+    names = frappe.db.sql_list(
+        f"SELECT name FROM {QUEUE_TABLE} WHERE {condition} LIMIT %s",
+        params + (batch,)
+    )
+    if not names:
+        return 0
+
+    in_names = ", ".join(["%s"] * len(names))
+    # INSERT IGNORE: a name already archived must not block the delete
+    frappe.db.sql(f"""
+        INSERT IGNORE INTO {ARCHIVE_TABLE}
+        (name, creation, modified, modified_by, owner, docstatus, idx,
+         job_token, printer_mac, invoice_name, outcome, status, priority,
+         queued_at, last_update, archived_at)
+        SELECT name, NOW(6), NOW(6), 'Administrator', 'Administrator', 0, 0,
+            job_token, printer_mac, invoice_name, %s, status, priority,
+            creation, modified, NOW(6)
+        FROM {QUEUE_TABLE}
+        WHERE name IN ({in_names}) AND {condition}
+    """, (outcome,) + tuple(names) + params)
+    frappe.db.sql(
+        f"DELETE FROM {QUEUE_TABLE} WHERE name IN ({in_names}) AND {condition}",
+        tuple(names) + params
+    )
+    return frappe.db._cursor.rowcount
+
+
+def prune_archive(settings, batch):
+    """Delete one batch of archive rows past the archive retention"""
+    frappe.db.sql(PRUNE_ARCHIVE_SQL, (settings["cloudprnt_queue_archive_days"], batch))
+    return frappe.db._cursor.rowcount
+
+
+def prune_history(settings, batch):
+    """Delete one batch of job history rows past the history retention"""
+    frappe.db.sql(PRUNE_HISTORY_SQL, (settings["cloudprnt_job_history_days"], batch))
+    return frappe.db._cursor.rowcount
+
+
+def purge_payload_files(settings):
+    """
+    Remove payload store files of jobs that left the queue
+
+    A file is kept while a queue row references it, and until it is older
+    than a job can stay queued (Redis-backed queues have no rows to check).
+    The references are read after the store is walked, so a job queued
+    meanwhile keeps its file.
+
+    :return: Number of files removed
+    """
+    def referenced():
+        return frappe.db.sql_list(
+            f"SELECT DISTINCT payload_hash FROM {QUEUE_TABLE} WHERE payload_hash IS NOT NULL"
+        )
+
+    max_age = settings["cloudprnt_queue_pending_ttl"] + settings["cloudprnt_queue_fetched_ttl"]
+    return get_payload_store().purge(referenced, max_age)
+
+
+def sweep_queue(settings=None):
+    """
+    Drop old payloads, archive finished and expired jobs, prune the archive,
+    the job history and the payload store
+
+    Runs from scheduler_events.
+
+    :param settings: Retention settings (default get_retention_settings())
+    :return: Dict of rows handled per step
+    """
+    settings = settings or get_retention_settings()
+    result = {"payloads_dropped": 0, "finished": 0, "expired": 0, "archive_pruned": 0,
+              "history_pruned": 0, "payload_files_removed": 0}
+
+    try:
+        result["payloads_dropped"] = _in_batches(lambda batch: drop_payloads(settings, batch), settings)
+
+        for outcome, condition, setting in ARCHIVE_RULES:
+            params = (settings[setting],) if setting else ()
+            result[outcome.lower()] += _in_batches(
+                lambda batch: archive_batch(outcome, condition, params, batch),
+                settings
+            )
+
+        result["archive_pruned"] = _in_batches(lambda batch: prune_archive(settings, batch), settings)
+        result["history_pruned"] = _in_batches(lambda batch: prune_history(settings, batch), settings)
+        result["payload_files_removed"] = purge_payload_files(settings)
+
+    except Exception as e:
+        frappe.db.rollback()
+        frappe.log_error(f"Error sweeping print queue: {str(e)}", "sweep_queue")
+
+    if any(result.values()):
+        frappe.logger().info(f"CloudPRNT queue sweep: {result}")
+    return result
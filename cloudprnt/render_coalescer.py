@@ -0,0 +1,191 @@
+"""
+CloudPRNT Render Coalescer
+==========================
+
+Single-flight layer for the standalone /job endpoint.
+
+When a render is slow, printers time out and re-issue GET /job for the same
+token. Without coalescing every retry starts its own markup fetch and
+render next to the first one. Renders are keyed by (token, media type,
+render profile):
+
+- Within one server process, later requests await the in-flight render.
+- Across server processes, a short Redis lock elects one renderer; the
+  others poll for the result, which is handed off through Redis for a
+  few seconds after the render finishes.
+
+Waiters poll Redis every 50 ms, so the standalone server gives the
+coalescer a plain Redis client run in threads (asyncio.to_thread) rather
+than holding Frappe context pool slots. Without a client, frappe.cache()
+is used and every Redis call needs a Frappe context (see
+FrappeContextPool.run).
+
+Usage:
+    coalescer = RenderCoalescer(asyncio.to_thread, client=redis_client, prefix=db_name)
+    binary_data = await coalescer.run((token, media_type, profile), render)
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+
+import frappe
+
+KEY_PREFIX = "cloudprnt_render"
+DEFAULT_LOCK_TTL = 25  # seconds, longer than the render deadline
+DEFAULT_RESULT_TTL = 30  # seconds a finished render stays available to retries
+POLL_INTERVAL = 0.05  # seconds between checks by waiting workers
+
+# Delete the lock only if we still own it
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+logger = logging.getLogger("cloudprnt.render_coalescer")
+
+
+class RenderCoalescer:
+    """
+    Collapses concurrent renders of the same key into one
+    """
+
+    def __init__(self, run_in_context, lock_ttl=DEFAULT_LOCK_TTL, result_ttl=DEFAULT_RESULT_TTL,
+                 client=None, prefix=None):
+        """
+        :param run_in_context: Coroutine function running a blocking Redis call
+            (asyncio.to_thread with a client, a Frappe context runner without)
+        :param lock_ttl: Seconds before an abandoned render lock expires
+        :param result_ttl: Seconds a rendered result is kept for retries
+        :param client: redis.Redis client (default frappe.cache())
+        :param prefix: Site key prefix used with a client, like frappe.cache().make_key (its db_name)
+        """
+        self.run_in_context = run_in_context
+        self.client = client
+        self.prefix = prefix
+        self.lock_ttl = lock_ttl
+        self.result_ttl = result_ttl
+        self._inflight = {}
+
+        # Counters, read by the health and metrics endpoints
+        self.renders = 0
+        self.local_joins = 0
+        self.remote_joins = 0
+        self.handoff_hits = 0
+
+    def stats(self):
+        """Coalescer counters as a dict"""
+        return {
+            "in_flight": len(self._inflight),
+            "renders": self.renders,
+            "local_joins": self.local_joins,
+            "remote_joins": self.remote_joins,
+            "handoff_hits": self.handoff_hits
+        }
+
+    def _redis(self):
+        return self.client if self.client is not None else frappe.cache()
+
+    def _make_key(self, kind, key):
+        """Site-prefixed Redis key for a coalescing key tuple"""
+        name = f"{KEY_PREFIX}_{kind}|" + "|".join(str(k) for k in key)
+        if self.client is None:
+            return frappe.cache().make_key(name)
+        return f"{self.prefix}|{name}"
+
+    def _acquire_lock(self, key, owner, ttl):
+        """
+        Try to become the renderer for a key
+
+        :return: True if the lock was acquired
+        """
+        return bool(self._redis().set(self._make_key("lock", key), owner, nx=True, px=int(ttl * 1000)))
+
+    def _release_lock(self, key, owner):
+        """Release the lock if it is still ours"""
+        self._redis().eval(_RELEASE_SCRIPT, 1, self._make_key("lock", key), owner)
+
+    def _store_result(self, key, data, ttl):
+        """Hand a rendered result off to other workers"""
+        self._redis().set(self._make_key("result", key), data, px=int(ttl * 1000))
+
+    def _load_result(self, key):
+        """Get a result handed off by another worker, or None"""
+        return self._redis().get(self._make_key("result", key))
+
+    async def run(self, key, render):
+        """
+        Render once per key, sharing the result with concurrent callers
+
+        :param key: Tuple of (token, media type, profile)
+        :param render: Coroutine function producing the bytes
+        :return: Rendered bytes
+        """
+        future = self._inflight.get(key)
+        if future is not None:
+            self.local_joins += 1
+            # Shield so a disconnecting retry does not cancel the shared render
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._run_across_workers(key, render)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when no other caller joined
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _run_across_workers(self, key, render):
+        """Render under the Redis lock, or wait for the worker holding it"""
+        deadline = time.monotonic() + self.lock_ttl
+        owner = uuid.uuid4().hex
+        joined = False
+
+        while True:
+            result = await self._try_redis(self._load_result, key)
+            if result is not None:
+                if joined:
+                    self.remote_joins += 1
+                else:
+                    self.handoff_hits += 1
+                return result
+
+            # Without Redis, fall back to rendering locally
+            acquired = await self._try_redis(self._acquire_lock, key, owner, self.lock_ttl, default=True)
+            if acquired:
+                return await self._render_and_hand_off(key, owner, render)
+
+            joined = True
+            if time.monotonic() >= deadline:
+                # The lock holder is stuck; render ourselves rather than fail
+                logger.warning("Render lock for %s held too long, rendering locally", key)
+                return await self._render_and_hand_off(key, owner, render)
+
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def _render_and_hand_off(self, key, owner, render):
+        """Render, publish the result for other workers and release the lock"""
+        try:
+            self.renders += 1
+            result = await render()
+            await self._try_redis(self._store_result, key, result, self.result_ttl)
+            return result
+        finally:
+            await self._try_redis(self._release_lock, key, owner)
+
+    async def _try_redis(self, fn, *args, default=None):
+        """Run a Redis helper off the event loop, returning default on error"""
+        try:
+            return await self.run_in_context(fn, *args)
+        except Exception as e:
+            logger.error("Render coalescer Redis error in %s: %s", fn.__name__, e)
+            return default
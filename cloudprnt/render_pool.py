@@ -0,0 +1,292 @@
+"""
+CloudPRNT Render Pool
+=====================
+
+Process pool for CPU-bound job rendering in the standalone server.
+
+Markup parsing, hex building, Pillow image processing and hex decoding
+run in dedicated worker processes instead of the asyncio event loop, so
+a heavy receipt never delays other printers' /poll requests.
+
+Workers are warm: each one imports the renderer modules (and Pillow)
+and initialises Frappe once at start-up. Only the rendered bytes are
+sent back to the server process.
+
+Each worker is its own single-process executor (a slot) and runs one job
+at a time. A job still waiting for a slot at its deadline is dropped. A
+job still rendering at its deadline would hold its worker for as long as
+it runs, so that one worker is terminated and replaced; jobs running on
+the other workers are not affected.
+
+Configuration (site_config.json):
+{
+    "cloudprnt_render_workers": 2,
+    "cloudprnt_render_timeout": 20
+}
+"""
+
+import asyncio
+import functools
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+DEFAULT_WORKERS = 2
+DEFAULT_TIMEOUT = 20  # seconds, per job, including time spent queued
+
+logger = logging.getLogger("cloudprnt.render_pool")
+
+
+class RenderTimeout(Exception):
+    """Raised when a job is not rendered before its deadline"""
+
+
+def _init_worker(site, sites_path, metrics_dir=None):
+    """
+    Warm up a render worker process
+
+    Imports the renderers once and opens the Frappe context that image
+    conversion needs (CPUtil path lookup, logging).
+    """
+    import frappe
+    from cloudprnt import job_renderer  # noqa: F401 - warm import
+    from cloudprnt import metrics, structured_log
+    from cloudprnt.frappe_context import init_site
+
+    if metrics_dir:
+        # CPUtil samples recorded here are merged into the server's /metrics
+        metrics.configure(metrics_dir)
+
+    try:
+        init_site(site, sites_path)
+        # Same JSON log output as the server process
+        structured_log.configure_from_site_config(frappe.local.conf)
+    except Exception as e:
+        # Text rendering still works without a site; image lookups will fail loudly
+        logger.error("Render worker could not initialise site %s: %s", site, e)
+
+
+def _warm_up():
+    """No-op task used to force worker processes to start"""
+    return True
+
+
+def _render_in_worker(markup_text, printer_mac, media_type):
+    """
+    Render markup to printer bytes inside a worker process
+
+    :return: Binary job data
+    """
+    import frappe
+    from cloudprnt import metrics
+    from cloudprnt.job_renderer import get_renderer
+
+    try:
+        return get_renderer(media_type)(markup_text, printer_mac)
+    finally:
+        # End the read transaction so settings changes are seen by the next job
+        if getattr(frappe.local, "db", None):
+            frappe.db.rollback()
+        metrics.flush()
+
+
+class RenderPool:
+    """
+    Warm pool of single-process workers with a per-job deadline and
+    queue-depth tracking
+    """
+
+    def __init__(self, site, sites_path, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, metrics_dir=None):
+        """
+        :param site: Site name (initialised in every worker)
+        :param sites_path: Absolute path to the bench sites directory
+        :param workers: Number of worker processes
+        :param timeout: Per-job deadline in seconds
+        :param metrics_dir: Shared metrics directory workers flush to (optional)
+        """
+        self.site = site
+        self.sites_path = sites_path
+        self.workers = workers
+        self.timeout = timeout
+        self.metrics_dir = metrics_dir
+        self._slots = None
+        self._free = deque()
+        self._waiters = deque()
+
+        # Counters, read by the health and metrics endpoints
+        self.in_flight = 0
+        self.completed = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.recycled = 0
+
+    def _new_executor(self):
+        return ProcessPoolExecutor(
+            max_workers=1,
+            # Never fork a process that holds DB connections and threads
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.site, self.sites_path, self.metrics_dir)
+        )
+
+    def start(self):
+        """Start the worker slots (idempotent)"""
+        if self._slots is None:
+            self._slots = [self._new_executor() for _ in range(self.workers)]
+            self._free = deque(range(self.workers))
+            self._waiters = deque()
+        return self
+
+    async def warm_up(self):
+        """Start every worker now rather than on the first job"""
+        self.start()
+        await asyncio.gather(*[
+            asyncio.wrap_future(executor.submit(_warm_up))
+            for executor in self._slots
+        ])
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        slots, self._slots = self._slots, None
+        for executor in slots or []:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def recycle(self, slot):
+        """
+        Terminate the worker of one slot, stuck or dead, and start a new one
+
+        :param slot: Slot index
+        """
+        executor = self._slots[slot]
+        self._slots[slot] = self._new_executor()
+        self._slots[slot].submit(_warm_up)
+        self.recycled += 1
+
+        # Private, but the only handle on the process before Python 3.14
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+        self._release(slot)
+
+    @property
+    def queue_depth(self):
+        """Jobs submitted but not yet picked up by a worker"""
+        return max(0, self.in_flight - self.workers)
+
+    def stats(self):
+        """Pool counters as a dict"""
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "recycled": self.recycled
+        }
+
+    async def render(self, markup_text, printer_mac, media_type=None):
+        """
+        Render markup to printer bytes in a worker process
+
+        :param markup_text: Star Document Markup
+        :param printer_mac: Normalized printer MAC address
+        :param media_type: Requested MIME type (optional)
+        :return: Binary job data
+        :raises RenderTimeout: If the deadline passes first
+        """
+        loop = asyncio.get_running_loop()
+        timeout = self.timeout
+        deadline = loop.time() + timeout
+        self.start()
+        self.in_flight += 1
+        try:
+            slot = await self._acquire(deadline)
+        except BaseException:
+            self.in_flight -= 1
+            raise
+        if slot is not None and loop.time() >= deadline:
+            # Handed a slot at the deadline: no time left to render
+            self._release(slot)
+            slot = None
+        if slot is None:
+            self.in_flight -= 1
+            self.timeouts += 1
+            raise RenderTimeout(f"No render worker free after {timeout}s")
+
+        executor = self._slots[slot]
+        future = asyncio.wrap_future(executor.submit(_render_in_worker, markup_text, printer_mac, media_type))
+        future.add_done_callback(functools.partial(self._on_done, slot, executor))
+
+        # asyncio.wait() returns at the deadline even if the worker is still
+        # busy; wait_for() would block until the process finished the job
+        done, _ = await asyncio.wait({future}, timeout=max(0, deadline - loop.time()))
+        if not done:
+            self.timeouts += 1
+            if self._slots is not None and self._slots[slot] is executor:
+                # The worker is lost until the job ends - replace only this one
+                logger.error("Render past its deadline, replacing its worker")
+                self.recycle(slot)
+            raise RenderTimeout(f"Render not finished after {timeout}s")
+
+        try:
+            result = future.result()
+        except Exception:
+            self.failures += 1
+            raise
+
+        self.completed += 1
+        return result
+
+    async def _acquire(self, deadline):
+        """
+        Wait for a free slot
+
+        :param deadline: Event loop time to give up at
+        :return: Slot index, or None if the deadline passed first
+        """
+        if self._free:
+            return self._free.popleft()
+
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        try:
+            done, _ = await asyncio.wait({waiter}, timeout=max(0, deadline - loop.time()))
+        except asyncio.CancelledError:
+            if waiter.done():
+                # Handed a slot just as the request went away
+                self._release(waiter.result())
+            waiter.cancel()
+            raise
+        if not done:
+            waiter.cancel()
+            return None
+        return waiter.result()
+
+    def _release(self, slot):
+        """Hand a free slot to the next waiting job, or mark it free"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(slot)
+                return
+        self._free.append(slot)
+
+    def _on_done(self, slot, executor, future):
+        """Free the slot once its worker is actually free"""
+        self.in_flight -= 1
+        # Mark the exception as retrieved for jobs nobody waits on anymore
+        error = None if future.cancelled() else future.exception()
+        if self._slots is None or self._slots[slot] is not executor:
+            # Shut down, or already replaced after an overrun
+            return
+        if isinstance(error, BrokenProcessPool):
+            # The worker died (OOM, segfault in a native lib) - replace it
+            logger.error("Render worker died, replacing it")
+            self.recycle(slot)
+        else:
+            self._release(slot)
@@ -0,0 +1,140 @@
+"""
+CloudPRNT Render Prefetcher
+===========================
+
+Speculative rendering for the standalone server.
+
+When /poll answers jobReady: true, the printer's GET /job follows a few
+hundred milliseconds later. The prefetcher starts rendering the job as
+soon as the poll reports it, through the render coalescer, so the GET
+joins the in-flight render or picks up the handed-off result instead of
+starting from scratch.
+
+Prefetching is bounded: at most `budget` speculative renders run at
+once, each token is prefetched once per result TTL, and prefetches are
+skipped when the render pool already has jobs waiting or the printer's
+media type is not known yet.
+
+Configuration (site_config.json):
+{
+    "cloudprnt_prefetch_budget": 2
+}
+Set the budget to 0 to disable prefetching.
+"""
+
+import asyncio
+import logging
+import time
+
+DEFAULT_BUDGET = 2
+
+logger = logging.getLogger("cloudprnt.render_prefetcher")
+
+
+class RenderPrefetcher:
+    """
+    Bounded background renders started by positive polls
+    """
+
+    def __init__(self, coalescer, budget=DEFAULT_BUDGET):
+        """
+        :param coalescer: RenderCoalescer shared with the job endpoint
+        :param budget: Maximum concurrent speculative renders (0 disables)
+        """
+        self.coalescer = coalescer
+        self.budget = budget
+        self._tasks = set()
+        # token -> time scheduled, to prefetch each job once
+        self._tokens = {}
+        # render key -> [start, end] of the speculative render
+        self._renders = {}
+
+        # Counters, read by the health and metrics endpoints
+        self.scheduled = 0
+        self.skipped = 0
+        self.failures = 0
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def stats(self):
+        """Prefetch counters as a dict"""
+        served = self.hits + self.misses
+        return {
+            "budget": self.budget,
+            "in_flight": len(self._tasks),
+            "scheduled": self.scheduled,
+            "skipped": self.skipped,
+            "failures": self.failures,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / served, 3) if served else None,
+            "saved_ms_total": round(self.saved_seconds * 1000, 1),
+            "saved_ms_avg": round(self.saved_seconds * 1000 / self.hits, 1) if self.hits else None
+        }
+
+    def schedule(self, token, get_key, render):
+        """
+        Start rendering a job in the background if the budget allows
+
+        :param token: Job token reported by the poll
+        :param get_key: Coroutine function returning the coalescing key
+        :param render: Coroutine function producing the bytes
+        :return: True if a prefetch was started
+        """
+        self._expire()
+
+        if self.budget <= 0 or token in self._tokens:
+            return False
+        if len(self._tasks) >= self.budget:
+            self.skipped += 1
+            return False
+
+        self._tokens[token] = time.monotonic()
+        self.scheduled += 1
+
+        task = asyncio.get_running_loop().create_task(self._prefetch(token, get_key, render))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    def record_get(self, key, wait_seconds):
+        """
+        Record how a GET /job was served
+
+        :param key: Coalescing key of the GET
+        :param wait_seconds: Time the GET spent waiting for its bytes
+        """
+        timing = self._renders.pop(key, None)
+        if timing is None or timing[1] is None:
+            self.misses += 1
+            return
+
+        self.hits += 1
+        # Without the prefetch the GET would have waited for the full render
+        start, end = timing
+        self.saved_seconds += max(0.0, (end - start) - wait_seconds)
+
+    def forget(self, token):
+        """Drop bookkeeping for a finished job"""
+        self._tokens.pop(token, None)
+        for key in [k for k in self._renders if k[0] == token]:
+            del self._renders[key]
+
+    async def _prefetch(self, token, get_key, render):
+        """Run one speculative render through the coalescer"""
+        try:
+            key = await get_key()
+            timing = self._renders[key] = [time.monotonic(), None]
+            await self.coalescer.run(key, render)
+            timing[1] = time.monotonic()
+        except Exception as e:
+            # The GET will render again and report the error to the printer
+            self.failures += 1
+            logger.warning("Prefetch of job %s failed: %s", token, e)
+
+    def _expire(self):
+        """Forget tokens whose handed-off result has expired"""
+        cutoff = time.monotonic() - self.coalescer.result_ttl
+        for token in [t for t, scheduled in self._tokens.items() if scheduled < cutoff]:
+            self.forget(token)
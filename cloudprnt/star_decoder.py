@@ -0,0 +1,634 @@
+"""
+CloudPRNT Star Line Mode Decoder
+================================
+
+Decodes the Star Line Mode and StarPRNT byte streams sent to printers back
+into structured commands, lays them out as printed lines, and renders a
+text or PNG preview.
+
+Used by the tests to compare renderer backends semantically (two backends
+are equivalent when their layouts match, whatever bytes they chose) and by
+the printer simulator to save a readable preview of every job.
+
+Commands (decode):
+    {"op": "align", "align": "left" | "center" | "right"}
+    {"op": "emphasis" | "underline" | "inverse", "on": bool}
+    {"op": "magnify", "width": w, "height": h}
+    {"op": "text", "text": str} and {"op": "newline"}
+    {"op": "feed", "lines": n} or {"op": "feed", "dots": n}
+    {"op": "raster", "width": px, "height": rows, "data": bytes}
+    {"op": "barcode", "symbology", "hri", "module", "height", "data"}
+    {"op": "qr", "model", "ecc", "cell", "data"}
+    {"op": "cut", "partial": bool, "feed": bool}
+    plus init, codepage, encoding, line_spacing, logo, buzzer, drawer
+    and unknown (raw bytes of a command the decoder does not know)
+
+Usage:
+    from cloudprnt.star_decoder import compare, preview_text
+    print(preview_text(binary_data))
+    assert compare(render_a(markup), render_b(markup)) == []
+"""
+
+import difflib
+import hashlib
+import io
+
+ESC = 0x1B
+GS = 0x1D
+FS = 0x1C
+RS = 0x1E
+LF = 0x0A
+CR = 0x0D
+FF = 0x0C
+BEL = 0x07
+
+PAPER_COLUMNS = 48  # 80mm, font A
+PAPER_DOTS = 576
+
+ALIGNMENTS = {0: "left", 1: "center", 2: "right"}
+
+BARCODE_SYMBOLOGIES = {
+    0: "UPC-E", 1: "UPC-A", 2: "EAN8", 3: "EAN13", 4: "CODE39",
+    5: "ITF", 6: "CODE128", 7: "CODE93", 8: "NW7"
+}
+
+# Star code page numbers (ESC GS t n) -> Python codec
+CODEPAGES = {
+    0: "cp437", 1: "cp437", 2: "cp932", 3: "cp437", 4: "cp858", 5: "cp852",
+    6: "cp860", 7: "cp861", 8: "cp863", 9: "cp865", 10: "cp866", 11: "cp855",
+    12: "cp857", 13: "cp862", 14: "cp864", 15: "cp737", 16: "cp851", 17: "cp869",
+    32: "cp1252", 33: "cp1250", 34: "cp1251"
+}
+DEFAULT_ENCODING = "cp1252"  # StarCloudPRNTStarLineModeJob selects 1252 first
+
+# ESC <byte> -> (op, number of parameter bytes)
+ESC_COMMANDS = {
+    ord("@"): ("init", 0),
+    ord("E"): ("emphasis_on", 0),
+    ord("F"): ("emphasis_off", 0),
+    ord("-"): ("underline", 1),
+    ord("4"): ("inverse_on", 0),
+    ord("5"): ("inverse_off", 0),
+    ord("i"): ("magnify", 2),
+    ord("W"): ("magnify_width", 1),
+    ord("h"): ("magnify_height", 1),
+    ord("d"): ("cut", 1),
+    ord("a"): ("feed_lines", 1),
+    ord("J"): ("feed_dots", 1),
+    ord("3"): ("line_spacing", 1),
+    ord("z"): ("line_spacing_preset", 1),
+    ord("0"): ("line_spacing_eighth", 0),
+    ord("R"): ("international", 1),
+    ord("p"): ("drawer", 3),
+    BEL: ("buzzer", 2),
+}
+
+# ESC GS <byte> -> (op, number of parameter bytes)
+ESC_GS_COMMANDS = {
+    ord("a"): ("align", 1),
+    ord("t"): ("codepage", 1),
+    BEL: ("buzzer", 3),
+    ord("#"): ("setting", 2),
+}
+
+
+def _param(value):
+    """Star commands accept both n and ASCII "n" for small parameters"""
+    return value - 0x30 if 0x30 <= value <= 0x39 else value
+
+
+class _Decoder:
+    """Byte stream state machine, one instance per decode() call"""
+
+    def __init__(self, data):
+        self.data = bytes(data)
+        self.pos = 0
+        self.commands = []
+        self.text = bytearray()
+        self.encoding = DEFAULT_ENCODING
+        self.qr = {"model": 2, "ecc": 0, "cell": 3, "data": ""}
+        # Line Mode raster state
+        self.raster_mode = False
+        self.raster_rows = []
+
+    def emit(self, op, **fields):
+        self.flush_text()
+        fields["op"] = op
+        self.commands.append(fields)
+
+    def flush_text(self):
+        if self.text:
+            text = bytes(self.text).decode(self.encoding, errors="replace")
+            self.text = bytearray()
+            self.commands.append({"op": "text", "text": text})
+
+    def take(self, count):
+        """Next `count` bytes (fewer at the end of a truncated stream)"""
+        chunk = self.data[self.pos:self.pos + count]
+        self.pos += count
+        return chunk
+
+    def take_until(self, terminator):
+        end = self.data.find(bytes([terminator]), self.pos)
+        if end < 0:
+            end = len(self.data)
+        chunk = self.data[self.pos:end]
+        self.pos = end + 1
+        return chunk
+
+    def unknown(self, start):
+        self.emit("unknown", bytes=self.data[start:self.pos].hex().upper())
+
+    def run(self):
+        while self.pos < len(self.data):
+            if self.raster_mode:
+                self.raster_byte()
+                continue
+
+            byte = self.data[self.pos]
+            self.pos += 1
+
+            if byte == ESC:
+                self.escape()
+            elif byte == LF:
+                self.emit("newline")
+            elif byte == FF:
+                self.emit("form_feed")
+            elif byte == BEL or byte == FS:
+                self.emit("drawer")
+            elif byte == 0x09 or byte >= 0x20:
+                self.text.append(byte)
+            # other control bytes (NUL, CR, ...) print nothing
+
+        self.flush_raster()
+        self.flush_text()
+        return self.commands
+
+    def escape(self):
+        start = self.pos - 1
+        if self.pos >= len(self.data):
+            return self.unknown(start)
+
+        byte = self.data[self.pos]
+        self.pos += 1
+
+        if byte == GS:
+            return self.escape_gs(start)
+        if byte == ord("*") and self.data[self.pos:self.pos + 1] == b"r":
+            self.pos += 1
+            return self.raster_command(start)
+        if byte == ord("b"):
+            return self.barcode()
+        if byte == FS and self.data[self.pos:self.pos + 1] == b"p":
+            self.pos += 1
+            key, mode = self.take(2).ljust(2, b"\x00")
+            return self.emit("logo", key=key, mode=mode)
+        if byte == FF:
+            # ESC FF n: form feed (end of page in raster mode)
+            self.take(1)
+            return self.emit("form_feed")
+
+        if byte not in ESC_COMMANDS:
+            return self.unknown(start)
+
+        op, size = ESC_COMMANDS[byte]
+        params = self.take(size)
+        if len(params) < size:
+            return self.unknown(start)
+
+        if op == "emphasis_on":
+            self.emit("emphasis", on=True)
+        elif op == "emphasis_off":
+            self.emit("emphasis", on=False)
+        elif op == "inverse_on":
+            self.emit("inverse", on=True)
+        elif op == "inverse_off":
+            self.emit("inverse", on=False)
+        elif op == "underline":
+            self.emit("underline", on=_param(params[0]) != 0)
+        elif op == "magnify":
+            # ESC i n1 n2: n1 = height, n2 = width (0 = normal)
+            self.emit("magnify", width=_param(params[1]) + 1, height=_param(params[0]) + 1)
+        elif op == "magnify_width":
+            self.emit("magnify", width=_param(params[0]) + 1, height=None)
+        elif op == "magnify_height":
+            self.emit("magnify", width=None, height=_param(params[0]) + 1)
+        elif op == "cut":
+            mode = _param(params[0])
+            self.emit("cut", partial=mode in (1, 3), feed=mode in (2, 3))
+        elif op == "feed_lines":
+            self.emit("feed", lines=params[0])
+        elif op == "feed_dots":
+            self.emit("feed", dots=params[0])
+        elif op == "line_spacing":
+            self.emit("line_spacing", dots=params[0])
+        elif op == "line_spacing_preset":
+            self.emit("line_spacing", dots=24 if _param(params[0]) == 0 else 32)
+        elif op == "line_spacing_eighth":
+            self.emit("line_spacing", dots=24)
+        elif op == "drawer":
+            self.emit("drawer")
+        elif op == "buzzer":
+            self.emit("buzzer", on_ms=params[0] * 20, off_ms=params[1] * 20)
+        else:
+            self.emit(op, value=params[0])
+
+    def escape_gs(self, start):
+        byte = self.take(1)
+        if not byte:
+            return self.unknown(start)
+        byte = byte[0]
+
+        if byte == ord("y"):
+            return self.qr_command(start)
+        if byte == ord(")"):
+            # ESC GS ) <fn class> pL pH d1..dk
+            cls = self.take(1)
+            low, high = self.take(2).ljust(2, b"\x00")
+            body = self.take(low + high * 256)
+            if cls == b"U" and body[:1] == b"0":
+                self.encoding = "utf-8" if body[1:2] == b"\x01" else DEFAULT_ENCODING
+                return self.emit("encoding", encoding=self.encoding)
+            return self.emit("setting", bytes=self.data[start:self.pos].hex().upper())
+        if byte == ord("S"):
+            return self.starprnt_raster(start)
+
+        if byte not in ESC_GS_COMMANDS:
+            return self.unknown(start)
+
+        op, size = ESC_GS_COMMANDS[byte]
+        params = self.take(size)
+        if len(params) < size:
+            return self.unknown(start)
+
+        if op == "align":
+            self.emit("align", align=ALIGNMENTS.get(_param(params[0]), "left"))
+        elif op == "codepage":
+            self.encoding = CODEPAGES.get(params[0], DEFAULT_ENCODING)
+            self.emit("codepage", codepage=params[0])
+        elif op == "buzzer":
+            self.emit("buzzer", circuit=params[0], on_ms=params[1] * 20, off_ms=params[2] * 20)
+        else:
+            self.unknown(start)
+
+    def barcode(self):
+        # ESC b n1 n2 n3 n4 d1..dk RS
+        symbology, hri, module, height = self.take(4).ljust(4, b"\x00")
+        data = self.take_until(RS).decode("ascii", errors="replace")
+        self.emit(
+            "barcode",
+            symbology=BARCODE_SYMBOLOGIES.get(_param(symbology), str(symbology)),
+            hri=_param(hri) in (2, 4),
+            module=module,
+            height=height,
+            data=data
+        )
+
+    def qr_command(self, start):
+        # ESC GS y S 0 n (model), S 1 n (ecc), S 2 n (cell),
+        # D 1 m nL nH d1..dk (data), P (print)
+        sub = self.take(1)
+        if sub == b"S":
+            kind, value = self.take(2).ljust(2, b"\x00")
+            field = {0x30: "model", 0x31: "ecc", 0x32: "cell"}.get(kind)
+            if field:
+                self.qr[field] = value
+            return
+        if sub == b"D":
+            self.take(2)  # "1" and m
+            low, high = self.take(2).ljust(2, b"\x00")
+            self.qr["data"] = self.take(low + high * 256).decode(self.encoding, errors="replace")
+            return
+        if sub == b"P":
+            return self.emit("qr", **self.qr)
+        self.unknown(start)
+
+    def raster_command(self, start):
+        # ESC * r <c> [n NUL]
+        command = self.take(1)
+        if command == b"A":
+            self.flush_text()
+            self.raster_mode = True
+        elif command == b"B":
+            self.raster_mode = False
+            self.flush_raster()
+        elif command in (b"R", b"C"):
+            pass
+        elif command == b"m":
+            self.take(1)  # l / r
+            self.take_until(0)
+        elif command in (b"Q", b"E", b"P", b"T", b"F", b"e"):
+            self.take_until(0)
+        elif command == b"Y":
+            rows = int(self.take_until(0) or b"0")
+            self.raster_rows.extend([b""] * rows)
+        else:
+            self.unknown(start)
+
+    def raster_byte(self):
+        start = self.pos
+        byte = self.data[self.pos]
+        self.pos += 1
+
+        if byte in (ord("b"), ord("k")):
+            # b nL nH d1..dk: one raster row
+            low, high = self.take(2).ljust(2, b"\x00")
+            self.raster_rows.append(self.take(low + high * 256))
+        elif byte == ESC:
+            if self.data[self.pos:self.pos + 2] == b"*r":
+                self.pos += 2
+                self.raster_command(start)
+            elif self.data[self.pos:self.pos + 1] == bytes([FF]):
+                self.take(2)
+            else:
+                self.pos += 1
+        # anything else is ignored in raster mode
+
+    def flush_raster(self):
+        rows, self.raster_rows = self.raster_rows, []
+        if any(rows):
+            self.emit_band(rows)
+
+    def emit_band(self, rows):
+        width = max(len(row) for row in rows)
+        data = b"".join(row.ljust(width, b"\x00") for row in rows)
+        self.emit("raster", width=width * 8, height=len(rows), data=data)
+
+    def starprnt_raster(self, start):
+        # ESC GS S m xL xH yL yH n d1..dk (x bytes per row, y rows)
+        header = self.take(6)
+        if len(header) < 6:
+            return self.unknown(start)
+        _, x_low, x_high, y_low, y_high, _ = header
+        width = x_low + x_high * 256
+        height = y_low + y_high * 256
+        data = self.take(width * height)
+        self.emit("raster", width=width * 8, height=height, data=data.ljust(width * height, b"\x00"))
+
+
+def decode(data):
+    """
+    Decode a Star Line Mode or StarPRNT byte stream
+
+    :param data: Job bytes (or a hex string)
+    :return: List of command dicts
+    """
+    if isinstance(data, str):
+        data = bytes.fromhex("".join(data.split()))
+    return _Decoder(data).run()
+
+
+def layout(data):
+    """
+    Lay decoded commands out as printed blocks
+
+    Text blocks hold the line alignment and its segments, each segment a
+    (text, style) pair; trailing spaces are dropped since they print
+    nothing. Consecutive blank lines become one feed block.
+
+    :param data: Job bytes, hex string or decode() result
+    :return: List of block dicts (type text, feed, raster, barcode, qr, logo, cut)
+    """
+    commands = data if isinstance(data, list) else decode(data)
+
+    blocks = []
+    align = "left"
+    style = {"bold": False, "underline": False, "inverse": False, "width": 1, "height": 1}
+    segments = []
+
+    def add_feed(lines):
+        if blocks and blocks[-1]["type"] == "feed":
+            blocks[-1]["lines"] += lines
+        else:
+            blocks.append({"type": "feed", "lines": lines})
+
+    def end_line():
+        while segments and not segments[-1][0].rstrip():
+            segments.pop()
+        if segments:
+            text, last = segments[-1]
+            segments[-1] = (text.rstrip(), last)
+            blocks.append({"type": "text", "align": align, "segments": list(segments)})
+        else:
+            add_feed(1)
+        segments.clear()
+
+    for command in commands:
+        op = command["op"]
+        if op == "text":
+            key = tuple(sorted(style.items()))
+            if segments and segments[-1][1] == key:
+                segments[-1] = (segments[-1][0] + command["text"], key)
+            else:
+                segments.append((command["text"], key))
+        elif op == "newline":
+            end_line()
+        elif op == "align":
+            align = command["align"]
+        elif op == "emphasis":
+            style["bold"] = command["on"]
+        elif op in ("underline", "inverse"):
+            style[op] = command["on"]
+        elif op == "magnify":
+            for axis in ("width", "height"):
+                if command[axis] is not None:
+                    style[axis] = command[axis]
+        elif op == "init":
+            align = "left"
+            style.update(bold=False, underline=False, inverse=False, width=1, height=1)
+        elif op == "feed":
+            if segments:
+                end_line()
+            if command.get("lines"):
+                add_feed(command["lines"])
+        elif op in ("raster", "barcode", "qr", "logo", "cut"):
+            if segments:
+                end_line()
+            block = {key: value for key, value in command.items() if key != "op"}
+            block["type"] = op
+            if op in ("raster", "barcode", "qr"):
+                block["align"] = align
+            blocks.append(block)
+
+    if segments:
+        end_line()
+    return blocks
+
+
+def _segment_style(key):
+    return dict(key)
+
+
+def describe_block(block):
+    """One-line description of a block, used by compare() and the text preview"""
+    kind = block["type"]
+    if kind == "text":
+        parts = []
+        for text, key in block["segments"]:
+            style = _segment_style(key)
+            flags = [name for name in ("bold", "underline", "inverse") if style[name]]
+            if style["width"] != 1 or style["height"] != 1:
+                flags.append(f"x{style['width']}x{style['height']}")
+            parts.append(f"{text!r}" + (f" ({', '.join(flags)})" if flags else ""))
+        return f"text {block['align']}: " + " + ".join(parts)
+    if kind == "feed":
+        return f"feed {block['lines']}"
+    if kind == "raster":
+        digest = hashlib.sha1(block["data"]).hexdigest()[:12]
+        return f"raster {block['width']}x{block['height']} {block['align']} sha1:{digest}"
+    if kind == "barcode":
+        return f"barcode {block['symbology']} height {block['height']}{' hri' if block['hri'] else ''}: {block['data']}"
+    if kind == "qr":
+        return f"qr model {block['model']} ecc {block['ecc']} cell {block['cell']}: {block['data']}"
+    if kind == "logo":
+        return f"logo {block['key']}"
+    return f"cut {'partial' if block['partial'] else 'full'}{' feed' if block['feed'] else ''}"
+
+
+def compare(expected, actual):
+    """
+    Compare two jobs semantically
+
+    :param expected: Job bytes, hex string or layout() result
+    :param actual: Same, for the job under test
+    :return: Unified diff lines, empty when both print the same receipt
+    """
+    def describe(job):
+        blocks = job if isinstance(job, list) and (not job or "type" in job[0]) else layout(job)
+        return [describe_block(block) for block in blocks]
+
+    return list(difflib.unified_diff(describe(expected), describe(actual), "expected", "actual", lineterm=""))
+
+
+def preview_text(data, columns=PAPER_COLUMNS):
+    """
+    Plain text preview of a job
+
+    :param data: Job bytes, hex string or layout() result
+    :param columns: Characters per line at normal width
+    :return: Text, one printed line per line
+    """
+    blocks = data if isinstance(data, list) and (not data or "type" in data[0]) else layout(data)
+    lines = []
+
+    for block in blocks:
+        kind = block["type"]
+        if kind == "text":
+            text = "".join(
+                "".join(c + " " * (_segment_style(key)["width"] - 1) for c in segment)
+                for segment, key in block["segments"]
+            )
+            if block["align"] == "center":
+                text = text.center(columns).rstrip()
+            elif block["align"] == "right":
+                text = text.rjust(columns)
+            lines.append(text)
+        elif kind == "feed":
+            lines.extend([""] * block["lines"])
+        elif kind == "cut":
+            lines.append(("- " * (columns // 2)).rstrip() if block["partial"] else "=" * columns)
+        else:
+            lines.append(f"[{describe_block(block)}]".center(columns).rstrip())
+
+    return "\n".join(lines) + "\n"
+
+
+# The preview font is Latin-1 only
+GLYPH_FALLBACKS = {"€": "E", "–": "-", "—": "-", "‘": "'", "’": "'", "“": '"', "”": '"', "œ": "o", "Œ": "O"}
+
+
+def _load_font():
+    """6x11 bitmap font, scaled to the 12x24 dot character cell"""
+    from PIL import ImageFont
+
+    if hasattr(ImageFont, "load_default_imagefont"):
+        return ImageFont.load_default_imagefont()
+    return ImageFont.load_default()
+
+
+def _latin1(text):
+    text = "".join(GLYPH_FALLBACKS.get(c, c) for c in text)
+    return text.encode("latin-1", errors="replace").decode("latin-1")
+
+
+def preview_png(data, width=PAPER_DOTS, columns=PAPER_COLUMNS):
+    """
+    PNG preview of a job
+
+    Text is drawn on a fixed character grid so columns line up as on
+    paper; raster bands are drawn dot for dot. Barcodes and QR codes are
+    drawn as labelled boxes.
+
+    :param data: Job bytes, hex string or layout() result
+    :param width: Paper width in dots
+    :param columns: Characters per line at normal width
+    :return: PNG bytes
+    """
+    from PIL import Image, ImageDraw
+
+    blocks = data if isinstance(data, list) and (not data or "type" in data[0]) else layout(data)
+    cell_width = width // columns
+    line_height = cell_width * 2
+    font = _load_font()
+
+    def x_for(align, content_width):
+        if align == "center":
+            return max(0, (width - content_width) // 2)
+        if align == "right":
+            return max(0, width - content_width)
+        return 0
+
+    # Draw onto pieces first, then stack them: the height is not known upfront
+    pieces = []
+    for block in blocks:
+        kind = block["type"]
+        if kind == "text":
+            chars = [(c, _segment_style(key)) for segment, key in block["segments"] for c in segment]
+            height = line_height * max(style["height"] for _, style in chars)
+            line_width = sum(cell_width * style["width"] for _, style in chars)
+            piece = Image.new("L", (width, height), 255)
+            x = x_for(block["align"], line_width)
+            for char, style in chars:
+                w, h = cell_width * style["width"], line_height * style["height"]
+                glyph = Image.new("L", (6, 12), 0 if style["inverse"] else 255)
+                draw = ImageDraw.Draw(glyph)
+                ink = 255 if style["inverse"] else 0
+                draw.text((0, 0), _latin1(char), font=font, fill=ink)
+                if style["bold"]:
+                    draw.text((1, 0), _latin1(char), font=font, fill=ink)
+                if style["underline"]:
+                    draw.line([0, 11, 5, 11], fill=ink)
+                piece.paste(glyph.resize((w, h), Image.NEAREST), (x, height - h))
+                x += w
+            pieces.append(piece)
+        elif kind == "feed":
+            pieces.append(Image.new("L", (width, line_height * block["lines"]), 255))
+        elif kind == "raster":
+            band = Image.frombytes("1", (block["width"], block["height"]), block["data"], "raw", "1;I")
+            piece = Image.new("L", (width, block["height"]), 255)
+            piece.paste(band.convert("L"), (x_for(block["align"], block["width"]), 0))
+            pieces.append(piece)
+        elif kind == "cut":
+            piece = Image.new("L", (width, line_height), 255)
+            draw = ImageDraw.Draw(piece)
+            for x in range(0, width, 12 if block["partial"] else 4):
+                draw.line([x, line_height // 2, x + 6, line_height // 2], fill=0)
+            pieces.append(piece)
+        else:
+            label = describe_block(block)
+            box_height = block.get("height") or line_height * 3
+            piece = Image.new("L", (width, box_height + 8), 255)
+            draw = ImageDraw.Draw(piece)
+            draw.rectangle([8, 4, width - 9, box_height + 3], outline=0, width=2)
+            draw.text((16, 8), _latin1(label), font=font, fill=0)
+            pieces.append(piece)
+
+    image = Image.new("L", (width, max(1, sum(p.height for p in pieces))), 255)
+    y = 0
+    for piece in pieces:
+        image.paste(piece, (0, y))
+        y += piece.height
+
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
@@ -0,0 +1,342 @@
+"""
+CloudPRNT Structured Logging
+============================
+
+Leveled, sampled, rate-limited JSON logging for the printer hot paths.
+
+- One JSON object per line: ts, level, logger, event, mac and any extra fields.
+- Printer records (with a mac) below WARNING are sampled
+  (cloudprnt_log_sample_rate).
+- Each printer gets its own token bucket (cloudprnt_log_rate_limit records per
+  minute); suppressed records are counted and reported on the next one.
+- Records without a mac (startup, errors of other cloudprnt loggers sharing
+  the handler) are neither sampled nor rate-limited.
+- Records are handed to a QueueHandler; a QueueListener thread formats and
+  writes them, so request handlers never block on stdout or disk.
+- Verbosity can be raised for a single MAC at runtime, for a limited time,
+  with set_printer_log_level(). That printer then bypasses the level,
+  sampling and rate limit. Overrides live in Redis, so every process sees
+  them.
+
+Configuration (site_config.json):
+{
+    "cloudprnt_log_level": "INFO",
+    "cloudprnt_log_sample_rate": 0.1,
+    "cloudprnt_log_rate_limit": 30
+}
+
+JSON output, sampling, rate limits and the listener thread only apply once
+configure() has run, which the standalone server does in its lifespan.
+Elsewhere (Frappe web and background workers) records propagate to
+Frappe's own log handlers with the fields appended to the message.
+
+Usage:
+    from cloudprnt.structured_log import get_logger
+    log = get_logger("cloudprnt.standalone")
+    log.debug("poll", mac=printer_mac, status=status_code)
+"""
+
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+
+import frappe
+
+DEFAULT_LEVEL = logging.INFO
+DEFAULT_SAMPLE_RATE = 0.1
+DEFAULT_RATE_LIMIT = 30  # records per printer per minute
+OVERRIDES_CACHE_KEY = "cloudprnt_log_overrides"
+OVERRIDES_REFRESH_INTERVAL = 5  # seconds
+
+# MAC -> (levelno, expires at) for printers with raised verbosity
+_overrides = {}
+_overrides_loaded_at = 0
+_level = DEFAULT_LEVEL
+_auto_refresh = False
+
+_listener = None
+_queue_handler = None
+_configure_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON"""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage()
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class PrinterRateFilter(logging.Filter):
+    """
+    Sampling and per-printer token-bucket rate limiting
+
+    Runs in the calling thread, before the record is queued. Records without
+    a mac are not printer traffic and always pass.
+    """
+
+    def __init__(self, sample_rate=DEFAULT_SAMPLE_RATE, rate_limit=DEFAULT_RATE_LIMIT):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.rate_limit = rate_limit
+        # mac -> [tokens, last refill, suppressed count]
+        self._buckets = {}
+
+    def filter(self, record):
+        mac = getattr(record, "mac", None)
+        if not mac or getattr(record, "verbose", False):
+            # Not printer traffic, or raised verbosity for this printer: keep everything
+            return True
+
+        if record.levelno < logging.WARNING and self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return False
+
+        if self.rate_limit <= 0:
+            return True
+
+        now = time.monotonic()
+        bucket = self._buckets.get(mac)
+        if bucket is None:
+            bucket = self._buckets[mac] = [float(self.rate_limit), now, 0]
+        else:
+            bucket[0] = min(self.rate_limit, bucket[0] + (now - bucket[1]) * self.rate_limit / 60)
+            bucket[1] = now
+
+        if bucket[0] < 1:
+            bucket[2] += 1
+            return False
+
+        bucket[0] -= 1
+        if bucket[2]:
+            record.fields = dict(getattr(record, "fields", None) or {}, suppressed=bucket[2])
+            bucket[2] = 0
+        return True
+
+
+class PrinterLogger:
+    """
+    Logger taking an event name, an optional printer MAC and extra fields
+
+    The level is checked here, before any record is built, so disabled
+    calls cost a method call and a comparison. The stdlib logger itself
+    stays at DEBUG so overridden printers get through.
+    """
+
+    def __init__(self, name):
+        self._logger = logging.getLogger(name)
+
+    def _log(self, level, event, mac, fields, exc_info=False):
+        if _auto_refresh:
+            _maybe_refresh_overrides()
+
+        verbose = False
+        override = _overrides.get(mac) if mac else None
+        if override is not None and override[1] > time.time() and level >= override[0]:
+            verbose = True
+        elif level < _level:
+            return
+
+        if mac:
+            fields["mac"] = mac
+        if _queue_handler is None and fields:
+            # Not configured: plain handlers only print the message
+            msg, args = "%s %s", (event, json.dumps(fields, default=str))
+        else:
+            msg, args = event, ()
+        self._logger.log(
+            level, msg, *args,
+            exc_info=exc_info,
+            extra={"fields": fields, "mac": mac, "verbose": verbose}
+        )
+
+    def debug(self, event, mac=None, **fields):
+        self._log(logging.DEBUG, event, mac, fields)
+
+    def info(self, event, mac=None, **fields):
+        self._log(logging.INFO, event, mac, fields)
+
+    def warning(self, event, mac=None, **fields):
+        self._log(logging.WARNING, event, mac, fields)
+
+    def error(self, event, mac=None, **fields):
+        self._log(logging.ERROR, event, mac, fields)
+
+    def exception(self, event, mac=None, **fields):
+        self._log(logging.ERROR, event, mac, fields, exc_info=True)
+
+
+def configure(level=DEFAULT_LEVEL, sample_rate=DEFAULT_SAMPLE_RATE, rate_limit=DEFAULT_RATE_LIMIT, handler=None):
+    """
+    Route "cloudprnt" loggers through a non-blocking queue
+
+    Safe to call again to change settings; the listener thread is reused.
+
+    :param level: Level name or number for the cloudprnt loggers
+    :param sample_rate: Fraction of DEBUG/INFO records kept (0-1)
+    :param rate_limit: Records per printer per minute (0 disables)
+    :param handler: Sink handler (default: stdout)
+    """
+    global _listener, _queue_handler, _level
+
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+
+    with _configure_lock:
+        _level = level
+        root = logging.getLogger("cloudprnt")
+        root.setLevel(logging.DEBUG)
+        root.propagate = False
+
+        if _queue_handler is None:
+            sink = handler or logging.StreamHandler(sys.stdout)
+            sink.setFormatter(JsonFormatter())
+            records = queue.SimpleQueue()
+            _queue_handler = logging.handlers.QueueHandler(records)
+            _listener = logging.handlers.QueueListener(records, sink, respect_handler_level=True)
+            _listener.start()
+            root.addHandler(_queue_handler)
+
+        _queue_handler.filters = [PrinterRateFilter(sample_rate, rate_limit)]
+
+
+def configure_from_site_config(site_config):
+    """Configure from cloudprnt_log_* keys of a site config dict"""
+    configure(
+        level=site_config.get("cloudprnt_log_level", "INFO"),
+        sample_rate=float(site_config.get("cloudprnt_log_sample_rate", DEFAULT_SAMPLE_RATE)),
+        rate_limit=int(site_config.get("cloudprnt_log_rate_limit", DEFAULT_RATE_LIMIT))
+    )
+
+
+def shutdown():
+    """Flush queued records, stop the listener thread and restore propagation"""
+    global _listener, _queue_handler
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+        if _queue_handler is not None:
+            root = logging.getLogger("cloudprnt")
+            root.removeHandler(_queue_handler)
+            root.propagate = True
+            _queue_handler = None
+
+
+def get_logger(name="cloudprnt"):
+    """
+    Get a structured logger
+
+    Safe at module import: nothing is configured until configure() is called.
+
+    :param name: Logger name under "cloudprnt"
+    :return: PrinterLogger
+    """
+    return PrinterLogger(name)
+
+
+def enable_auto_refresh():
+    """
+    Reload per-printer overrides from Redis while logging
+
+    For processes that log from inside a Frappe context (web workers).
+    The standalone server refreshes from a background task instead.
+    """
+    global _auto_refresh
+    _auto_refresh = True
+
+
+def _maybe_refresh_overrides():
+    if time.monotonic() - _overrides_loaded_at > OVERRIDES_REFRESH_INTERVAL:
+        try:
+            refresh_overrides()
+        except Exception:
+            # No Frappe context or Redis down: keep the current overrides
+            pass
+
+
+def _load_overrides():
+    raw = frappe.cache().get_value(OVERRIDES_CACHE_KEY)
+    if not raw:
+        return {}
+    now = time.time()
+    return {
+        mac: entry for mac, entry in json.loads(raw).items()
+        if entry.get("until", 0) > now
+    }
+
+
+def refresh_overrides():
+    """
+    Reload per-printer verbosity overrides from Redis
+
+    Must run inside a Frappe context.
+    """
+    global _overrides, _overrides_loaded_at
+    _overrides_loaded_at = time.monotonic()
+    _overrides = {
+        mac: (logging.getLevelName(entry["level"]), entry["until"])
+        for mac, entry in _load_overrides().items()
+    }
+
+
+def _save_overrides(overrides):
+    frappe.cache().set_value(
+        OVERRIDES_CACHE_KEY,
+        json.dumps(overrides),
+        expires_in_sec=max([int(e["until"] - time.time()) for e in overrides.values()] + [1])
+    )
+    refresh_overrides()
+
+
+@frappe.whitelist()
+def set_printer_log_level(mac_address, level="DEBUG", minutes=30):
+    """
+    Raise log verbosity for one printer, for a limited time
+
+    :param mac_address: Printer MAC address (dots or colons)
+    :param level: Level name (DEBUG, INFO, ...)
+    :param minutes: Duration of the override
+    :return: Active overrides
+    """
+    frappe.only_for("System Manager")
+
+    level = level.upper()
+    if not isinstance(logging.getLevelName(level), int):
+        frappe.throw(f"Unknown log level: {level}")
+
+    overrides = _load_overrides()
+    overrides[mac_address.replace(".", ":").upper()] = {
+        "level": level,
+        "until": time.time() + int(minutes) * 60
+    }
+    _save_overrides(overrides)
+    return overrides
+
+
+@frappe.whitelist()
+def clear_printer_log_level(mac_address):
+    """
+    Return a printer to the normal log level
+
+    :param mac_address: Printer MAC address (dots or colons)
+    :return: Active overrides
+    """
+    frappe.only_for("System Manager")
+
+    overrides = _load_overrides()
+    overrides.pop(mac_address.replace(".", ":").upper(), None)
+    _save_overrides(overrides)
+    return overrides
@@ -0,0 +1,178 @@
+"""
+Query Counter for CloudPRNT Tests
+=================================
+
+Counts the database work done by a block of code so tests can assert
+query budgets on hot endpoints.
+
+Two layers are wrapped while the counter is active:
+    frappe.db.sql               everything going through Frappe's ORM
+    pymysql Cursor.execute      raw connections (standalone server)
+    pymysql Connection.commit   raw commits
+
+Queries made by frappe.db.sql are counted once, at the Frappe layer.
+Transaction control (start transaction, rollback, savepoints) is not
+counted as a query; "commit" statements are counted as commits.
+
+Usage:
+    with QueryCounter() as counter:
+        cloudprnt_poll()
+
+    counter.assert_within("cloudprnt_poll", queries=2, commits=1)
+"""
+
+import threading
+import time
+import frappe
+
+try:
+    import pymysql
+    PYMYSQL_AVAILABLE = True
+except ImportError:
+    PYMYSQL_AVAILABLE = False
+
+CONTROL_PREFIXES = ("start transaction", "begin", "rollback", "savepoint", "release savepoint", "set ")
+
+_local = threading.local()
+
+
+def classify(sql):
+    """
+    Classify a statement
+
+    :param sql: SQL text
+    :return: "commit", "control" or "query"
+    """
+    statement = " ".join(str(sql).split()).lower()
+    if statement.startswith("commit"):
+        return "commit"
+    if statement.startswith(CONTROL_PREFIXES):
+        return "control"
+    return "query"
+
+
+class QueryCounter:
+    """Context manager recording every statement run inside it"""
+
+    def __init__(self):
+        self.statements = []  # (sql, seconds, rows, source)
+        self.commits = 0
+        self._patches = []
+
+    @property
+    def queries(self):
+        """Statements counted against the query budget"""
+        return [s for s in self.statements if classify(s[0]) == "query"]
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def rows(self):
+        """Rows returned or affected by counted queries"""
+        return sum(s[2] for s in self.queries)
+
+    @property
+    def db_ms(self):
+        """Time spent in the database, commits included"""
+        return round(sum(s[1] for s in self.statements) * 1000, 3)
+
+    def record(self, sql, seconds, rows, source):
+        if classify(sql) == "commit":
+            self.commits += 1
+        self.statements.append((str(sql), seconds, rows, source))
+
+    def _patch(self, owner, name, replacement):
+        self._patches.append((owner, name, owner.__dict__.get(name)))
+        setattr(owner, name, replacement)
+
+    def __enter__(self):
+        counter = self
+        db = frappe.local.db
+        frappe_sql = db.sql
+
+        def sql(query, *args, **kwargs):
+            _local.depth = getattr(_local, "depth", 0) + 1
+            start = time.perf_counter()
+            try:
+                result = frappe_sql(query, *args, **kwargs)
+            finally:
+                _local.depth -= 1
+            rows = len(result) if isinstance(result, (list, tuple)) else 0
+            counter.record(query, time.perf_counter() - start, rows, "frappe")
+            return result
+
+        self._patch(db, "sql", sql)
+
+        if PYMYSQL_AVAILABLE:
+            cursor_execute = pymysql.cursors.Cursor.execute
+            connection_commit = pymysql.connections.Connection.commit
+
+            def execute(cursor, query, args=None):
+                if getattr(_local, "depth", 0):
+                    return cursor_execute(cursor, query, args)
+                start = time.perf_counter()
+                affected = cursor_execute(cursor, query, args)
+                counter.record(query, time.perf_counter() - start, affected or 0, "raw")
+                return affected
+
+            def commit(connection):
+                start = time.perf_counter()
+                connection_commit(connection)
+                counter.record("COMMIT", time.perf_counter() - start, 0, "raw")
+
+            self._patch(pymysql.cursors.Cursor, "execute", execute)
+            self._patch(pymysql.connections.Connection, "commit", commit)
+
+        return self
+
+    def __exit__(self, *exc):
+        for owner, name, original in reversed(self._patches):
+            if original is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self._patches = []
+        return False
+
+    def report(self):
+        """One line per statement, for assertion messages"""
+        lines = [f"{self.count} queries, {self.commits} commits, {self.rows} rows, {self.db_ms} ms"]
+        for sql, seconds, rows, source in self.statements:
+            statement = " ".join(sql.split())
+            lines.append(f"  [{source}] {seconds * 1000:7.2f} ms {rows:5d} rows  {statement[:160]}")
+        return "\n".join(lines)
+
+    def assert_within(self, label, queries=None, commits=None, rows=None, db_ms=None):
+        """
+        Fail if any budget is exceeded
+
+        :param label: Name of the code path, for the message
+        :param queries: Maximum counted queries
+        :param commits: Maximum commits
+        :param rows: Maximum rows returned or affected
+        :param db_ms: Maximum database time in milliseconds
+        """
+        over = []
+        for name, budget, actual in (
+            ("queries", queries, self.count),
+            ("commits", commits, self.commits),
+            ("rows", rows, self.rows),
+            ("db_ms", db_ms, self.db_ms)
+        ):
+            if budget is not None and actual > budget:
+                over.append(f"{name} {actual} > {budget}")
+
+        assert not over, f"{label} over budget: {', '.join(over)}\n{self.report()}"
+
+
+def count_queries(fn, *args, **kwargs):
+    """
+    Call fn inside a QueryCounter
+
+    :return: (result, counter)
+    """
+    with QueryCounter() as counter:
+        result = fn(*args, **kwargs)
+    return result, counter
@@ -0,0 +1,75 @@
+"""
+Tests for CloudPRNT Renderer Benchmarks
+=======================================
+
+Tests the receipt fixtures and baseline comparison, and runs the pure
+Python renderer cases against the committed baseline.
+
+Run: bench --site sitename run-tests cloudprnt.tests.test_benchmark
+"""
+
+import pytest
+import frappe
+from cloudprnt import benchmark
+from cloudprnt.job_renderer import render_star_line
+
+
+def make_run(**medians):
+    return {
+        "results": {name: {"median_ms": ms} for name, ms in medians.items()},
+        "skipped": {}
+    }
+
+
+@pytest.mark.unit
+class TestBenchmarkCompare:
+    """Tests for fixtures and baseline comparison"""
+
+    def test_receipt_fixture_sizes(self):
+        """Test fixtures have the requested number of item lines and render"""
+        for lines in benchmark.RECEIPT_SIZES:
+            markup = benchmark.make_receipt_markup(lines)
+
+            assert markup.count("[column: left:") == lines + 1
+            assert render_star_line(markup, benchmark.BENCH_MAC).endswith(b"\x1b\x64\x03")
+
+    def test_logo_fixture(self):
+        """Test logo fixtures reference the logo at header and footer"""
+        markup = benchmark.make_receipt_markup(20, "http://127.0.0.1:1/logo.png")
+
+        assert markup.count("[image: url http://127.0.0.1:1/logo.png") == 2
+
+    def test_regression_threshold(self):
+        """Test slowdowns over the threshold are regressions"""
+        baseline = make_run(**{"a": 1.0, "b": 1.0, "c": 1.0})
+        run = make_run(**{"a": 1.2, "b": 1.5, "c": 0.5, "d": 3.0})
+
+        report = benchmark.compare(run, baseline, threshold=0.25)
+
+        assert [e["case"] for e in report["regressions"]] == ["b"]
+        assert [e["case"] for e in report["improvements"]] == ["c"]
+        assert report["unchanged"] == ["a"]
+        assert report["new"] == ["d"]
+
+    def test_measure(self):
+        """Test measure() reports per-call time"""
+        result = benchmark.measure(lambda: sum(range(100)), min_time=0.05, rounds=3)
+
+        assert result["rounds"] == 3
+        assert result["iterations"] >= 1
+        assert 0 < result["min_ms"] <= result["median_ms"]
+
+
+@pytest.mark.unit
+@pytest.mark.slow
+class TestRendererBaseline:
+    """Benchmark: pure Python renderer cases against the committed baseline"""
+
+    def test_no_gross_regression(self):
+        """Test render_star_line stays within 2x of the baseline"""
+        run = benchmark.run_benchmarks(name_filter="render_star_line/", min_time=0.3, rounds=3)
+        report = benchmark.compare(run, benchmark.load_baseline(), threshold=1.0)
+
+        frappe.logger().info("\n" + benchmark.format_report(run, report))
+
+        assert report["regressions"] == []
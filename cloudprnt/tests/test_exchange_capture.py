@@ -0,0 +1,166 @@
+"""
+Tests for CloudPRNT Exchange Capture
+====================================
+
+Tests body encoding, the ASGI capture middleware and the per-printer
+Redis ring buffer.
+
+Run: bench --site sitename run-tests cloudprnt.tests.test_exchange_capture
+"""
+
+import asyncio
+import json
+import time
+import pytest
+import frappe
+from cloudprnt import exchange_capture
+
+TEST_MAC = "00:11:62:12:34:56"
+OTHER_MAC = "00:11:62:AB:CD:EF"
+
+
+async def echo_app(scope, receive, send):
+    """ASGI app answering with the request body"""
+    message = await receive()
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": message["body"]})
+
+
+def call(app, method, path, query=b"", body=b"", headers=()):
+    """Run one request through an ASGI app, return the response body"""
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query,
+        "headers": [(b"host", b"localhost"), *headers],
+        "client": ("192.0.2.10", 5000)
+    }
+    asyncio.run(app(scope, receive, send))
+    return b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body")
+
+
+@pytest.mark.unit
+@pytest.mark.standalone
+class TestCaptureMiddleware:
+    """Tests for capturing exchanges in the standalone server"""
+
+    def setup_method(self):
+        """Setup before each test"""
+        self.stored = []
+        self.app = exchange_capture.CaptureMiddleware(
+            echo_app, store=lambda mac, entry: self.stored.append((mac, entry))
+        )
+
+    def teardown_method(self):
+        """Cleanup after each test"""
+        exchange_capture._enabled = {}
+
+    def test_nothing_captured_when_disabled(self):
+        """Test requests pass through untouched when no printer is captured"""
+        body = json.dumps({"printerMAC": "00.11.62.12.34.56"}).encode()
+
+        assert call(self.app, "POST", "/poll", body=body) == body
+        assert self.stored == []
+
+    def test_poll_captured_by_body_mac(self):
+        """Test a poll of a captured printer is stored with request and response"""
+        exchange_capture._enabled = {TEST_MAC: {"until": time.time() + 60, "size": 10}}
+        body = json.dumps({"printerMAC": "00.11.62.12.34.56", "statusCode": "200 OK"}).encode()
+
+        assert call(self.app, "POST", "/poll", body=body) == body
+
+        mac, entry = self.stored[0]
+        assert mac == TEST_MAC
+        assert entry["request"]["method"] == "POST"
+        assert json.loads(entry["request"]["body"]["data"])["statusCode"] == "200 OK"
+        assert entry["response"]["status"] == 200
+        assert entry["response"]["bytes_sent"] == len(body)
+
+    def test_other_printers_not_captured(self):
+        """Test only the enabled MAC is captured"""
+        exchange_capture._enabled = {TEST_MAC: {"until": time.time() + 60, "size": 10}}
+
+        call(self.app, "GET", "/job", query=b"mac=00.11.62.AB.CD.EF&token=TEST-CAP-1")
+        call(self.app, "GET", "/job", query=b"mac=00.11.62.12.34.56&token=TEST-CAP-1")
+
+        assert [mac for mac, _ in self.stored] == [TEST_MAC]
+
+    def test_credentials_are_redacted(self):
+        """Test auth and session headers never reach the buffer"""
+        exchange_capture._enabled = {TEST_MAC: {"until": time.time() + 60, "size": 10}}
+
+        call(self.app, "GET", "/job", query=b"mac=00.11.62.12.34.56&token=TEST-CAP-1", headers=[
+            (b"authorization", b"Basic cHJpbnRlcjpzZWNyZXQ="),
+            (b"cookie", b"sid=0123456789abcdef"),
+            (b"user-agent", b"Star CloudPRNT")
+        ])
+
+        headers = self.stored[0][1]["request"]["headers"]
+        assert headers["authorization"] == exchange_capture.REDACTED
+        assert headers["cookie"] == exchange_capture.REDACTED
+        assert headers["user-agent"] == "Star CloudPRNT"
+        assert "sid=" not in json.dumps(self.stored[0][1])
+
+    def test_build_entry_redacts_any_case(self):
+        """Test header names are matched case-insensitively, as Frappe passes them capitalised"""
+        entry = exchange_capture.build_entry(
+            {"headers": {"Authorization": "token key:secret", "Host": "localhost"}},
+            {"status": 200, "headers": {"Set-Cookie": "sid=abc"}}
+        )
+
+        assert entry["request"]["headers"] == {"Authorization": exchange_capture.REDACTED, "Host": "localhost"}
+        assert entry["response"]["headers"] == {"Set-Cookie": exchange_capture.REDACTED}
+
+    def test_binary_body_is_base64(self):
+        """Test binary payloads are base64 encoded and truncated"""
+        payload = b"\x1b\x40" + b"\xff" * (exchange_capture.MAX_BODY_BYTES + 10)
+
+        encoded = exchange_capture.encode_body(payload)
+
+        assert encoded["encoding"] == "base64"
+        assert encoded["length"] == len(payload)
+        assert encoded["data"].startswith("G0D/")
+
+
+@pytest.mark.integration
+class TestCaptureBuffer:
+    """Tests for the Redis ring buffer"""
+
+    def teardown_method(self):
+        """Cleanup after each test"""
+        exchange_capture.disable_capture(TEST_MAC)
+        frappe.cache().delete_value(exchange_capture._buffer_key(TEST_MAC))
+
+    def test_buffer_is_bounded(self):
+        """Test the buffer keeps the latest exchanges, oldest first"""
+        exchange_capture.enable_capture("00.11.62.12.34.56", minutes=5, size=3)
+
+        for i in range(5):
+            exchange_capture.store_exchange(
+                TEST_MAC,
+                exchange_capture.build_entry({"method": "POST", "body": f"poll {i}"}, {"status": 200})
+            )
+
+        exchanges = exchange_capture.get_exchanges(TEST_MAC)
+        assert [e["request"]["body"]["data"] for e in exchanges] == ["poll 2", "poll 3", "poll 4"]
+
+    def test_status_and_disable(self):
+        """Test the status lists enabled printers until capture is disabled"""
+        exchange_capture.enable_capture(TEST_MAC, minutes=5)
+
+        status = exchange_capture.get_capture_status()
+        assert TEST_MAC in [c["mac_address"] for c in status["captures"]]
+
+        exchange_capture.disable_capture(TEST_MAC)
+
+        assert not exchange_capture.is_enabled(TEST_MAC)
+        frappe.logger().info("✅ Capture enabled and disabled per printer")
@@ -0,0 +1,73 @@
+"""
+Tests for the Frappe Context Pool
+==================================
+
+Tests the pooled Frappe contexts used by the standalone server
+instead of per-request frappe.init().
+
+Run: bench --site sitename run-tests cloudprnt.tests.test_frappe_context
+"""
+
+import asyncio
+import os
+import threading
+import pytest
+import frappe
+from cloudprnt.frappe_context import FrappeContextPool
+
+
+def _sites_path():
+    """Absolute sites path of the site used by the test session"""
+    return os.path.abspath(frappe.local.sites_path)
+
+
+@pytest.mark.standalone
+@pytest.mark.integration
+class TestFrappeContextPool:
+    """Tests for FrappeContextPool"""
+
+    def setup_method(self):
+        """Setup before each test"""
+        self.pool = FrappeContextPool(frappe.local.site, _sites_path(), size=2)
+
+    def teardown_method(self):
+        """Cleanup after each test"""
+        self.pool.shutdown()
+
+    def test_run_returns_site_from_pooled_context(self):
+        """Test calls run with an initialised Frappe context"""
+        site = asyncio.run(self.pool.run(lambda: frappe.local.site))
+
+        assert site == frappe.local.site
+
+    def test_context_is_reused_between_calls(self):
+        """Test a worker thread initialises Frappe only once"""
+        def get_db_id():
+            return threading.get_ident(), id(frappe.local.db)
+
+        async def run_twice():
+            first = await self.pool.run(get_db_id)
+            second = await self.pool.run(get_db_id)
+            return first, second
+
+        first, second = asyncio.run(run_twice())
+
+        # Same thread means same connection object
+        if first[0] == second[0]:
+            assert first[1] == second[1]
+
+    def test_errors_are_propagated(self):
+        """Test exceptions are raised to the caller instead of swallowed"""
+        def fail():
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError):
+            asyncio.run(self.pool.run(fail))
+
+    def test_start_is_idempotent(self):
+        """Test calling start() twice keeps a single executor"""
+        self.pool.start()
+        executor = self.pool._executor
+        self.pool.start()
+
+        assert self.pool._executor is executor
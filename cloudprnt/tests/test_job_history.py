@@ -0,0 +1,162 @@
+"""
+Tests for CloudPRNT Job History
+===============================
+
+Tests lifecycle timestamps recorded by the queue manager and the
+percentiles of the CloudPRNT Job Latency report.
+
+Run: bench --site sitename run-tests cloudprnt.tests.test_job_history
+"""
+
+import json
+import pytest
+import frappe
+from frappe.utils import set_request
+from cloudprnt import cloudprnt_server
+from cloudprnt.print_queue_manager import add_job_to_queue, mark_job_fetched, mark_job_printed
+from cloudprnt.cloudprnt.report.cloudprnt_job_latency.cloudprnt_job_latency import (
+    execute,
+    percentile
+)
+from cloudprnt.tests.utils import clear_test_print_queue
+
+TEST_MAC = "00:11:62:12:34:56"
+
+
+def clear_test_history():
+    """Remove history rows of test jobs"""
+    frappe.db.sql("DELETE FROM `tabCloudPRNT Job History` WHERE job_token LIKE 'TEST-%'")
+    frappe.db.commit()
+
+
+def get_history(job_token):
+    return frappe.db.get_value(
+        "CloudPRNT Job History",
+        {"job_token": job_token},
+        ["printer_mac", "enqueued_at", "fetched_at", "confirmed_at", "status_code", "total_ms"],
+        as_dict=True
+    )
+
+
+@pytest.mark.queue
+@pytest.mark.integration
+class TestJobHistory:
+    """Tests for lifecycle timestamps"""
+
+    def setup_method(self):
+        """Setup before each test"""
+        clear_test_print_queue()
+        clear_test_history()
+
+    def teardown_method(self):
+        """Cleanup after each test"""
+        clear_test_print_queue()
+        clear_test_history()
+
+    def test_enqueue_creates_history(self):
+        """Test adding a job records its enqueue time"""
+        add_job_to_queue(job_token="TEST-HIST-001", printer_mac=TEST_MAC, job_data="[cut]")
+
+        history = get_history("TEST-HIST-001")
+        assert history.printer_mac == TEST_MAC
+        assert history.enqueued_at is not None
+        assert history.fetched_at is None
+
+    def test_history_survives_queue_delete(self):
+        """Test fetch and confirmation are kept after the queue row is deleted"""
+        add_job_to_queue(job_token="TEST-HIST-002", printer_mac=TEST_MAC, job_data="[cut]")
+        mark_job_fetched("TEST-HIST-002")
+        mark_job_printed("TEST-HIST-002", status_code="200 OK")
+
+        assert not frappe.db.exists("CloudPRNT Print Queue", {"job_token": "TEST-HIST-002"})
+
+        history = get_history("TEST-HIST-002")
+        assert history.fetched_at >= history.enqueued_at
+        assert history.confirmed_at >= history.fetched_at
+        assert history.status_code == "200 OK"
+        assert history.total_ms >= 0
+        frappe.logger().info(f"✅ Job confirmed after {history.total_ms}ms")
+
+    def test_first_fetch_is_kept(self):
+        """Test a retried GET does not overwrite the first fetch time"""
+        add_job_to_queue(job_token="TEST-HIST-003", printer_mac=TEST_MAC, job_data="[cut]")
+        mark_job_fetched("TEST-HIST-003")
+        first = get_history("TEST-HIST-003").fetched_at
+
+        mark_job_fetched("TEST-HIST-003")
+
+        assert get_history("TEST-HIST-003").fetched_at == first
+
+    def test_reprint_starts_new_lifecycle(self):
+        """Test queueing a printed token again resets its stages"""
+        add_job_to_queue(job_token="TEST-HIST-005", printer_mac=TEST_MAC, job_data="[cut]")
+        mark_job_fetched("TEST-HIST-005")
+        mark_job_printed("TEST-HIST-005", status_code="200 OK")
+
+        add_job_to_queue(job_token="TEST-HIST-005", printer_mac=TEST_MAC, job_data="[cut]")
+
+        history = get_history("TEST-HIST-005")
+        assert history.enqueued_at is not None
+        assert history.fetched_at is None
+        assert history.confirmed_at is None
+        assert history.total_ms is None
+
+        mark_job_printed("TEST-HIST-005", status_code="200 OK")
+        assert get_history("TEST-HIST-005").confirmed_at >= history.enqueued_at
+
+    def test_frappe_endpoints_record_history(self):
+        """Test GET and DELETE on the Frappe endpoints record fetch and confirmation"""
+        add_job_to_queue(job_token="TEST-HIST-004", printer_mac=TEST_MAC, job_data="[cut]")
+        set_request(
+            method="GET",
+            path="/api/method/cloudprnt.cloudprnt_server.cloudprnt_job",
+            query_string=f"mac={TEST_MAC.replace(':', '.')}&type=text/vnd.star.markup&token=TEST-HIST-004"
+        )
+        cloudprnt_server.cloudprnt_job()
+
+        assert get_history("TEST-HIST-004").fetched_at is not None
+
+        set_request(
+            method="DELETE",
+            path="/api/method/cloudprnt.cloudprnt_server.cloudprnt_delete",
+            data=json.dumps({"printerMAC": TEST_MAC, "statusCode": "200 OK", "jobToken": "TEST-HIST-004"}),
+            content_type="application/json"
+        )
+        assert cloudprnt_server.cloudprnt_delete() == {"message": "ok"}
+
+        history = get_history("TEST-HIST-004")
+        assert history.confirmed_at >= history.fetched_at
+        assert history.status_code == "200 OK"
+
+    def test_latency_report_per_printer(self):
+        """Test the report groups confirmed jobs per printer"""
+        for i in range(3):
+            token = f"TEST-HIST-R{i}"
+            add_job_to_queue(job_token=token, printer_mac=TEST_MAC, job_data="[cut]")
+            mark_job_printed(token, status_code="200 OK")
+
+        columns, data = execute({
+            "from_date": frappe.utils.add_days(frappe.utils.today(), -1),
+            "to_date": frappe.utils.today(),
+            "group_by": "Printer",
+            "printer_mac": TEST_MAC
+        })
+
+        assert "total_ms_p95" in [c["fieldname"] for c in columns]
+        assert data[0]["group"] == TEST_MAC
+        assert data[0]["confirmed"] >= 3
+        assert data[0]["total_ms_p50"] is not None
+
+
+@pytest.mark.unit
+class TestPercentile:
+    """Tests for report percentiles"""
+
+    def test_percentiles(self):
+        """Test linear interpolation between ranks"""
+        values = list(range(1, 101))
+
+        assert percentile(values, 50) == 50.5
+        assert percentile(values, 99) == pytest.approx(99.01)
+        assert percentile([7], 95) == 7
+        assert percentile([], 50) is None
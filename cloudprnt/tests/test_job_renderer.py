@@ -0,0 +1,113 @@
+"""
+Tests for the Job Renderer Registry
+====================================
+
+Tests the renderer registry used by the standalone /job endpoint and
+benchmarks it against the per-request dynamic module loading it replaced.
+
+Run: bench --site sitename run-tests cloudprnt.tests.test_job_renderer
+"""
+
+import importlib.util
+import os
+import sys
+import time
+import pytest
+import frappe
+from cloudprnt.job_renderer import (
+    render_job,
+    render_star_line,
+    get_renderer,
+    is_hex_job,
+    STAR_LINE_MEDIA_TYPE
+)
+from cloudprnt.tests.utils import get_test_markup_simple
+
+RENDERER_MODULES = [
+    "cloudprnt.cputil_wrapper",
+    "cloudprnt.print_job",
+    "cloudprnt.pos_invoice_markup"
+]
+
+
+@pytest.mark.unit
+class TestRendererRegistry:
+    """Tests for renderer lookup and job classification"""
+
+    def test_star_line_renderer_registered(self):
+        """Test Star Line Mode has a renderer"""
+        assert get_renderer(STAR_LINE_MEDIA_TYPE) is render_star_line
+
+    def test_unknown_media_type_falls_back_to_star_line(self):
+        """Test unknown types use the Star Line Mode renderer"""
+        assert get_renderer("text/vnd.star.markup") is render_star_line
+        assert get_renderer(None) is render_star_line
+
+    def test_is_hex_job(self):
+        """Test hex detection only matches long, tag-free data"""
+        assert is_hex_job("1B40" * 50) == True
+        assert is_hex_job("1B40") == False
+        assert is_hex_job("[align: centre]" * 10) == False
+        assert is_hex_job(None) == False
+
+    def test_render_job_without_data_returns_none(self):
+        """Test jobs without markup or invoice are rejected"""
+        assert render_job({}, "00:11:62:12:34:56") is None
+
+    def test_render_markup_job(self):
+        """Test markup renders to Star Line Mode commands"""
+        binary_data = render_job(
+            {"job_data": get_test_markup_simple()},
+            "00:11:62:12:34:56"
+        )
+
+        hex_data = binary_data.hex().upper()
+        assert hex_data.startswith("1B1D7420")  # Codepage 1252
+        assert "1B1D6101" in hex_data  # Center align
+        assert hex_data.endswith("1B6403")  # Partial cut
+        assert "Line 1".encode("cp1252").hex().upper() in hex_data
+
+
+@pytest.mark.unit
+@pytest.mark.slow
+class TestRendererImportOverhead:
+    """Benchmark: no module loading on the job path"""
+
+    def _load_modules_dynamically(self):
+        """Reproduce the old per-request spec_from_file_location loading"""
+        app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        for name in ("cputil_wrapper", "print_job", "pos_invoice_markup"):
+            spec = importlib.util.spec_from_file_location(name, os.path.join(app_dir, f"{name}.py"))
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+
+    def test_render_does_not_reload_modules(self):
+        """Test rendering keeps the same module objects in sys.modules"""
+        before = {name: sys.modules[name] for name in RENDERER_MODULES}
+
+        render_job({"job_data": get_test_markup_simple()}, "00:11:62:12:34:56")
+
+        after = {name: sys.modules[name] for name in RENDERER_MODULES}
+        assert before == after
+
+    def test_registry_removes_import_overhead(self):
+        """Test per-GET renderer lookup is far cheaper than dynamic loading"""
+        iterations = 20
+        job = {"job_data": get_test_markup_simple()}
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            self._load_modules_dynamically()
+            render_job(job, "00:11:62:12:34:56")
+        dynamic_ms = (time.perf_counter() - start) * 1000 / iterations
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            render_job(job, "00:11:62:12:34:56")
+        registry_ms = (time.perf_counter() - start) * 1000 / iterations
+
+        frappe.logger().info(
+            f"⏱️  Per-GET render: dynamic loading {dynamic_ms:.2f}ms, registry {registry_ms:.2f}ms"
+        )
+
+        assert registry_ms < dynamic_ms / 2
@@ -0,0 +1,141 @@
+"""
+Tests for the Job Spool
+=======================
+
+Tests chunked hex decoding to spool files, Range parsing and
+chunked streaming used by the standalone /job endpoint.
+
+Run: bench --site sitename run-tests cloudprnt.tests.test_job_spool
+"""
+
+import os
+import shutil
+import tempfile
+import pytest
+import frappe
+from cloudprnt.job_spool import (
+    JobSpool,
+    RangeNotSatisfiable,
+    iter_file,
+    parse_range,
+    CHUNK_SIZE
+)
+
+
+@pytest.mark.unit
+@pytest.mark.standalone
+class TestJobSpool:
+    """Tests for JobSpool files"""
+
+    def setup_method(self):
+        """Setup before each test"""
+        self.directory = tempfile.mkdtemp(prefix="cloudprnt_spool_")
+        self.spool = JobSpool(self.directory)
+
+    def teardown_method(self):
+        """Cleanup after each test"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_write_hex_matches_fromhex(self):
+        """Test chunked decoding gives the same bytes as bytes.fromhex"""
+        payload = os.urandom(CHUNK_SIZE * 3 + 17)
+        path = self.spool.path_for("IMG-TEST")
+
+        size = self.spool.write_hex(path, payload.hex().upper())
+
+        assert size == len(payload)
+        with open(path, "rb") as f:
+            assert f.read() == payload
+        frappe.logger().info(f"✅ Spooled {size} bytes in chunks")
+
+    def test_write_hex_ignores_whitespace_and_pads(self):
+        """Test whitespace is stripped and odd lengths are padded"""
+        path = self.spool.path_for("TEST")
+
+        self.spool.write_hex(path, "1B 40\n1B6")
+
+        with open(path, "rb") as f:
+            assert f.read() == bytes.fromhex("1B401B60")
+
+    def test_variants_get_separate_files(self):
+        """Test renders for different media types do not share a file"""
+        line = self.spool.path_for("TOKEN", ("application/vnd.star.line", "thermal3"))
+        starprnt = self.spool.path_for("TOKEN", ("application/vnd.star.starprnt", "thermal3"))
+
+        assert line != starprnt
+        assert os.path.dirname(line) == self.directory
+
+    def test_unsafe_token_stays_in_spool_dir(self):
+        """Test tokens cannot escape the spool directory"""
+        path = self.spool.path_for("../../etc/passwd")
+
+        assert os.path.dirname(path) == self.directory
+
+    def test_remove_deletes_all_variants(self):
+        """Test DELETE cleanup removes every file of the job"""
+        self.spool.write_bytes(self.spool.path_for("TOKEN"), b"a")
+        self.spool.write_bytes(self.spool.path_for("TOKEN", ("type", "profile")), b"b")
+        self.spool.write_bytes(self.spool.path_for("OTHER"), b"c")
+
+        self.spool.remove("TOKEN")
+
+        assert os.listdir(self.directory) == [os.path.basename(self.spool.path_for("OTHER"))]
+
+    def test_remove_keeps_tokens_sharing_a_prefix(self):
+        """Test confirming a job leaves its copies' files alone"""
+        self.spool.write_bytes(self.spool.path_for("X"), b"a")
+        self.spool.write_bytes(self.spool.path_for("X-copy-1"), b"b")
+        self.spool.write_bytes(self.spool.path_for("X-copy-1", ("type", "profile")), b"c")
+
+        self.spool.remove("X")
+
+        assert not os.path.exists(self.spool.path_for("X"))
+        assert os.path.exists(self.spool.path_for("X-copy-1"))
+        assert os.path.exists(self.spool.path_for("X-copy-1", ("type", "profile")))
+
+    def test_similar_tokens_get_separate_files(self):
+        """Test tokens differing only in unsafe characters do not share a file"""
+        assert self.spool.path_for("A.B") != self.spool.path_for("A_B")
+
+    def test_iter_file_range(self):
+        """Test a byte range is streamed in bounded chunks"""
+        path = self.spool.path_for("TOKEN")
+        self.spool.write_bytes(path, bytes(range(256)) * 10)
+
+        chunks = list(iter_file(path, 100, 1099, chunk_size=256))
+
+        assert b"".join(chunks) == (bytes(range(256)) * 10)[100:1100]
+        assert max(len(c) for c in chunks) <= 256
+
+
+@pytest.mark.unit
+@pytest.mark.standalone
+class TestParseRange:
+    """Tests for HTTP Range parsing"""
+
+    def test_no_header_means_full_payload(self):
+        """Test missing or multi-range headers return the full payload"""
+        assert parse_range(None, 1000) is None
+        assert parse_range("bytes=0-10,20-30", 1000) is None
+        assert parse_range("items=0-10", 1000) is None
+
+    def test_resume_from_offset(self):
+        """Test open-ended ranges used to resume a transfer"""
+        assert parse_range("bytes=400-", 1000) == (400, 999)
+
+    def test_bounded_and_clamped_ranges(self):
+        """Test end offsets past the payload are clamped"""
+        assert parse_range("bytes=0-99", 1000) == (0, 99)
+        assert parse_range("bytes=900-5000", 1000) == (900, 999)
+
+    def test_suffix_range(self):
+        """Test the last N bytes"""
+        assert parse_range("bytes=-100", 1000) == (900, 999)
+        assert parse_range("bytes=-5000", 1000) == (0, 999)
+
+    def test_unsatisfiable_range(self):
+        """Test ranges outside the payload are rejected"""
+        with pytest.raises(RangeNotSatisfiable):
+            parse_range("bytes=1000-", 1000)
+        with pytest.raises(RangeNotSatisfiable):
+            parse_range("bytes=-0", 1000)
@@ -0,0 +1,130 @@
+"""
+Tests for CloudPRNT Metrics
+===========================
+
+Tests the Prometheus registry used by the standalone server: recording
+cost, exposition format and file-backed multi-process aggregation.
+
+Run: bench --site sitename run-tests cloudprnt.tests.test_metrics
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import pytest
+import frappe
+from cloudprnt import metrics
+
+POLL = (("endpoint", "poll"),)
+DEAD_PID = 2 ** 22 + 1  # above the default pid_max, never alive
+
+
+@pytest.mark.unit
+@pytest.mark.standalone
+class TestMetricsRegistry:
+    """Tests for recording and exposition"""
+
+    def setup_method(self):
+        """Setup before each test"""
+        metrics.reset()
+        self.directory = tempfile.mkdtemp(prefix="cloudprnt_metrics_")
+        metrics.configure(self.directory)
+
+    def teardown_method(self):
+        """Cleanup after each test"""
+        metrics.reset()
+        metrics._directory = None
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_counter_exposition(self):
+        """Test counters are rendered with labels"""
+        metrics.inc("cloudprnt_requests_total", POLL + (("code", 200),))
+        metrics.inc("cloudprnt_requests_total", POLL + (("code", 200),))
+
+        text = metrics.render()
+
+        assert "# TYPE cloudprnt_requests_total counter" in text
+        assert 'cloudprnt_requests_total{endpoint="poll",code="200"} 2' in text
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test histogram buckets, sum and count"""
+        metrics.observe("cloudprnt_request_duration_seconds", 0.003, POLL)
+        metrics.observe("cloudprnt_request_duration_seconds", 0.2, POLL)
+        metrics.observe("cloudprnt_request_duration_seconds", 60, POLL)
+
+        text = metrics.render()
+
+        assert 'cloudprnt_request_duration_seconds_bucket{endpoint="poll",le="0.005"} 1' in text
+        assert 'cloudprnt_request_duration_seconds_bucket{endpoint="poll",le="0.25"} 2' in text
+        assert 'cloudprnt_request_duration_seconds_bucket{endpoint="poll",le="+Inf"} 3' in text
+        assert 'cloudprnt_request_duration_seconds_count{endpoint="poll"} 3' in text
+
+    def test_cache_hit_ratio(self):
+        """Test hit ratios are derived from cache counters"""
+        metrics.inc("cloudprnt_cache_requests_total", (("cache", "spool"), ("result", "hit")), 3)
+        metrics.inc("cloudprnt_cache_requests_total", (("cache", "spool"), ("result", "miss")))
+
+        assert 'cloudprnt_cache_hit_ratio{cache="spool"} 0.75' in metrics.render()
+
+    def test_scrape_gauges_are_not_stored(self):
+        """Test queue depth passed at scrape time is rendered but not flushed"""
+        text = metrics.render({"cloudprnt_queue_depth": {(("printer", "00:11:62:12:34:56"),): 4}})
+        metrics.flush()
+
+        assert 'cloudprnt_queue_depth{printer="00:11:62:12:34:56"} 4' in text
+        with open(os.path.join(self.directory, f"{os.getpid()}.json")) as f:
+            assert "cloudprnt_queue_depth" not in f.read()
+
+    def test_processes_are_aggregated(self):
+        """Test samples from other processes' files are merged"""
+        metrics.inc("cloudprnt_cputil_invocations_total", (("operation", "image"),))
+        other = {
+            "pid": DEAD_PID,
+            "counters": [["cloudprnt_cputil_invocations_total", [["operation", "image"]], 4]],
+            "gauges": [["cloudprnt_render_pool_in_flight", [], 7]],
+            "histograms": []
+        }
+        with open(os.path.join(self.directory, f"{DEAD_PID}.json"), "w") as f:
+            json.dump(other, f)
+
+        text = metrics.render()
+
+        # Counters of exited processes are kept, their gauges are not
+        assert 'cloudprnt_cputil_invocations_total{operation="image"} 5' in text
+        assert "cloudprnt_render_pool_in_flight 7" not in text
+
+        metrics.remove_dead_processes()
+        assert not os.path.exists(os.path.join(self.directory, f"{DEAD_PID}.json"))
+        frappe.logger().info("✅ Metrics merged across processes")
+
+
+@pytest.mark.unit
+@pytest.mark.slow
+class TestMetricsOverhead:
+    """Benchmark: recording must stay under a microsecond"""
+
+    def teardown_method(self):
+        """Cleanup after each test"""
+        metrics.reset()
+
+    def _per_call(self, fn, iterations=100000):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        return (time.perf_counter() - start) / iterations
+
+    def test_recording_is_sub_microsecond(self):
+        """Test inc() and observe() cost less than 1µs per call"""
+        inc_s = self._per_call(lambda: metrics.inc("cloudprnt_requests_total", POLL))
+        observe_s = self._per_call(
+            lambda: metrics.observe("cloudprnt_request_duration_seconds", 0.012, POLL)
+        )
+
+        frappe.logger().info(
+            f"⏱️  Metrics: inc {inc_s * 1e9:.0f}ns, observe {observe_s * 1e9:.0f}ns"
+        )
+
+        assert inc_s < 1e-6
+        assert observe_s < 1e-6
@@ -0,0 +1,139 @@
+"""
+Tests for CloudPRNT Payload Store
+=================================
+
+Tests content-addressed payload files, hex streaming with byte ranges,
+purging, and queueing jobs that reference their payload by hash.
+
+Run: bench --site sitename run-tests cloudprnt.tests.test_payload_store
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import pytest
+import frappe
+from cloudprnt.job_renderer import get_job_markup
+from cloudprnt.payload_store import PayloadStore, load_job_data
+from cloudprnt.print_queue_manager import add_jobs_to_queue, get_next_job
+from cloudprnt.tests.utils import clear_test_print_queue
+
+TEST_MAC = "00:11:62:12:34:56"
+HEX_JOB = "1B40" + "00FF" * 200
+
+
+@pytest.mark.unit
+class TestPayloadStore:
+    """Tests for the store itself"""
+
+    def setup_method(self):
+        """Setup before each test"""
+        self.directory = tempfile.mkdtemp()
+        self.store = PayloadStore(self.directory)
+
+    def teardown_method(self):
+        """Cleanup after each test"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_identical_payloads_stored_once(self):
+        """Test the same payload gives the same hash and a single file"""
+        first = self.store.put("[align: centre]Receipt[cut]")
+        second = self.store.put("[align: centre]Receipt[cut]")
+
+        assert first == second
+        assert first[0] == hashlib.sha256(b"[align: centre]Receipt[cut]").hexdigest()
+        assert first[1] == len("[align: centre]Receipt[cut]")
+        assert sum(len(files) for _, _, files in os.walk(self.directory)) == 1
+        assert self.store.read(first[0]) == "[align: centre]Receipt[cut]"
+        frappe.logger().info("✅ Identical payloads stored once")
+
+    def test_hex_normalized_and_streamed(self):
+        """Test hex payloads are stored without whitespace and decoded by range"""
+        payload_hash, size = self.store.put(HEX_JOB[:200].lower() + "\n" + HEX_JOB[200:])
+
+        assert size == len(HEX_JOB)
+        assert self.store.is_hex(payload_hash)
+        data = bytes.fromhex(HEX_JOB)
+        assert b"".join(self.store.iter_hex(payload_hash, chunk_size=64)) == data
+        assert b"".join(self.store.iter_hex(payload_hash, 10, 99, chunk_size=32)) == data[10:100]
+
+    def test_markup_is_not_hex(self):
+        """Test markup payloads are not streamed as hex"""
+        payload_hash, _ = self.store.put("[align: centre]" + "A" * 200)
+
+        assert not self.store.is_hex(payload_hash)
+
+    def test_invalid_hash_rejected(self):
+        """Test hashes cannot point outside the store"""
+        with pytest.raises(ValueError):
+            self.store.path("../../site_config.json")
+
+    def test_purge_keeps_referenced_and_recent(self):
+        """Test only old, unreferenced payloads are removed"""
+        old, _ = self.store.put("old")
+        kept, _ = self.store.put("referenced")
+        recent, _ = self.store.put("recent")
+        past = time.time() - 3600
+        for payload_hash in (old, kept):
+            os.utime(self.store.path(payload_hash), (past, past))
+
+        assert self.store.purge(referenced=[kept], max_age=600) == 1
+        assert not os.path.exists(self.store.path(old))
+        assert os.path.exists(self.store.path(kept))
+        assert os.path.exists(self.store.path(recent))
+
+    def test_purge_reads_references_after_walk(self):
+        """Test a payload referenced while the store is walked is kept"""
+        queued, _ = self.store.put("queued during the walk")
+        past = time.time() - 3600
+        os.utime(self.store.path(queued), (past, past))
+
+        assert self.store.purge(referenced=lambda: [queued], max_age=600) == 0
+        assert os.path.exists(self.store.path(queued))
+
+    def test_put_rewrites_purged_payload(self):
+        """Test storing a payload again after its file was purged writes it back"""
+        payload_hash, _ = self.store.put("purged")
+        os.unlink(self.store.path(payload_hash))
+
+        assert self.store.put("purged")[0] == payload_hash
+        assert self.store.read(payload_hash) == "purged"
+
+
+@pytest.mark.queue
+@pytest.mark.integration
+class TestQueuedPayloads:
+    """Tests for jobs queued through print_queue_manager"""
+
+    def setup_method(self):
+        """Setup before each test"""
+        clear_test_print_queue()
+
+    def teardown_method(self):
+        """Cleanup after each test"""
+        clear_test_print_queue()
+
+    def test_queue_rows_reference_payloads(self):
+        """Test copies share one payload and rows keep only hash and size"""
+        markup = "[align: centre]Copy[cut]"
+        add_jobs_to_queue([
+            {"job_token": "TEST-PAYLOAD-1", "printer_mac": TEST_MAC, "job_data": markup},
+            {"job_token": "TEST-PAYLOAD-2", "printer_mac": TEST_MAC, "job_data": markup}
+        ])
+
+        rows = frappe.get_all(
+            "CloudPRNT Print Queue",
+            filters={"job_token": ["like", "TEST-PAYLOAD-%"]},
+            fields=["job_data", "payload_hash", "payload_size"]
+        )
+
+        assert len(rows) == 2
+        assert {row.payload_hash for row in rows} == {hashlib.sha256(markup.encode()).hexdigest()}
+        assert all(row.job_data is None and row.payload_size == len(markup) for row in rows)
+
+        job = get_next_job(TEST_MAC)
+        assert load_job_data(job) == markup
+        assert get_job_markup(job) == markup
+        frappe.logger().info("✅ Queue rows reference shared payloads")
@@ -11,14 +11,19 @@ Run: bench --site sitename run-tests cloudprnt.tests.test_print_queue_manager
 import pytest
 import frappe
 import time
+from cloudprnt import cloudprnt_server
 from cloudprnt.print_queue_manager import (
     add_job_to_queue,
+    add_jobs_to_queue,
     get_next_job,
     mark_job_fetched,
     mark_job_printed,
     get_queue_position,
+    get_queue_positions,
     get_queue_status,
-    clear_queue
+    clear_queue,
+    mark_jobs_fetched,
+    mark_jobs_printed
 )
 from cloudprnt.tests.utils import clear_test_print_queue
 
@@ -93,6 +98,164 @@ class TestAddJobToQueue:
         assert job == "AA:BB:CC:DD:EE:FF"  # Should be uppercase
 
 
+@pytest.mark.queue
+@pytest.mark.integration
+class TestAddJobsToQueue:
+    """Tests for bulk enqueue"""
+
+    def setup_method(self):
+        """Setup before each test"""
+        clear_test_print_queue()
+
+    def teardown_method(self):
+        """Cleanup after each test"""
+        clear_test_print_queue()
+
+    def test_positions_in_list_order(self):
+        """Test every job gets its position, per printer and in list order"""
+        add_job_to_queue("TEST-BULKADD-0", "00:11:62:12:34:56")
+
+        result = add_jobs_to_queue([
+            {"job_token": "TEST-BULKADD-1", "printer_mac": "00.11.62.12.34.56", "job_data": "[cut]"},
+            {"job_token": "TEST-BULKADD-2", "printer_mac": "00:11:62:22:22:22"},
+            {"job_token": "TEST-BULKADD-3", "printer_mac": "00:11:62:12:34:56", "invoice_name": "POS-INV-1"}
+        ])
+
+        assert result["success"] == True
+        assert [(j["job_token"], j["printer_mac"], j["queue_position"]) for j in result["jobs"]] == [
+            ("TEST-BULKADD-1", "00:11:62:12:34:56", 2),
+            ("TEST-BULKADD-2", "00:11:62:22:22:22", 1),
+            ("TEST-BULKADD-3", "00:11:62:12:34:56", 3)
+        ]
+        assert get_next_job("00:11:62:12:34:56")["token"] == "TEST-BULKADD-0"
+        assert frappe.db.exists("CloudPRNT Job History", {"job_token": "TEST-BULKADD-3"})
+
+        frappe.logger().info("✅ Bulk enqueue positions test passed")
+
+    def test_invalid_spec_queues_nothing(self):
+        """Test one bad spec rejects the whole batch"""
+        result = add_jobs_to_queue([
+            {"job_token": "TEST-BULKADD-OK", "printer_mac": "00:11:62:12:34:56"},
+            {"job_token": "TEST-BULKADD-BAD", "printer_mac": "not-a-mac"}
+        ])
+
+        assert result["success"] == False
+        assert "Job 2" in result["message"]
+        assert get_next_job("00:11:62:12:34:56") is None
+
+    def test_duplicate_tokens_rejected(self):
+        """Test a token cannot appear twice in a batch"""
+        result = add_jobs_to_queue([
+            {"job_token": "TEST-BULKADD-DUP", "printer_mac": "00:11:62:12:34:56"},
+            {"job_token": "TEST-BULKADD-DUP", "printer_mac": "00:11:62:12:34:56"}
+        ])
+
+        assert result["success"] == False
+        assert "duplicate" in result["message"]
+
+    def test_unknown_priority_rejected(self):
+        """Test priorities outside the known classes are rejected"""
+        result = add_jobs_to_queue([
+            {"job_token": "TEST-BULKADD-PRIO", "printer_mac": "00:11:62:12:34:56", "priority": "urgent"}
+        ])
+
+        assert result["success"] == False
+        assert "Job 1" in result["message"]
+
+
+@pytest.mark.queue
+@pytest.mark.integration
+class TestIdempotentEnqueue:
+    """Tests for collapsing repeated print requests"""
+
+    def setup_method(self):
+        """Setup before each test"""
+        clear_test_print_queue()
+        self.window = frappe.conf.get("cloudprnt_dedupe_window")
+
+    def teardown_method(self):
+        """Cleanup after each test"""
+        frappe.conf.cloudprnt_dedupe_window = self.window
+        clear_test_print_queue()
+
+    def count_rows(self, pattern):
+        return frappe.db.count("CloudPRNT Print Queue", {"job_token": ["like", pattern]})
+
+    def test_repeated_request_collapsed(self):
+        """Test a double-tap queues the job once and returns the first job"""
+        first = add_job_to_queue("TEST-IDEM-1", "00:11:62:12:34:56", invoice_name="POS-INV-1")
+        second = add_job_to_queue("TEST-IDEM-1", "00.11.62.12.34.56", invoice_name="POS-INV-1")
+
+        assert first["duplicate"] == False
+        assert second == {"success": True, "job_token": "TEST-IDEM-1", "queue_position": 1, "duplicate": True}
+        assert self.count_rows("TEST-IDEM-1") == 1
+        frappe.logger().info("✅ Repeated request collapsed")
+
+    def test_copy_gets_own_token(self):
+        """Test a copy counter queues another job"""
+        add_job_to_queue("TEST-IDEM-2", "00:11:62:12:34:56")
+        copy = add_job_to_queue("TEST-IDEM-2", "00:11:62:12:34:56", copy=1)
+
+        assert copy["duplicate"] == False
+        assert copy["job_token"] == "TEST-IDEM-2-copy-1"
+        assert copy["queue_position"] == 2
+        assert add_job_to_queue("TEST-IDEM-2", "00:11:62:12:34:56", copy=1)["duplicate"] == True
+        assert self.count_rows("TEST-IDEM-2%") == 2
+
+    def test_explicit_key(self):
+        """Test jobs with different tokens sharing a key are queued once, also within one batch"""
+        result = add_jobs_to_queue([
+            {"job_token": "TEST-IDEM-3A", "printer_mac": "00:11:62:12:34:56", "idempotency_key": "TEST-IDEM-KEY"},
+            {"job_token": "TEST-IDEM-3B", "printer_mac": "00:11:62:12:34:56", "idempotency_key": "TEST-IDEM-KEY"}
+        ])
+
+        assert [(j["job_token"], j["duplicate"]) for j in result["jobs"]] == [
+            ("TEST-IDEM-3A", False),
+            ("TEST-IDEM-3A", True)
+        ]
+        assert self.count_rows("TEST-IDEM-3%") == 1
+
+    def test_window_disabled(self):
+        """Test a window of 0 queues every request sharing a key"""
+        frappe.conf.cloudprnt_dedupe_window = 0
+        add_job_to_queue("TEST-IDEM-4A", "00:11:62:12:34:56", idempotency_key="TEST-IDEM-KEY-4")
+        second = add_job_to_queue("TEST-IDEM-4B", "00:11:62:12:34:56", idempotency_key="TEST-IDEM-KEY-4")
+
+        assert second["duplicate"] == False
+        assert self.count_rows("TEST-IDEM-4%") == 2
+
+    def test_queued_token_collapsed(self):
+        """Test a token still queued is not queued again, whatever the window"""
+        frappe.conf.cloudprnt_dedupe_window = 0
+        add_job_to_queue("TEST-IDEM-6", "00:11:62:12:34:56")
+        result = add_jobs_to_queue([
+            {"job_token": "TEST-IDEM-6", "printer_mac": "00:11:62:12:34:56"},
+            {"job_token": "TEST-IDEM-7", "printer_mac": "00:11:62:12:34:56"}
+        ])
+
+        assert result["success"] == True
+        assert [(j["job_token"], j["queue_position"], j["duplicate"]) for j in result["jobs"]] == [
+            ("TEST-IDEM-6", 1, True),
+            ("TEST-IDEM-7", 2, False)
+        ]
+        assert self.count_rows("TEST-IDEM-6") == 1
+
+    def test_clear_releases_keys(self):
+        """Test a job can be printed again right after its queue was cleared"""
+        add_job_to_queue("TEST-IDEM-8", "00:11:62:12:34:56")
+        clear_queue("00:11:62:12:34:56")
+
+        assert add_job_to_queue("TEST-IDEM-8", "00:11:62:12:34:56")["duplicate"] == False
+        assert self.count_rows("TEST-IDEM-8") == 1
+
+    def test_invalid_copy_rejected(self):
+        """Test the copy counter must be a non-negative integer"""
+        result = add_job_to_queue("TEST-IDEM-5", "00:11:62:12:34:56", copy=-1)
+
+        assert result["success"] == False
+        assert "copy" in result["message"]
+
+
 @pytest.mark.queue
 @pytest.mark.integration
 class TestGetNextJob:
@@ -241,6 +404,52 @@ class TestQueuePosition:
         assert pos_c == 2  # Moved up from 3
 
 
+@pytest.mark.queue
+@pytest.mark.integration
+class TestBulkPrimitives:
+    """Tests for the list-of-tokens variants"""
+
+    def setup_method(self):
+        """Setup before each test"""
+        clear_test_print_queue()
+        for i in range(1, 5):
+            add_job_to_queue(f"TEST-BULK-{i}", "00:11:62:12:34:56")
+
+    def teardown_method(self):
+        """Cleanup after each test"""
+        clear_test_print_queue()
+
+    def test_positions_match_single_calls(self):
+        """Test bulk positions equal get_queue_position for every token"""
+        tokens = ["TEST-BULK-4", "TEST-BULK-2", "TEST-BULK-UNKNOWN"]
+
+        positions = get_queue_positions("00:11:62:12:34:56", tokens)
+
+        assert positions == {t: get_queue_position("00:11:62:12:34:56", t) for t in tokens}
+        assert positions == {"TEST-BULK-4": 4, "TEST-BULK-2": 2, "TEST-BULK-UNKNOWN": 0}
+
+    def test_mark_jobs_fetched(self):
+        """Test fetched jobs leave the pending positions"""
+        mark_jobs_fetched(["TEST-BULK-1", "TEST-BULK-3"])
+
+        status = frappe.db.get_value("CloudPRNT Print Queue", {"job_token": "TEST-BULK-3"}, "status")
+        assert status == "Fetched"
+        assert get_queue_position("00:11:62:12:34:56", "TEST-BULK-1") == 0
+        assert get_queue_position("00:11:62:12:34:56", "TEST-BULK-4") == 2
+        assert get_next_job("00:11:62:12:34:56")["token"] == "TEST-BULK-2"
+
+    def test_mark_jobs_printed(self):
+        """Test one result per token, like mark_job_printed"""
+        results = mark_jobs_printed(["TEST-BULK-1", "TEST-BULK-2", "INVALID-TOKEN"], "200 OK")
+
+        assert results["TEST-BULK-1"] == {"success": True}
+        assert results["TEST-BULK-2"] == {"success": True}
+        assert results["INVALID-TOKEN"] == mark_job_printed("INVALID-TOKEN")
+        assert get_queue_position("00:11:62:12:34:56", "TEST-BULK-3") == 1
+
+        frappe.logger().info("✅ Bulk mark printed test passed")
+
+
 @pytest.mark.queue
 @pytest.mark.integration
 class TestQueueStatus:
@@ -280,6 +489,62 @@ class TestQueueStatus:
         assert status["printer_mac"] == "00:11:62:12:34:56"
         assert len(status["jobs"]) >= 2
 
+    def test_get_queue_status_priority(self):
+        """Test jobs are listed in serving order with their priority"""
+        add_job_to_queue("TEST-STATUS-T1", "00:11:62:12:34:56", priority="test")
+        add_job_to_queue("TEST-STATUS-R1", "00:11:62:12:34:56", priority="reprint")
+        add_job_to_queue("TEST-STATUS-P1", "00:11:62:12:34:56")
+
+        status = get_queue_status("00:11:62:12:34:56")
+
+        assert [(job["job_token"], job["priority"]) for job in status["jobs"]] == [
+            ("TEST-STATUS-P1", "pos"),
+            ("TEST-STATUS-R1", "reprint"),
+            ("TEST-STATUS-T1", "test")
+        ]
+        frappe.logger().info("✅ Queue status priority test passed")
+
+    def test_get_queue_status_counts(self):
+        """Test per-printer counts by status and the oldest pending age"""
+        add_job_to_queue("TEST-STATUS-C1", "00:11:62:12:34:56")
+        add_job_to_queue("TEST-STATUS-C2", "00:11:62:12:34:56")
+        mark_job_fetched("TEST-STATUS-C1")
+
+        status = get_queue_status("00:11:62:12:34:56")
+
+        printer = status["printers"]["00:11:62:12:34:56"]
+        assert printer["counts"] == {"Fetched": 1, "Pending": 1}
+        assert printer["total"] == 2
+        assert printer["oldest_pending_age"] >= 0
+        assert status["total_jobs"] == 2
+
+    def test_get_queue_status_pages(self):
+        """Test jobs are listed one page at a time with a cursor"""
+        for i in range(5):
+            add_job_to_queue(f"TEST-STATUS-PAGE-{i}", "00:11:62:12:34:56")
+
+        first = get_queue_status("00:11:62:12:34:56", limit=2)
+        second = get_queue_status("00:11:62:12:34:56", limit=2, after=first["next"])
+
+        assert [job["job_token"] for job in first["jobs"] + second["jobs"]] == [
+            f"TEST-STATUS-PAGE-{i}" for i in range(4)
+        ]
+        assert first["total_jobs"] == 5
+        assert get_queue_status("00:11:62:12:34:56", limit=2, after=second["next"])["next"] is None
+
+    def test_get_queue_status_etag(self):
+        """Test an unchanged queue answers not_modified to its etag"""
+        add_job_to_queue("TEST-STATUS-E1", "00:11:62:12:34:56")
+        etag = get_queue_status("00:11:62:12:34:56")["etag"]
+
+        assert get_queue_status("00:11:62:12:34:56", etag=etag) == {"etag": etag, "not_modified": True}
+
+        add_job_to_queue("TEST-STATUS-E2", "00:11:62:12:34:56")
+        status = get_queue_status("00:11:62:12:34:56", etag=etag)
+        assert status["etag"] != etag
+        assert len(status["jobs"]) == 2
+        frappe.logger().info("✅ Queue status etag test passed")
+
 
 @pytest.mark.queue
 @pytest.mark.integration
@@ -328,6 +593,17 @@ class TestClearQueue:
         p2_job = get_next_job("00:11:62:22:22:22")
         assert p2_job is not None
 
+    def test_debug_clear_removes_fetched_jobs(self):
+        """Test the debug endpoint clears a printer stuck on a fetched job"""
+        add_job_to_queue("TEST-CLEAR-STUCK", "00:11:62:11:11:11")
+        mark_job_fetched("TEST-CLEAR-STUCK")
+
+        result = cloudprnt_server.clear_queue("00.11.62.11.11.11")
+
+        assert result["success"] == True
+        status = get_queue_status()
+        assert not [j for j in status["jobs"] if j["job_token"] == "TEST-CLEAR-STUCK"]
+
 
 @pytest.mark.queue
 @pytest.mark.integration
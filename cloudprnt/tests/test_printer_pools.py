@@ -0,0 +1,119 @@
+"""
+Tests for CloudPRNT Printer Pools
+=================================
+
+Tests claim-time dispatch of pooled jobs to the least busy available
+member, and queueing jobs to a pool.
+
+Run: bench --site sitename run-tests cloudprnt.tests.test_printer_pools
+"""
+
+import pytest
+import frappe
+from cloudprnt.print_queue_manager import add_job_to_queue, get_next_job
+from cloudprnt.printer_pools import dispatch_pool_job, find_pool, get_pool_map, is_available, pool_queue
+from cloudprnt.queue_backend import get_backend
+from cloudprnt.tests.query_counter import count_queries
+from cloudprnt.tests.utils import clear_test_print_queue, create_test_printer, remove_test_printer, set_printer_status
+
+POOL = "TEST-POOL"
+FIRST_MAC = "00:11:62:AA:00:01"
+SECOND_MAC = "00:11:62:AA:00:02"
+
+
+@pytest.mark.queue
+@pytest.mark.integration
+class TestPoolDispatch:
+    """Tests for dispatch_pool_job"""
+
+    def setup_method(self):
+        """Setup before each test"""
+        create_test_printer(FIRST_MAC, label="Test Pool 1", printer_pool=POOL)
+        create_test_printer(SECOND_MAC, label="Test Pool 2", printer_pool=POOL)
+        set_printer_status(FIRST_MAC)
+        set_printer_status(SECOND_MAC)
+        get_backend().clear(pool_queue(POOL))
+        clear_test_print_queue()
+
+    def teardown_method(self):
+        """Cleanup after each test"""
+        get_backend().clear(pool_queue(POOL))
+        clear_test_print_queue()
+        remove_test_printer(FIRST_MAC)
+        remove_test_printer(SECOND_MAC)
+
+    def test_idle_member_takes_job(self):
+        """Test a polling member with the shortest queue gets the pool's next job"""
+        add_job_to_queue("TEST-POOL-1", pool_queue(POOL))
+        add_job_to_queue("TEST-POOL-2", pool_queue(POOL))
+
+        assert dispatch_pool_job(FIRST_MAC) == "TEST-POOL-1"
+        assert get_next_job(FIRST_MAC)["token"] == "TEST-POOL-1"
+        assert get_next_job(pool_queue(POOL))["token"] == "TEST-POOL-2"
+        frappe.logger().info("✅ Idle pool member takes the job")
+
+    def test_busier_member_waits(self):
+        """Test a member with a longer queue leaves the job to an available member"""
+        add_job_to_queue("TEST-POOL-OWN", FIRST_MAC)
+        add_job_to_queue("TEST-POOL-3", pool_queue(POOL))
+
+        assert dispatch_pool_job(FIRST_MAC) is None
+        assert dispatch_pool_job(SECOND_MAC) == "TEST-POOL-3"
+
+    @pytest.mark.parametrize("status", [
+        {"printing_in_progress": 1},
+        {"online": 0},
+        {"seconds_ago": 3600},
+        {"status_code": "410 Out of paper"}
+    ])
+    def test_unavailable_members_ignored(self, status):
+        """Test printing, offline and silent members do not hold jobs back"""
+        add_job_to_queue("TEST-POOL-OWN", FIRST_MAC)
+        add_job_to_queue("TEST-POOL-4", pool_queue(POOL))
+        set_printer_status(SECOND_MAC, **status)
+
+        assert dispatch_pool_job(FIRST_MAC) == "TEST-POOL-4"
+
+    def test_printing_member_takes_nothing(self):
+        """Test a member reporting printingInProgress is not given a job"""
+        add_job_to_queue("TEST-POOL-5", pool_queue(POOL))
+
+        assert dispatch_pool_job(FIRST_MAC, printing_in_progress=True) is None
+        assert dispatch_pool_job(FIRST_MAC, status_code="420 Cover open") is None
+        assert get_next_job(FIRST_MAC) is None
+
+    def test_printer_outside_pools_costs_no_query(self):
+        """Test a poll from a printer in no pool is answered from the cached membership"""
+        get_pool_map()
+
+        result, counter = count_queries(dispatch_pool_job, "00:11:62:AA:00:99")
+
+        assert result is None
+        assert counter.count == 0
+
+    def test_membership_follows_settings(self):
+        """Test the cached membership is dropped when the printers change"""
+        assert FIRST_MAC in get_pool_map()[POOL]
+        remove_test_printer(FIRST_MAC)
+
+        assert FIRST_MAC not in get_pool_map()[POOL]
+
+    def test_pool_lookup(self):
+        """Test pools are found by name in any case"""
+        assert find_pool("test-pool") == POOL
+        assert find_pool("TEST-NO-POOL") is None
+
+
+@pytest.mark.unit
+class TestMemberAvailability:
+    """Tests for is_available"""
+
+    def test_availability(self):
+        """Test a member must be online, idle and recently polled"""
+        member = {"online": 1, "printing_in_progress": 0, "last_activity": 1000}
+
+        assert is_available(member, now=1010, timeout=30)
+        assert not is_available(member, now=1100, timeout=30)
+        assert not is_available(dict(member, online=0), now=1010, timeout=30)
+        assert not is_available(dict(member, printing_in_progress=1), now=1010, timeout=30)
+        assert not is_available(dict(member, status_code="410 Out of paper"), now=1010, timeout=30)
@@ -0,0 +1,130 @@
+"""
+Tests for CloudPRNT Printer Swarm
+=================================
+
+Runs small swarms against an in-process fake CloudPRNT server and checks
+the JSON summary: latency percentiles, outcomes, job counts and failure
+injection.
+
+Run: bench --site sitename run-tests cloudprnt.tests.test_printer_swarm
+"""
+
+import asyncio
+import json
+import pytest
+import frappe
+from urllib.parse import parse_qs
+from cloudprnt import printer_swarm
+from cloudprnt.printer_swarm import SwarmConfig, percentile, run_swarm, swarm_mac
+
+pytestmark = pytest.mark.skipif(not printer_swarm.HTTPX_AVAILABLE, reason="httpx not installed")
+
+
+class FakeServer:
+    """ASGI app answering like the standalone server, one job per printer"""
+
+    def __init__(self, job_status=200, job_timeout=None):
+        self.job_status = job_status
+        # Seconds after which the GET times out, as a hung server does
+        self.job_timeout = job_timeout
+        self.offered = set()
+        self.deleted = []
+
+    async def __call__(self, scope, receive, send):
+        message = await receive()
+        query = parse_qs(scope["query_string"].decode())
+
+        if scope["method"] == "POST":
+            mac = json.loads(message["body"])["printerMAC"]
+            body = {"jobReady": mac not in self.offered, "jobToken": f"TEST-SWARM-{mac}"}
+            self.offered.add(mac)
+            await self.respond(send, 200, json.dumps(body).encode(), b"application/json")
+        elif scope["method"] == "GET":
+            if self.job_timeout is not None:
+                await asyncio.sleep(self.job_timeout)
+                raise printer_swarm.httpx.ReadTimeout("timed out")
+            await self.respond(send, self.job_status, b"\x1b\x40" * 100, b"application/vnd.star.line")
+        else:
+            self.deleted.append((query["token"][0], query["code"][0]))
+            await self.respond(send, 200, b'{"message": "ok"}', b"application/json")
+
+    async def respond(self, send, status, body, content_type):
+        await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", content_type)]})
+        await send({"type": "http.response.body", "body": body})
+
+
+def swarm(server, printers=5, duration=0.5, **config):
+    config.setdefault("poll_interval", 0.05)
+    config.setdefault("think_time", (0, 0))
+    config.setdefault("min_print_time", 0)
+    return asyncio.run(run_swarm(
+        "http://swarm.test",
+        printers=printers,
+        duration=duration,
+        config=SwarmConfig(**config),
+        transport=printer_swarm.httpx.ASGITransport(app=server)
+    ))
+
+
+@pytest.mark.unit
+class TestPrinterSwarm:
+    """Tests for the swarm against a fake server"""
+
+    def test_summary_per_endpoint(self):
+        """Test every printer polls, prints its job and confirms it"""
+        server = FakeServer()
+
+        result = swarm(server, printers=5)
+
+        assert result["printers"] == 5
+        assert result["jobs"]["printed"] == 5
+        assert len(server.deleted) == 5
+        poll = result["endpoints"]["poll"]
+        assert poll["requests"] > 5
+        assert poll["errors"] == 0
+        assert poll["p50_ms"] <= poll["p95_ms"] <= poll["p99_ms"] <= poll["max_ms"]
+        json.dumps(result)
+        frappe.logger().info(f"✅ Swarm: {result['throughput_rps']} req/s")
+
+    def test_server_errors_are_counted(self):
+        """Test 5xx responses show up in the error rate"""
+        result = swarm(FakeServer(job_status=503), printers=4)
+
+        job = result["endpoints"]["job"]
+        assert job["outcomes"]["503"] == 4
+        assert job["error_rate"] == 1
+        assert result["jobs"]["printed"] == 0
+
+    def test_timeouts_keep_their_latency(self):
+        """Test requests the printer gave up on count in the percentiles"""
+        result = swarm(FakeServer(job_timeout=0.1), printers=3, duration=0.3)
+
+        job = result["endpoints"]["job"]
+        assert job["outcomes"]["timeout"] == 3
+        assert job["p50_ms"] >= 100
+
+    def test_failure_injection(self):
+        """Test failed prints and dropped confirmations"""
+        server = FakeServer()
+        result = swarm(server, printers=4, failure_rate=1)
+
+        assert result["jobs"]["failed"] == 4
+        assert all(code == printer_swarm.FAILURE_STATUS for _, code in server.deleted)
+
+        server = FakeServer()
+        result = swarm(server, printers=4, drop_delete_rate=1)
+
+        assert result["jobs"]["deletes_dropped"] == 4
+        assert server.deleted == []
+
+    def test_swarm_macs_are_unique(self):
+        """Test virtual printers get distinct, locally administered MACs"""
+        macs = {swarm_mac(i) for i in range(5000)}
+
+        assert len(macs) == 5000
+        assert swarm_mac(1) == "02:CF:00:00:00:01"
+
+    def test_percentile(self):
+        """Test linear interpolation between ranks"""
+        assert percentile(list(range(1, 101)), 50) == 50.5
+        assert percentile([], 99) is None
@@ -0,0 +1,142 @@
+"""
+Tests for CloudPRNT Printer Watchdog
+====================================
+
+Tests down printers being marked offline and their pending jobs moved to
+their backup printer or pool.
+
+Run: bench --site sitename run-tests cloudprnt.tests.test_printer_watchdog
+"""
+
+import pytest
+import frappe
+from cloudprnt.print_queue_manager import add_job_to_queue, get_next_job, mark_job_fetched
+from cloudprnt.printer_pools import pool_queue
+from cloudprnt.printer_watchdog import check_printers, get_backup_targets
+from cloudprnt.queue_backend import get_backend
+from cloudprnt.tests.utils import clear_test_print_queue, create_test_printer, remove_test_printer, set_printer_status
+
+POOL = "TEST-WATCHDOG-POOL"
+DOWN_MAC = "00:11:62:BB:00:01"
+BACKUP_MAC = "00:11:62:BB:00:02"
+MEMBER_MAC = "00:11:62:BB:00:03"
+
+
+def printer_online(mac_address):
+    return frappe.db.get_value(
+        "CloudPRNT Printers",
+        {"parent": "CloudPRNT Settings", "mac_address": mac_address},
+        "online"
+    )
+
+
+@pytest.mark.queue
+@pytest.mark.integration
+class TestPrinterFailover:
+    """Tests for check_printers"""
+
+    def setup_method(self):
+        """Setup before each test"""
+        create_test_printer(DOWN_MAC, label="Test Watchdog Down", backup_printer="Test Watchdog Backup")
+        create_test_printer(BACKUP_MAC, label="Test Watchdog Backup")
+        create_test_printer(MEMBER_MAC, label="Test Watchdog Member", printer_pool=POOL)
+        for mac in (DOWN_MAC, BACKUP_MAC, MEMBER_MAC):
+            set_printer_status(mac)
+        get_backend().clear(pool_queue(POOL))
+        clear_test_print_queue()
+
+    def teardown_method(self):
+        """Cleanup after each test"""
+        get_backend().clear(pool_queue(POOL))
+        clear_test_print_queue()
+        for mac in (DOWN_MAC, BACKUP_MAC, MEMBER_MAC):
+            remove_test_printer(mac)
+
+    def test_silent_printer_fails_over(self):
+        """Test a printer that stopped polling goes offline and its waiting jobs move to its backup"""
+        add_job_to_queue("TEST-WATCHDOG-FETCHED", DOWN_MAC)
+        add_job_to_queue("TEST-WATCHDOG-1", DOWN_MAC)
+        mark_job_fetched("TEST-WATCHDOG-FETCHED")
+        set_printer_status(DOWN_MAC, seconds_ago=3600)
+
+        result = check_printers(offline_after=120)
+
+        assert result["offline"] >= 1 and result["moved"] >= 1
+        assert not printer_online(DOWN_MAC)
+        assert get_next_job(BACKUP_MAC)["token"] == "TEST-WATCHDOG-1"
+        assert get_next_job(DOWN_MAC) is None
+        frappe.logger().info("✅ Silent printer jobs moved to backup")
+
+    def test_error_status_fails_over(self):
+        """Test a printer reporting an error status is down even while polling"""
+        add_job_to_queue("TEST-WATCHDOG-2", DOWN_MAC)
+        set_printer_status(DOWN_MAC, status_code="410 Out of paper")
+
+        assert check_printers(offline_after=120)["moved"] == 1
+        assert get_next_job(BACKUP_MAC)["token"] == "TEST-WATCHDOG-2"
+
+    def test_pool_member_fails_over_to_pool(self):
+        """Test a pool member without Backup Printer hands its jobs back to its pool"""
+        add_job_to_queue("TEST-WATCHDOG-3", MEMBER_MAC)
+        set_printer_status(MEMBER_MAC, seconds_ago=3600)
+
+        check_printers(offline_after=120)
+
+        assert get_next_job(pool_queue(POOL))["token"] == "TEST-WATCHDOG-3"
+
+    def test_down_backup_skipped(self):
+        """Test jobs stay put when the backup is down too"""
+        add_job_to_queue("TEST-WATCHDOG-4", DOWN_MAC)
+        set_printer_status(DOWN_MAC, seconds_ago=3600)
+        set_printer_status(BACKUP_MAC, seconds_ago=3600)
+
+        result = check_printers(offline_after=120)
+
+        assert result["moved"] == 0
+        assert get_next_job(DOWN_MAC)["token"] == "TEST-WATCHDOG-4"
+
+    def test_unknown_liveness_skipped(self):
+        """Test a printer that never recorded a poll is not failed over"""
+        add_job_to_queue("TEST-WATCHDOG-6", DOWN_MAC)
+        frappe.db.sql("""
+            UPDATE `tabCloudPRNT Printers` SET last_activity = NULL
+            WHERE parent = 'CloudPRNT Settings' AND mac_address = %s
+        """, (DOWN_MAC,))
+        frappe.db.commit()
+
+        check_printers(offline_after=120)
+
+        assert get_next_job(DOWN_MAC)["token"] == "TEST-WATCHDOG-6"
+        assert printer_online(DOWN_MAC)
+
+    def test_healthy_printers_untouched(self):
+        """Test nothing moves while printers poll without errors"""
+        add_job_to_queue("TEST-WATCHDOG-5", DOWN_MAC)
+
+        assert check_printers(offline_after=120)["moved"] == 0
+        assert printer_online(DOWN_MAC)
+
+
+@pytest.mark.unit
+class TestBackupTargets:
+    """Tests for get_backup_targets"""
+
+    def test_targets(self):
+        """Test backups resolve by label or pool name, falling back to the printer's pool"""
+        printers = [
+            frappe._dict(name="p1", label="Bar", mac_address="AA", printer_pool=None),
+            frappe._dict(name="p2", label="Kitchen", mac_address="BB", printer_pool="Counter"),
+            frappe._dict(name="p3", label="Terrace", mac_address="CC", printer_pool=None)
+        ]
+        down = [
+            frappe._dict(mac_address="AA", backup_printer="Kitchen", printer_pool=None),
+            frappe._dict(mac_address="BB", backup_printer="", printer_pool="Counter"),
+            frappe._dict(mac_address="CC", backup_printer="counter", printer_pool=None)
+        ]
+
+        assert get_backup_targets(down, printers) == {
+            "BB": "POOL:COUNTER",
+            "CC": "POOL:COUNTER"
+        }
+        # A backup that is itself down is skipped
+        assert get_backup_targets(down[:1], printers) == {"AA": "BB"}
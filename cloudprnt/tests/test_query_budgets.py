@@ -0,0 +1,236 @@
+"""
+Tests for CloudPRNT Query Budgets
+=================================
+
+Counts queries, commits and database time on the hot endpoints and fails
+when a change makes them do more database work than their budget.
+
+Budgets are today's cost. When a change lowers the cost of a path,
+lower its budget in the same change so the gain cannot silently regress.
+
+Run: bench --site sitename run-tests cloudprnt.tests.test_query_budgets
+"""
+
+import pytest
+import frappe
+from frappe.utils import set_request
+from cloudprnt import cloudprnt_server
+from cloudprnt.api import print_pos_invoice
+from cloudprnt.pos_invoice_markup import get_pos_invoice_markup
+from cloudprnt.print_queue_manager import (
+    add_job_to_queue,
+    add_jobs_to_queue,
+    clear_idempotency_keys,
+    mark_job_fetched,
+    mark_job_printed
+)
+from cloudprnt.tests.query_counter import QueryCounter, classify, count_queries
+from cloudprnt.tests.utils import clear_test_print_queue, get_test_markup_simple
+
+TEST_MAC = "00:11:62:12:34:56"
+
+QUERY_BUDGETS = {
+    # printer lookup + status update + queue peek; pool dispatch reads the
+    # cached pool membership, no query for a printer outside pools
+    "cloudprnt_poll": {"queries": 3, "commits": 1},
+    # queue claim (select + update) + history update + print log insert
+    "cloudprnt_job": {"queries": 4, "commits": 2},
+    # queue insert + pos_profile lookup + history insert + queue position,
+    # reading one pos_profile row and one COUNT row
+    "add_job_to_queue": {"queries": 4, "commits": 1, "rows": 2},
+    # one multi-row queue insert + one position query per printer + one history insert
+    "add_jobs_to_queue": {"queries": 4, "commits": 1},
+    # keyed queue UPDATE + history update
+    "mark_job_fetched": {"queries": 2, "commits": 1},
+    # keyed queue DELETE + history update
+    "mark_job_printed": {"queries": 2, "commits": 1},
+    # invoice document (one query per child table) + owner, settings, address, tax id
+    "get_pos_invoice_markup": {"queries": 30, "commits": 0},
+    # invoice check + markup + add_job_to_queue
+    "print_pos_invoice": {"queries": 35, "commits": 1},
+    # invoice check + queue position of the queued job, no markup
+    "print_pos_invoice_duplicate": {"queries": 2, "commits": 0},
+}
+
+
+class FakeDB:
+    """Stands in for frappe.local.db in the counter unit tests"""
+
+    def sql(self, query, values=None, as_dict=False):
+        return [{"name": "A"}, {"name": "B"}] if query.startswith("SELECT") else ()
+
+
+@pytest.mark.unit
+class TestQueryCounter:
+    """Tests for the counter itself"""
+
+    def setup_method(self):
+        """Setup before each test"""
+        self.db = getattr(frappe.local, "db", None)
+        frappe.local.db = FakeDB()
+
+    def teardown_method(self):
+        """Cleanup after each test"""
+        frappe.local.db = self.db
+
+    def test_counts_queries_and_commits(self):
+        """Test queries, commits and rows are counted, transaction control is not"""
+        with QueryCounter() as counter:
+            frappe.local.db.sql("SELECT name FROM `tabCloudPRNT Print Queue`")
+            frappe.local.db.sql("UPDATE `tabCloudPRNT Print Queue` SET status = 'Printed'")
+            frappe.local.db.sql("commit")
+            frappe.local.db.sql("start transaction")
+
+        assert counter.count == 2
+        assert counter.commits == 1
+        assert counter.rows == 2
+        assert len(counter.statements) == 4
+
+    def test_restores_sql(self):
+        """Test the wrapper is removed on exit"""
+        with QueryCounter():
+            pass
+
+        assert "sql" not in vars(frappe.local.db)
+
+    def test_assert_within_lists_statements(self):
+        """Test a blown budget names the limit and the statements"""
+        _, counter = count_queries(lambda: frappe.local.db.sql("SELECT name FROM `tabCloudPRNT Printers`"))
+
+        with pytest.raises(AssertionError) as error:
+            counter.assert_within("lookup", queries=0)
+
+        assert "queries 1 > 0" in str(error.value)
+        assert "tabCloudPRNT Printers" in str(error.value)
+
+    def test_classify(self):
+        """Test statement classification"""
+        assert classify("  COMMIT") == "commit"
+        assert classify("rollback") == "control"
+        assert classify("SAVEPOINT sp1") == "control"
+        assert classify("\n\tSELECT 1") == "query"
+
+
+@pytest.mark.integration
+@pytest.mark.slow
+class TestEndpointBudgets:
+    """Query budgets of the hot endpoints"""
+
+    def setup_method(self):
+        """Setup before each test"""
+        clear_test_print_queue()
+        frappe.local.response = frappe._dict()
+
+    def teardown_method(self):
+        """Cleanup after each test"""
+        clear_test_print_queue()
+
+    def check(self, label, counter):
+        frappe.logger().info(f"✅ {label}: {counter.report().splitlines()[0]}")
+        counter.assert_within(label, **QUERY_BUDGETS[label])
+
+    def test_cloudprnt_poll(self, test_printer):
+        """Test a poll from a registered printer"""
+        set_request(method="POST", path="/api/method/cloudprnt.cloudprnt_server.cloudprnt_poll", json={
+            "printerMAC": test_printer.replace(":", "."),
+            "statusCode": "200 OK",
+            "printingInProgress": False
+        })
+
+        _, counter = count_queries(cloudprnt_server.cloudprnt_poll)
+
+        assert frappe.response.get("jobReady") is False
+        self.check("cloudprnt_poll", counter)
+
+    def test_cloudprnt_job(self, test_printer):
+        """Test fetching a Star Line job"""
+        add_job_to_queue("TEST-BUDGET-JOB", test_printer, "TEST-BUDGET-JOB", job_data=get_test_markup_simple())
+        set_request(
+            method="GET",
+            path="/api/method/cloudprnt.cloudprnt_server.cloudprnt_job",
+            query_string=f"mac={test_printer.replace(':', '.')}&type=application/vnd.star.line&token=TEST-BUDGET-JOB"
+        )
+
+        _, counter = count_queries(cloudprnt_server.cloudprnt_job)
+
+        assert frappe.response.get("content_type") == "application/vnd.star.line"
+        frappe.db.sql("DELETE FROM `tabCloudPRNT Logs` WHERE document_link = 'TEST-BUDGET-JOB'")
+        frappe.db.commit()
+        self.check("cloudprnt_job", counter)
+
+    def test_add_job_to_queue(self, test_invoice):
+        """Test enqueueing an invoice job"""
+        result, counter = count_queries(add_job_to_queue, "TEST-BUDGET-ADD", TEST_MAC, test_invoice)
+
+        assert result["success"]
+        self.check("add_job_to_queue", counter)
+
+    def test_add_job_queries_independent_of_depth(self):
+        """Test enqueueing costs the same number of queries on a deep queue"""
+        _, first = count_queries(add_job_to_queue, "TEST-BUDGET-DEPTH-0", TEST_MAC)
+        for i in range(1, 20):
+            add_job_to_queue(f"TEST-BUDGET-DEPTH-{i}", TEST_MAC)
+        _, deep = count_queries(add_job_to_queue, "TEST-BUDGET-DEPTH-20", TEST_MAC)
+
+        frappe.logger().info(f"✅ add_job_to_queue rows: {first.rows} empty, {deep.rows} at depth 20")
+        assert deep.count == first.count
+        assert deep.rows == first.rows
+
+    def test_add_jobs_to_queue(self):
+        """Test a batch costs one insert and one commit, not one per job"""
+        jobs = [
+            {"job_token": f"TEST-BUDGET-BULK-{i}", "printer_mac": mac}
+            for i, mac in enumerate([TEST_MAC, TEST_MAC, TEST_MAC, "00:11:62:22:22:22"])
+        ]
+
+        result, counter = count_queries(add_jobs_to_queue, jobs)
+
+        assert result["success"]
+        self.check("add_jobs_to_queue", counter)
+
+    def test_mark_job_fetched(self):
+        """Test marking a job fetched is one keyed UPDATE"""
+        add_job_to_queue("TEST-BUDGET-FETCH", TEST_MAC)
+
+        _, counter = count_queries(mark_job_fetched, "TEST-BUDGET-FETCH")
+
+        self.check("mark_job_fetched", counter)
+
+    def test_mark_job_printed(self):
+        """Test confirming a job is one keyed DELETE, without loading the document"""
+        add_job_to_queue("TEST-BUDGET-PRINTED", TEST_MAC)
+
+        result, counter = count_queries(mark_job_printed, "TEST-BUDGET-PRINTED", "200 OK")
+
+        assert result == {"success": True}
+        self.check("mark_job_printed", counter)
+
+    def test_get_pos_invoice_markup(self, test_invoice):
+        """Test rendering the markup of a two-item invoice"""
+        markup, counter = count_queries(get_pos_invoice_markup, test_invoice)
+
+        assert markup
+        assert counter.commits == 0
+        self.check("get_pos_invoice_markup", counter)
+
+    def test_print_pos_invoice(self, test_invoice, test_printer):
+        """Test printing an invoice to a printer given by MAC"""
+        result, counter = count_queries(print_pos_invoice, test_invoice, test_printer)
+
+        assert result["success"]
+        frappe.db.sql("DELETE FROM `tabCloudPRNT Print Queue` WHERE job_token = %s", (test_invoice,))
+        frappe.db.commit()
+        clear_idempotency_keys(test_printer)
+        self.check("print_pos_invoice", counter)
+
+    def test_print_pos_invoice_duplicate(self, test_invoice, test_printer):
+        """Test a double-tap is answered before the markup is built"""
+        print_pos_invoice(test_invoice, test_printer)
+
+        result, counter = count_queries(print_pos_invoice, test_invoice, test_printer)
+
+        assert result["duplicate"]
+        frappe.db.sql("DELETE FROM `tabCloudPRNT Print Queue` WHERE job_token = %s", (test_invoice,))
+        frappe.db.commit()
+        clear_idempotency_keys(test_printer)
+        self.check("print_pos_invoice_duplicate", counter)
@@ -0,0 +1,428 @@
+"""
+Tests for CloudPRNT Queue Backends
+==================================
+
+Runs the same queue contract against the database backend and the Redis
+Streams backend, plus backend selection from the site config.
+
+Run: bench --site sitename run-tests cloudprnt.tests.test_queue_backend
+"""
+
+import time
+import pytest
+import frappe
+from cloudprnt import queue_backend
+from cloudprnt.queue_backend import DatabaseBackend, RedisStreamsBackend, make_backend, priority_level
+
+TEST_MAC = "00:11:62:12:34:56"
+OTHER_MAC = "00:11:62:AB:CD:EF"
+
+
+@pytest.fixture(params=["db", "redis"])
+def backend(request):
+    """Each backend, emptied of the test printers' jobs around the test"""
+    if request.param == "redis":
+        if not queue_backend.REDIS_AVAILABLE:
+            pytest.skip("redis not installed")
+        backend = RedisStreamsBackend(frappe.cache(), "test_cloudprnt")
+    else:
+        backend = DatabaseBackend()
+
+    for mac in (TEST_MAC, OTHER_MAC, "POOL:TEST"):
+        backend.clear(mac)
+    yield backend
+    for mac in (TEST_MAC, OTHER_MAC, "POOL:TEST"):
+        backend.clear(mac)
+    frappe.db.commit()
+
+
+@pytest.mark.queue
+@pytest.mark.integration
+class TestQueueContract:
+    """Tests every backend must pass"""
+
+    def test_enqueue_and_peek(self, backend):
+        """Test jobs come out oldest first and peek leaves them pending"""
+        assert backend.enqueue("TEST-QB-1", TEST_MAC, "POS-INV-1") == 1
+        assert backend.enqueue("TEST-QB-2", TEST_MAC, job_data="[align: centre]") == 2
+
+        job = backend.peek(TEST_MAC)
+
+        assert job["token"] == "TEST-QB-1"
+        assert job["invoice"] == "POS-INV-1"
+        assert job["job_data"] is None
+        assert job["printer_mac"] == TEST_MAC
+        assert "application/vnd.star.line" in job["media_types"]
+        assert backend.peek(TEST_MAC)["token"] == "TEST-QB-1"
+        frappe.logger().info(f"✅ {backend.name}: enqueue and peek")
+
+    def test_enqueue_many(self, backend):
+        """Test a batch keeps list order within each printer"""
+        backend.enqueue("TEST-QB-0", TEST_MAC)
+
+        positions = backend.enqueue_many([
+            {"job_token": "TEST-QB-1", "printer_mac": TEST_MAC},
+            {"job_token": "TEST-QB-2", "printer_mac": OTHER_MAC, "job_data": "[cut]"},
+            {"job_token": "TEST-QB-3", "printer_mac": TEST_MAC, "invoice_name": "POS-INV-3"}
+        ])
+
+        assert positions == {"TEST-QB-1": 2, "TEST-QB-2": 1, "TEST-QB-3": 3}
+        assert [job["job_token"] for job in backend.list(TEST_MAC)] == ["TEST-QB-0", "TEST-QB-1", "TEST-QB-3"]
+        assert backend.peek(OTHER_MAC)["job_data"] == "[cut]"
+
+    def test_claim_marks_fetched(self, backend):
+        """Test a claimed job is no longer offered but can be fetched again"""
+        backend.enqueue("TEST-QB-1", TEST_MAC)
+        backend.enqueue("TEST-QB-2", TEST_MAC)
+
+        job = backend.claim(TEST_MAC, "TEST-QB-1")
+
+        assert job["token"] == "TEST-QB-1"
+        assert backend.peek(TEST_MAC)["token"] == "TEST-QB-2"
+        assert backend.position(TEST_MAC, "TEST-QB-2") == 1
+        # Retried GET
+        assert backend.claim(TEST_MAC, "TEST-QB-1")["token"] == "TEST-QB-1"
+        assert backend.depth() == {TEST_MAC: 1}
+
+    def test_claim_without_token_takes_oldest(self, backend):
+        """Test GET without a token gets the oldest pending job"""
+        backend.enqueue("TEST-QB-1", TEST_MAC)
+        backend.enqueue("TEST-QB-2", TEST_MAC)
+
+        assert backend.claim(TEST_MAC)["token"] == "TEST-QB-1"
+        assert backend.claim(TEST_MAC)["token"] == "TEST-QB-2"
+        assert backend.claim(TEST_MAC) is None
+
+    def test_claim_checks_printer(self, backend):
+        """Test a printer cannot claim another printer's job"""
+        backend.enqueue("TEST-QB-1", TEST_MAC)
+
+        assert backend.claim(OTHER_MAC, "TEST-QB-1") is None
+        assert backend.claim(TEST_MAC, "TEST-QB-UNKNOWN") is None
+
+    def test_ack_removes_job(self, backend):
+        """Test acknowledged jobs leave the queue"""
+        backend.enqueue("TEST-QB-1", TEST_MAC)
+        backend.enqueue("TEST-QB-2", TEST_MAC)
+        backend.claim(TEST_MAC, "TEST-QB-1")
+
+        assert backend.ack("TEST-QB-1") is True
+        assert backend.ack("TEST-QB-1") is False
+        assert [job["job_token"] for job in backend.list(TEST_MAC)] == ["TEST-QB-2"]
+
+    def test_requeue_goes_to_back(self, backend):
+        """Test a requeued job is pending again behind the others"""
+        backend.enqueue("TEST-QB-1", TEST_MAC)
+        backend.enqueue("TEST-QB-2", TEST_MAC)
+        backend.claim(TEST_MAC, "TEST-QB-1")
+
+        assert backend.requeue("TEST-QB-1") is True
+
+        assert backend.position(TEST_MAC, "TEST-QB-2") == 1
+        assert backend.position(TEST_MAC, "TEST-QB-1") == 2
+        assert backend.depth(TEST_MAC) == {TEST_MAC: 2}
+
+    def test_bulk_variants(self, backend):
+        """Test list-of-tokens calls agree with the single-token ones"""
+        for i in range(1, 5):
+            backend.enqueue(f"TEST-QB-{i}", TEST_MAC)
+
+        assert backend.positions(TEST_MAC, ["TEST-QB-3", "TEST-QB-9"]) == {"TEST-QB-3": 3, "TEST-QB-9": 0}
+        assert backend.mark_fetched(["TEST-QB-1", "TEST-QB-2", "TEST-QB-9"]) == 2
+        assert backend.position(TEST_MAC, "TEST-QB-4") == 2
+        assert backend.ack_many(["TEST-QB-2", "TEST-QB-3", "TEST-QB-9"]) == {"TEST-QB-2", "TEST-QB-3"}
+        assert [job["job_token"] for job in backend.list(TEST_MAC)] == ["TEST-QB-1", "TEST-QB-4"]
+
+    def test_priority_classes(self, backend):
+        """Test POS receipts are served before reprints and test prints"""
+        backend.enqueue("TEST-QB-TEST", TEST_MAC, priority="test")
+        backend.enqueue("TEST-QB-REPRINT", TEST_MAC, priority="reprint")
+        backend.enqueue("TEST-QB-POS-1", TEST_MAC)
+        backend.enqueue("TEST-QB-POS-2", TEST_MAC, priority="pos")
+
+        jobs = backend.list(TEST_MAC)
+
+        assert [job["job_token"] for job in jobs] == ["TEST-QB-POS-1", "TEST-QB-POS-2", "TEST-QB-REPRINT", "TEST-QB-TEST"]
+        assert [job["priority"] for job in jobs] == ["pos", "pos", "reprint", "test"]
+        assert backend.peek(TEST_MAC)["token"] == "TEST-QB-POS-1"
+        assert backend.position(TEST_MAC, "TEST-QB-TEST") == 4
+        assert backend.claim(TEST_MAC)["token"] == "TEST-QB-POS-1"
+        # A printer may still fetch the job it was offered before a receipt arrived
+        assert backend.claim(TEST_MAC, "TEST-QB-REPRINT")["token"] == "TEST-QB-REPRINT"
+        assert backend.peek(TEST_MAC)["token"] == "TEST-QB-POS-2"
+        frappe.logger().info(f"✅ {backend.name}: priority classes")
+
+    def test_aging(self, backend):
+        """Test a low-priority job waiting longer than its delay goes first"""
+        backend.aging = 0.01
+        backend.enqueue("TEST-QB-TEST", TEST_MAC, priority="test")
+        time.sleep(0.05)
+        backend.enqueue("TEST-QB-POS", TEST_MAC)
+
+        assert backend.peek(TEST_MAC)["token"] == "TEST-QB-TEST"
+        assert backend.positions(TEST_MAC, ["TEST-QB-TEST", "TEST-QB-POS"]) == {"TEST-QB-TEST": 1, "TEST-QB-POS": 2}
+
+    def test_positions_follow_serving_order(self, backend):
+        """Test positions match list() across classes, aging and fetched jobs"""
+        backend.aging = 0.05
+        backend.enqueue("TEST-QB-TEST-1", TEST_MAC, priority="test")
+        backend.enqueue("TEST-QB-POS-1", TEST_MAC)
+        time.sleep(0.12)
+        backend.enqueue_many([
+            {"job_token": "TEST-QB-REPRINT", "printer_mac": TEST_MAC, "priority": "reprint"},
+            {"job_token": "TEST-QB-POS-2", "printer_mac": TEST_MAC},
+            {"job_token": "TEST-QB-TEST-2", "printer_mac": TEST_MAC, "priority": "test"}
+        ])
+        backend.claim(TEST_MAC, "TEST-QB-POS-1")
+        tokens = [job["job_token"] for job in backend.list(TEST_MAC)]
+
+        expected = {
+            job["job_token"]: position
+            for position, job in enumerate([job for job in backend.list(TEST_MAC) if job["status"] == "Pending"], 1)
+        }
+        expected["TEST-QB-POS-1"] = 0
+
+        assert backend.positions(TEST_MAC, tokens) == expected
+        assert backend.positions(OTHER_MAC, tokens) == dict.fromkeys(tokens, 0)
+
+    def test_assign_moves_next_job(self, backend):
+        """Test assign hands the next pending job of a queue to a printer, once"""
+        backend.enqueue("TEST-QB-POOL-1", "POOL:TEST")
+        backend.enqueue("TEST-QB-POOL-2", "POOL:TEST")
+
+        assert backend.assign("POOL:TEST", TEST_MAC) == "TEST-QB-POOL-1"
+        assert backend.peek(TEST_MAC)["token"] == "TEST-QB-POOL-1"
+        assert backend.peek("POOL:TEST")["token"] == "TEST-QB-POOL-2"
+        assert backend.claim(TEST_MAC, "TEST-QB-POOL-1")["printer_mac"] == TEST_MAC
+        assert backend.ack("TEST-QB-POOL-1")
+        assert backend.assign("POOL:TEST", OTHER_MAC) == "TEST-QB-POOL-2"
+        assert backend.assign("POOL:TEST", TEST_MAC) is None
+
+    def test_move_pending_moves_waiting_jobs(self, backend):
+        """Test move_pending moves pending jobs in order and leaves fetched jobs"""
+        backend.enqueue("TEST-QB-MOVE-1", TEST_MAC, invoice_name="TEST-INV")
+        backend.enqueue("TEST-QB-MOVE-2", TEST_MAC)
+        backend.enqueue("TEST-QB-MOVE-3", TEST_MAC)
+        backend.claim(TEST_MAC, "TEST-QB-MOVE-1")
+
+        moved = backend.move_pending({TEST_MAC: OTHER_MAC})
+
+        assert [job["job_token"] for job in moved] == ["TEST-QB-MOVE-2", "TEST-QB-MOVE-3"]
+        assert moved[0]["from_mac"] == TEST_MAC and moved[0]["to_mac"] == OTHER_MAC
+        assert backend.peek(OTHER_MAC)["token"] == "TEST-QB-MOVE-2"
+        assert backend.peek(TEST_MAC) is None
+        assert backend.claim(OTHER_MAC, "TEST-QB-MOVE-2")["printer_mac"] == OTHER_MAC
+        assert backend.ack("TEST-QB-MOVE-1")
+        assert backend.move_pending({}) == []
+
+    def test_list_depth_and_clear(self, backend):
+        """Test listing, depths per printer and clearing one printer"""
+        backend.enqueue("TEST-QB-1", TEST_MAC)
+        backend.enqueue("TEST-QB-2", OTHER_MAC)
+        backend.claim(TEST_MAC)
+
+        jobs = {job["job_token"]: job for job in backend.list()}
+        assert jobs["TEST-QB-1"]["status"] == "Fetched"
+        assert jobs["TEST-QB-2"]["status"] == "Pending"
+        assert jobs["TEST-QB-2"]["printer_mac"] == OTHER_MAC
+        assert backend.depth(OTHER_MAC) == {OTHER_MAC: 1}
+        assert backend.depth([TEST_MAC, OTHER_MAC, "POOL:TEST"]) == {OTHER_MAC: 1}
+        assert backend.depth([]) == {}
+
+        backend.clear(TEST_MAC)
+
+        assert backend.list(TEST_MAC) == []
+        assert backend.peek(OTHER_MAC)["token"] == "TEST-QB-2"
+
+    def test_claim_after_clear_elsewhere(self, backend):
+        """Test a queue cleared by another process still serves new jobs"""
+        backend.enqueue("TEST-QB-1", TEST_MAC)
+        backend.claim(TEST_MAC)
+        if backend.name == "redis":
+            other = RedisStreamsBackend(frappe.cache(), "test_cloudprnt")
+        else:
+            other = DatabaseBackend()
+
+        other.clear(TEST_MAC)
+        backend.enqueue("TEST-QB-2", TEST_MAC)
+
+        assert backend.claim(TEST_MAC)["token"] == "TEST-QB-2"
+
+    def test_find_queued_tokens(self, backend):
+        """Test find returns the printer of pending and fetched jobs only"""
+        backend.enqueue("TEST-QB-FIND-1", TEST_MAC)
+        backend.enqueue("TEST-QB-FIND-2", OTHER_MAC)
+        backend.claim(TEST_MAC)
+
+        assert backend.find(["TEST-QB-FIND-1", "TEST-QB-FIND-2", "TEST-QB-FIND-3"]) == {
+            "TEST-QB-FIND-1": TEST_MAC,
+            "TEST-QB-FIND-2": OTHER_MAC
+        }
+        assert backend.find([]) == {}
+
+    def test_summary_counts_per_status(self, backend):
+        """Test summary counts jobs per printer and status with the oldest pending job"""
+        backend.enqueue("TEST-QB-SUM-1", TEST_MAC)
+        backend.enqueue("TEST-QB-SUM-2", TEST_MAC)
+        backend.enqueue("TEST-QB-SUM-3", OTHER_MAC)
+        backend.claim(TEST_MAC)
+
+        summary = backend.summary()
+
+        assert summary[TEST_MAC]["counts"] == {"Fetched": 1, "Pending": 1}
+        assert summary[TEST_MAC]["oldest_pending_age"] >= 0
+        assert summary[TEST_MAC]["oldest_pending"] is not None
+        assert summary[OTHER_MAC]["counts"] == {"Pending": 1}
+        assert list(backend.summary(OTHER_MAC)) == [OTHER_MAC]
+
+    def test_page_with_cursor_and_filters(self, backend):
+        """Test pages follow the serving order and filters without overlap"""
+        for i in range(5):
+            backend.enqueue(f"TEST-QB-PAGE-{i}", TEST_MAC)
+        backend.enqueue("TEST-QB-PAGE-TEST", TEST_MAC, priority="test")
+        backend.claim(TEST_MAC)
+
+        tokens = []
+        jobs, cursor = backend.page(TEST_MAC, limit=2)
+        tokens += [job["job_token"] for job in jobs]
+        while cursor:
+            jobs, cursor = backend.page(TEST_MAC, after=cursor, limit=2)
+            tokens += [job["job_token"] for job in jobs]
+
+        assert tokens == [job["job_token"] for job in backend.list(TEST_MAC)]
+        assert len(tokens) == 6
+        pending, _ = backend.page(TEST_MAC, status="Pending")
+        assert "TEST-QB-PAGE-0" not in [job["job_token"] for job in pending]
+        tests, _ = backend.page(TEST_MAC, priority="test")
+        assert [job["job_token"] for job in tests] == ["TEST-QB-PAGE-TEST"]
+        with pytest.raises(ValueError):
+            backend.page(TEST_MAC, after="no cursor")
+
+    def test_page_across_printers(self, backend):
+        """Test one-job pages over several printers skip no job queued in the same instant"""
+        backend.enqueue_many([
+            {"job_token": f"TEST-QB-PAGE-{mac}-{i}", "printer_mac": mac}
+            for i in range(2) for mac in (TEST_MAC, OTHER_MAC)
+        ])
+
+        tokens = []
+        cursor = None
+        while True:
+            jobs, cursor = backend.page(after=cursor, limit=1)
+            tokens += [job["job_token"] for job in jobs]
+            if not cursor:
+                break
+
+        assert sorted(token for token in tokens if token.startswith("TEST-QB-PAGE-")) == sorted(
+            f"TEST-QB-PAGE-{mac}-{i}" for i in range(2) for mac in (TEST_MAC, OTHER_MAC)
+        )
+
+    def test_version_follows_changes(self, backend):
+        """Test version changes when a job is queued, claimed or acknowledged"""
+        versions = [backend.version(TEST_MAC)]
+        backend.enqueue("TEST-QB-VER-1", TEST_MAC)
+        versions.append(backend.version(TEST_MAC))
+        assert backend.version(TEST_MAC) == versions[-1]
+        backend.claim(TEST_MAC)
+        versions.append(backend.version(TEST_MAC))
+        backend.ack("TEST-QB-VER-1")
+        versions.append(backend.version(TEST_MAC))
+
+        assert len(set(versions[1:])) == 3
+        assert versions[1] != versions[0]
+
+
+class CountingClient:
+    """Redis client counting the stream entries it reads"""
+
+    def __init__(self, client):
+        self.client = client
+        self.entries_read = 0
+
+    def xrange(self, *args, **kwargs):
+        entries = self.client.xrange(*args, **kwargs)
+        self.entries_read += len(entries)
+        return entries
+
+    def xrevrange(self, *args, **kwargs):
+        entries = self.client.xrevrange(*args, **kwargs)
+        self.entries_read += len(entries)
+        return entries
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+@pytest.mark.queue
+@pytest.mark.integration
+@pytest.mark.skipif(not queue_backend.REDIS_AVAILABLE, reason="redis not installed")
+class TestRedisPositions:
+    """Tests for the cost of Redis queue positions"""
+
+    def setup_method(self):
+        """Setup before each test"""
+        self.client = CountingClient(frappe.cache())
+        self.backend = RedisStreamsBackend(self.client, "test_cloudprnt")
+        self.backend.clear(TEST_MAC)
+
+    def teardown_method(self):
+        """Cleanup after each test"""
+        self.backend.clear(TEST_MAC)
+
+    def test_enqueue_does_not_read_the_queue(self):
+        """Test enqueueing on a deep queue reads only the new entries"""
+        self.backend.enqueue_many([
+            {"job_token": f"TEST-QB-DEEP-{i}", "printer_mac": TEST_MAC, "job_data": "1B40" * 1000}
+            for i in range(50)
+        ])
+        self.client.entries_read = 0
+
+        position = self.backend.enqueue("TEST-QB-DEEP-50", TEST_MAC, priority="reprint")
+
+        assert position == 51
+        assert self.client.entries_read <= 1
+        frappe.logger().info(f"✅ Position 51 after reading {self.client.entries_read} entries")
+
+
+@pytest.mark.unit
+class TestBackendSelection:
+    """Tests for choosing the backend from the site config"""
+
+    def test_default_is_database(self):
+        """Test the database queue is used unless configured otherwise"""
+        assert make_backend({}).name == "db"
+
+    @pytest.mark.skipif(not queue_backend.REDIS_AVAILABLE, reason="redis not installed")
+    def test_redis_backend(self):
+        """Test the streams backend prefixes its keys with the site's db name"""
+        backend = make_backend({
+            "cloudprnt_queue_backend": "redis",
+            "db_name": "_abc123"
+        }, redis_url="redis://localhost:11000")
+
+        assert backend.name == "redis"
+        assert backend._stream(TEST_MAC.lower()) == "_abc123|cloudprnt_queue|" + TEST_MAC
+
+    @pytest.mark.skipif(not queue_backend.REDIS_AVAILABLE, reason="redis not installed")
+    def test_redis_backend_needs_url(self):
+        """Test the streams backend never falls back to the evicting cache Redis"""
+        with pytest.raises(ValueError):
+            make_backend({"cloudprnt_queue_backend": "redis", "db_name": "_abc123"})
+
+    def test_priority_aging_setting(self):
+        """Test the aging delay comes from the site config"""
+        assert make_backend({}).aging == queue_backend.DEFAULT_PRIORITY_AGING
+        assert make_backend({"cloudprnt_priority_aging": 5}).aging == 5
+
+    def test_priority_level(self):
+        """Test priority names, levels and the default"""
+        assert priority_level(None) == 0
+        assert priority_level("reprint") == 1
+        assert priority_level("2") == 2
+        with pytest.raises(ValueError):
+            priority_level("urgent")
+
+    def test_unknown_backend(self):
+        """Test a typo in the setting is an error, not a silent fallback"""
+        with pytest.raises(ValueError):
+            make_backend({"cloudprnt_queue_backend": "rabbitmq"})
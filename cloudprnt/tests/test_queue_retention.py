@@ -0,0 +1,182 @@
+"""
+Tests for CloudPRNT Queue Retention
+===================================
+
+Tests the scheduled sweep: payloads dropped from old fetched jobs,
+finished and expired jobs moved to the archive in bounded batches, and
+archive pruning.
+
+Run: bench --site sitename run-tests cloudprnt.tests.test_queue_retention
+"""
+
+import pytest
+import frappe
+from cloudprnt.print_queue_manager import add_job_to_queue, mark_job_fetched
+from cloudprnt.queue_backend import get_backend
+from cloudprnt.queue_retention import RETENTION_DEFAULTS, get_retention_settings, sweep_queue
+from cloudprnt.tests.utils import clear_test_print_queue
+
+TEST_MAC = "00:11:62:12:34:56"
+
+
+def clear_test_archive():
+    """Remove archive rows of test jobs"""
+    frappe.db.sql("DELETE FROM `tabCloudPRNT Print Queue Archive` WHERE job_token LIKE 'TEST-%'")
+    frappe.db.commit()
+
+
+def age_job(job_token, seconds, status=None):
+    """Pretend a queue row was last updated some seconds ago"""
+    frappe.db.sql("""
+        UPDATE `tabCloudPRNT Print Queue`
+        SET modified = NOW(6) - INTERVAL %s SECOND, status = COALESCE(%s, status)
+        WHERE job_token = %s
+    """, (seconds, status, job_token))
+    frappe.db.commit()
+
+
+def queue_row(job_token):
+    return frappe.db.get_value(
+        "CloudPRNT Print Queue",
+        {"job_token": job_token},
+        ["status", "job_data"],
+        as_dict=True
+    )
+
+
+def archive_row(job_token):
+    return frappe.db.get_value(
+        "CloudPRNT Print Queue Archive",
+        {"job_token": job_token},
+        ["outcome", "status", "printer_mac", "queued_at"],
+        as_dict=True
+    )
+
+
+def settings(**overrides):
+    values = dict(RETENTION_DEFAULTS)
+    values.update(overrides)
+    return values
+
+
+@pytest.mark.queue
+@pytest.mark.integration
+class TestQueueSweep:
+    """Tests for sweep_queue"""
+
+    def setup_method(self):
+        """Setup before each test"""
+        clear_test_print_queue()
+        clear_test_archive()
+
+    def teardown_method(self):
+        """Cleanup after each test"""
+        clear_test_print_queue()
+        clear_test_archive()
+
+    def test_finished_jobs_archived(self):
+        """Test printed and failed rows move to the archive without their payload"""
+        add_job_to_queue("TEST-SWEEP-DONE", TEST_MAC, job_data="[cut]")
+        add_job_to_queue("TEST-SWEEP-FAILED", TEST_MAC)
+        age_job("TEST-SWEEP-DONE", 0, status="Printed")
+        age_job("TEST-SWEEP-FAILED", 0, status="Error")
+
+        result = sweep_queue(settings())
+
+        assert result["finished"] == 2
+        assert queue_row("TEST-SWEEP-DONE") is None
+        archived = archive_row("TEST-SWEEP-DONE")
+        assert archived.outcome == "Finished"
+        assert archived.status == "Printed"
+        assert archived.printer_mac == TEST_MAC
+        assert archived.queued_at is not None
+        frappe.logger().info("✅ Finished jobs archived")
+
+    def test_expired_jobs_archived(self):
+        """Test jobs never confirmed or never fetched expire after their TTL"""
+        add_job_to_queue("TEST-SWEEP-FETCHED", TEST_MAC)
+        add_job_to_queue("TEST-SWEEP-PENDING", TEST_MAC)
+        add_job_to_queue("TEST-SWEEP-FRESH", TEST_MAC)
+        mark_job_fetched("TEST-SWEEP-FETCHED")
+        age_job("TEST-SWEEP-FETCHED", 7200)
+        age_job("TEST-SWEEP-PENDING", 2 * 86400)
+
+        result = sweep_queue(settings())
+
+        assert result["expired"] == 2
+        assert archive_row("TEST-SWEEP-FETCHED").status == "Fetched"
+        assert archive_row("TEST-SWEEP-PENDING").outcome == "Expired"
+        assert queue_row("TEST-SWEEP-FRESH").status == "Pending"
+
+    def test_payload_dropped_before_expiry(self):
+        """Test old fetched jobs lose their inline payload but stay queued until they expire"""
+        # Inline job_data, as queued before the payload store
+        get_backend().enqueue("TEST-SWEEP-PAYLOAD", TEST_MAC, job_data="[align: centre]")
+        get_backend().enqueue("TEST-SWEEP-WAITING", TEST_MAC, job_data="[align: centre]")
+        frappe.db.commit()
+        mark_job_fetched("TEST-SWEEP-PAYLOAD")
+        age_job("TEST-SWEEP-PAYLOAD", 900)
+        age_job("TEST-SWEEP-WAITING", 900)
+
+        result = sweep_queue(settings())
+
+        assert result["payloads_dropped"] == 1
+        assert queue_row("TEST-SWEEP-PAYLOAD") == {"status": "Fetched", "job_data": None}
+        # Pending jobs still need their payload
+        assert queue_row("TEST-SWEEP-WAITING").job_data == "[align: centre]"
+
+    def test_batches_are_bounded(self):
+        """Test one run archives at most batch size x max batches rows"""
+        for i in range(5):
+            add_job_to_queue(f"TEST-SWEEP-BATCH-{i}", TEST_MAC)
+            age_job(f"TEST-SWEEP-BATCH-{i}", 0, status="Printed")
+
+        first = sweep_queue(settings(cloudprnt_queue_sweep_batch=2, cloudprnt_queue_sweep_max_batches=2))
+        second = sweep_queue(settings(cloudprnt_queue_sweep_batch=2, cloudprnt_queue_sweep_max_batches=2))
+
+        assert first["finished"] == 4
+        assert second["finished"] == 1
+
+    def test_archive_pruned(self):
+        """Test archive rows past the retention are deleted"""
+        add_job_to_queue("TEST-SWEEP-OLD", TEST_MAC)
+        age_job("TEST-SWEEP-OLD", 0, status="Printed")
+        sweep_queue(settings())
+        frappe.db.sql("""
+            UPDATE `tabCloudPRNT Print Queue Archive`
+            SET archived_at = NOW(6) - INTERVAL 100 DAY
+            WHERE job_token = 'TEST-SWEEP-OLD'
+        """)
+        frappe.db.commit()
+
+        result = sweep_queue(settings())
+
+        assert result["archive_pruned"] >= 1
+        assert archive_row("TEST-SWEEP-OLD") is None
+
+    def test_history_pruned(self):
+        """Test job history rows past the history retention are deleted"""
+        add_job_to_queue("TEST-SWEEP-HIST", TEST_MAC)
+        frappe.db.sql("""
+            UPDATE `tabCloudPRNT Job History`
+            SET enqueued_at = NOW(6) - INTERVAL 100 DAY
+            WHERE job_token = 'TEST-SWEEP-HIST'
+        """)
+        frappe.db.commit()
+
+        result = sweep_queue(settings())
+
+        assert result["history_pruned"] >= 1
+        assert not frappe.db.exists("CloudPRNT Job History", {"job_token": "TEST-SWEEP-HIST"})
+
+
+@pytest.mark.unit
+class TestRetentionSettings:
+    """Tests for reading the retention settings"""
+
+    def test_defaults_and_overrides(self):
+        """Test site config values override the defaults"""
+        values = get_retention_settings({"cloudprnt_queue_fetched_ttl": "120"})
+
+        assert values["cloudprnt_queue_fetched_ttl"] == 120
+        assert values["cloudprnt_queue_sweep_batch"] == RETENTION_DEFAULTS["cloudprnt_queue_sweep_batch"]
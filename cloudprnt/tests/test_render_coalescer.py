@@ -0,0 +1,114 @@
+"""
+Tests for the Render Coalescer
+==============================
+
+Tests single-flight rendering of GET /job retries in the standalone
+server, within one process and across processes through Redis.
+
+Run: bench --site sitename run-tests cloudprnt.tests.test_render_coalescer
+"""
+
+import asyncio
+import pytest
+import frappe
+from cloudprnt.render_coalescer import RenderCoalescer
+
+
+async def run_inline(fn, *args, **kwargs):
+    """Run Redis helpers in the test's own Frappe context"""
+    return fn(*args, **kwargs)
+
+
+@pytest.mark.standalone
+@pytest.mark.integration
+class TestRenderCoalescer:
+    """Tests for RenderCoalescer"""
+
+    def setup_method(self):
+        """Setup before each test"""
+        self.key = (f"TEST-{frappe.generate_hash(length=8)}", "application/vnd.star.line", "thermal3")
+        self.coalescer = RenderCoalescer(run_inline, lock_ttl=5, result_ttl=5)
+        self.render_count = 0
+
+    async def slow_render(self):
+        """Render stand-in counting how often it really runs"""
+        self.render_count += 1
+        await asyncio.sleep(0.2)
+        return b"\x1b\x1dt rendered"
+
+    def test_concurrent_requests_render_once(self):
+        """Test retries in the same process await the first render"""
+        async def three_requests():
+            return await asyncio.gather(*[
+                self.coalescer.run(self.key, self.slow_render)
+                for _ in range(3)
+            ])
+
+        results = asyncio.run(three_requests())
+
+        assert self.render_count == 1
+        assert results == [b"\x1b\x1dt rendered"] * 3
+        assert self.coalescer.stats()["local_joins"] == 2
+        frappe.logger().info("✅ Three concurrent GETs, one render")
+
+    def test_retry_after_render_uses_handoff(self):
+        """Test a retry arriving after the render reuses the handed-off result"""
+        asyncio.run(self.coalescer.run(self.key, self.slow_render))
+
+        other_worker = RenderCoalescer(run_inline, lock_ttl=5, result_ttl=5)
+        result = asyncio.run(other_worker.run(self.key, self.slow_render))
+
+        assert self.render_count == 1
+        assert result == b"\x1b\x1dt rendered"
+        assert other_worker.stats()["handoff_hits"] == 1
+
+    def test_plain_client_shares_frappe_keys(self):
+        """Test a coalescer with its own Redis client sees results stored through frappe.cache()"""
+        import redis
+        asyncio.run(self.coalescer.run(self.key, self.slow_render))
+
+        threaded = RenderCoalescer(
+            asyncio.to_thread,
+            lock_ttl=5,
+            result_ttl=5,
+            client=redis.Redis.from_url(frappe.conf.redis_cache),
+            prefix=frappe.conf.db_name
+        )
+        result = asyncio.run(threaded.run(self.key, self.slow_render))
+
+        assert self.render_count == 1
+        assert result == b"\x1b\x1dt rendered"
+        assert threaded.stats()["handoff_hits"] == 1
+
+    def test_waits_for_render_in_other_worker(self):
+        """Test a worker waits while another one holds the Redis lock"""
+        self.coalescer._acquire_lock(self.key, "other-worker", 5)
+
+        async def other_worker_finishes():
+            await asyncio.sleep(0.2)
+            await self.coalescer._render_and_hand_off(self.key, "other-worker", self.slow_render)
+
+        async def scenario():
+            waiter = RenderCoalescer(run_inline, lock_ttl=5, result_ttl=5)
+            result, _ = await asyncio.gather(
+                waiter.run(self.key, self.slow_render),
+                other_worker_finishes()
+            )
+            return waiter, result
+
+        waiter, result = asyncio.run(scenario())
+
+        assert self.render_count == 1
+        assert result == b"\x1b\x1dt rendered"
+        assert waiter.stats()["remote_joins"] == 1
+
+    def test_failed_render_releases_lock(self):
+        """Test errors propagate and the next request can render"""
+        async def fail():
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError):
+            asyncio.run(self.coalescer.run(self.key, fail))
+
+        assert self.coalescer._acquire_lock(self.key, "next", 5) == True
+        self.coalescer._release_lock(self.key, "next")
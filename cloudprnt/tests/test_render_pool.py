@@ -0,0 +1,112 @@
+"""
+Tests for the Render Pool
+=========================
+
+Tests the process pool that renders markup jobs outside the
+standalone server's event loop.
+
+Run: bench --site sitename run-tests cloudprnt.tests.test_render_pool
+"""
+
+import asyncio
+import os
+import pytest
+import frappe
+from cloudprnt.render_pool import RenderPool, RenderTimeout
+from cloudprnt.tests.utils import get_test_markup_simple
+
+TEST_MAC = "00:11:62:12:34:56"
+
+
+@pytest.mark.standalone
+@pytest.mark.integration
+@pytest.mark.slow
+class TestRenderPool:
+    """Tests for RenderPool"""
+
+    def setup_method(self):
+        """Setup before each test"""
+        self.pool = RenderPool(
+            frappe.local.site,
+            os.path.abspath(frappe.local.sites_path),
+            workers=2,
+            timeout=30
+        )
+
+    def teardown_method(self):
+        """Cleanup after each test"""
+        self.pool.shutdown()
+
+    def test_render_in_worker(self):
+        """Test markup is rendered to Star Line Mode bytes by a worker"""
+        async def render():
+            await self.pool.warm_up()
+            return await self.pool.render(get_test_markup_simple(), TEST_MAC)
+
+        binary_data = asyncio.run(render())
+
+        assert binary_data.hex().upper().endswith("1B6403")
+        assert self.pool.stats()["completed"] == 1
+        frappe.logger().info("✅ Rendered job in worker process")
+
+    def test_concurrent_renders_are_queued(self):
+        """Test more jobs than workers all complete"""
+        async def render_many():
+            await self.pool.warm_up()
+            return await asyncio.gather(*[
+                self.pool.render(get_test_markup_simple(), TEST_MAC)
+                for _ in range(6)
+            ])
+
+        results = asyncio.run(render_many())
+
+        assert len(set(results)) == 1
+        assert self.pool.stats()["in_flight"] == 0
+        assert self.pool.queue_depth == 0
+
+    def test_deadline_raises_render_timeout(self):
+        """Test a job past its deadline returns control to the server"""
+        self.pool.timeout = 0.0001
+        markup = get_test_markup_simple() + "\n" * 200000
+
+        with pytest.raises(RenderTimeout):
+            asyncio.run(self.pool.render(markup, TEST_MAC))
+
+        assert self.pool.stats()["timeouts"] == 1
+        frappe.logger().info("✅ Render deadline enforced")
+
+    def test_overrun_recycles_workers(self):
+        """Test the worker still rendering at the deadline is replaced"""
+        markup = get_test_markup_simple() + "\n" * 200000
+
+        async def overrun():
+            await self.pool.warm_up()
+            self.pool.timeout = 0.01
+            with pytest.raises(RenderTimeout):
+                await self.pool.render(markup, TEST_MAC)
+            self.pool.timeout = 30
+            return await self.pool.render(get_test_markup_simple(), TEST_MAC)
+
+        assert asyncio.run(overrun()).hex().upper().endswith("1B6403")
+        assert self.pool.stats()["recycled"] == 1
+
+    def test_overrun_spares_other_workers(self):
+        """Test renders running beside an overrunning one still succeed"""
+        markup = get_test_markup_simple() + "\n" * 200000
+
+        async def overrun_beside_healthy():
+            await self.pool.warm_up()
+            self.pool.timeout = 0.05
+            stuck = asyncio.create_task(self.pool.render(markup, TEST_MAC))
+            await asyncio.sleep(0)
+            self.pool.timeout = 30
+            healthy = [self.pool.render(get_test_markup_simple(), TEST_MAC) for _ in range(4)]
+            return await asyncio.gather(stuck, *healthy, return_exceptions=True)
+
+        stuck, *healthy = asyncio.run(overrun_beside_healthy())
+
+        assert isinstance(stuck, RenderTimeout)
+        assert all(result.hex().upper().endswith("1B6403") for result in healthy)
+        assert self.pool.stats()["recycled"] == 1
+        assert self.pool.stats()["failures"] == 0
+        frappe.logger().info("✅ Only the overrunning worker was replaced")
@@ -0,0 +1,104 @@
+"""
+Tests for the Render Prefetcher
+===============================
+
+Tests speculative rendering started by positive polls in the
+standalone server.
+
+Run: bench --site sitename run-tests cloudprnt.tests.test_render_prefetcher
+"""
+
+import asyncio
+import time
+import pytest
+import frappe
+from cloudprnt.render_coalescer import RenderCoalescer
+from cloudprnt.render_prefetcher import RenderPrefetcher
+
+
+async def run_inline(fn, *args, **kwargs):
+    """Run Redis helpers in the test's own Frappe context"""
+    return fn(*args, **kwargs)
+
+
+@pytest.mark.standalone
+@pytest.mark.integration
+class TestRenderPrefetcher:
+    """Tests for RenderPrefetcher"""
+
+    def setup_method(self):
+        """Setup before each test"""
+        self.token = f"TEST-{frappe.generate_hash(length=8)}"
+        self.key = (self.token, "application/vnd.star.line", "thermal3")
+        self.coalescer = RenderCoalescer(run_inline, lock_ttl=5, result_ttl=5)
+        self.prefetcher = RenderPrefetcher(self.coalescer, budget=1)
+        self.render_count = 0
+
+    async def get_key(self):
+        """Coalescing key of the test job"""
+        return self.key
+
+    async def slow_render(self):
+        """Render stand-in counting how often it really runs"""
+        self.render_count += 1
+        await asyncio.sleep(0.3)
+        return b"\x1b\x1dt rendered"
+
+    def test_get_after_poll_is_served_warm(self):
+        """Test the GET following a positive poll reuses the prefetch"""
+        async def poll_then_get():
+            assert self.prefetcher.schedule(self.token, self.get_key, self.slow_render) == True
+            await asyncio.sleep(0.1)  # printer turnaround
+
+            started = time.monotonic()
+            result = await self.coalescer.run(self.key, self.slow_render)
+            self.prefetcher.record_get(self.key, time.monotonic() - started)
+            return result
+
+        result = asyncio.run(poll_then_get())
+        stats = self.prefetcher.stats()
+
+        assert result == b"\x1b\x1dt rendered"
+        assert self.render_count == 1
+        assert stats["hits"] == 1
+        assert stats["hit_rate"] == 1.0
+        assert stats["saved_ms_total"] > 0
+        frappe.logger().info(f"✅ Prefetch saved {stats['saved_ms_total']}ms")
+
+    def test_token_is_prefetched_once(self):
+        """Test repeated positive polls do not render the job again"""
+        async def two_polls():
+            first = self.prefetcher.schedule(self.token, self.get_key, self.slow_render)
+            second = self.prefetcher.schedule(self.token, self.get_key, self.slow_render)
+            await asyncio.gather(*self.prefetcher._tasks)
+            return first, second
+
+        assert asyncio.run(two_polls()) == (True, False)
+        assert self.render_count == 1
+
+    def test_budget_limits_concurrent_prefetches(self):
+        """Test prefetches beyond the budget are skipped"""
+        async def two_jobs():
+            first = self.prefetcher.schedule(self.token, self.get_key, self.slow_render)
+            second = self.prefetcher.schedule("OTHER", self.get_key, self.slow_render)
+            await asyncio.gather(*self.prefetcher._tasks)
+            return first, second
+
+        assert asyncio.run(two_jobs()) == (True, False)
+        assert self.prefetcher.stats()["skipped"] == 1
+
+    def test_disabled_with_zero_budget(self):
+        """Test a budget of 0 turns prefetching off"""
+        self.prefetcher.budget = 0
+
+        async def poll():
+            return self.prefetcher.schedule(self.token, self.get_key, self.slow_render)
+
+        assert asyncio.run(poll()) == False
+
+    def test_get_without_prefetch_is_a_miss(self):
+        """Test GETs for jobs that were not prefetched count as misses"""
+        self.prefetcher.record_get(self.key, 0.5)
+
+        assert self.prefetcher.stats()["misses"] == 1
+        assert self.prefetcher.stats()["hit_rate"] == 0.0
@@ -302,6 +302,25 @@ class TestStandaloneServerConcurrency:
         frappe.logger().info("✅ Concurrent requests test passed")
 
 
+@pytest.mark.skipif(not STANDALONE_AVAILABLE, reason="Standalone server not available")
+@pytest.mark.standalone
+@pytest.mark.unit
+class TestStandalonePrefetch:
+    """Tests for prefetching renders on positive polls"""
+
+    def test_unknown_media_type_not_prefetched(self):
+        """Test nothing is rendered ahead for a printer whose media type is not known yet"""
+        from cloudprnt import cloudprnt_standalone_server as server
+
+        server.LAST_MEDIA_TYPES.pop("00:11:62:44:44:44", None)
+        skipped = server.render_prefetcher.skipped
+
+        server.prefetch_job({"token": "TEST-PREFETCH-1", "job_data": "[cut]"}, "00:11:62:44:44:44")
+
+        assert server.render_prefetcher.skipped == skipped + 1
+        assert server.render_prefetcher.stats()["in_flight"] == 0
+
+
 def run_tests():
     """Helper to run all standalone server tests"""
     import sys
@@ -0,0 +1,165 @@
+"""
+Tests for CloudPRNT Star Line Mode Decoder
+==========================================
+
+Decodes the bytes produced by the job builder and renderers back into
+commands and printed lines, and compares renderer backends semantically.
+
+Run: bench --site sitename run-tests cloudprnt.tests.test_star_decoder
+"""
+
+import pytest
+import frappe
+from cloudprnt.print_job import StarCloudPRNTStarLineModeJob
+from cloudprnt.job_renderer import render_star_line
+from cloudprnt.cloudprnt_server import generate_star_line_job
+from cloudprnt.star_decoder import compare, decode, layout, preview_png, preview_text
+from cloudprnt.tests.utils import (
+    assert_png_valid,
+    assert_same_receipt,
+    get_test_markup_simple,
+    mock_printer_meta
+)
+
+TEST_MAC = "00:11:62:12:34:56"
+
+
+def ops(data, skip=("codepage",)):
+    """Decoded commands without the ones every job starts with"""
+    return [c for c in decode(data) if c["op"] not in skip]
+
+
+@pytest.mark.unit
+class TestDecodeCommands:
+    """Tests for decoding the job builder output"""
+
+    def setup_method(self):
+        """Setup before each test"""
+        self.job = StarCloudPRNTStarLineModeJob(mock_printer_meta())
+
+    def test_text_styles(self):
+        """Test alignment, emphasis, magnification and text"""
+        self.job.set_text_center_align()
+        self.job.set_font_magnification(2, 2)
+        self.job.set_text_emphasized()
+        self.job.add_text_line("Crème brûlée")
+        self.job.cancel_text_emphasized()
+
+        assert ops(self.job.print_job_builder) == [
+            {"op": "align", "align": "center"},
+            {"op": "magnify", "width": 2, "height": 2},
+            {"op": "emphasis", "on": True},
+            {"op": "text", "text": "Crème brûlée"},
+            {"op": "newline"},
+            {"op": "emphasis", "on": False}
+        ]
+
+    def test_barcode_qr_and_cut(self):
+        """Test barcode, QR code and cut decode with their parameters"""
+        self.job.add_barcode(4, 2, True, 40, "POS-INV-001")
+        self.job.add_qr_code(1, 4, "https://example.com/r/1")
+        self.job.cut()
+
+        barcode, qr, cut = ops(self.job.print_job_builder)
+
+        assert barcode["symbology"] == "CODE39"
+        assert barcode["hri"] is True
+        assert barcode["data"] == "POS-INV-001"
+        assert qr == {"op": "qr", "model": 2, "ecc": 1, "cell": 4, "data": "https://example.com/r/1"}
+        assert cut == {"op": "cut", "partial": True, "feed": True}
+
+    def test_line_mode_raster(self):
+        """Test ESC * r raster rows become one band, blank rows included"""
+        data = (
+            b"\x1b*rR\x1b*rA\x1b*rP0\x00"
+            + b"b\x02\x00\xff\x00" * 3
+            + b"\x1b*rY2\x00"
+            + b"b\x01\x00\x81"
+            + b"\x1b*rB"
+        )
+
+        [raster] = ops(data)
+
+        assert raster["width"] == 16
+        assert raster["height"] == 6
+        assert raster["data"][:2] == b"\xff\x00"
+        assert raster["data"][-2:] == b"\x81\x00"
+
+    def test_starprnt_raster(self):
+        """Test ESC GS S raster bands"""
+        data = b"\x1b\x1dS\x01\x02\x00\x02\x00\x00" + b"\xf0\x0f\x0f\xf0"
+
+        assert ops(data) == [{"op": "raster", "width": 16, "height": 2, "data": b"\xf0\x0f\x0f\xf0"}]
+
+    def test_unknown_command_does_not_stop_decoding(self):
+        """Test unknown commands are reported and the text after them kept"""
+        data = b"\x1b\x7fHello\n"
+
+        assert ops(data) == [
+            {"op": "unknown", "bytes": "1B7F"},
+            {"op": "text", "text": "Hello"},
+            {"op": "newline"}
+        ]
+
+
+@pytest.mark.unit
+class TestLayoutAndPreview:
+    """Tests for layout, comparison and previews"""
+
+    def test_layout_merges_blank_lines(self):
+        """Test equivalent byte streams give the same layout"""
+        one = StarCloudPRNTStarLineModeJob(mock_printer_meta())
+        one.add_text_line("Total")
+        one.add_new_line(2)
+
+        other = StarCloudPRNTStarLineModeJob(mock_printer_meta())
+        other.add_text("Tot")
+        other.add_text("al   ")
+        other.add_hex("0A0A")
+        other.add_new_line(1)
+
+        assert_same_receipt(one.print_job_builder, other.print_job_builder)
+        assert [b["type"] for b in layout(one.print_job_builder)] == ["text", "feed"]
+
+    def test_renderers_agree_on_simple_markup(self):
+        """Test both Star Line renderers print the same simple receipt"""
+        markup = get_test_markup_simple()
+
+        server = generate_star_line_job({"test_markup": markup, "printer_mac": TEST_MAC})
+        renderer = render_star_line(markup, TEST_MAC)
+
+        assert_same_receipt(server, renderer)
+        frappe.logger().info("✅ Renderers agree on simple markup")
+
+    def test_compare_reports_differences(self):
+        """Test a diff names the line that changed"""
+        one = StarCloudPRNTStarLineModeJob(mock_printer_meta())
+        one.add_text_line("TOTAL 10.00")
+        other = StarCloudPRNTStarLineModeJob(mock_printer_meta())
+        other.set_text_emphasized()
+        other.add_text_line("TOTAL 10.00")
+
+        diff = compare(one.print_job_builder, other.print_job_builder)
+
+        assert "-text left: 'TOTAL 10.00'" in diff
+        assert "+text left: 'TOTAL 10.00' (bold)" in diff
+
+    def test_text_preview(self):
+        """Test the text preview applies alignment and shows the cut"""
+        data = render_star_line(get_test_markup_simple(), TEST_MAC)
+
+        lines = preview_text(data).splitlines()
+
+        assert lines[0] == "Test Receipt".center(48).rstrip()
+        assert lines[1:4] == ["Line 1", "Line 2", "Line 3"]
+        assert lines[-1].startswith("- - -")
+
+    def test_png_preview(self):
+        """Test the PNG preview is a paper-wide image"""
+        from PIL import Image
+        import io
+
+        png = preview_png(render_star_line(get_test_markup_simple(), TEST_MAC))
+
+        assert_png_valid(png)
+        assert Image.open(io.BytesIO(png)).width == 576
@@ -0,0 +1,188 @@
+"""
+Tests for CloudPRNT Structured Logging
+======================================
+
+Tests JSON output, sampling, per-printer rate limits, the per-MAC
+verbosity override and the cost of disabled log calls.
+
+Run: bench --site sitename run-tests cloudprnt.tests.test_structured_log
+"""
+
+import io
+import json
+import logging
+import time
+import pytest
+import frappe
+from cloudprnt import structured_log
+
+TEST_MAC = "00:11:62:12:34:56"
+OTHER_MAC = "00:11:62:AB:CD:EF"
+
+
+def read_records(stream):
+    structured_log._listener.stop()
+    structured_log._listener.start()
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+@pytest.mark.unit
+@pytest.mark.standalone
+class TestStructuredLog:
+    """Tests for filtering and output"""
+
+    def setup_method(self):
+        """Setup before each test"""
+        structured_log.shutdown()
+        structured_log._queue_handler = None
+        logging.getLogger("cloudprnt").handlers = []
+        structured_log._overrides = {}
+        self.stream = io.StringIO()
+        self.sink = logging.StreamHandler(self.stream)
+
+    def teardown_method(self):
+        """Cleanup after each test"""
+        structured_log.shutdown()
+        structured_log._queue_handler = None
+        logging.getLogger("cloudprnt").handlers = []
+        structured_log._overrides = {}
+
+    def test_json_record(self):
+        """Test records are one JSON object with event, mac and fields"""
+        structured_log.configure("INFO", sample_rate=1, rate_limit=0, handler=self.sink)
+        log = structured_log.get_logger("cloudprnt.test")
+
+        log.info("job_ready", mac=TEST_MAC, token="TEST-LOG-001")
+        log.debug("poll", mac=TEST_MAC)
+
+        records = read_records(self.stream)
+        assert len(records) == 1
+        assert records[0]["event"] == "job_ready"
+        assert records[0]["mac"] == TEST_MAC
+        assert records[0]["token"] == "TEST-LOG-001"
+        assert records[0]["level"] == "INFO"
+
+    def test_get_logger_has_no_side_effects(self):
+        """Test importing a module that gets a logger leaves logging to Frappe"""
+        logging.getLogger("cloudprnt").addHandler(self.sink)
+        log = structured_log.get_logger("cloudprnt.test")
+
+        log.info("job_ready", mac=TEST_MAC, token="TEST-LOG-001")
+
+        assert structured_log._listener is None
+        assert logging.getLogger("cloudprnt").propagate
+        assert logging.getLogger("cloudprnt").handlers == [self.sink]
+        assert "job_ready" in self.stream.getvalue()
+        assert "TEST-LOG-001" in self.stream.getvalue()
+
+    def test_shutdown_restores_propagation(self):
+        """Test the queue handler is removed when the server stops"""
+        structured_log.configure("INFO", handler=self.sink)
+        assert not logging.getLogger("cloudprnt").propagate
+
+        structured_log.shutdown()
+
+        assert logging.getLogger("cloudprnt").propagate
+        assert logging.getLogger("cloudprnt").handlers == []
+
+    def test_rate_limit_per_printer(self):
+        """Test each printer has its own budget and suppressed records are counted"""
+        structured_log.configure("INFO", sample_rate=1, rate_limit=3, handler=self.sink)
+        log = structured_log.get_logger("cloudprnt.test")
+
+        for _ in range(10):
+            log.info("poll", mac=TEST_MAC)
+        log.info("poll", mac=OTHER_MAC)
+
+        records = read_records(self.stream)
+        assert [r["mac"] for r in records] == [TEST_MAC] * 3 + [OTHER_MAC]
+
+        # Refill the bucket: the next record reports what was dropped
+        structured_log._queue_handler.filters[0]._buckets[TEST_MAC][1] -= 60
+        log.info("poll", mac=TEST_MAC)
+        assert read_records(self.stream)[-1]["suppressed"] == 7
+
+    def test_sampling_keeps_warnings(self):
+        """Test sampling drops INFO records but never warnings"""
+        structured_log.configure("INFO", sample_rate=0, rate_limit=0, handler=self.sink)
+        log = structured_log.get_logger("cloudprnt.test")
+
+        log.info("poll", mac=TEST_MAC)
+        log.warning("invalid_mac", printer_mac="bad")
+
+        assert [r["event"] for r in read_records(self.stream)] == ["invalid_mac"]
+
+    def test_records_without_mac_pass(self):
+        """Test records without a printer are neither sampled nor rate-limited"""
+        structured_log.configure("INFO", sample_rate=0, rate_limit=1, handler=self.sink)
+        log = structured_log.get_logger("cloudprnt.test")
+
+        log.info("queue_backend", backend="db")
+        for _ in range(3):
+            log.error("sweep_failed")
+            logging.getLogger("cloudprnt.other").warning("plain warning")
+
+        events = [r["event"] for r in read_records(self.stream)]
+        assert events.count("sweep_failed") == 3
+        assert events.count("plain warning") == 3
+        assert "queue_backend" in events
+
+    def test_verbose_printer_bypasses_filters(self):
+        """Test a per-MAC override logs DEBUG for that printer only"""
+        structured_log.configure("WARNING", sample_rate=0, rate_limit=1, handler=self.sink)
+        log = structured_log.get_logger("cloudprnt.test")
+        structured_log._overrides = {TEST_MAC: (logging.DEBUG, time.time() + 60)}
+
+        for _ in range(5):
+            log.debug("poll", mac=TEST_MAC)
+        log.debug("poll", mac=OTHER_MAC)
+
+        records = read_records(self.stream)
+        assert len(records) == 5
+        assert all(r["mac"] == TEST_MAC for r in records)
+
+    def test_expired_override_is_ignored(self):
+        """Test an expired override falls back to the normal level"""
+        structured_log.configure("WARNING", sample_rate=1, rate_limit=0, handler=self.sink)
+        log = structured_log.get_logger("cloudprnt.test")
+        structured_log._overrides = {TEST_MAC: (logging.DEBUG, time.time() - 1)}
+
+        log.debug("poll", mac=TEST_MAC)
+
+        assert read_records(self.stream) == []
+
+    def test_disabled_call_cost(self):
+        """Test a filtered-out DEBUG call costs under a microsecond"""
+        structured_log.configure("INFO", handler=self.sink)
+        log = structured_log.get_logger("cloudprnt.test")
+
+        iterations = 100000
+        start = time.perf_counter()
+        for _ in range(iterations):
+            log.debug("poll", mac=TEST_MAC, status="200 OK")
+        per_call = (time.perf_counter() - start) / iterations
+
+        frappe.logger().info(f"⏱️  Disabled log call: {per_call * 1e9:.0f}ns")
+        assert per_call < 1e-6
+
+
+@pytest.mark.integration
+class TestPrinterLogLevel:
+    """Tests for the per-MAC override stored in Redis"""
+
+    def teardown_method(self):
+        """Cleanup after each test"""
+        frappe.cache().delete_value(structured_log.OVERRIDES_CACHE_KEY)
+        structured_log._overrides = {}
+
+    def test_set_and_clear(self):
+        """Test overrides are saved, loaded and cleared by MAC"""
+        structured_log.set_printer_log_level("00.11.62.12.34.56", "debug", minutes=5)
+
+        assert structured_log._overrides[TEST_MAC][0] == logging.DEBUG
+
+        structured_log.clear_printer_log_level(TEST_MAC)
+        structured_log.refresh_overrides()
+
+        assert TEST_MAC not in structured_log._overrides
+        frappe.logger().info("✅ Per-printer log level set and cleared")
@@ -0,0 +1,217 @@
+"""
+Tests for CloudPRNT Traffic Trace
+=================================
+
+Records exchanges through the trace middleware, checks anonymization and
+the trace file, and replays traces against an in-process fake server.
+
+Run: bench --site sitename run-tests cloudprnt.tests.test_traffic_trace
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+import pytest
+import frappe
+from urllib.parse import parse_qs
+from cloudprnt import printer_swarm, traffic_trace
+from cloudprnt.exchange_capture import build_entry
+from cloudprnt.traffic_trace import Anonymizer, load_trace, replay_trace, trace_from_capture
+
+TEST_MAC = "00:11:62:12:34:56"
+
+
+class FakeServer:
+    """ASGI app answering like the standalone server, logging what it receives"""
+
+    def __init__(self):
+        self.requests = []
+
+    async def __call__(self, scope, receive, send):
+        message = await receive()
+        query = parse_qs(scope["query_string"].decode())
+        self.requests.append((time.monotonic(), scope["method"], query, message.get("body", b"")))
+
+        if scope["method"] == "POST":
+            mac = json.loads(message["body"])["printerMAC"]
+            body = json.dumps({"jobReady": True, "jobToken": f"TEST-TRACE-{mac}"}).encode()
+        elif scope["method"] == "GET":
+            body = b"\x1b\x40" * 50
+        else:
+            body = b'{"message": "ok"}'
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": body})
+
+
+def call(app, method, path, query=b"", body=b""):
+    """Run one request through an ASGI app"""
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        pass
+
+    scope = {"type": "http", "method": method, "path": path, "query_string": query, "headers": []}
+    asyncio.run(app(scope, receive, send))
+
+
+def trace_events():
+    """One printer: poll, fetch and confirm a job, poll again"""
+    mac = Anonymizer("test").mac(TEST_MAC)
+    return [
+        {"t": 0.0, "e": "poll", "m": mac, "s": 200, "ms": 1, "b": {"printerMAC": mac, "statusCode": "200 OK"}, "r": 1},
+        {"t": 0.5, "e": "job", "m": mac, "s": 200, "ms": 1, "k": "J1", "ty": "application/vnd.star.line", "n": 100},
+        {"t": 1.0, "e": "delete", "m": mac, "s": 200, "ms": 1, "k": "J1", "c": "200 OK"},
+        {"t": 2.0, "e": "poll", "m": mac, "s": 200, "ms": 1, "b": {"printerMAC": mac, "statusCode": "200 OK"}, "r": 0}
+    ]
+
+
+@pytest.mark.unit
+@pytest.mark.standalone
+class TestTraceRecording:
+    """Tests for the recorder and the trace file"""
+
+    def setup_method(self):
+        """Setup before each test"""
+        self.directory = tempfile.mkdtemp()
+        self.app = traffic_trace.TraceMiddleware(FakeServer())
+
+    def teardown_method(self):
+        """Cleanup after each test"""
+        traffic_trace.stop_recording()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_anonymizer(self):
+        """Test MACs map to stable locally administered MACs and tokens to opaque ids"""
+        anonymizer = Anonymizer("salt")
+
+        mac = anonymizer.mac("00.11.62.12.34.56")
+
+        assert mac == anonymizer.mac(TEST_MAC)
+        assert mac.startswith("02:") and TEST_MAC[3:] not in mac
+        assert Anonymizer("other").mac(TEST_MAC) != mac
+        assert anonymizer.token("POS-INV-0001").startswith("J")
+
+    def test_nothing_recorded_when_disabled(self):
+        """Test requests pass through when no trace is active"""
+        call(self.app, "POST", "/poll", body=json.dumps({"printerMAC": "00.11.62.12.34.56"}).encode())
+
+        assert os.listdir(self.directory) == []
+
+    def test_exchanges_recorded_anonymized(self):
+        """Test poll, job and delete are recorded without real MACs or tokens"""
+        path = traffic_trace.start_recording(self.directory, salt="test")
+
+        call(self.app, "POST", "/poll", body=json.dumps({"printerMAC": "00.11.62.12.34.56", "statusCode": "200 OK"}).encode())
+        call(self.app, "GET", "/job", query=b"mac=00.11.62.12.34.56&type=application/vnd.star.line&token=POS-INV-0001")
+        call(self.app, "DELETE", "/job", query=b"mac=00.11.62.12.34.56&token=POS-INV-0001&code=200%20OK")
+        call(self.app, "GET", "/health")
+        traffic_trace.stop_recording()
+
+        with gzip.open(path, "rt") as f:
+            raw = f.read()
+        assert "12.34.56" not in raw and "12:34:56" not in raw and "POS-INV" not in raw
+
+        header, events = load_trace(path)
+        assert header["trace"] == traffic_trace.TRACE_VERSION
+        assert [e["e"] for e in events] == ["poll", "job", "delete"]
+        assert events[0]["r"] == 1
+        assert events[0]["b"]["statusCode"] == "200 OK"
+        assert events[1]["n"] == 100
+        assert events[1]["k"] == events[2]["k"]
+        assert events[2]["c"] == "200 OK"
+        assert len({e["m"] for e in events}) == 1
+
+    def test_truncated_trace_is_readable(self):
+        """Test a trace cut by a crash is read up to its last complete event"""
+        path = os.path.join(self.directory, "cut.jsonl.gz")
+        lines = "".join(json.dumps(e) + "\n" for e in trace_events())
+        data = gzip.compress(lines.encode())
+
+        with open(path, "wb") as f:
+            f.write(data[:-30])
+
+        _, events = load_trace(path)
+
+        assert 0 < len(events) <= 4
+
+    def test_trace_from_capture(self):
+        """Test debug capture exchanges convert to trace events"""
+        entries = [
+            build_entry(
+                {"method": "POST", "query": "", "body": json.dumps({"printerMAC": "00.11.62.12.34.56"})},
+                {"status": 200, "body": '{"jobReady": false}', "bytes_sent": 19}
+            ),
+            build_entry(
+                {"method": "GET", "query": "mac=00.11.62.12.34.56&token=POS-INV-1&type=text/plain", "body": ""},
+                {"status": 404, "body": "", "bytes_sent": 0}
+            )
+        ]
+
+        events = trace_from_capture(entries, salt="test")
+
+        assert [e["e"] for e in events] == ["poll", "job"]
+        assert events[0]["m"] == Anonymizer("test").mac(TEST_MAC)
+        assert events[1]["s"] == 404
+
+
+@pytest.mark.unit
+@pytest.mark.skipif(not printer_swarm.HTTPX_AVAILABLE, reason="httpx not installed")
+class TestTraceReplay:
+    """Tests for replaying a trace"""
+
+    def replay(self, server, events, **kwargs):
+        return asyncio.run(replay_trace(
+            events,
+            "http://replay.test",
+            transport=printer_swarm.httpx.ASGITransport(app=server),
+            **kwargs
+        ))
+
+    def test_replay_uses_server_tokens_and_speed(self):
+        """Test events keep their order and spacing, compressed by the speed"""
+        server = FakeServer()
+
+        result = self.replay(server, trace_events(), speed=10)
+
+        methods = [method for _, method, _, _ in server.requests]
+        assert methods == ["POST", "GET", "DELETE", "POST"]
+        # GET and DELETE use the token the server handed out
+        mac = trace_events()[0]["m"].replace(":", ".")
+        assert server.requests[1][2]["token"] == [f"TEST-TRACE-{mac}"]
+        # 2 s of trace at 10x
+        elapsed = server.requests[-1][0] - server.requests[0][0]
+        assert 0.15 <= elapsed < 1.0
+        assert result["jobs"]["printed"] == 1
+        frappe.logger().info(f"✅ Replay lag p99: {result['schedule_lag_ms']['p99']} ms")
+
+    def test_enqueue_before_positive_polls(self):
+        """Test a job is queued before each poll answered with a job in production"""
+        queued = []
+
+        async def enqueue(token, mac):
+            queued.append((token, mac))
+
+        self.replay(FakeServer(), trace_events(), speed=50, enqueue=enqueue)
+
+        assert len(queued) == 1
+        assert queued[0][0].startswith(traffic_trace.REPLAY_TOKEN_PREFIX)
+
+    def test_copies_multiply_printers(self):
+        """Test every printer is replayed once per copy with its own MAC"""
+        server = FakeServer()
+
+        result = self.replay(server, trace_events(), speed=50, copies=3)
+
+        macs = {json.loads(body)["printerMAC"] for _, method, _, body in server.requests if method == "POST"}
+        assert len(macs) == 3
+        assert result["printers"] == 3
+
+    def test_speed_is_bounded(self):
+        """Test speeds above the maximum are rejected"""
+        with pytest.raises(ValueError):
+            self.replay(FakeServer(), trace_events(), speed=traffic_trace.MAX_SPEED + 1)
@@ -10,13 +10,15 @@ import json
 from datetime import datetime, timedelta
 
 
-def create_test_printer(mac_address="00:11:62:12:34:56", label="Test Printer", use_mqtt=False):
+def create_test_printer(mac_address="00:11:62:12:34:56", label="Test Printer", use_mqtt=False, printer_pool=None, backup_printer=None):
     """
     Create a test printer in CloudPRNT Settings
 
     :param mac_address: Printer MAC address (with colons)
     :param label: Printer label
     :param use_mqtt: Enable MQTT for this printer
+    :param printer_pool: Printer Pool name (optional)
+    :param backup_printer: Backup Printer label or pool name (optional)
     :return: Printer MAC address
     """
     try:
@@ -31,7 +33,9 @@ def create_test_printer(mac_address="00:11:62:12:34:56", label="Test Printer", u
         settings.append("printers", {
             "label": label,
             "mac_address": mac_address,
-            "use_mqtt": 1 if use_mqtt else 0
+            "use_mqtt": 1 if use_mqtt else 0,
+            "printer_pool": printer_pool,
+            "backup_printer": backup_printer
         })
         settings.save()
         frappe.db.commit()
@@ -58,6 +62,21 @@ def remove_test_printer(mac_address="00:11:62:12:34:56"):
         frappe.log_error(f"Error removing test printer: {str(e)}", "remove_test_printer")
 
 
+def set_printer_status(mac_address, online=1, printing_in_progress=0, seconds_ago=0, status_code="200 OK"):
+    """
+    Set the status a test printer reported on its last poll
+
+    :param mac_address: Printer MAC address (with colons)
+    :param seconds_ago: Age of the last poll (last_activity)
+    """
+    frappe.db.sql("""
+        UPDATE `tabCloudPRNT Printers`
+        SET online = %s, printing_in_progress = %s, last_activity = %s, status_code = %s
+        WHERE parent = 'CloudPRNT Settings' AND mac_address = %s
+    """, (online, printing_in_progress, frappe.utils.now_datetime().timestamp() - seconds_ago, status_code, mac_address))
+    frappe.db.commit()
+
+
 def create_test_invoice(customer="_Test Customer", company="_Test Company", items=None):
     """
     Create a test POS Invoice
@@ -172,6 +191,9 @@ def clear_test_print_queue(printer_mac=None):
 
         frappe.db.commit()
 
+        # Let the next test queue the same tokens again
+        frappe.cache().delete_keys("cloudprnt_enqueue|TEST-")
+
     except Exception as e:
         frappe.log_error(f"Error clearing test print queue: {str(e)}", "clear_test_print_queue")
 
@@ -259,6 +281,20 @@ def assert_png_valid(png_data):
     assert png_data[:8] == b'\x89PNG\r\n\x1a\n', "PNG signature invalid"
 
 
+def assert_same_receipt(expected, actual):
+    """
+    Assert that two Star Line Mode / StarPRNT jobs print the same receipt
+
+    :param expected: Job bytes or hex string
+    :param actual: Job bytes or hex string
+    :raises AssertionError: With a diff of the decoded layouts
+    """
+    from cloudprnt.star_decoder import compare
+
+    diff = compare(expected, actual)
+    assert not diff, "Receipts differ:\n" + "\n".join(diff)
+
+
 def assert_mac_address_valid(mac_address):
     """
     Assert that a MAC address is valid (colon notation)
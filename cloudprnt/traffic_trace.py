@@ -0,0 +1,530 @@
+"""
+CloudPRNT Traffic Trace
+=======================
+
+Records real printer traffic into a compact trace file and replays it
+against a staging server, faster than real time.
+
+Recording (standalone server):
+    Set "cloudprnt_trace_dir" in site_config.json. Every poll, job fetch
+    and DELETE is appended to <dir>/cloudprnt-trace-<date>-<pid>.jsonl.gz
+    until "cloudprnt_trace_max_events" (default 1,000,000) is reached.
+
+    MAC addresses become locally administered MACs (02:xx:xx:xx:xx:xx) and
+    job tokens become opaque ids, both through an HMAC with a salt that is
+    never written to the trace. The same printer keeps the same anonymous
+    MAC within a trace ("cloudprnt_trace_salt" keeps it across traces).
+
+Trace format (gzip JSON lines):
+    {"trace": 1, "started": 1718960000.0, "source": "standalone"}
+    {"t": 0.512, "e": "poll", "m": "02:8E:..", "s": 200, "ms": 3.1, "b": {...}, "r": 1}
+    {"t": 0.873, "e": "job", "m": "02:8E:..", "s": 200, "ms": 41.0, "k": "J5c1f..", "ty": "...", "n": 2412}
+    {"t": 2.911, "e": "delete", "m": "02:8E:..", "s": 200, "ms": 6.2, "k": "J5c1f..", "c": "200 OK"}
+
+    t is seconds since the start of the trace, b the poll body and r
+    whether the poll was answered with a job.
+
+Replay:
+    Each printer of the trace becomes a VirtualPrinter (printer_swarm) that
+    sends its own requests at their recorded offsets divided by the speed,
+    so inter-arrival times keep their original distribution. Job fetches
+    and DELETEs use the token the staging server handed out on the last
+    poll. With an enqueue callable, a job is queued before every poll that
+    was answered with a job in production.
+
+    Exchanges downloaded from the debug capture (exchange_capture) can be
+    turned into a trace with trace_from_capture().
+
+Usage:
+    bench --site staging.local cloudprnt-replay --trace saturday.jsonl.gz --speed 20
+"""
+
+import asyncio
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+from datetime import datetime
+from urllib.parse import parse_qs
+
+from cloudprnt import printer_swarm
+from cloudprnt.exchange_capture import _mac_from_request, _replay, normalize_mac
+from cloudprnt.printer_simulator import PREFERRED_MEDIA_TYPE, job_params, poll_reply
+from cloudprnt.printer_swarm import SWARM_TOKEN_PREFIX, SwarmConfig, SwarmStats, VirtualPrinter, percentile
+
+TRACE_VERSION = 1
+DEFAULT_MAX_EVENTS = 1_000_000
+FLUSH_INTERVAL = 5  # seconds, a crash loses at most this much of the trace
+MAX_SPEED = 50
+REPLAY_TOKEN_PREFIX = f"{SWARM_TOKEN_PREFIX}REPLAY-"
+
+# Request method -> event kind
+EVENT_KINDS = {"POST": "poll", "GET": "job", "DELETE": "delete"}
+
+# The active recorder (None: tracing disabled)
+_recorder = None
+
+
+class Anonymizer:
+    """
+    Stable, irreversible replacement of MAC addresses and job tokens
+
+    :param salt: HMAC key (random if None)
+    """
+
+    def __init__(self, salt=None):
+        self.salt = (salt or secrets.token_hex(16)).encode()
+        self._macs = {}
+
+    def _digest(self, value):
+        return hmac.new(self.salt, value.encode(), hashlib.sha256).digest()
+
+    def mac(self, mac_address):
+        """Locally administered MAC standing in for `mac_address` (colons)"""
+        mac = normalize_mac(mac_address)
+        if not mac:
+            return None
+        if mac not in self._macs:
+            self._macs[mac] = "02:" + ":".join(f"{b:02X}" for b in self._digest(mac)[:5])
+        return self._macs[mac]
+
+    def token(self, job_token):
+        """Opaque id standing in for a job token"""
+        if not job_token:
+            return None
+        return "J" + self._digest(job_token).hex()[:15]
+
+    def poll_body(self, body):
+        """Poll body with the printer MAC and any job token replaced"""
+        body = dict(body)
+        if body.get("printerMAC"):
+            body["printerMAC"] = self.mac(body["printerMAC"]).replace(":", ".")
+        if body.get("jobToken"):
+            body["jobToken"] = self.token(body["jobToken"])
+        body.pop("uniqueID", None)
+        return body
+
+
+def build_event(anonymizer, offset, method, query_string, request_body, status, ms, response_body=b"", bytes_sent=0):
+    """
+    Trace event of one exchange
+
+    :param anonymizer: Anonymizer
+    :param offset: Seconds since the start of the trace
+    :param method: HTTP method (POST poll, GET job, DELETE delete)
+    :param query_string: Raw query string (bytes)
+    :param request_body: Request body (bytes)
+    :param status: Response status code
+    :param ms: Request duration in milliseconds
+    :param response_body: First bytes of the response (polls only)
+    :param bytes_sent: Response size
+    :return: Event dict, or None for requests that are not printer traffic
+    """
+    kind = EVENT_KINDS.get(method)
+    mac = _mac_from_request(query_string, request_body)
+    if not kind or not mac:
+        return None
+
+    event = {"t": round(offset, 3), "e": kind, "m": anonymizer.mac(mac), "s": status, "ms": round(ms, 2)}
+    query = parse_qs(query_string.decode("latin-1"))
+
+    if kind == "poll":
+        try:
+            body = json.loads(request_body)
+        except ValueError:
+            body = {}
+        event["b"] = anonymizer.poll_body(body)
+        try:
+            event["r"] = int(bool(json.loads(response_body).get("jobReady")))
+        except (ValueError, AttributeError):
+            event["r"] = 0
+    elif kind == "job":
+        event["k"] = anonymizer.token(query.get("token", [None])[0])
+        event["ty"] = query.get("type", [None])[0]
+        event["n"] = bytes_sent
+    else:
+        event["k"] = anonymizer.token(query.get("token", [None])[0])
+        event["c"] = query.get("code", [None])[0]
+
+    return event
+
+
+class TraceRecorder:
+    """
+    Appends events to a gzip JSON lines trace
+
+    :param path: Trace file path
+    :param salt: Anonymization salt (random if None)
+    :param max_events: Stop recording after this many events
+    :param source: Recorded in the header
+    """
+
+    def __init__(self, path, salt=None, max_events=DEFAULT_MAX_EVENTS, source="standalone"):
+        self.path = path
+        self.anonymizer = Anonymizer(salt)
+        self.max_events = max_events
+        self.events = 0
+        self.started = time.time()
+        self._started_monotonic = time.monotonic()
+        self._flushed_at = self._started_monotonic
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self._write({"trace": TRACE_VERSION, "started": self.started, "source": source})
+
+    def _write(self, obj):
+        self._file.write(json.dumps(obj, separators=(",", ":")) + "\n")
+
+    @property
+    def full(self):
+        return self.events >= self.max_events
+
+    def offset(self):
+        """Seconds since the start of the trace"""
+        return time.monotonic() - self._started_monotonic
+
+    def record(self, event):
+        if event is None or self.full or self._file.closed:
+            return
+        self._write(event)
+        self.events += 1
+        now = time.monotonic()
+        if now - self._flushed_at >= FLUSH_INTERVAL:
+            self._file.flush()
+            self._flushed_at = now
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+def trace_path(directory):
+    """New trace file name in `directory`, unique per process"""
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"cloudprnt-trace-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}.jsonl.gz")
+
+
+def start_recording(directory, salt=None, max_events=DEFAULT_MAX_EVENTS):
+    """
+    Start recording traffic seen by TraceMiddleware
+
+    :param directory: Directory for the trace file
+    :return: Trace file path
+    """
+    global _recorder
+    stop_recording()
+    _recorder = TraceRecorder(trace_path(directory), salt=salt, max_events=max_events)
+    return _recorder.path
+
+
+def stop_recording():
+    """Close the active trace, if any"""
+    global _recorder
+    if _recorder is not None:
+        _recorder.close()
+        _recorder = None
+
+
+def start_from_site_config(site_config):
+    """Start recording if "cloudprnt_trace_dir" is set, return the trace path or None"""
+    directory = site_config.get("cloudprnt_trace_dir")
+    if not directory:
+        return None
+    return start_recording(
+        directory,
+        salt=site_config.get("cloudprnt_trace_salt"),
+        max_events=int(site_config.get("cloudprnt_trace_max_events", DEFAULT_MAX_EVENTS))
+    )
+
+
+class TraceMiddleware:
+    """
+    ASGI middleware adding every printer exchange to the active trace
+
+    When no trace is being recorded it only costs a None check per request.
+
+    :param app: ASGI application
+    :param paths: Paths to record
+    """
+
+    def __init__(self, app, paths=("/", "/poll", "/job")):
+        self.app = app
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        recorder = _recorder
+        if scope["type"] != "http" or recorder is None or recorder.full or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+
+        offset = recorder.offset()
+        start = time.perf_counter()
+
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+        body = b"".join(chunks)
+
+        response = {"status": None, "body": b"", "bytes_sent": 0}
+
+        async def send_and_measure(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                response["bytes_sent"] += len(chunk)
+                if scope["method"] == "POST" and len(response["body"]) < 4096:
+                    response["body"] += chunk
+            await send(message)
+
+        try:
+            await self.app(scope, _replay(body, receive), send_and_measure)
+        finally:
+            recorder.record(build_event(
+                recorder.anonymizer,
+                offset,
+                scope["method"],
+                scope.get("query_string", b""),
+                body,
+                response["status"],
+                (time.perf_counter() - start) * 1000,
+                response["body"],
+                response["bytes_sent"]
+            ))
+
+
+def load_trace(path):
+    """
+    Read a trace file
+
+    A trace cut short by a crash is read up to its last complete line.
+
+    :param path: Trace file (.jsonl.gz or plain .jsonl)
+    :return: (header dict, list of events sorted by t)
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    header = {}
+    events = []
+    with opener(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    obj = json.loads(line)
+                except ValueError:
+                    break  # truncated last line
+                if "trace" in obj:
+                    header = obj
+                else:
+                    events.append(obj)
+        except EOFError:
+            pass
+    events.sort(key=lambda e: e["t"])
+    return header, events
+
+
+def trace_from_capture(entries, salt=None):
+    """
+    Convert debug capture exchanges (exchange_capture.download_capture) to trace events
+
+    :param entries: Exchange dicts, e.g. read from the downloaded JSON lines
+    :param salt: Anonymization salt (random if None)
+    :return: List of events sorted by t
+    """
+    import base64
+
+    def raw(body):
+        if not body:
+            return b""
+        if body.get("encoding") == "base64":
+            return base64.b64decode(body["data"])
+        return body.get("data", "").encode("utf-8")
+
+    anonymizer = Anonymizer(salt)
+    entries = sorted(entries, key=lambda e: e["ts"])
+    events = []
+    for entry in entries:
+        request, response = entry["request"], entry["response"]
+        event = build_event(
+            anonymizer,
+            entry["ts"] - entries[0]["ts"],
+            request.get("method"),
+            (request.get("query") or "").encode("latin-1"),
+            raw(request.get("body")),
+            response.get("status"),
+            0,
+            raw(response.get("body")),
+            response.get("bytes_sent", 0)
+        )
+        if event:
+            events.append(event)
+    return events
+
+
+def trace_summary(events):
+    """
+    Shape of a trace
+
+    :return: Dict with duration, printers, event counts and peak requests per second
+    """
+    if not events:
+        return {"duration_s": 0, "printers": 0, "events": {}, "peak_rps": 0}
+    counts = {}
+    per_second = {}
+    for event in events:
+        counts[event["e"]] = counts.get(event["e"], 0) + 1
+        second = int(event["t"])
+        per_second[second] = per_second.get(second, 0) + 1
+    return {
+        "duration_s": round(events[-1]["t"] - events[0]["t"], 3),
+        "printers": len({event["m"] for event in events}),
+        "events": counts,
+        "peak_rps": max(per_second.values())
+    }
+
+
+def _copy_mac(mac, copy):
+    """MAC of copy number `copy` of a traced printer (copy 0 is the printer itself)"""
+    if not copy:
+        return mac
+    parts = mac.split(":")
+    parts[1] = f"{(int(parts[1], 16) + copy) & 0xFF:02X}"
+    return ":".join(parts)
+
+
+class ReplayPrinter(VirtualPrinter):
+    """
+    Replays the events of one traced printer
+
+    :param mac_address: MAC address to send (colons)
+    :param events: This printer's events, sorted by t
+    :param stats: Shared SwarmStats
+    :param lags: Shared list of scheduling delays in ms
+    """
+
+    def __init__(self, mac_address, events, client, stats, config, target="standalone", enqueue=None, lags=None):
+        super().__init__(mac_address, client, stats, config, target)
+        self.mac_address = mac_address
+        self.events = events
+        self.enqueue = enqueue
+        self.lags = lags if lags is not None else []
+        self.token = None
+        self.queued = False
+
+    async def run(self, started_at, speed):
+        """
+        Send every event at started_at + t / speed (event loop time)
+        """
+        loop = asyncio.get_running_loop()
+        for event in self.events:
+            due = started_at + event["t"] / speed
+            delay = due - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.lags.append(max(0.0, loop.time() - due) * 1000)
+            await self.send(event)
+
+    async def send(self, event):
+        kind = event["e"]
+
+        if kind == "poll":
+            if event.get("r") and self.enqueue and not self.token and not self.queued:
+                token = f"{REPLAY_TOKEN_PREFIX}{secrets.token_hex(6)}"
+                try:
+                    await self.enqueue(token, self.mac_address)
+                    self.stats.jobs_enqueued += 1
+                    self.queued = True
+                except Exception:
+                    self.stats.record("enqueue", "error")
+
+            body = dict(event.get("b") or {})
+            body["printerMAC"] = self.mac_display
+            response = await self.request("poll", "POST", self.paths["poll"], json=body)
+            if response is None or response.status_code != 200:
+                return
+            try:
+                data = poll_reply(response.json())
+            except ValueError:
+                return
+            if data.get("jobReady") and data.get("jobToken"):
+                self.token = data["jobToken"]
+
+        elif kind == "job":
+            await self.request("job", "GET", self.paths["job"], params=job_params(
+                self.mac_display,
+                self.token or event.get("k"),
+                event.get("ty") or PREFERRED_MEDIA_TYPE
+            ))
+
+        elif kind == "delete":
+            code = event.get("c") or "200 OK"
+            await self.confirm(self.token or event.get("k"), code)
+            if self.token:
+                if code.startswith("2"):
+                    self.stats.jobs_printed += 1
+                else:
+                    self.stats.jobs_failed += 1
+            self.token = None
+            self.queued = False
+
+
+async def replay_trace(events, server_url, speed=1.0, target="standalone", enqueue=None,
+                       copies=1, timeout=10, transport=None):
+    """
+    Replay trace events against a server
+
+    :param events: Events from load_trace() or trace_from_capture()
+    :param server_url: Base URL of the staging server
+    :param speed: Time compression, 1 (real time) to MAX_SPEED
+    :param target: "standalone" or "frappe"
+    :param enqueue: Async callable(job_token, printer_mac) queueing a job (optional)
+    :param copies: Replay every printer this many times, with distinct MACs
+    :param timeout: Request timeout in seconds
+    :param transport: httpx transport (tests use httpx.ASGITransport)
+    :return: Summary dict (printer_swarm format plus schedule lag)
+    """
+    if not printer_swarm.HTTPX_AVAILABLE:
+        raise RuntimeError("httpx is required for replay: pip install httpx")
+    if not 0 < speed <= MAX_SPEED:
+        raise ValueError(f"speed must be between 0 and {MAX_SPEED}")
+    if target not in printer_swarm.ENDPOINTS:
+        raise ValueError(f"Unknown target {target}, expected one of {', '.join(printer_swarm.ENDPOINTS)}")
+
+    by_printer = {}
+    for event in events:
+        by_printer.setdefault(event["m"], []).append(event)
+
+    stats = SwarmStats()
+    lags = []
+    config = SwarmConfig(timeout=timeout)
+    printers = len(by_printer) * copies
+    limits = printer_swarm.httpx.Limits(max_connections=printers, max_keepalive_connections=printers)
+
+    async with printer_swarm.httpx.AsyncClient(base_url=server_url.rstrip("/"), limits=limits, transport=transport) as client:
+        replayers = [
+            ReplayPrinter(_copy_mac(mac, copy), printer_events, client, stats, config, target, enqueue, lags)
+            for mac, printer_events in by_printer.items()
+            for copy in range(copies)
+        ]
+        started_at = asyncio.get_running_loop().time()
+        await asyncio.gather(*(replayer.run(started_at, speed) for replayer in replayers))
+
+    lags.sort()
+    summary = stats.summary()
+    summary.update({
+        "target": target,
+        "server_url": server_url,
+        "printers": printers,
+        "speed": speed,
+        "trace": trace_summary(events),
+        "schedule_lag_ms": {
+            "p50": round(percentile(lags, 50) or 0, 2),
+            "p99": round(percentile(lags, 99) or 0, 2),
+            "max": round(lags[-1], 2) if lags else 0
+        }
+    })
+    return summary